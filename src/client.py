@@ -21,7 +21,7 @@
 #
 
 #
-# Copyright (c) 2007, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2007, 2026, Oracle and/or its affiliates. All rights reserved.
 # Copyright 2018 OmniOS Community Edition (OmniOSce) Association.
 #
 
@@ -166,6 +166,7 @@ def usage(usage_error=None, cmd=None, retcode=EXIT_BADOPT, full=False,
             "            [--deny-new-be | --require-new-be] [--be-name name]\n"
             "            [-R | -r [-z image_name ... | -Z image_name ...]]\n"
             "            [--sync-actuators | --sync-actuators-timeout timeout]\n"
+            "            [--solver-stats file]\n"
             "            [--reject pkg_fmri_pattern ... ] pkg_fmri_pattern ...")
         basic_usage["uninstall"] = _(
             "[-nvq] [-C n] [--ignore-missing] [--no-be-activate] [--no-index]\n"
@@ -181,6 +182,7 @@ def usage(usage_error=None, cmd=None, retcode=EXIT_BADOPT, full=False,
             "            [--deny-new-be | --require-new-be] [--be-name name]\n"
             "            [-R | -r [-z image_name ... | -Z image_name ...]]\n"
             "            [--sync-actuators | --sync-actuators-timeout timeout]\n"
+            "            [--solver-stats file]\n"
             "            [--reject pkg_fmri_pattern ...] [pkg_fmri_pattern ...]")
         basic_usage["list"] = _(
             "[-Hafnqsuv] [-g path_or_uri ...] [--no-refresh]\n"
@@ -270,6 +272,7 @@ def usage(usage_error=None, cmd=None, retcode=EXIT_BADOPT, full=False,
             "            [--deny-new-be | --require-new-be] [--be-name name]\n"
             "            [-R | -r [-z image_name ... | -Z image_name ...]]\n"
             "            [--sync-actuators | --sync-actuators-timeout timeout]\n"
+            "            [--solver-stats file]\n"
             "            [--reject pkg_fmri_pattern ... ]\n"
             "            <variant_spec>=<instance> ...")
 
@@ -280,6 +283,7 @@ def usage(usage_error=None, cmd=None, retcode=EXIT_BADOPT, full=False,
             "            [--deny-new-be | --require-new-be] [--be-name name]\n"
             "            [-R | -r [-z image_name ... | -Z image_name ...]]\n"
             "            [--sync-actuators | --sync-actuators-timeout timeout]\n"
+            "            [--solver-stats file]\n"
             "            [--reject pkg_fmri_pattern ... ]\n"
             "            <facet_spec>=[True|False|None] ...")
 
@@ -331,7 +335,7 @@ def usage(usage_error=None, cmd=None, retcode=EXIT_BADOPT, full=False,
         adv_usage["publisher"] = _("[-HPn] [-F format] [publisher ...]")
         adv_usage["history"] = _("[-HNl] [-t [time|time-time],...] [-n number] [-o column,...]")
         adv_usage["purge-history"] = ""
-        adv_usage["rebuild-index"] = ""
+        adv_usage["rebuild-index"] = _("[--jobs n]")
         adv_usage["update-format"] = ""
         adv_usage["exact-install"] = _("[-nvq] [-C n] [-g path_or_uri ...] [--accept]\n"
             "            [--licenses] [--no-be-activate] [--no-index] [--no-refresh]\n"
@@ -1700,6 +1704,18 @@ def __api_plan_load(api_inst, stage, origins):
         if stage == API_STAGE_EXECUTE:
                 __api_plan_delete(api_inst)
 
+def __api_plan_solver_stats(api_inst, path):
+        """Write the statistics for the solver run used to create the current
+        plan to the file 'path' as JSON."""
+
+        stats = api_inst.describe().get_solver_stats()
+        try:
+                with open(path, "w") as fobj:
+                        json.dump(stats, fobj, indent=2, sort_keys=True)
+                        fobj.write("\n")
+        except EnvironmentError as e:
+                raise api_errors._convert_error(e)
+
 def __api_plan_delete(api_inst):
         """Delete an image plan file."""
 
@@ -1712,7 +1728,7 @@ def __api_plan_delete(api_inst):
 def __api_op(_op, _api_inst, _accept=False, _li_ignore=None, _noexecute=False,
     _omit_headers=False, _origins=None, _parsable_version=None, _quiet=False,
     _quiet_plan=False, _review_release_notes=False, _show_licenses=False,
-    _stage=API_STAGE_DEFAULT, _verbose=0, **kwargs):
+    _solver_stats=None, _stage=API_STAGE_DEFAULT, _verbose=0, **kwargs):
         """Do something that involves the api.
 
         Arguments prefixed with '_' are primarily used within this
@@ -1733,6 +1749,8 @@ def __api_op(_op, _api_inst, _accept=False, _li_ignore=None, _noexecute=False,
 
                 if rv != EXIT_OK:
                         return rv
+                if _solver_stats:
+                        __api_plan_solver_stats(_api_inst, _solver_stats)
                 if not _noexecute and _stage == API_STAGE_PLAN:
                         # We always save the plan, even if it is a noop.  We
                         # do this because we want to be able to verify that we
@@ -1868,7 +1886,7 @@ def change_variant(op, api_inst, pargs,
     accept, act_timeout, backup_be, backup_be_name, be_activate, be_name,
     li_ignore, li_parent_sync, li_erecurse, new_be, noexecute, origins,
     parsable_version, quiet, refresh_catalogs, reject_pats, show_licenses,
-    stage, update_index, verbose):
+    solver_stats, stage, update_index, verbose):
         """Attempt to change a variant associated with an image, updating
         the image contents as necessary."""
 
@@ -1900,10 +1918,10 @@ def change_variant(op, api_inst, pargs,
         return __api_op(op, api_inst, _accept=accept, _li_ignore=li_ignore,
             _noexecute=noexecute, _origins=origins,
             _parsable_version=parsable_version, _quiet=quiet,
-            _show_licenses=show_licenses, _stage=stage, _verbose=verbose,
-            act_timeout=act_timeout, backup_be=backup_be,
-            backup_be_name=backup_be_name, be_activate=be_activate,
-            be_name=be_name, li_erecurse=li_erecurse,
+            _show_licenses=show_licenses, _solver_stats=solver_stats,
+            _stage=stage, _verbose=verbose, act_timeout=act_timeout,
+            backup_be=backup_be, backup_be_name=backup_be_name,
+            be_activate=be_activate, be_name=be_name, li_erecurse=li_erecurse,
             li_parent_sync=li_parent_sync, new_be=new_be,
             refresh_catalogs=refresh_catalogs, reject_list=reject_pats,
             update_index=update_index, variants=variants)
@@ -1912,7 +1930,7 @@ def change_facet(op, api_inst, pargs,
     accept, act_timeout, backup_be, backup_be_name, be_activate, be_name,
     li_ignore, li_erecurse, li_parent_sync, new_be, noexecute, origins,
     parsable_version, quiet, refresh_catalogs, reject_pats, show_licenses,
-    stage, update_index, verbose):
+    solver_stats, stage, update_index, verbose):
         """Attempt to change the facets as specified, updating
         image as necessary"""
 
@@ -1951,10 +1969,11 @@ def change_facet(op, api_inst, pargs,
         return __api_op(op, api_inst, _accept=accept, _li_ignore=li_ignore,
             _noexecute=noexecute, _origins=origins,
             _parsable_version=parsable_version, _quiet=quiet,
-            _show_licenses=show_licenses, _stage=stage, _verbose=verbose,
-            act_timeout=act_timeout, backup_be=backup_be,
-            backup_be_name=backup_be_name, be_activate=be_activate,
-            be_name=be_name, facets=facets, li_erecurse=li_erecurse,
+            _show_licenses=show_licenses, _solver_stats=solver_stats,
+            _stage=stage, _verbose=verbose, act_timeout=act_timeout,
+            backup_be=backup_be, backup_be_name=backup_be_name,
+            be_activate=be_activate, be_name=be_name, facets=facets,
+            li_erecurse=li_erecurse,
             li_parent_sync=li_parent_sync, new_be=new_be,
             refresh_catalogs=refresh_catalogs, reject_list=reject_pats,
             update_index=update_index)
@@ -2089,7 +2108,7 @@ def install(op, api_inst, pargs,
     accept, act_timeout, backup_be, backup_be_name, be_activate, be_name,
     li_ignore, li_erecurse, li_parent_sync, new_be, noexecute, origins,
     parsable_version, quiet, refresh_catalogs, reject_pats, show_licenses,
-    stage, update_index, verbose):
+    solver_stats, stage, update_index, verbose):
         """Attempt to take package specified to INSTALLED state.  The operands
         are interpreted as glob patterns."""
 
@@ -2097,7 +2116,7 @@ def install(op, api_inst, pargs,
             accept, act_timeout, backup_be, backup_be_name, be_activate,
             be_name, li_ignore, li_erecurse, li_parent_sync, new_be, noexecute,
             origins, parsable_version, quiet, refresh_catalogs, reject_pats,
-            show_licenses, stage, update_index, verbose,
+            show_licenses, solver_stats, stage, update_index, verbose,
             display_plan_cb=display_plan_cb, logger=logger)
 
         return  __handle_client_json_api_output(out_json, op)
@@ -2105,7 +2124,8 @@ def install(op, api_inst, pargs,
 def update(op, api_inst, pargs, accept, act_timeout, backup_be, backup_be_name,
     be_activate, be_name, force, ignore_missing, li_ignore, li_erecurse,
     li_parent_sync, new_be, noexecute, origins, parsable_version, quiet,
-    refresh_catalogs, reject_pats, show_licenses, stage, update_index, verbose):
+    refresh_catalogs, reject_pats, show_licenses, solver_stats, stage,
+    update_index, verbose):
         """Attempt to take all installed packages specified to latest
         version."""
 
@@ -2113,8 +2133,8 @@ def update(op, api_inst, pargs, accept, act_timeout, backup_be, backup_be_name,
             backup_be, backup_be_name, be_activate, be_name, force,
             ignore_missing, li_ignore, li_erecurse, li_parent_sync, new_be,
             noexecute, origins, parsable_version, quiet, refresh_catalogs,
-            reject_pats, show_licenses, stage, update_index, verbose,
-            display_plan_cb=display_plan_cb, logger=logger)
+            reject_pats, show_licenses, solver_stats, stage, update_index,
+            verbose, display_plan_cb=display_plan_cb, logger=logger)
 
         return __handle_client_json_api_output(out_json, op)
 
@@ -4504,18 +4524,34 @@ def image_create(args):
 
         return EXIT_OK
 
-def rebuild_index(api_inst, pargs):
-        """pkg rebuild-index
+def rebuild_index(api_inst, args):
+        """pkg rebuild-index [--jobs n]
 
         Forcibly rebuild the search indexes. Will remove existing indexes
         and build new ones from scratch."""
 
+        jobs = 1
+        opts, pargs = getopt.getopt(args, "", ["jobs="])
+        for opt, arg in opts:
+                if opt == "--jobs":
+                        try:
+                                jobs = int(arg)
+                                if jobs < 0:
+                                        raise ValueError(arg)
+                        except ValueError:
+                                usage(_("--jobs expects a non-negative "
+                                    "integer value; got '{0}'").format(arg),
+                                    cmd="rebuild-index")
+                        if jobs == 0:
+                                # Use one process per CPU.
+                                jobs = misc.get_ncpus()
+
         if pargs:
                 usage(_("command does not take operands ('{0}')").format(
                     " ".join(pargs)), cmd="rebuild-index")
 
         try:
-                api_inst.rebuild_search_index()
+                api_inst.rebuild_search_index(jobs=jobs)
         except api_errors.ImageFormatUpdateNeeded as e:
                 format_update_error(e)
                 return EXIT_OOPS
@@ -4978,6 +5014,7 @@ opts_mapping = {
 
     "origins" :           ("g",  ""),
 
+    "solver_stats" :      ("",  "solver-stats"),
     "stage" :             ("",  "stage"),
 
     "allow_relink" :      ("",  "allow-relink"),
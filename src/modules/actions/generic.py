@@ -597,7 +597,12 @@ class Action(object):
                         try:
                                 os.mkdir(p, fs.st_mode)
                         except OSError as e:
-                                if e.ernno != errno.ENOTDIR:
+                                if e.errno == errno.EEXIST and \
+                                    os.path.isdir(p):
+                                        # Created by another action being
+                                        # executed concurrently.
+                                        continue
+                                if e.errno != errno.ENOTDIR:
                                         raise
                                 err_txt = _("Unable to create {path}; a "
                                     "parent directory {p} has been replaced "
@@ -620,7 +625,11 @@ class Action(object):
                 mode = kw.get("mode", fs.st_mode)
                 uid = kw.get("uid", fs.st_uid)
                 gid = kw.get("gid", fs.st_gid)
-                os.mkdir(path, mode)
+                try:
+                        os.mkdir(path, mode)
+                except OSError as e:
+                        if e.errno != errno.EEXIST or not os.path.isdir(path):
+                                raise
                 os.chmod(path, mode)
                 try:
                         portable.chown(path, uid, gid)
@@ -19,7 +19,7 @@
 #
 # CDDL HEADER END
 #
-# Copyright (c) 2007, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2007, 2026, Oracle and/or its affiliates. All rights reserved.
 
 """Interfaces and implementation for the Catalog object, as well as functions
 that operate on lists of package FMRIs."""
@@ -31,10 +31,13 @@ import datetime
 import errno
 import fnmatch
 import hashlib
+import mmap
 import os
 import simplejson as json
 import stat
 import statvfs
+import struct
+import tempfile
 import threading
 import types
 
@@ -201,6 +204,397 @@ class _JSONWriter(object):
                         self.__sha_1.update(l)
 
 
+class _JSONReader(object):
+        """Private helper class used to incrementally parse the JSON data of a
+        catalog part or update log from a file object so that its entries can
+        be processed one at a time instead of loading all of it into memory.
+
+        The data must be an object that maps publisher prefixes to objects
+        mapping package stems to lists of entries.  Members with names
+        starting with "_" are reserved and can have any value."""
+
+        def __init__(self, fobj, bufsz=64 * 1024):
+                self.__fobj = fobj
+                self.__bufsz = bufsz
+                self.__buf = ""
+                self.__pos = 0
+                self.__eof = False
+                self.__decoder = json.JSONDecoder()
+                self.__encoder = json.JSONEncoder(check_circular=False,
+                    separators=(",", ":"), sort_keys=True)
+
+        def __fill(self):
+                """Read more data, discarding the data that has already been
+                parsed.  Returns False if there is no more data."""
+
+                if self.__eof:
+                        return False
+                # Read at least as much as is buffered so that the cost of
+                # parsing a value larger than the buffer size stays linear.
+                data = self.__fobj.read(max(self.__bufsz,
+                    len(self.__buf) - self.__pos))
+                if not data:
+                        self.__eof = True
+                        return False
+                self.__buf = self.__buf[self.__pos:] + data
+                self.__pos = 0
+                return True
+
+        def __peek(self):
+                """Skip any whitespace and return the next character, or ""
+                if there is no more data."""
+
+                while True:
+                        buf = self.__buf
+                        pos = self.__pos
+                        end = len(buf)
+                        while pos < end and buf[pos] in " \t\n\r":
+                                pos += 1
+                        self.__pos = pos
+                        if pos < end:
+                                return buf[pos]
+                        if not self.__fill():
+                                return ""
+
+        def __expect(self, chars):
+                """Consume the next character, which must be one of 'chars',
+                and return it."""
+
+                c = self.__peek()
+                if not c or c not in chars:
+                        raise ValueError("expected one of {0!r} at {1!r}".format(
+                            chars, self.__buf[self.__pos:self.__pos + 16]))
+                self.__pos += 1
+                return c
+
+        def __value(self):
+                """Decode and return the next complete value."""
+
+                self.__peek()
+                while True:
+                        try:
+                                val, end = self.__decoder.raw_decode(
+                                    self.__buf, self.__pos)
+                        except ValueError:
+                                # The value may continue beyond the data
+                                # read so far.
+                                if self.__fill():
+                                        continue
+                                raise
+                        if end >= len(self.__buf) and self.__fill():
+                                # A number may continue beyond the end of
+                                # the buffer.
+                                continue
+                        self.__pos = end
+                        return val
+
+        def __key(self):
+                """Decode and return the next member name and consume the
+                separator that follows it."""
+
+                key = self.__value()
+                if not isinstance(key, basestring):
+                        raise ValueError("invalid member name {0!r}".format(
+                            key))
+                self.__expect(":")
+                return key
+
+        def __members(self, start, end):
+                """Consume the 'start' character of an object or array and
+                yield once for each of its members, which the caller must
+                consume, then consume the separator that follows each member
+                and the closing 'end' character."""
+
+                self.__expect(start)
+                if self.__peek() == end:
+                        self.__pos += 1
+                        return
+                while True:
+                        yield
+                        if self.__expect("," + end) == end:
+                                return
+
+        def entries(self):
+                """A generator function that produces tuples of the form
+                (pub, stem, entry) for each entry in the data, in the order
+                they are stored.  For reserved members, a tuple of the form
+                (name, None, value) is produced instead.  ValueError is raised
+                if the data is malformed."""
+
+                for unused in self.__members("{", "}"):
+                        pub = self.__key()
+                        if pub.startswith("_"):
+                                yield pub, None, self.__value()
+                                continue
+                        for unused in self.__members("{", "}"):
+                                stem = self.__key()
+                                for unused in self.__members("[", "]"):
+                                        yield pub, stem, self.__value()
+
+        def digest(self, hash_obj):
+                """Update 'hash_obj' with the text _JSONWriter would produce
+                for the data, excluding any signature data, one entry at a
+                time, and return the signature data (or an empty dict).
+
+                Since _JSONWriter sorts member names, ValueError is raised if
+                they aren't stored in sorted order, as well as if the data is
+                malformed; the data must be loaded to generate its text in
+                that case."""
+
+                enc = self.__encoder.encode
+                update = hash_obj.update
+                stored = {}
+                sep = ""
+                last = None
+                update("{")
+                for unused in self.__members("{", "}"):
+                        pub = self.__key()
+                        if pub == "_SIGNATURE":
+                                # Always stored last, and not signed.
+                                stored = self.__value()
+                                continue
+                        if last is not None and pub <= last:
+                                raise ValueError("unsorted data")
+                        last = pub
+                        update(sep + enc(pub) + ":")
+                        sep = ","
+                        if pub.startswith("_"):
+                                update(enc(self.__value()))
+                                continue
+
+                        ssep = ""
+                        slast = None
+                        update("{")
+                        for unused in self.__members("{", "}"):
+                                stem = self.__key()
+                                if slast is not None and stem <= slast:
+                                        raise ValueError("unsorted data")
+                                slast = stem
+                                update(ssep + enc(stem) + ":[")
+                                ssep = ","
+                                esep = ""
+                                for unused in self.__members("[", "]"):
+                                        update(esep + enc(self.__value()))
+                                        esep = ","
+                                update("]")
+                        update("}")
+                update("}\n")
+                return stored
+
+
+# The compact index is an alternative, binary encoding of a CatalogPart's data
+# that is written alongside the JSON file for the part.  It allows the data for
+# individual package stems to be located and decoded on demand instead of
+# parsing the entire part on load.  It is a purely local cache; the JSON file
+# remains authoritative and is the format used for transfer.
+#
+# The index starts with a fixed header containing the size and modification
+# time of the JSON file it was generated from (so that a stale index can be
+# detected), the number of stems, the size of the key data, and the size of a
+# JSON object containing the publisher ranges and any reserved (non-publisher)
+# catalog data.  That is followed by the JSON object, one fixed-width record
+# per (publisher, stem) sorted by key, the key data, and finally the
+# compact-JSON encoded list of version entries for each stem.
+_COMPACT_MAGIC = "PKG5CIX1"
+_COMPACT_SUFFIX = ".idx"
+_COMPACT_HEADER = struct.Struct("!8sQQIII")
+_COMPACT_RECORD = struct.Struct("!IIQI")
+
+
+def _compact_stat(pathname):
+        """Return the (size, modification time) tuple used to determine whether
+        a compact index matches the JSON file at 'pathname'."""
+
+        st = os.stat(pathname)
+        return st.st_size, int(st.st_mtime * 1000000)
+
+
+def _compact_str(val):
+        """Decode a UTF-8 byte string from a compact index the way the JSON
+        parser would; ASCII strings are returned unchanged."""
+
+        try:
+                val.decode("ascii")
+        except UnicodeDecodeError:
+                return val.decode("utf-8")
+        return val
+
+
+def _save_compact_index(pathname, data):
+        """Write the compact index for the CatalogPart data 'data' that was
+        just stored as JSON at 'pathname'."""
+
+        size, mtime = _compact_stat(pathname)
+
+        reserved = {}
+        keys = []
+        for pub, pkg_list in data.iteritems():
+                if pub[0] == "_":
+                        reserved[pub] = pkg_list
+                        continue
+                for stem in pkg_list:
+                        keys.append(("{0}\0{1}".format(misc.force_bytes(pub),
+                            misc.force_bytes(stem)), pub, stem))
+        keys.sort()
+
+        pubs = {}
+        records = []
+        keydata = []
+        blobs = []
+        koff = 0
+        doff = 0
+        for i, (bkey, pub, stem) in enumerate(keys):
+                lo, hi = pubs.get(pub, (i, i))
+                pubs[pub] = (lo, i + 1)
+                blob = json.dumps(data[pub][stem], separators=(",", ":"))
+                records.append((koff, len(bkey), doff, len(blob)))
+                keydata.append(bkey)
+                blobs.append(blob)
+                koff += len(bkey)
+                doff += len(blob)
+
+        extra = json.dumps({ "publishers": pubs, "reserved": reserved },
+            separators=(",", ":"))
+        base = _COMPACT_HEADER.size + len(extra) + \
+            len(records) * _COMPACT_RECORD.size + koff
+
+        meta_root, name = os.path.split(pathname)
+        fd, tmp = tempfile.mkstemp(prefix=name + _COMPACT_SUFFIX + ".",
+            dir=meta_root)
+        try:
+                with os.fdopen(fd, "wb") as f:
+                        f.write(_COMPACT_HEADER.pack(_COMPACT_MAGIC, size,
+                            mtime, len(records), koff, len(extra)))
+                        f.write(extra)
+                        f.write("".join(
+                            _COMPACT_RECORD.pack(ko, kl, base + do, dl)
+                            for ko, kl, do, dl in records
+                        ))
+                        f.write("".join(keydata))
+                        f.write("".join(blobs))
+                os.chmod(tmp, stat.S_IMODE(os.stat(pathname).st_mode))
+                portable.rename(tmp, pathname + _COMPACT_SUFFIX)
+        except:
+                try:
+                        portable.remove(tmp)
+                except EnvironmentError:
+                        pass
+                raise
+
+
+class _CompactIndex(object):
+        """Private helper class providing read-only access to a memory-mapped
+        compact index."""
+
+        def __init__(self, pathname):
+                """'pathname' is the path of the JSON file for the part.
+                ValueError is raised if the index is missing, stale, or
+                corrupt."""
+
+                try:
+                        size, mtime = _compact_stat(pathname)
+                        with open(pathname + _COMPACT_SUFFIX, "rb") as f:
+                                self.__map = mmap.mmap(f.fileno(), 0,
+                                    access=mmap.ACCESS_READ)
+                except EnvironmentError as e:
+                        raise ValueError(e)
+
+                m = self.__map
+                if len(m) < _COMPACT_HEADER.size:
+                        raise ValueError(pathname)
+                magic, isize, imtime, self.__count, keysize, extralen = \
+                    _COMPACT_HEADER.unpack_from(m, 0)
+                if magic != _COMPACT_MAGIC or isize != size or \
+                    imtime != mtime:
+                        raise ValueError(pathname)
+
+                start = _COMPACT_HEADER.size
+                self.__recbase = start + extralen
+                self.__keybase = self.__recbase + \
+                    self.__count * _COMPACT_RECORD.size
+                if len(m) < self.__keybase + keysize:
+                        raise ValueError(pathname)
+                extra = json.loads(m[start:self.__recbase])
+                self.publishers = dict(
+                    (pub, tuple(r))
+                    for pub, r in extra["publishers"].iteritems()
+                )
+                self.reserved = extra["reserved"]
+
+        def __record(self, i):
+                return _COMPACT_RECORD.unpack_from(self.__map,
+                    self.__recbase + i * _COMPACT_RECORD.size)
+
+        def __key(self, rec):
+                start = self.__keybase + rec[0]
+                return self.__map[start:start + rec[1]]
+
+        def find(self, pub, stem, lo, hi):
+                """Return the record number of the entry for 'stem' of
+                publisher 'pub' between records 'lo' and 'hi', or None."""
+
+                bkey = "{0}\0{1}".format(misc.force_bytes(pub),
+                    misc.force_bytes(stem))
+                while lo < hi:
+                        mid = (lo + hi) // 2
+                        if self.__key(self.__record(mid)) < bkey:
+                                lo = mid + 1
+                        else:
+                                hi = mid
+                if lo < self.__count and \
+                    self.__key(self.__record(lo)) == bkey:
+                        return lo
+                return None
+
+        def stem(self, i):
+                """Return the stem of record number 'i'."""
+
+                return _compact_str(
+                    self.__key(self.__record(i)).split("\0", 1)[1])
+
+        def versions(self, i):
+                """Return the decoded list of version entries of record
+                number 'i'."""
+
+                rec = self.__record(i)
+                return json.loads(self.__map[rec[2]:rec[2] + rec[3]])
+
+
+class _CompactStems(collections.Mapping):
+        """Private helper class that is used in place of the dictionary
+        mapping stems to version entries for a publisher in a CatalogPart
+        loaded from a compact index.  The entries for a stem are decoded when
+        first accessed and cached thereafter."""
+
+        def __init__(self, index, pub):
+                self.__index = index
+                self.__pub = pub
+                self.__lo, self.__hi = index.publishers[pub]
+                self.__cache = {}
+
+        def __contains__(self, stem):
+                return stem in self.__cache or self.__index.find(self.__pub,
+                    stem, self.__lo, self.__hi) is not None
+
+        def __getitem__(self, stem):
+                try:
+                        return self.__cache[stem]
+                except KeyError:
+                        pass
+                i = self.__index.find(self.__pub, stem, self.__lo, self.__hi)
+                if i is None:
+                        raise KeyError(stem)
+                ver_list = self.__cache[stem] = self.__index.versions(i)
+                return ver_list
+
+        def __iter__(self):
+                for i in xrange(self.__lo, self.__hi):
+                        yield self.__index.stem(i)
+
+        def __len__(self):
+                return self.__hi - self.__lo
+
+
 class CatalogPartBase(object):
         """A CatalogPartBase object is an abstract class containing core
         functionality shared between CatalogPart and CatalogAttrs."""
@@ -293,14 +687,14 @@ class CatalogPartBase(object):
                         return False
                 return os.path.exists(self.pathname)
 
-        def load(self):
-                """Load the serialized data for the catalog part and return the
-                resulting structure."""
+        def __open(self):
+                """Open the file containing the serialized data for the catalog
+                part and return the file object."""
 
                 location = os.path.join(self.meta_root, self.name)
 
                 try:
-                        fobj = file(location, "rb")
+                        return file(location, "rb")
                 except EnvironmentError as e:
                         if e.errno == errno.ENOENT:
                                 raise api_errors.RetrievalError(e,
@@ -313,6 +707,53 @@ class CatalogPartBase(object):
                                     e.filename)
                         raise
 
+        def _stream(self):
+                """A generator function that produces tuples of the form
+                (pub, stem, entry) for each entry in the serialized data for
+                the catalog part, in the order they are stored, without
+                loading all of the data into memory.  For members in the
+                reserved catalog namespace, tuples of the form (name, None,
+                value) are produced instead."""
+
+                location = os.path.join(self.meta_root, self.name)
+                fobj = self.__open()
+                try:
+                        for t in _JSONReader(fobj).entries():
+                                yield t
+                except EnvironmentError as e:
+                        raise api_errors.RetrievalError(e)
+                except ValueError as e:
+                        # Not a valid catalog file.
+                        raise api_errors.InvalidCatalogFile(location)
+                finally:
+                        fobj.close()
+
+        def _stream_signatures(self):
+                """Returns a tuple of the signature data stored with the
+                serialized data for the catalog part and the signatures
+                generated for its content, computed one entry at a time
+                without loading all of the data into memory.
+
+                ValueError is raised if the signatures can't be generated
+                this way, in which case the data must be loaded instead."""
+
+                fobj = self.__open()
+                try:
+                        sha_1 = hashlib.sha1()
+                        stored = _JSONReader(fobj).digest(sha_1)
+                except EnvironmentError as e:
+                        raise api_errors.RetrievalError(e)
+                finally:
+                        fobj.close()
+                return stored, { "sha-1": sha_1.hexdigest() }
+
+        def load(self):
+                """Load the serialized data for the catalog part and return the
+                resulting structure."""
+
+                location = os.path.join(self.meta_root, self.name)
+                fobj = self.__open()
+
                 try:
                         struct = json.load(fobj)
                 except EnvironmentError as e:
@@ -381,12 +822,22 @@ class CatalogPart(CatalogPartBase):
         FMRIs available from a package repository."""
 
         __data = None
+        __lazy = False
+        compact = False
         ordered = None
 
-        def __init__(self, name, meta_root=None, ordered=True, sign=True):
-                """Initializes a CatalogPart object."""
+        def __init__(self, name, meta_root=None, ordered=True, sign=True,
+            compact=False):
+                """Initializes a CatalogPart object.
+
+                'compact' is an optional boolean value indicating that a
+                compact index of the part's data should be maintained
+                alongside the JSON file for the part and used in place of it
+                when loading.  This allows the entries for a package stem to
+                be decoded only when needed."""
 
                 self.__data = {}
+                self.compact = compact
                 self.ordered = ordered
                 if not name.startswith("catalog."):
                         raise UnrecognizedCatalogPart(name)
@@ -458,6 +909,8 @@ class CatalogPart(CatalogPartBase):
                         # Hot path, so avoid calling load unless necessary, even
                         # though it performs this check already.
                         self.load()
+                if self.__lazy:
+                        self.__materialize()
 
                 if pfmri:
                         pub, stem, ver = pfmri.tuple()
@@ -495,6 +948,19 @@ class CatalogPart(CatalogPartBase):
                 discards all content."""
 
                 self.__data = {}
+                self.__lazy = False
+                if self.pathname:
+                        try:
+                                portable.remove(self.pathname + _COMPACT_SUFFIX)
+                        except EnvironmentError as e:
+                                if e.errno == errno.EACCES:
+                                        raise api_errors.PermissionsException(
+                                            e.filename)
+                                if e.errno == errno.EROFS:
+                                        raise api_errors.ReadOnlyFileSystemException(
+                                            e.filename)
+                                if e.errno != errno.ENOENT:
+                                        raise
                 return CatalogPartBase.destroy(self)
 
         def entries(self, cb=None, last=False, ordered=False, pubs=EmptyI):
@@ -535,6 +1001,34 @@ class CatalogPart(CatalogPartBase):
                         if cb is None or cb(f, entry):
                                 yield f, entry
 
+        def stream_entries(self, pubs=EmptyI):
+                """A generator function that produces tuples of the form
+                (fmri, entry) for each entry in the catalog part, like
+                entries(), but if the part hasn't been loaded yet, the entries
+                are read one at a time from its file instead of loading all
+                of them into memory.  This is intended for callers that only
+                need to visit each entry once, such as when copying the
+                entries to another catalog.
+
+                'pubs' is an optional list of publisher prefixes to restrict
+                the results to.
+
+                Results are always in catalog version order on a per-
+                publisher, per-stem basis.
+                """
+
+                if self.loaded:
+                        for t in self.entries(pubs=pubs):
+                                yield t
+                        return
+
+                for pub, stem, entry in self._stream():
+                        if stem is None or (pubs and pub not in pubs):
+                                # Reserved catalog namespace.
+                                continue
+                        yield fmri.PkgFmri(name=stem, publisher=pub,
+                            version=entry["version"]), entry
+
         def entries_by_version(self, name, pubs=EmptyI):
                 """A generator function that produces tuples of (version,
                 entries), where entries is a list of tuples of the format
@@ -697,8 +1191,39 @@ class CatalogPart(CatalogPartBase):
                 if self.loaded:
                         # Already loaded, or only in-memory.
                         return
+
+                if self.compact:
+                        try:
+                                index = _CompactIndex(self.pathname)
+                        except ValueError:
+                                # Missing or stale; fall back to the JSON
+                                # data.  The index will be rewritten the
+                                # next time the part is saved.
+                                pass
+                        else:
+                                data = dict(index.reserved)
+                                self.signatures = data.pop("_SIGNATURE", {})
+                                for pub in index.publishers:
+                                        data[pub] = _CompactStems(index, pub)
+                                self.__data = data
+                                self.__lazy = True
+                                self.loaded = True
+                                return
+
                 self.__data = CatalogPartBase.load(self)
 
+        def __materialize(self):
+                """Replace any lazily-decoded package data with dictionaries
+                so that it can be modified or serialized."""
+
+                self.load()
+                if not self.__lazy:
+                        return
+                for pub, pkg_list in self.__data.items():
+                        if isinstance(pkg_list, _CompactStems):
+                                self.__data[pub] = dict(pkg_list.iteritems())
+                self.__lazy = False
+
         def names(self, pubs=EmptyI):
                 """Returns a set containing the names of all the packages in
                 the CatalogPart.
@@ -770,7 +1295,7 @@ class CatalogPart(CatalogPartBase):
                 if not pfmri.publisher:
                         raise api_errors.AnarchicalCatalogFMRI(pfmri.get_fmri())
 
-                self.load()
+                self.__materialize()
                 pkg_list = self.__data.get(pfmri.publisher, None)
                 if not pkg_list:
                         raise api_errors.UnknownCatalogEntry(pfmri.get_fmri())
@@ -816,9 +1341,20 @@ class CatalogPart(CatalogPartBase):
                         return
 
                 # Ensure content is loaded before attempting save.
-                self.load()
+                self.__materialize()
 
                 CatalogPartBase.save(self, self.__data, single_pass=single_pass)
+                if self.compact:
+                        try:
+                                _save_compact_index(self.pathname, self.__data)
+                        except EnvironmentError as e:
+                                if e.errno == errno.EACCES:
+                                        raise api_errors.PermissionsException(
+                                            e.filename)
+                                if e.errno == errno.EROFS:
+                                        raise api_errors.ReadOnlyFileSystemException(
+                                            e.filename)
+                                raise
 
         def sort(self, pfmris=None, pubs=None):
                 """Re-sorts the contents of the CatalogPart such that version
@@ -842,7 +1378,7 @@ class CatalogPart(CatalogPartBase):
                         v2 = pkg.version.Version(b["version"])
                         return cmp(v1, v2)
 
-                self.load()
+                self.__materialize()
                 if pfmris is not None:
                         processed = set()
                         for f in pfmris:
@@ -939,13 +1475,27 @@ class CatalogPart(CatalogPartBase):
                         # Nothing to validate, and we're not required to.
                         return
 
-                # Ensure content is loaded before attempting to retrieve
-                # or generate signature data.
-                self.load()
-                if not signatures:
-                        signatures = self.signatures
+                new_signatures = None
+                if not self.loaded:
+                        # Generate the signature data from the file one
+                        # entry at a time instead of loading it if possible.
+                        try:
+                                stored, new_signatures = \
+                                    self._stream_signatures()
+                        except ValueError:
+                                pass
+                        else:
+                                if not signatures:
+                                        signatures = stored
+
+                if new_signatures is None:
+                        # Ensure content is loaded before attempting to
+                        # retrieve or generate signature data.
+                        self.__materialize()
+                        if not signatures:
+                                signatures = self.signatures
+                        new_signatures = self._gen_signatures(self.__data)
 
-                new_signatures = self._gen_signatures(self.__data)
                 if new_signatures != signatures:
                         raise api_errors.BadCatalogSignatures(self.pathname)
 
@@ -1068,8 +1618,6 @@ class CatalogUpdate(CatalogPartBase):
                 per-publisher, per-stem basis.
                 """
 
-                self.load()
-
                 def get_update(pub, stem, entry):
                         mdata = {}
                         for key in entry:
@@ -1080,6 +1628,15 @@ class CatalogUpdate(CatalogPartBase):
                             version=entry["version"])
                         return (pfmri, entry["op-type"], op_time, mdata)
 
+                if not self.loaded:
+                        # Update logs are only read once when they are
+                        # applied, so read the entries one at a time instead
+                        # of loading all of them into memory.
+                        for pub, stem, entry in self._stream():
+                                if stem is not None:
+                                        yield get_update(pub, stem, entry)
+                        return
+
                 for pub in self.publishers():
                         for stem in self.__data[pub]:
                                 for entry in self.__data[pub][stem]:
@@ -1097,13 +1654,27 @@ class CatalogUpdate(CatalogPartBase):
                         # Nothing to validate, and we're not required to.
                         return
 
-                # Ensure content is loaded before attempting to retrieve
-                # or generate signature data.
-                self.load()
-                if not signatures:
-                        signatures = self.signatures
+                new_signatures = None
+                if not self.loaded:
+                        # Generate the signature data from the file one
+                        # entry at a time instead of loading it if possible.
+                        try:
+                                stored, new_signatures = \
+                                    self._stream_signatures()
+                        except ValueError:
+                                pass
+                        else:
+                                if not signatures:
+                                        signatures = stored
+
+                if new_signatures is None:
+                        # Ensure content is loaded before attempting to
+                        # retrieve or generate signature data.
+                        self.load()
+                        if not signatures:
+                                signatures = self.signatures
+                        new_signatures = self._gen_signatures(self.__data)
 
-                new_signatures = self._gen_signatures(self.__data)
                 if new_signatures != signatures:
                         raise api_errors.BadCatalogSignatures(self.pathname)
 
@@ -1339,6 +1910,7 @@ class Catalog(object):
         # found near the end of the class definition.
         _attrs = None
         __batch_mode = None
+        __compact = None
         __lock = None
         __manifest_cb = None
         __meta_root = None
@@ -1354,7 +1926,7 @@ class Catalog(object):
         DEPENDENCY, SUMMARY = range(2)
 
         def __init__(self, batch_mode=False, meta_root=None, log_updates=False,
-            manifest_cb=None, read_only=False, sign=True):
+            manifest_cb=None, read_only=False, sign=True, compact=False):
                 """Initializes a Catalog object.
 
                 'batch_mode' is an optional boolean value that indicates that
@@ -1389,9 +1961,18 @@ class Catalog(object):
                 the catalog data should have signature data generated and
                 embedded when serialized.  This option is primarily a matter
                 of convenience for callers that wish to trade integrity checks
-                for improved catalog serialization performance."""
+                for improved catalog serialization performance.
+
+                'compact' is an optional boolean value that indicates that a
+                compact index should be maintained for each catalog part
+                alongside its JSON data and used when loading it so that only
+                the entries for the package stems actually accessed need to be
+                decoded.  This is intended for catalogs that are loaded far
+                more often than they are written, such as those of an image;
+                the JSON data remains authoritative."""
 
                 self.__batch_mode = batch_mode
+                self.__compact = compact
                 self.__manifest_cb = manifest_cb
                 self.__parts = {}
                 self.__updates = {}
@@ -1460,7 +2041,7 @@ class Catalog(object):
                                     pfmri.get_fmri())
                         entries = [(pfmri, entry)]
                 else:
-                        entries = src_base.entries()
+                        entries = src_base.stream_entries(pubs=pubs)
 
                 d = {}
                 for f, entry in entries:
@@ -1508,7 +2089,7 @@ class Catalog(object):
                                         continue
                                 entries = [(pfmri, entry)]
                         else:
-                                entries = part.entries()
+                                entries = part.stream_entries(pubs=pubs)
 
                         npart = self.get_part(name)
                         for f, entry in entries:
@@ -3397,7 +3978,8 @@ class Catalog(object):
                 # Next, since the part hasn't been cached, create an object
                 # for it and add it to catalog attributes.
                 part = CatalogPart(name, meta_root=self.meta_root,
-                    ordered=not self.__batch_mode, sign=self.__sign)
+                    ordered=not self.__batch_mode, sign=self.__sign,
+                    compact=self.__compact)
                 if must_exist and self.meta_root and not part.exists:
                         # This is a double-check for the client case where
                         # there is a part that is known to the catalog but
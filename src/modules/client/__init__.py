@@ -21,7 +21,7 @@
 #
 
 #
-# Copyright (c) 2007, 2013, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2007, 2026, Oracle and/or its affiliates. All rights reserved.
 #
 
 # Missing docstring; pylint: disable=C0111
@@ -113,6 +113,16 @@ class GlobalSettings(object):
                 # Maximum number of transient errors before we abort an
                 # endpoint.
                 self.pkg_client_max_consecutive_error_default = 4
+                # Default maximum number of threads used to verify downloaded
+                # content while other files are being transferred.
+                self.pkg_client_verify_threads_default = 4
+                # Default maximum number of threads used to extract files from
+                # package archives.
+                self.pkg_client_archive_threads_default = 4
+                # Default minimum compressed size, in bytes, of a file for
+                # which an older installed version is used to retrieve it as
+                # a delta; smaller files are cheaper to retrieve in full.
+                self.pkg_client_delta_min_size_default = 64 * 1024
 
                 # The location within the image of the cache for pkg.sysrepo(1M)
                 self.sysrepo_pub_cache_path = \
@@ -162,6 +172,33 @@ class GlobalSettings(object):
                 except ValueError:
                         self.PKG_CLIENT_MAX_REDIRECT = \
                             self.pkg_client_max_redirect_default
+                try:
+                        # Maximum number of threads used to verify
+                        # downloaded content.
+                        self.PKG_CLIENT_VERIFY_THREADS = int(
+                            os.environ.get("PKG_CLIENT_VERIFY_THREADS",
+                            self.pkg_client_verify_threads_default))
+                except ValueError:
+                        self.PKG_CLIENT_VERIFY_THREADS = \
+                            self.pkg_client_verify_threads_default
+                try:
+                        # Maximum number of threads used to extract files
+                        # from package archives.
+                        self.PKG_CLIENT_ARCHIVE_THREADS = int(
+                            os.environ.get("PKG_CLIENT_ARCHIVE_THREADS",
+                            self.pkg_client_archive_threads_default))
+                except ValueError:
+                        self.PKG_CLIENT_ARCHIVE_THREADS = \
+                            self.pkg_client_archive_threads_default
+                try:
+                        # Minimum compressed size of a file that is retrieved
+                        # as a delta against an older installed version.
+                        self.PKG_CLIENT_DELTA_MIN_SIZE = int(
+                            os.environ.get("PKG_CLIENT_DELTA_MIN_SIZE",
+                            self.pkg_client_delta_min_size_default))
+                except ValueError:
+                        self.PKG_CLIENT_DELTA_MIN_SIZE = \
+                            self.pkg_client_delta_min_size_default
                 self.reset_logging()
 
         def __get_error_log_handler(self):
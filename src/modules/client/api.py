@@ -21,7 +21,7 @@
 #
 
 #
-# Copyright (c) 2008, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2008, 2026, Oracle and/or its affiliates. All rights reserved.
 #
 
 """This module provides the supported, documented interface for clients to
@@ -4935,12 +4935,15 @@ in the environment or by setting simulate_cmdpath in DebugValues.""")
 
                 return None
 
-        def rebuild_search_index(self):
+        def rebuild_search_index(self, jobs=1):
                 """Rebuilds the search indexes.  Removes all
                 existing indexes and replaces them from scratch rather than
                 performing the incremental update which is usually used.
                 This is useful for times when the index for the client has
-                been corrupted."""
+                been corrupted.
+
+                'jobs' is the number of processes to use to read the
+                manifests of the installed packages."""
                 self._img.update_index_dir()
                 self.log_operation_start("rebuild-index")
                 if not os.path.isdir(self._img.index_dir):
@@ -4948,7 +4951,8 @@ in the environment or by setting simulate_cmdpath in DebugValues.""")
                 try:
                         ind = indexer.Indexer(self._img, self._img.get_manifest,
                             self._img.get_manifest_path,
-                            self.__progresstracker, self._img.list_excludes())
+                            self.__progresstracker, self._img.list_excludes(),
+                            jobs=jobs)
                         ind.rebuild_index_from_scratch(
                             self._img.gen_installed_pkgs())
                 except search_errors.ProblematicPermissionsIndexException as e:
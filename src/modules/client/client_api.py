@@ -1408,6 +1408,18 @@ def __api_plan_load(api_inst, stage, origins, logger=None):
         if stage == API_STAGE_EXECUTE:
                 __api_plan_delete(api_inst)
 
+def __api_plan_solver_stats(api_inst, path):
+        """Write the statistics for the solver run used to create the current
+        plan to the file 'path' as JSON."""
+
+        stats = api_inst.describe().get_solver_stats()
+        try:
+                with open(path, "w") as fobj:
+                        json.dump(stats, fobj, indent=2, sort_keys=True)
+                        fobj.write("\n")
+        except EnvironmentError as e:
+                raise api_errors._convert_error(e)
+
 def __api_plan_delete(api_inst):
         """Delete an image plan file."""
 
@@ -1419,7 +1431,7 @@ def __api_plan_delete(api_inst):
 
 def __api_op(_op, _api_inst, _accept=False, _li_ignore=None, _noexecute=False,
     _origins=None, _parsable_version=None, _quiet=False,
-    _review_release_notes=False, _show_licenses=False,
+    _review_release_notes=False, _show_licenses=False, _solver_stats=None,
     _stage=API_STAGE_DEFAULT, _verbose=0, display_plan_cb=None, logger=None,
     **kwargs):
         """Do something that involves the api.
@@ -1445,6 +1457,8 @@ def __api_op(_op, _api_inst, _accept=False, _li_ignore=None, _noexecute=False,
                         return ret
                 if "data" in ret:
                         data.update(ret["data"])
+                if _solver_stats:
+                        __api_plan_solver_stats(_api_inst, _solver_stats)
 
                 if not _noexecute and _stage == API_STAGE_PLAN:
                         # We always save the plan, even if it is a noop.  We
@@ -1520,8 +1534,8 @@ def _exact_install(op, api_inst, pargs,
 def _install(op, api_inst, pargs, accept, act_timeout, backup_be,
     backup_be_name, be_activate, be_name, li_ignore, li_erecurse,
     li_parent_sync, new_be, noexecute, origins, parsable_version, quiet,
-    refresh_catalogs, reject_pats, show_licenses, stage, update_index,
-    verbose, display_plan_cb=None, logger=None):
+    refresh_catalogs, reject_pats, show_licenses, solver_stats, stage,
+    update_index, verbose, display_plan_cb=None, logger=None):
         """Attempt to take package specified to INSTALLED state.  The operands
         are interpreted as glob patterns."""
 
@@ -1544,10 +1558,10 @@ def _install(op, api_inst, pargs, accept, act_timeout, backup_be,
         return __api_op(op, api_inst, _accept=accept, _li_ignore=li_ignore,
             _noexecute=noexecute, _origins=origins,
             _parsable_version=parsable_version, _quiet=quiet,
-            _show_licenses=show_licenses, _stage=stage, _verbose=verbose,
-            act_timeout=act_timeout, backup_be=backup_be,
-            backup_be_name=backup_be_name, be_activate=be_activate,
-            be_name=be_name, li_erecurse=li_erecurse,
+            _show_licenses=show_licenses, _solver_stats=solver_stats,
+            _stage=stage, _verbose=verbose, act_timeout=act_timeout,
+            backup_be=backup_be, backup_be_name=backup_be_name,
+            be_activate=be_activate, be_name=be_name, li_erecurse=li_erecurse,
             li_parent_sync=li_parent_sync, new_be=new_be, pkgs_inst=pargs,
             refresh_catalogs=refresh_catalogs, reject_list=reject_pats,
             update_index=update_index, display_plan_cb=display_plan_cb,
@@ -1556,8 +1570,8 @@ def _install(op, api_inst, pargs, accept, act_timeout, backup_be,
 def _update(op, api_inst, pargs, accept, act_timeout, backup_be, backup_be_name,
     be_activate, be_name, force, ignore_missing, li_ignore, li_erecurse,
     li_parent_sync, new_be, noexecute, origins, parsable_version, quiet,
-    refresh_catalogs, reject_pats, show_licenses, stage, update_index, verbose,
-    display_plan_cb=None, logger=None):
+    refresh_catalogs, reject_pats, show_licenses, solver_stats, stage,
+    update_index, verbose, display_plan_cb=None, logger=None):
         """Attempt to take all installed packages specified to latest
         version."""
 
@@ -1589,10 +1603,11 @@ def _update(op, api_inst, pargs, accept, act_timeout, backup_be, backup_be_name,
             _noexecute=noexecute, _origins=origins,
             _parsable_version=parsable_version, _quiet=quiet,
             _review_release_notes=review_release_notes,
-            _show_licenses=show_licenses, _stage=stage, _verbose=verbose,
-            act_timeout=act_timeout, backup_be=backup_be,
-            backup_be_name=backup_be_name, be_activate=be_activate,
-            be_name=be_name, force=force, ignore_missing=ignore_missing,
+            _show_licenses=show_licenses, _solver_stats=solver_stats,
+            _stage=stage, _verbose=verbose, act_timeout=act_timeout,
+            backup_be=backup_be, backup_be_name=backup_be_name,
+            be_activate=be_activate, be_name=be_name, force=force,
+            ignore_missing=ignore_missing,
             li_erecurse=li_erecurse, li_parent_sync=li_parent_sync,
             new_be=new_be, pkgs_update=pkgs_update,
             refresh_catalogs=refresh_catalogs, reject_list=reject_pats,
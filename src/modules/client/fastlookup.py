@@ -0,0 +1,425 @@
+#!/usr/bin/python2.7
+#
+# CDDL HEADER START
+#
+# The contents of this file are subject to the terms of the
+# Common Development and Distribution License (the "License").
+# You may not use this file except in compliance with the License.
+#
+# You can obtain a copy of the license at usr/src/OPENSOLARIS.LICENSE
+# or http://www.opensolaris.org/os/licensing.
+# See the License for the specific language governing permissions
+# and limitations under the License.
+#
+# When distributing Covered Code, include this CDDL HEADER in each
+# file and include the License file at usr/src/OPENSOLARIS.LICENSE.
+# If applicable, add the following below this CDDL HEADER, with the
+# fields enclosed by brackets "[]" replaced with your own identifying
+# information: Portions Copyright [yyyy] [name of copyright owner]
+#
+# CDDL HEADER END
+#
+
+#
+# Copyright (c) 2026, Oracle and/or its affiliates. All rights reserved.
+#
+
+"""Support for the image's fast lookups database.
+
+The fast lookups database consists of two coordinated files kept in the
+image's action cache directory:
+
+    actions.stripped
+        A text file starting with the lines "VERSION 1" and a timestamp,
+        followed by one line of the form "<pkg fmri> <stripped action>" for
+        every globally identical action delivered by an installed package.
+        Lines are grouped by action name and key attribute value.
+
+    actions.offsets
+        A file starting with the lines "VERSION 3", the same timestamp as
+        actions.stripped, and a string identifying the image state (the set of
+        installed packages and the variant and facet settings) the database
+        was built for, followed by a
+        binary table which maps each (action name, key attribute value) pair
+        to the offset of its group of lines in actions.stripped and the number
+        of lines in that group.
+
+The binary table consists of a header containing the number of entries and the
+size of the key data, followed by one fixed-width record per entry, sorted by
+key, followed by the key data itself.  This allows the table to be memory
+mapped and searched without parsing it.
+
+The action cache directory also contains a store of the complete installed
+actions of the types most often iterated over for every installed package,
+which is kept in sync with the database:
+
+    actions.bytype
+        A text file starting with the lines "VERSION 1" and the image state
+        string, followed by one line of the form "<name> <offset> <length>"
+        for each section of the file (in the order of BYTYPE_SECTIONS) and an
+        empty line.  Each section consists of one line of the form "<pkg
+        fmri> <action>" for every action of the named type delivered by an
+        installed package; the IMPLICIT_DIRS section contains the directories
+        which are only implicitly delivered by each package.  Offsets are
+        relative to the start of the file and are written as fixed-width
+        numbers so that the header can be rewritten in place once the size
+        of each section is known."""
+
+import mmap
+import struct
+
+import pkg.actions as actions
+import pkg.fmri as fmri
+import pkg.misc as misc
+
+# Version of each of the files that comprise the database; these are written
+# as the first line of each file.
+STRIPPED_VERSION = "VERSION 1"
+OFFSETS_VERSION = "VERSION 3"
+BYTYPE_VERSION = "VERSION 1"
+
+# The types of action stored in actions.bytype.
+BYTYPE_ACTIONS = ("dir", "driver", "file", "group", "hardlink", "link", "user")
+
+# The name of the actions.bytype section containing implicit directories.
+IMPLICIT_DIRS = "dir.implicit"
+
+BYTYPE_SECTIONS = BYTYPE_ACTIONS + (IMPLICIT_DIRS,)
+
+# Format of each section entry in the actions.bytype header.
+_BYTYPE_ENTRY = "{0} {1:020d} {2:020d}\n"
+
+# Header of the binary offsets table: number of records and size of the key
+# data in bytes.
+_HEADER = struct.Struct("!II")
+
+# Each offsets record: offset and length of the entry's key in the key data,
+# offset of the entry's first line in actions.stripped, and number of lines.
+_RECORD = struct.Struct("!IIQI")
+
+
+def _encode_key(name, key):
+        """Return the byte string used to sort and search for the table entry
+        for the action 'name' and key attribute value 'key'.  The separator
+        ensures that entries sort by action name first."""
+
+        return "{0}\0{1}".format(name, misc.force_bytes(key))
+
+
+def _decode_key(bkey):
+        """Return the (action name, key attribute value) tuple for the byte
+        string 'bkey' produced by _encode_key()."""
+
+        return tuple(bkey.split("\0", 1))
+
+
+def write_offsets(fh, timestamp, state, entries):
+        """Write an actions.offsets file to the file object 'fh'.
+
+        'timestamp' is the timestamp of the actions.stripped file the offsets
+        refer to.
+
+        'state' is a string identifying the image state the database reflects.
+
+        'entries' is an iterable of (action name, key attribute value, offset,
+        count) tuples; it need not be sorted."""
+
+        records = sorted(
+            (_encode_key(name, key), offset, cnt)
+            for name, key, offset, cnt in entries
+        )
+
+        keydata = []
+        keysize = 0
+        table = []
+        for bkey, offset, cnt in records:
+                table.append(_RECORD.pack(keysize, len(bkey), offset, cnt))
+                keydata.append(bkey)
+                keysize += len(bkey)
+
+        fh.write("{0}\n{1}\n{2}\n".format(OFFSETS_VERSION, timestamp,
+            state))
+        fh.write(_HEADER.pack(len(records), keysize))
+        fh.write("".join(table))
+        fh.write("".join(keydata))
+
+
+def merge_stripped(sf, offsets, out, timestamp, gone_fmris, added):
+        """Write a new actions.stripped file to the file object 'out' which
+        reflects the contents of an existing one after the removal and
+        addition of some packages, and return the offsets for the new file.
+        Only the groups of lines that change are parsed; the rest are copied.
+
+        'sf' is the contents of the existing actions.stripped file (usually a
+        mmap object).
+
+        'offsets' is the ActionOffsets object (or equivalent dictionary) for
+        'sf'.
+
+        'timestamp' is the timestamp to write to the new file.
+
+        'gone_fmris' is a set of the string form of the FMRIs of the packages
+        whose actions should be dropped.
+
+        'added' is an iterable of (action name, key attribute value, fmri
+        string, stripped action string) tuples for the actions to add.
+
+        The return value is a tuple of a list of (action name, key attribute
+        value, offset, count) tuples suitable for passing to write_offsets()
+        and the set of (action name, key attribute value) tuples for which
+        actions were dropped or added."""
+
+        if isinstance(offsets, dict):
+                old = sorted(offsets.iteritems(),
+                    key=lambda e: _encode_key(*e[0]))
+        else:
+                old = offsets.iteritems()
+
+        new = {}
+        for name, key, fmristr, actstr in added:
+                new.setdefault(_encode_key(name, key), []).append(
+                    "{0} {1}\n".format(fmristr, actstr))
+        new_keys = sorted(new)
+
+        entries = []
+        changed = set()
+        def emit(bkey, lines):
+                if not lines:
+                        return
+                name, key = _decode_key(bkey)
+                entries.append((name, key, out.tell(), len(lines)))
+                out.write("".join(lines))
+
+        out.write("{0}\n{1}\n".format(STRIPPED_VERSION, timestamp))
+        ni = 0
+        for (name, key), (pos, cnt) in old:
+                bkey = _encode_key(name, key)
+                while ni < len(new_keys) and new_keys[ni] < bkey:
+                        changed.add(_decode_key(new_keys[ni]))
+                        emit(new_keys[ni], new[new_keys[ni]])
+                        ni += 1
+
+                lines = []
+                for i in xrange(cnt):
+                        end = sf.find("\n", pos)
+                        if end < 0:
+                                end = len(sf) - 1
+                        line = sf[pos:end + 1]
+                        pos = end + 1
+                        if line.split(None, 1)[0] not in gone_fmris:
+                                lines.append(line)
+                if len(lines) != cnt:
+                        changed.add((name, key))
+
+                if ni < len(new_keys) and new_keys[ni] == bkey:
+                        changed.add((name, key))
+                        lines.extend(new[bkey])
+                        ni += 1
+                emit(bkey, lines)
+
+        for bkey in new_keys[ni:]:
+                changed.add(_decode_key(bkey))
+                emit(bkey, new[bkey])
+        return entries, changed
+
+
+def write_bytype(fh, state, sections):
+        """Write an actions.bytype file to the file object 'fh', which must be
+        seekable.
+
+        'state' is a string identifying the image state the file reflects.
+
+        'sections' is a dictionary mapping each of BYTYPE_SECTIONS to an
+        iterable of (fmri string, action string) tuples."""
+
+        def write_header(entries):
+                fh.write("{0}\n{1}\n".format(BYTYPE_VERSION, state))
+                for name in BYTYPE_SECTIONS:
+                        offset, length = entries.get(name, (0, 0))
+                        fh.write(_BYTYPE_ENTRY.format(name, offset, length))
+                fh.write("\n")
+
+        start = fh.tell()
+        write_header({})
+        entries = {}
+        for name in BYTYPE_SECTIONS:
+                offset = fh.tell()
+                for fmristr, actstr in sections.get(name, ()):
+                        fh.write("{0} {1}\n".format(fmristr, actstr))
+                entries[name] = (offset, fh.tell() - offset)
+
+        # The header is the same size each time it's written.
+        end = fh.tell()
+        fh.seek(start)
+        write_header(entries)
+        fh.seek(end)
+
+
+class ActionsByType(object):
+        """A read-only, memory-mapped view of an actions.bytype file."""
+
+        def __init__(self, path):
+                """'path' is the pathname of the actions.bytype file.
+
+                ValueError is raised if the file is not of the expected
+                version or is truncated."""
+
+                self.__sections = {}
+                with open(path, "rb") as fh:
+                        self.version = fh.readline().rstrip()
+                        if self.version != BYTYPE_VERSION:
+                                raise ValueError(self.version)
+                        self.state = fh.readline().rstrip("\n")
+                        for name in BYTYPE_SECTIONS:
+                                l = fh.readline().split()
+                                if len(l) != 3 or l[0] != name:
+                                        raise ValueError(path)
+                                self.__sections[name] = (int(l[1]),
+                                    int(l[2]))
+                        if fh.readline() != "\n":
+                                raise ValueError(path)
+                        self.__map = mmap.mmap(fh.fileno(), 0,
+                            access=mmap.ACCESS_READ)
+
+                for offset, length in self.__sections.itervalues():
+                        if len(self.__map) < offset + length:
+                                self.__map.close()
+                                raise ValueError(path)
+
+        def gen_lines(self, name):
+                """Yield a tuple of (fmri string, action string) for each
+                entry of the section 'name'."""
+
+                offset, length = self.__sections[name]
+                end = offset + length
+                m = self.__map
+                while offset < end:
+                        eol = m.find("\n", offset, end)
+                        if eol < 0:
+                                eol = end
+                        fmristr, actstr = m[offset:eol].split(" ", 1)
+                        offset = eol + 1
+                        yield fmristr, actstr
+
+        def gen_actions(self, atype, implicit_dirs=False, pkgs=None):
+                """Yield a tuple of (action, fmri) for each stored action of
+                type 'atype'.  If 'implicit_dirs' is True and 'atype' is
+                'dir', then directories only implicitly delivered by each
+                package are included.  If 'pkgs' is not None, only the actions
+                of the packages whose FMRI strings it contains are yielded."""
+
+                names = [atype]
+                if implicit_dirs and atype == "dir":
+                        names.append(IMPLICIT_DIRS)
+
+                fmris = {}
+                for name in names:
+                        for fmristr, actstr in self.gen_lines(name):
+                                if pkgs is not None and fmristr not in pkgs:
+                                        continue
+                                try:
+                                        pfmri = fmris[fmristr]
+                                except KeyError:
+                                        pfmri = fmris[fmristr] = \
+                                            fmri.PkgFmri(fmristr)
+                                yield actions.fromstr(actstr), pfmri
+
+        def close(self):
+                """Release the mapping of the file."""
+
+                self.__map.close()
+
+
+class ActionOffsets(object):
+        """A read-only, memory-mapped view of an actions.offsets file.
+
+        Objects of this class can be used in place of a dictionary mapping
+        (action name, key attribute value) tuples to (offset, count) tuples;
+        lookups are performed using a binary search of the mapped file so no
+        parsing of the file is required."""
+
+        def __init__(self, path):
+                """'path' is the pathname of the actions.offsets file.
+
+                ValueError is raised if the file is not of the expected
+                version or is truncated."""
+
+                with open(path, "rb") as fh:
+                        self.version = fh.readline().rstrip()
+                        if self.version != OFFSETS_VERSION:
+                                raise ValueError(self.version)
+                        self.timestamp = fh.readline().rstrip()
+                        self.state = fh.readline().rstrip("\n")
+                        base = fh.tell()
+                        self.__map = mmap.mmap(fh.fileno(), 0,
+                            access=mmap.ACCESS_READ)
+
+                if len(self.__map) < base + _HEADER.size:
+                        raise ValueError(path)
+                self.__count, keysize = _HEADER.unpack_from(self.__map, base)
+                self.__recbase = base + _HEADER.size
+                self.__keybase = self.__recbase + self.__count * _RECORD.size
+                if len(self.__map) < self.__keybase + keysize:
+                        raise ValueError(path)
+
+        def __len__(self):
+                return self.__count
+
+        def __record(self, i):
+                return _RECORD.unpack_from(self.__map,
+                    self.__recbase + i * _RECORD.size)
+
+        def __key(self, koff, klen):
+                start = self.__keybase + koff
+                return self.__map[start:start + klen]
+
+        def __find(self, bkey):
+                """Return the record for 'bkey' or None if it isn't present."""
+
+                lo = 0
+                hi = self.__count
+                while lo < hi:
+                        mid = (lo + hi) // 2
+                        rec = self.__record(mid)
+                        if self.__key(rec[0], rec[1]) < bkey:
+                                lo = mid + 1
+                        else:
+                                hi = mid
+                if lo < self.__count:
+                        rec = self.__record(lo)
+                        if self.__key(rec[0], rec[1]) == bkey:
+                                return rec
+                return None
+
+        def get(self, key, default=None):
+                """Return the (offset, count) tuple for the (action name, key
+                attribute value) tuple 'key', or 'default' if there is no such
+                entry."""
+
+                rec = self.__find(_encode_key(*key))
+                if rec is None:
+                        return default
+                return rec[2], rec[3]
+
+        def __getitem__(self, key):
+                val = self.get(key)
+                if val is None:
+                        raise KeyError(key)
+                return val
+
+        def __contains__(self, key):
+                return self.__find(_encode_key(*key)) is not None
+
+        def iteritems(self):
+                """Yield each ((action name, key attribute value), (offset,
+                count)) entry in key order."""
+
+                for i in xrange(self.__count):
+                        koff, klen, offset, cnt = self.__record(i)
+                        yield _decode_key(self.__key(koff, klen)), \
+                            (offset, cnt)
+
+        def close(self):
+                """Release the mapping of the file."""
+
+                self.__map.close()
@@ -21,7 +21,7 @@
 #
 
 #
-# Copyright (c) 2007, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2007, 2026, Oracle and/or its affiliates. All rights reserved.
 #
 
 import atexit
@@ -31,6 +31,8 @@ import copy
 import datetime
 import errno
 import hashlib
+import itertools
+import mmap
 import os
 import platform
 import shutil
@@ -51,6 +53,7 @@ import pkg.actions
 import pkg.catalog
 import pkg.client.api_errors            as apx
 import pkg.client.bootenv               as bootenv
+import pkg.client.fastlookup            as fastlookup
 import pkg.client.history               as history
 import pkg.client.imageconfig           as imageconfig
 import pkg.client.imageplan             as imageplan
@@ -1142,9 +1145,9 @@ in the environment or by setting simulate_cmdpath in DebugValues.""")
 
                 # Create the new image catalogs.
                 kcat = pkg.catalog.Catalog(batch_mode=True,
-                    manifest_cb=self._manifest_cb, sign=False)
+                    manifest_cb=self._manifest_cb, sign=False, compact=True)
                 icat = pkg.catalog.Catalog(batch_mode=True,
-                    manifest_cb=self._manifest_cb, sign=False)
+                    manifest_cb=self._manifest_cb, sign=False, compact=True)
 
                 # XXX For backwards compatibility, 'upgradability' of packages
                 # is calculated and stored based on whether a given pkg stem
@@ -1660,6 +1663,12 @@ in the environment or by setting simulate_cmdpath in DebugValues.""")
         def get_root(self):
                 return self.root
 
+        def get_solver_cache_path(self):
+                """Return the pathname of the file used by the solver to cache
+                the results of catalog queries between operations."""
+
+                return os.path.join(self.__action_cache_dir, "solver.cache")
+
         def get_last_modified(self, string=False):
                 """Return the UTC time of the image's last state change or
                 None if unknown.  By default the time is returned via datetime
@@ -2773,7 +2782,8 @@ in the environment or by setting simulate_cmdpath in DebugValues.""")
                 # image upgrade or metadata refresh.  In both cases, the catalog
                 # is resorted and finalized so this is always safe to use.
                 cat = pkg.catalog.Catalog(batch_mode=True,
-                    manifest_cb=self._manifest_cb, meta_root=croot, sign=False)
+                    manifest_cb=self._manifest_cb, meta_root=croot, sign=False,
+                    compact=True)
                 return cat
 
         def __remove_catalogs(self):
@@ -2986,7 +2996,7 @@ in the environment or by setting simulate_cmdpath in DebugValues.""")
 
                 kcat = pkg.catalog.Catalog(batch_mode=True,
                     meta_root=os.path.join(tmp_state_root,
-                    self.IMG_CATALOG_KNOWN), sign=False)
+                    self.IMG_CATALOG_KNOWN), sign=False, compact=True)
 
                 # XXX if any of the below fails for any reason, the old 'known'
                 # catalog needs to be re-loaded so the client is in a consistent
@@ -3038,7 +3048,7 @@ in the environment or by setting simulate_cmdpath in DebugValues.""")
                 # Create the new installed catalog in a temporary location.
                 icat = pkg.catalog.Catalog(batch_mode=True,
                     meta_root=os.path.join(tmp_state_root,
-                    self.IMG_CATALOG_INSTALLED), sign=False)
+                    self.IMG_CATALOG_INSTALLED), sign=False, compact=True)
 
                 excludes = self.list_excludes()
 
@@ -3499,24 +3509,19 @@ in the environment or by setting simulate_cmdpath in DebugValues.""")
                 attribute value to the action string comprising the unique
                 attributes of the action, for all installed actions.  This is
                 done with a file mapping the tuple to an offset into a second
-                file, where those actions are kept.  Once the offsets are loaded
-                into memory, it is simple to seek into the second file to the
+                file, where those actions are kept.  Once the offsets are
+                looked up, it is simple to seek into the second file to the
                 given offset and read until you hit an action that doesn't
-                match."""
+                match.  See pkg.client.fastlookup for the file formats."""
 
                 if not progtrack:
                         progtrack = progress.NullProgressTracker()
 
                 self.__actdict = None
                 self.__actdict_timestamp = None
-                stripped_path = os.path.join(self.__action_cache_dir,
-                    "actions.stripped")
-                offsets_path = os.path.join(self.__action_cache_dir,
-                    "actions.offsets")
-                conflicting_keys_path = os.path.join(self.__action_cache_dir,
-                    "keys.conflicting")
 
                 excludes = self.list_excludes()
+                state = self._get_fast_lookups_state()
                 heap = []
 
                 # nsd is the "name-space dictionary."  It maps action name
@@ -3528,11 +3533,18 @@ in the environment or by setting simulate_cmdpath in DebugValues.""")
 
                 from heapq import heappush, heappop
 
+                # bytype maps each section of the actions.bytype file to a
+                # list of (fmri string, action string) tuples.
+                bytype = {}
+
                 progtrack.job_start(progtrack.JOB_FAST_LOOKUP)
 
                 for pfmri in self.gen_installed_pkgs():
                         progtrack.job_add_progress(progtrack.JOB_FAST_LOOKUP)
                         m = self.get_manifest(pfmri, ignore_excludes=True)
+                        for name, item in self.__gen_bytype_lines(pfmri, m,
+                            excludes):
+                                bytype.setdefault(name, []).append(item)
                         for act in m.gen_actions(excludes=excludes):
                                 if not act.globally_identical:
                                         continue
@@ -3553,18 +3565,21 @@ in the environment or by setting simulate_cmdpath in DebugValues.""")
                 # stripped actions file.
                 try:
                         actdict = {}
+                        offsets = []
                         sf, sp = self.temporary_file(close=False)
                         of, op = self.temporary_file(close=False)
                         bf, bp = self.temporary_file(close=False)
+                        tf, tp = self.temporary_file(close=False)
 
                         sf = os.fdopen(sf, "wb")
                         of = os.fdopen(of, "wb")
                         bf = os.fdopen(bf, "wb")
+                        tf = os.fdopen(tf, "wb")
 
                         # We need to make sure the files are coordinated.
                         timestamp = int(time.time())
-                        sf.write("VERSION 1\n{0}\n".format(timestamp))
-                        of.write("VERSION 2\n{0}\n".format(timestamp))
+                        sf.write("{0}\n{1}\n".format(
+                            fastlookup.STRIPPED_VERSION, timestamp))
                         # The conflicting keys file doesn't need a timestamp
                         # because it's not coordinated with the stripped or
                         # offsets files and the result of loading it isn't
@@ -3591,9 +3606,9 @@ in the environment or by setting simulate_cmdpath in DebugValues.""")
                                                 last_key = key
                                         else:
                                                 assert cnt > 0
-                                                of.write("{0} {1} {2} {3}\n".format(
-                                                    last_name, last_offset,
-                                                    cnt, last_key))
+                                                offsets.append((last_name,
+                                                    last_key, last_offset,
+                                                    cnt))
                                                 actdict[(last_name, last_key)] = last_offset, cnt
                                                 last_name, last_key, last_offset = \
                                                     act.name, key, sf.tell()
@@ -3605,11 +3620,15 @@ in the environment or by setting simulate_cmdpath in DebugValues.""")
                                 assert last_key is not None
                                 assert last_offset is not None
                                 assert cnt > 0
-                                of.write("{0} {1} {2} {3}\n".format(
-                                    last_name, last_offset, cnt, last_key))
+                                offsets.append((last_name, last_key,
+                                    last_offset, cnt))
                                 actdict[(last_name, last_key)] = \
                                     last_offset, cnt
 
+                        fastlookup.write_offsets(of, timestamp, state,
+                            offsets)
+                        fastlookup.write_bytype(tf, state, bytype)
+                        bytype = None
                         progtrack.job_add_progress(progtrack.JOB_FAST_LOOKUP)
 
                         bad_keys = imageplan.ImagePlan._check_actions(nsd)
@@ -3620,21 +3639,62 @@ in the environment or by setting simulate_cmdpath in DebugValues.""")
                         sf.close()
                         of.close()
                         bf.close()
+                        tf.close()
                         os.chmod(sp, misc.PKG_FILE_MODE)
                         os.chmod(op, misc.PKG_FILE_MODE)
                         os.chmod(bp, misc.PKG_FILE_MODE)
+                        os.chmod(tp, misc.PKG_FILE_MODE)
                 except BaseException as e:
                         try:
                                 os.unlink(sp)
                                 os.unlink(op)
                                 os.unlink(bp)
+                                os.unlink(tp)
                         except:
                                 pass
                         raise
 
                 progtrack.job_add_progress(progtrack.JOB_FAST_LOOKUP)
+                self.__install_fast_lookups(sp, op, bp, tp)
+                progtrack.job_add_progress(progtrack.JOB_FAST_LOOKUP)
+                progtrack.job_done(progtrack.JOB_FAST_LOOKUP)
+                return actdict, timestamp
+
+        @staticmethod
+        def __gen_bytype_lines(pfmri, m, excludes):
+                """Yield a tuple of (section name, (fmri string, action
+                string)) for each entry of the actions.bytype file (see
+                pkg.client.fastlookup) for the package 'pfmri' with manifest
+                'm'."""
+
+                fstr = str(pfmri)
+                dirs = set()
+                for act in m.gen_actions_by_types(fastlookup.BYTYPE_ACTIONS,
+                    excludes=excludes):
+                        if act.name == "dir":
+                                dirs.add(act.attrs["path"])
+                        yield act.name, (fstr, str(act))
+
+                da = pkg.actions.directory.DirectoryAction
+                for d in m.get_directories(excludes):
+                        if d not in dirs:
+                                yield fastlookup.IMPLICIT_DIRS, (fstr,
+                                    str(da(path=d, implicit="true")))
+
+        def __install_fast_lookups(self, sp, op, bp, tp):
+                """Rename the temporary stripped actions, offsets, conflicting
+                keys, and actions by type files at 'sp', 'op', 'bp', and 'tp'
+                into place as the image's fast lookups database."""
+
+                stripped_path = os.path.join(self.__action_cache_dir,
+                    "actions.stripped")
+                offsets_path = os.path.join(self.__action_cache_dir,
+                    "actions.offsets")
+                conflicting_keys_path = os.path.join(self.__action_cache_dir,
+                    "keys.conflicting")
+                bytype_path = os.path.join(self.__action_cache_dir,
+                    "actions.bytype")
 
-                # Finally, rename the temporary files into their final place.
                 # If we have any problems, do our best to remove them, and we'll
                 # try to recreate them on the read-side.
                 try:
@@ -3643,6 +3703,7 @@ in the environment or by setting simulate_cmdpath in DebugValues.""")
                         portable.rename(sp, stripped_path)
                         portable.rename(op, offsets_path)
                         portable.rename(bp, conflicting_keys_path)
+                        portable.rename(tp, bytype_path)
                 except EnvironmentError as e:
                         if e.errno == errno.EACCES or e.errno == errno.EROFS:
                                 self.__action_cache_dir = self.temporary_dir()
@@ -3652,22 +3713,228 @@ in the environment or by setting simulate_cmdpath in DebugValues.""")
                                     self.__action_cache_dir, "actions.offsets")
                                 conflicting_keys_path = os.path.join(
                                     self.__action_cache_dir, "keys.conflicting")
+                                bytype_path = os.path.join(
+                                    self.__action_cache_dir, "actions.bytype")
                                 portable.rename(sp, stripped_path)
                                 portable.rename(op, offsets_path)
                                 portable.rename(bp, conflicting_keys_path)
+                                portable.rename(tp, bytype_path)
                         else:
                                 exc_info = sys.exc_info()
                                 try:
                                         os.unlink(stripped_path)
                                         os.unlink(offsets_path)
                                         os.unlink(conflicting_keys_path)
+                                        os.unlink(bytype_path)
                                 except:
                                         pass
                                 raise exc_info[0], exc_info[1], exc_info[2]
 
+        def _get_fast_lookups_state(self):
+                """Return a string identifying the state of the image that the
+                fast lookups database reflects: a digest of the set of
+                installed packages and of the variant and facet settings which
+                determine the actions they deliver.  Unlike the image's last
+                modified time, this doesn't change when catalogs are
+                refreshed."""
+
+                h = hashlib.sha1()
+                for fstr in sorted(str(f) for f in self.gen_installed_pkgs()):
+                        h.update("{0}\n".format(fstr))
+                for vcs in (self.cfg.variants, self.cfg.facets):
+                        for name, value in sorted(vcs.iteritems()):
+                                h.update("{0}={1}\n".format(name, value))
+                return h.hexdigest()
+
+        def _update_fast_lookups(self, pkg_pairs, old_state, progtrack=None):
+                """Update the on-disk database created by _create_fast_lookups
+                in place to reflect a change to the set of installed packages,
+                so that the cost scales with the size of the change rather than
+                with the number of installed packages.
+
+                'pkg_pairs' is an iterable of (destination, origin) FMRI tuples
+                as passed to update_pkg_installed_state().
+
+                'old_state' is the value _get_fast_lookups_state() returned
+                before the change was made.  If the existing database doesn't
+                reflect that state (because it's missing, out of date, or from
+                an older client), or it can't be read, it is rebuilt from
+                scratch instead.  The variant and facet settings of the image
+                must not have changed."""
+
+                if not progtrack:
+                        progtrack = progress.NullProgressTracker()
+
+                self.__actdict = None
+                self.__actdict_timestamp = None
+
+                stripped_path = os.path.join(self.__action_cache_dir,
+                    "actions.stripped")
+                try:
+                        offsets = fastlookup.ActionOffsets(os.path.join(
+                            self.__action_cache_dir, "actions.offsets"))
+                        sf = open(stripped_path, "rb")
+                        bad_keys = self._load_conflicting_keys()
+                        bytype = fastlookup.ActionsByType(os.path.join(
+                            self.__action_cache_dir, "actions.bytype"))
+                except (EnvironmentError, ValueError):
+                        return self._create_fast_lookups(progtrack=progtrack)
+
+                try:
+                        sversion = sf.readline().rstrip()
+                        stimestamp = sf.readline().rstrip()
+                        if sversion != fastlookup.STRIPPED_VERSION or \
+                            stimestamp != offsets.timestamp or \
+                            offsets.state != old_state or bad_keys is None or \
+                            bytype.state != old_state:
+                                raise ValueError(stripped_path)
+                        # The new timestamp must differ from the old one so
+                        # that any cached offsets aren't mistaken for current.
+                        timestamp = max(int(time.time()),
+                            int(offsets.timestamp) + 1)
+                except ValueError:
+                        sf.close()
+                        offsets.close()
+                        bytype.close()
+                        return self._create_fast_lookups(progtrack=progtrack)
+
+                progtrack.job_start(progtrack.JOB_FAST_LOOKUP)
+
+                excludes = self.list_excludes()
+                gone_fmris = set()
+                added = []
+                added_bytype = {}
+                for dest, origin in pkg_pairs:
+                        if dest == origin:
+                                continue
+                        if origin:
+                                gone_fmris.add(str(origin))
+                        if not dest:
+                                continue
+                        progtrack.job_add_progress(progtrack.JOB_FAST_LOOKUP)
+                        m = self.get_manifest(dest, ignore_excludes=True)
+                        for name, item in self.__gen_bytype_lines(dest, m,
+                            excludes):
+                                added_bytype.setdefault(name, []).append(item)
+                        for act in m.gen_actions(excludes=excludes):
+                                if not act.globally_identical:
+                                        continue
+                                act.strip()
+                                added.append((act.name,
+                                    act.attrs[act.key_attr], str(dest),
+                                    str(act)))
+
+                # As in _create_fast_lookups, the new database is written to
+                # temporary files that are only renamed into place once
+                # complete.
+                try:
+                        sfd, sp = self.temporary_file(close=False)
+                        ofd, op = self.temporary_file(close=False)
+                        bfd, bp = self.temporary_file(close=False)
+                        tfd, tp = self.temporary_file(close=False)
+
+                        nsf = os.fdopen(sfd, "wb")
+                        of = os.fdopen(ofd, "wb")
+                        bf = os.fdopen(bfd, "wb")
+                        tf = os.fdopen(tfd, "wb")
+
+                        msf = mmap.mmap(sf.fileno(), 0, access=mmap.ACCESS_READ)
+                        try:
+                                entries, changed = fastlookup.merge_stripped(
+                                    msf, offsets, nsf, timestamp, gone_fmris,
+                                    added)
+                        finally:
+                                msf.close()
+                                sf.close()
+                                offsets.close()
+                        nsf.close()
+                        progtrack.job_add_progress(progtrack.JOB_FAST_LOOKUP)
+
+                        state = self._get_fast_lookups_state()
+                        fastlookup.write_offsets(of, timestamp, state,
+                            entries)
+                        of.close()
+                        progtrack.job_add_progress(progtrack.JOB_FAST_LOOKUP)
+
+                        # The actions of the packages that remain are copied
+                        # from the existing actions.bytype file.
+                        try:
+                                fastlookup.write_bytype(tf, state, dict(
+                                    (name, itertools.chain(
+                                        (
+                                            item
+                                            for item in bytype.gen_lines(name)
+                                            if item[0] not in gone_fmris
+                                        ),
+                                        added_bytype.get(name, ())))
+                                    for name in fastlookup.BYTYPE_SECTIONS
+                                ))
+                        finally:
+                                bytype.close()
+                        tf.close()
+                        progtrack.job_add_progress(progtrack.JOB_FAST_LOOKUP)
+
+                        # Only keys for which actions were added or dropped
+                        # can have changed whether they conflict, so only
+                        # those are re-checked.
+                        changed_keys = set(k for n, k in changed)
+                        bad_keys -= changed_keys
+                        bad_keys |= imageplan.ImagePlan._check_actions(
+                            self.__load_fast_lookups_nsd(sp, entries,
+                            changed_keys))
+                        bf.write("VERSION 1\n")
+                        for k in sorted(bad_keys):
+                                bf.write("{0}\n".format(k))
+                        bf.close()
+
+                        os.chmod(sp, misc.PKG_FILE_MODE)
+                        os.chmod(op, misc.PKG_FILE_MODE)
+                        os.chmod(bp, misc.PKG_FILE_MODE)
+                        os.chmod(tp, misc.PKG_FILE_MODE)
+                except BaseException as e:
+                        try:
+                                os.unlink(sp)
+                                os.unlink(op)
+                                os.unlink(bp)
+                                os.unlink(tp)
+                        except:
+                                pass
+                        raise
+
                 progtrack.job_add_progress(progtrack.JOB_FAST_LOOKUP)
+                self.__install_fast_lookups(sp, op, bp, tp)
                 progtrack.job_done(progtrack.JOB_FAST_LOOKUP)
-                return actdict, timestamp
+
+        @staticmethod
+        def __load_fast_lookups_nsd(stripped_path, entries, keys):
+                """Return a namespace dictionary (see _create_fast_lookups) of
+                the actions in the stripped actions file at 'stripped_path'
+                whose key attribute value is in 'keys'.  'entries' is the list
+                of (action name, key, offset, count) tuples describing the
+                file."""
+
+                nsd = {}
+                fmri_dict = {}
+                with open(stripped_path, "rb") as sf:
+                        for name, key, offset, cnt in entries:
+                                if key not in keys:
+                                        continue
+                                sf.seek(offset)
+                                for i in xrange(cnt):
+                                        fmristr, actstr = \
+                                            sf.readline().rstrip().split(None,
+                                            1)
+                                        act = pkg.actions.fromstr(actstr)
+                                        try:
+                                                pfmri = fmri_dict[fmristr]
+                                        except KeyError:
+                                                pfmri = pkg.fmri.PkgFmri(
+                                                    fmristr)
+                                                fmri_dict[fmristr] = pfmri
+                                        nsd.setdefault(act.namespace_group,
+                                            {}).setdefault(key, []).append(
+                                            (act, pfmri))
+                return nsd
 
         def _remove_fast_lookups(self):
                 """Remove on-disk database created by _create_fast_lookups.
@@ -3676,7 +3943,7 @@ in the environment or by setting simulate_cmdpath in DebugValues.""")
                 interrupted."""
 
                 for fname in ("actions.stripped", "actions.offsets",
-                    "keys.conflicting"):
+                    "keys.conflicting", "actions.bytype"):
                         try:
                                 portable.remove(os.path.join(
                                     self.__action_cache_dir, fname))
@@ -3686,13 +3953,18 @@ in the environment or by setting simulate_cmdpath in DebugValues.""")
                                 raise apx._convert_error(e)
 
         def _load_actdict(self, progtrack):
-                """Read the file of offsets created in _create_fast_lookups()
-                and return the dictionary mapping action name and key value to
-                offset."""
+                """Return an object mapping action name and key value to
+                offset in the file of stripped actions created by
+                _create_fast_lookups().  The object returned is either a
+                dictionary or a pkg.client.fastlookup.ActionOffsets object
+                providing a read-only, memory-mapped view of the file of
+                offsets; in either case, its get() method can be used to
+                perform lookups."""
 
+                offsets_path = os.path.join(self.__action_cache_dir,
+                    "actions.offsets")
                 try:
-                        of = open(os.path.join(self.__action_cache_dir,
-                            "actions.offsets"), "rb")
+                        of = open(offsets_path, "rb")
                 except IOError as e:
                         if e.errno != errno.ENOENT:
                                 raise
@@ -3705,6 +3977,7 @@ in the environment or by setting simulate_cmdpath in DebugValues.""")
                 # Make sure the files are paired, and try to create them if not.
                 oversion = of.readline().rstrip()
                 otimestamp = of.readline().rstrip()
+                of.close()
 
                 # The original action.offsets file existed and had the same
                 # timestamp as the stored actdict, so that actdict can be
@@ -3717,37 +3990,35 @@ in the environment or by setting simulate_cmdpath in DebugValues.""")
 
                 # If we recognize neither file's version or their timestamps
                 # don't match, then we blow them away and try again.
-                if oversion != "VERSION 2" or sversion != "VERSION 1" or \
-                    stimestamp != otimestamp:
-                        of.close()
+                actdict = None
+                if oversion == fastlookup.OFFSETS_VERSION and \
+                    sversion == fastlookup.STRIPPED_VERSION and \
+                    stimestamp == otimestamp:
+                        # At this point, the original actions.offsets file
+                        # existed, no actdict was saved in the image, the
+                        # versions matched what was expected, and the
+                        # timestamps of the actions.offsets and
+                        # actions.stripped files matched, so the
+                        # actions.offsets file can simply be mapped.
+                        try:
+                                actdict = fastlookup.ActionOffsets(
+                                    offsets_path)
+                        except ValueError:
+                                # Truncated or replaced since it was checked
+                                # above; recreate it.
+                                pass
+
+                if actdict is None or actdict.timestamp != otimestamp or \
+                    actdict.state != self._get_fast_lookups_state():
+                        # The database doesn't reflect the image's current
+                        # state (e.g. an operation was interrupted after the
+                        # package state was updated); recreate it.
                         actdict, otimestamp = self._create_fast_lookups()
                         assert actdict is not None
-                        self.__actdict = actdict
-                        self.__actdict_timestamp = otimestamp
-                        return actdict
-
-                # At this point, the original actions.offsets file existed, no
-                # actdict was saved in the image, the versions matched what was
-                # expected, and the timestamps of the actions.offsets and
-                # actions.stripped files matched, so the actions.offsets file is
-                # parsed to generate actdict.
-                actdict = {}
-
-                for line in of:
-                        actname, offset, cnt, key_attr = \
-                            line.rstrip().split(None, 3)
-                        off = int(offset)
-                        actdict[(actname, key_attr)] = (off, int(cnt))
-
-                        # This is a tight loop, so try to avoid burning
-                        # CPU calling into the progress tracker excessively.
-                        # Since we are already using the offset, we use that
-                        # to damp calls back into the progress tracker.
-                        if off % 500 == 0:
-                                progtrack.plan_add_progress(
-                                    progtrack.PLAN_ACTION_CONFLICT)
+                else:
+                        progtrack.plan_add_progress(
+                            progtrack.PLAN_ACTION_CONFLICT)
 
-                of.close()
                 self.__actdict = actdict
                 self.__actdict_timestamp = otimestamp
                 return actdict
@@ -3782,6 +4053,24 @@ in the environment or by setting simulate_cmdpath in DebugValues.""")
                                 return None
                         raise
 
+        def _load_actions_bytype(self):
+                """Return a pkg.client.fastlookup.ActionsByType object for the
+                installed actions of each of the types in
+                pkg.client.fastlookup.BYTYPE_ACTIONS, or None if the store of
+                those actions doesn't exist or doesn't reflect the image's
+                current state.  The caller is responsible for closing the
+                object returned."""
+
+                try:
+                        bytype = fastlookup.ActionsByType(os.path.join(
+                            self.__action_cache_dir, "actions.bytype"))
+                except (EnvironmentError, ValueError):
+                        return None
+                if bytype.state != self._get_fast_lookups_state():
+                        bytype.close()
+                        return None
+                return bytype
+
         def gen_installed_actions_bytype(self, atype, implicit_dirs=False):
                 """Iterates through the installed actions of type 'atype'.  If
                 'implicit_dirs' is True and 'atype' is 'dir', then include
@@ -3791,6 +4080,18 @@ in the environment or by setting simulate_cmdpath in DebugValues.""")
                 if implicit_dirs and atype != "dir":
                         implicit_dirs = False
 
+                bytype = None
+                if atype in fastlookup.BYTYPE_ACTIONS:
+                        bytype = self._load_actions_bytype()
+                if bytype is not None:
+                        try:
+                                for act, pfmri in bytype.gen_actions(atype,
+                                    implicit_dirs=implicit_dirs):
+                                        yield act, pfmri
+                        finally:
+                                bytype.close()
+                        return
+
                 excludes = self.list_excludes()
 
                 for pfmri in self.gen_installed_pkgs():
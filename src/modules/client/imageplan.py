@@ -21,7 +21,7 @@
 #
 
 #
-# Copyright (c) 2007, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2007, 2026, Oracle and/or its affiliates. All rights reserved.
 #
 
 from __future__ import print_function
@@ -49,6 +49,7 @@ import pkg.actions
 import pkg.actions.driver as driver
 import pkg.catalog
 import pkg.client.api_errors as api_errors
+import pkg.client.fastlookup as fastlookup
 import pkg.client.indexer as indexer
 import pkg.client.linkedimage.zone as zone
 import pkg.client.pkg_solver as pkg_solver
@@ -69,6 +70,10 @@ from pkg.mediator import mediator_impl_matches
 from pkg.client.pkgdefs import (PKG_OP_DEHYDRATE, PKG_OP_REHYDRATE, MSG_ERROR,
     MSG_WARNING, MSG_INFO)
 
+# Types of actions that may be executed concurrently with other actions of the
+# same type during plan execution; see ImagePlan.__execute_actions().
+PARALLEL_ACTION_TYPES = frozenset(("file", "hardlink", "link"))
+
 class ImagePlan(object):
         """ImagePlan object contains the plan for changing the image...
         there are separate routines for planning the various types of
@@ -625,7 +630,8 @@ class ImagePlan(object):
                             variants,
                             avoid_set,
                             self.image.linked.parent_fmris(),
-                            self.__progtrack)
+                            self.__progtrack,
+                            cache_path=self.image.get_solver_cache_path())
 
                         if reject_set:
                                 self.__set_pkg_actuators(reject_set,
@@ -670,6 +676,7 @@ class ImagePlan(object):
                 self.__add_pkg_actuators_to_pd(reject_set)
 
                 self.pd._solver_summary = str(solver)
+                self.pd._solver_stats = solver.get_stats()
                 if DebugValues["plan"]:
                         self.pd._solver_errors = solver.get_trim_errors()
 
@@ -1212,7 +1219,8 @@ class ImagePlan(object):
                             self.image.get_variants(),
                             self.image.avoid_set_get(),
                             self.image.linked.parent_fmris(),
-                            self.__progtrack)
+                            self.__progtrack,
+                            cache_path=self.image.get_solver_cache_path())
 
                         # check for triggered ops
                         self.__set_pkg_actuators(pkgs_to_uninstall,
@@ -1241,6 +1249,7 @@ class ImagePlan(object):
                     [x.pkg_name for x in proposed_removals])
 
                 self.pd._solver_summary = str(solver)
+                self.pd._solver_stats = solver.get_stats()
                 if DebugValues["plan"]:
                         self.pd._solver_errors = solver.get_trim_errors()
 
@@ -1288,7 +1297,8 @@ class ImagePlan(object):
                             self.image.get_variants(),
                             self.image.avoid_set_get(),
                             self.image.linked.parent_fmris(),
-                            self.__progtrack)
+                            self.__progtrack,
+                            cache_path=self.image.get_solver_cache_path())
 
                         if reject_set:
                                 self.__set_pkg_actuators(reject_set,
@@ -1332,6 +1342,7 @@ class ImagePlan(object):
                 self.__add_pkg_actuators_to_pd(reject_set)
 
                 self.pd._solver_summary = str(solver)
+                self.pd._solver_stats = solver.get_stats()
                 if DebugValues["plan"]:
                         self.pd._solver_errors = solver.get_trim_errors()
 
@@ -1780,9 +1791,40 @@ class ImagePlan(object):
                 """Generates actions of type 'atype' from the packages in the
                 future image."""
 
+                if atype in fastlookup.BYTYPE_ACTIONS and \
+                    not self.pd._varcets_change:
+                        bytype = self.image._load_actions_bytype()
+                        if bytype is not None:
+                                return self.__gen_new_actions_bytype_stored(
+                                    bytype, atype, implicit_dirs)
+
                 return self.__gen_star_actions_bytype(atype,
                     self.gen_new_installed_pkgs, implicit_dirs=implicit_dirs)
 
+        def __gen_new_actions_bytype_stored(self, bytype, atype,
+            implicit_dirs):
+                """Generate actions of type 'atype' from the packages in the
+                future image using the image's store of installed actions by
+                type (the pkg.client.fastlookup.ActionsByType object 'bytype')
+                for the packages which remain installed, so that only the
+                manifests of the packages being installed or updated need to
+                be read."""
+
+                new_fmris = set(self.gen_new_installed_pkgs())
+                installed = set(self.image.gen_installed_pkgs())
+                try:
+                        for act, pfmri in bytype.gen_actions(atype,
+                            implicit_dirs=implicit_dirs,
+                            pkgs=set(str(f) for f in new_fmris & installed)):
+                                yield act, pfmri
+                finally:
+                        bytype.close()
+
+                added = new_fmris - installed
+                for act, pfmri in self.__gen_star_actions_bytype(atype,
+                    lambda: iter(added), implicit_dirs=implicit_dirs):
+                        yield act, pfmri
+
         def gen_only_new_installed_actions_bytype(self, atype,
             implicit_dirs=False, excludes=misc.EmptyI):
                 """Generates actions of type 'atype' from packages being
@@ -4541,11 +4583,14 @@ class ImagePlan(object):
                 # image before the current operation is performed is desired.
                 empty_image = self.__is_image_empty()
 
+                # Record the state the fast lookups database should reflect
+                # so that it can be updated incrementally afterwards.  If
+                # execution is interrupted, the database no longer matches
+                # the image's state and is recreated the next time it's used.
+                fast_lookups_state = None
                 if not empty_image:
-                        # Before proceeding, remove fast lookups database so
-                        # that if _create_fast_lookups is interrupted later the
-                        # client isn't left with invalid state.
-                        self.image._remove_fast_lookups()
+                        fast_lookups_state = \
+                            self.image._get_fast_lookups_state()
 
                 if not self.image.is_liveroot():
                         # Check if the child is a running zone. If so run the
@@ -4580,11 +4625,10 @@ class ImagePlan(object):
                                     len(self.pd.update_actions))
 
                                 # execute removals
-                                for p, src, dest in self.pd.removal_actions:
-                                        p.execute_removal(src, dest)
-                                        pt.actions_add_progress(
-                                            pt.ACTION_REMOVE)
-                                pt.actions_done(pt.ACTION_REMOVE)
+                                self.__execute_actions(
+                                    self.pd.removal_actions,
+                                    lambda ap: ap.p.execute_removal(ap.src,
+                                    ap.dst), pt.ACTION_REMOVE)
 
                                 # Update driver alias database to reflect the
                                 # aliases drivers have lost in the new image.
@@ -4600,23 +4644,21 @@ class ImagePlan(object):
                                 self.pd.removal_actions = []
 
                                 # execute installs
-                                for p, src, dest in self.pd.install_actions:
-                                        p.execute_install(src, dest)
-                                        pt.actions_add_progress(
-                                            pt.ACTION_INSTALL)
-                                pt.actions_done(pt.ACTION_INSTALL)
+                                self.__execute_actions(
+                                    self.pd.install_actions,
+                                    lambda ap: ap.p.execute_install(ap.src,
+                                    ap.dst), pt.ACTION_INSTALL)
 
                                 # Done with installs, so discard them so memory
                                 # can be re-used.
                                 self.pd.install_actions = []
 
                                 # execute updates
-                                for p, src, dest in self.pd.update_actions:
-                                        p.execute_update(src, dest)
-                                        pt.actions_add_progress(
-                                            pt.ACTION_UPDATE)
+                                self.__execute_actions(
+                                    self.pd.update_actions,
+                                    lambda ap: ap.p.execute_update(ap.src,
+                                    ap.dst), pt.ACTION_UPDATE)
 
-                                pt.actions_done(pt.ACTION_UPDATE)
                                 pt.actions_all_done()
                                 pt.set_major_phase(pt.PHASE_FINALIZE)
 
@@ -4701,7 +4743,14 @@ class ImagePlan(object):
                 else:
                         self.pd._actuators.exec_post_actuators(self.image)
 
-                self.image._create_fast_lookups(progtrack=self.__progtrack)
+                if fast_lookups_state is None or self.pd._varcets_change:
+                        # A change to variants or facets can change the set of
+                        # actions delivered by every package.
+                        self.image._create_fast_lookups(
+                            progtrack=self.__progtrack)
+                else:
+                        self.image._update_fast_lookups(executed_pp,
+                            fast_lookups_state, progtrack=self.__progtrack)
                 self.__save_release_notes()
 
                 # success
@@ -4775,6 +4824,84 @@ class ImagePlan(object):
                         if self.__preexecuted_indexing_error is not None:
                                 raise self.__preexecuted_indexing_error
 
+        @staticmethod
+        def __get_exec_concurrency():
+                """Return the number of worker threads to use when executing
+                the actions in a plan; this is the client concurrency setting,
+                with zero or a negative value meaning one thread per online
+                processor."""
+
+                concurrency = global_settings.client_concurrency
+                if concurrency <= 0:
+                        return misc.get_ncpus()
+                return concurrency
+
+        def __execute_actions(self, actions, execfunc, actionid):
+                """Execute each of the _ActionPlan objects in 'actions', which
+                must already be sorted in execution order, by calling
+                'execfunc' on it and record progress against the action phase
+                'actionid'.
+
+                If the client concurrency setting permits it, runs of
+                consecutive actions of the same type in PARALLEL_ACTION_TYPES
+                are dispatched to a pool of worker threads.  Since actions are
+                sorted by type, the directories such actions need already
+                exist (and files that hardlinks target have already been
+                installed) by the time a run is reached.  Actions that rely on
+                state shared with other actions in the plan (save_file and
+                preserve), actions whose path is already part of the current
+                run, and hardlinks targeting a path in the current run force
+                the run to be completed before they are executed."""
+
+                pt = self.__progtrack
+                pt.actions_start(actionid)
+
+                nworkers = self.__get_exec_concurrency()
+                if nworkers <= 1:
+                        for ap in actions:
+                                execfunc(ap)
+                                pt.actions_add_progress(actionid)
+                        pt.actions_done(actionid)
+                        return
+
+                def flush(run):
+                        if not run:
+                                return
+                        if len(run) == 1:
+                                execfunc(run[0])
+                                pt.actions_add_progress(actionid)
+                                return
+                        for ap in misc.threaded_imap(execfunc, run, nworkers):
+                                pt.actions_add_progress(actionid)
+
+                run = []
+                run_type = None
+                run_paths = set()
+                for ap in actions:
+                        act = ap.dst or ap.src
+                        attrs = act.attrs
+                        if act.name not in PARALLEL_ACTION_TYPES or \
+                            "save_file" in attrs or "preserve" in attrs:
+                                flush(run)
+                                run = []
+                                run_paths = set()
+                                execfunc(ap)
+                                pt.actions_add_progress(actionid)
+                                continue
+
+                        path = attrs["path"]
+                        if act.name != run_type or path in run_paths or \
+                            (act.name == "hardlink" and
+                            act.get_target_path() in run_paths):
+                                flush(run)
+                                run = []
+                                run_paths = set()
+                        run.append(ap)
+                        run_paths.add(path)
+                        run_type = act.name
+                flush(run)
+                pt.actions_done(actionid)
+
         def __is_image_empty(self):
                 try:
                         self.image.gen_installed_pkg_names().next()
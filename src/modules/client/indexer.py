@@ -34,9 +34,9 @@ from pkg.misc import EmptyI
 
 class Indexer(indexer.Indexer):
         def __init__(self, image, get_manf_func, get_manifest_path,
-            progtrack=None, excludes=EmptyI):
+            progtrack=None, excludes=EmptyI, jobs=1):
                 indexer.Indexer.__init__(self, image.index_dir, get_manf_func,
-                    get_manifest_path, progtrack, excludes)
+                    get_manifest_path, progtrack, excludes, jobs=jobs)
                 self.image = image
                 self._data_dict['full_fmri_hash'] = \
                     ss.IndexStoreSetHash('full_fmri_list.hash')
@@ -82,6 +82,7 @@ REJECT_PATS           = "reject_pats"
 REQUIRE_BACKUP_BE     = "require_backup_be"
 REQUIRE_NEW_BE        = "require_new_be"
 SHOW_LICENSES         = "show_licenses"
+SOLVER_STATS          = "solver_stats"
 STAGE                 = "stage"
 SUMMARY               = "summary"
 TAGGED                = "tagged"
@@ -1039,6 +1040,10 @@ opts_table_stage = [
     (STAGE,                None, [], {"type": ["null", "string"]}),
 ]
 
+opts_table_solver_stats = [
+    (SOLVER_STATS,         None, [], {"type": ["null", "string"]}),
+]
+
 opts_table_missing = [
     (IGNORE_MISSING,       False, [], {"type": "boolean"}),
 ]
@@ -1078,6 +1083,7 @@ opts_main = \
 
 opts_install = \
     opts_main + \
+    opts_table_solver_stats + \
     opts_table_stage + \
     opts_table_li_recurse + \
     opts_table_actuators + \
@@ -1099,6 +1105,7 @@ opts_update = \
     opts_main + \
     opts_table_force + \
     opts_table_li_recurse + \
+    opts_table_solver_stats + \
     opts_table_stage + \
     opts_table_actuators + \
     opts_table_missing + \
@@ -21,13 +21,18 @@
 #
 
 #
-# Copyright (c) 2007, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2007, 2026, Oracle and/or its affiliates. All rights reserved.
 #
 
 """Provides the interfaces and exceptions needed to determine which packages
 should be installed, updated, or removed to perform a requested operation."""
 
+import errno
 import operator
+import os
+import resource
+import simplejson as json
+import tempfile
 import time
 
 import pkg.actions
@@ -37,6 +42,7 @@ import pkg.client.api_errors as api_errors
 import pkg.client.image
 import pkg.fmri
 import pkg.misc as misc
+import pkg.portable as portable
 import pkg.solver
 import pkg.version           as version
 
@@ -112,19 +118,122 @@ class DependencyException(Exception):
                 return self.__reason
 
 
+class SolverCache(object):
+        """A persistent cache of the results of those catalog queries made by
+        the solver that depend only on the content of the catalog, so that
+        they need not be recomputed by every operation.
+
+        At present, this is the range of versions of a package that match
+        each dependency.  Matching versions requires comparing the dependency
+        with every version of the package in the catalog, which dominates the
+        time taken to generate the dependency clauses for large catalogs.
+
+        The cache is stored as a JSON file and is discarded whenever its key
+        (which identifies the content of the catalog) changes."""
+
+        VERSION = 1
+
+        def __init__(self, path, key):
+                """'path' is the pathname of the file the cache is stored in.
+
+                'key' is a string identifying the content of the catalog the
+                cached results were computed from."""
+
+                self.__path = path
+                self.__key = key
+                self.__matches = None
+                self.__dirty = False
+
+        def __load(self):
+                self.__matches = {}
+                try:
+                        with open(self.__path, "rb") as f:
+                                data = json.load(f)
+                except EnvironmentError as e:
+                        if e.errno in (errno.ENOENT, errno.EACCES):
+                                return
+                        raise
+                except ValueError:
+                        # Corrupt; it will be rewritten.
+                        return
+
+                if not isinstance(data, dict) or \
+                    data.get("version") != self.VERSION or \
+                    data.get("key") != self.__key:
+                        return
+                self.__matches = data.get("matches", {})
+
+        def get_match(self, key, count):
+                """Return a tuple of the indices of the first and last of the
+                'count' candidate versions that match the dependency
+                identified by 'key', either of which may be None, or None if
+                the result isn't cached."""
+
+                if self.__matches is None:
+                        self.__load()
+                entry = self.__matches.get(key)
+                if entry is None or entry[0] != count:
+                        return None
+                return entry[1], entry[2]
+
+        def set_match(self, key, count, first, last):
+                """Record the indices of the first and last of the 'count'
+                candidate versions that match the dependency identified by
+                'key'."""
+
+                if self.__matches is None:
+                        self.__load()
+                self.__matches[key] = (count, first, last)
+                self.__dirty = True
+
+        def save(self):
+                """Write the cache if it has changed.  Failure to do so due to
+                a lack of permissions is ignored."""
+
+                if not self.__dirty:
+                        return
+
+                dirname, name = os.path.split(self.__path)
+                tmp = None
+                try:
+                        if not os.path.exists(dirname):
+                                os.makedirs(dirname)
+                        fd, tmp = tempfile.mkstemp(prefix=name + ".",
+                            dir=dirname)
+                        with os.fdopen(fd, "wb") as f:
+                                json.dump({
+                                    "version": self.VERSION,
+                                    "key": self.__key,
+                                    "matches": self.__matches,
+                                }, f, separators=(",", ":"))
+                        os.chmod(tmp, misc.PKG_FILE_MODE)
+                        portable.rename(tmp, self.__path)
+                        tmp = None
+                except EnvironmentError as e:
+                        if e.errno not in (errno.EACCES, errno.EPERM,
+                            errno.EROFS):
+                                raise
+                finally:
+                        if tmp:
+                                portable.remove(tmp)
+                self.__dirty = False
+
+
 class PkgSolver(object):
         """Provides a SAT-based solution solver to determine which packages
         should be installed, updated, or removed to perform a requested
         operation."""
 
         def __init__(self, cat, installed_dict, pub_ranks, variants, avoids,
-            parent_pkgs, progtrack):
+            parent_pkgs, progtrack, cache_path=None):
                 """Create a PkgSolver instance; catalog should contain all
                 known pkgs, installed fmris should be a dict of fmris indexed
                 by name that define pkgs current installed in the image.
                 Pub_ranks dict contains (rank, stickiness, enabled) for each
                 publisher.  variants are the current image variants; avoids is
-                the set of pkg stems being avoided in the image."""
+                the set of pkg stems being avoided in the image.  cache_path,
+                if provided, is the pathname of a SolverCache for the
+                catalog."""
 
                 # check if we're allowed to use the solver
                 if DebugValues["no_solver"]:
@@ -174,6 +283,12 @@ class PkgSolver(object):
 
                 self.__cache = {}
                 self.__actcache = {}
+                self.__solver_cache = None
+                if cache_path:
+                        self.__solver_cache = SolverCache(cache_path,
+                            "{0} {1}".format(cat.last_modified.isoformat()
+                            if cat.last_modified else None,
+                            " ".join(sorted(cat.publishers()))))
                 self.__trimdone = False         # indicate we're finished
                                                 # trimming
                 self.__fmri_state = {}          # cache of obsolete, renamed
@@ -182,7 +297,9 @@ class PkgSolver(object):
                 self.__state = SOLVER_INIT
                 self.__iterations = 0
                 self.__clauses     = 0
+                self.__literals    = 0
                 self.__variables   = 0
+                self.__search_stats = {}        # cumulative sat solver stats
                 self.__subphasename = None
                 self.__timings = []
                 self.__start_time = 0
@@ -248,6 +365,59 @@ class PkgSolver(object):
 
                 return s
 
+        def get_stats(self):
+                """Returns a dictionary describing the work performed by the
+                solver, suitable for serialization as JSON:
+
+                    state               the solver state; one of the
+                                        SOLVER_* constants
+
+                    phases              a list of dictionaries with the 'name'
+                                        of each solver phase and the 'seconds'
+                                        it took
+
+                    variables, clauses, literals
+                                        the size of the problem given to the
+                                        sat solver
+
+                    iterations          the number of solutions examined
+
+                    conflicts, decisions, propagations, restarts
+                                        the amount of search performed by the
+                                        sat solver
+
+                    peak_rss            the peak resident set size of the
+                                        process in kilobytes, or 0 if it is
+                                        not available
+
+                This information remains available after the solver has
+                finished."""
+
+                try:
+                        peak_rss = resource.getrusage(
+                            resource.RUSAGE_SELF).ru_maxrss
+                except (AttributeError, resource.error):
+                        peak_rss = 0
+
+                return {
+                    "state": self.__state,
+                    "phases": [
+                        { "name": name, "seconds": secs }
+                        for name, secs in self.__timings
+                    ],
+                    "seconds": sum(secs for name, secs in self.__timings),
+                    "variables": self.__variables,
+                    "clauses": self.__clauses,
+                    "literals": self.__literals,
+                    "iterations": self.__iterations,
+                    "conflicts": self.__search_stats.get("conflicts", 0),
+                    "decisions": self.__search_stats.get("decisions", 0),
+                    "propagations": self.__search_stats.get("propagations",
+                        0),
+                    "restarts": self.__search_stats.get("starts", 0),
+                    "peak_rss": peak_rss,
+                }
+
         def __cleanup(self, rval):
                 """Discards all solver information except for that needed to
                 show failure information or to stringify the solver object.
@@ -272,6 +442,7 @@ class PkgSolver(object):
                 self.__variants = None
                 self.__cache = None
                 self.__actcache = None
+                self.__solver_cache = None
                 self.__trimdone = None
                 self.__fmri_state = None
                 self.__start_time = None
@@ -563,6 +734,8 @@ class PkgSolver(object):
                 pt = self.__progtrack
                 self.__end_subphase()  # end the last subphase.
                 pt.plan_done(pt.PLAN_SOLVE_SOLVER)
+                if self.__solver_cache:
+                        self.__solver_cache.save()
                 return self.__cleanup((self.__elide_possible_renames(solution,
                     excludes), (self.__avoid_set, self.__obs_set)))
 
@@ -1339,6 +1512,7 @@ class PkgSolver(object):
                 solution_vector = []
                 self.__state = SOLVER_FAIL
                 eliminated = set()
+                start_stats = self.__solver.get_stats()
                 while not self.__addclause_failure and self.__solver.solve([]):
                         self.__progress()
                         self.__iterations += 1
@@ -1368,6 +1542,11 @@ class PkgSolver(object):
                         # permit [] solution
                         self.__addclauses([[-i for i in solution_vector]])
 
+                for name, val in self.__solver.get_stats().iteritems():
+                        self.__search_stats[name] = \
+                            self.__search_stats.get(name, 0) + val - \
+                            start_stats.get(name, 0)
+
                 if not self.__iterations:
                         self.__raise_solution_error(no_solution=True)
 
@@ -1552,21 +1731,39 @@ class PkgSolver(object):
                         # Always use a copy; return value may be cached.
                         comb_fmris = all_fmris[::-1]
 
-                # Iteration is performed in descending version order with the
-                # assumption that systems are generally up-to-date so it should
-                # be faster to start at the end and look for the oldest version
-                # that matches.
-                first_ver = None
-                last_ver = None
-                for i, f in enumerate(comb_fmris):
-                        fver = f.version
-                        if ((fver.is_successor(mver, constraint=constraint) or
-                            fver == mver)):
-                                if first_ver is None:
-                                        first_ver = i
-                                last_ver = i
-                        elif last_ver is not None:
-                                break
+                # Until trimming is done, the candidates are all of the
+                # versions of the package in the catalog, so the range that
+                # matches depends only on the catalog and can be cached
+                # across operations.
+                ckey = None
+                match = None
+                if self.__solver_cache and not self.__trimdone:
+                        ckey = "{0} {1}".format(fmri, constraint)
+                        match = self.__solver_cache.get_match(ckey,
+                            len(comb_fmris))
+
+                if match:
+                        first_ver, last_ver = match
+                else:
+                        # Iteration is performed in descending version order
+                        # with the assumption that systems are generally
+                        # up-to-date so it should be faster to start at the end
+                        # and look for the oldest version that matches.
+                        first_ver = None
+                        last_ver = None
+                        for i, f in enumerate(comb_fmris):
+                                fver = f.version
+                                if ((fver.is_successor(mver,
+                                    constraint=constraint) or fver == mver)):
+                                        if first_ver is None:
+                                                first_ver = i
+                                        last_ver = i
+                                elif last_ver is not None:
+                                        break
+
+                        if ckey:
+                                self.__solver_cache.set_match(ckey,
+                                    len(comb_fmris), first_ver, last_ver)
 
                 if last_ver is not None:
                         # Oddly enough, it's a little bit faster to iterate
@@ -2596,6 +2793,7 @@ class PkgSolver(object):
                                 if not self.__solver.add_clause(c):
                                         self.__addclause_failure = True
                                 self.__clauses += 1
+                                self.__literals += len(c)
                         except TypeError:
                                 raise TypeError(_("List of integers, not {0}, "
                                     "expected").format(c))
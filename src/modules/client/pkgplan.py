@@ -530,8 +530,18 @@ class PkgPlan(object):
                         progtrack.download_end_pkg(self.get_xferfmri())
                         return
 
+                root = self.image.get_root()
                 for src, dest in itertools.chain(*self.actions):
-                        if dest and dest.needsdata(src, self):
+                        if not dest or not dest.needsdata(src, self):
+                                continue
+                        if src and src.name == "file" and \
+                            dest.name == "file" and src.hash != dest.hash:
+                                # The file is being updated, so it may be
+                                # possible to retrieve it as a delta against
+                                # the installed version.
+                                mfile.add_action(dest, origin=(src,
+                                    src.get_installed_path(root)))
+                        else:
                                 mfile.add_action(dest)
 
                 mfile.wait_files()
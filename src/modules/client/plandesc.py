@@ -184,6 +184,7 @@ class PlanDescription(object):
                 }
                 self._solver_summary = []
                 self._solver_errors = None
+                self._solver_stats = None
                 self.li_attach = False
                 self.li_ppkgs = frozenset()
                 self.li_ppubs = None
@@ -707,6 +708,16 @@ class PlanDescription(object):
 
                 return self._solver_errors
 
+        def get_solver_stats(self):
+                """Returns a dictionary describing the work performed by the
+                solver to create this plan (see PkgSolver.get_stats()), or
+                None if the operation didn't use the solver."""
+
+                assert self.state >= EVALUATED_PKGS, \
+                        "{0} >= {1}".format(self.state, EVALUATED_PKGS)
+
+                return self._solver_stats
+
         def add_item_message(self, item_id, msg_time, msg_type, msg_text):
                 """Add a new message with its time, type and text for an
                 item."""
@@ -21,7 +21,7 @@
 #
 
 #
-# Copyright (c) 2008, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2008, 2026, Oracle and/or its affiliates. All rights reserved.
 #
 
 #
@@ -902,6 +902,9 @@ class ProgressTrackerFrontend(object):
         @pt_abstract
         def actions_set_goal(self, actionid, nactions): pass
 
+        @pt_abstract
+        def actions_start(self, actionid): pass
+
         @pt_abstract
         def actions_add_progress(self, actionid): pass
 
@@ -921,7 +924,12 @@ class ProgressTrackerFrontend(object):
         def job_done(self, jobid): pass
 
         @pt_abstract
-        def republish_set_goal(self, npkgs, ngetbytes, nsendbytes): pass
+        def republish_set_goal(self, npkgs, ngetbytes, nsendbytes,
+            showspeed=False):
+                """Call to set the goal of a republishing operation.  If
+                'showspeed' is True, the transfer rate is also displayed by
+                trackers that support it."""
+                pass
 
         @pt_abstract
         def republish_start_pkg(self, pkgfmri, getbytes=None, sendbytes=None):
@@ -1039,6 +1047,7 @@ class ProgressTracker(ProgressTrackerFrontend, ProgressTrackerBackend):
                     GoalTrackerItem(_("Republished pkgs"))
                 self.repub_send_bytes = \
                     GoalTrackerItem(_("Republish sent bytes"))
+                self.repub_show_speed = False
 
         def reset(self):
                 # Attribute defined outside __init__; pylint: disable=W0201
@@ -1453,6 +1462,13 @@ class ProgressTracker(ProgressTrackerFrontend, ProgressTrackerBackend):
                 actionitem.reset()
                 actionitem.goalitems = nactions
 
+        def actions_start(self, actionid):
+                """Called when a particular phase of action activity begins so
+                that the time reported for the phase also covers any time
+                spent before the first action in it completes."""
+                assert self.major_phase == self.PHASE_EXECUTE
+                self._actionitems[actionid].start()
+
         def actions_add_progress(self, actionid):
                 assert self.major_phase == self.PHASE_EXECUTE
                 actionitem = self._actionitems[actionid]
@@ -1499,8 +1515,10 @@ class ProgressTracker(ProgressTrackerFrontend, ProgressTrackerBackend):
                 if jobitem.printed:
                         self._job_output(OutSpec(last=True), jobitem)
 
-        def republish_set_goal(self, npkgs, ngetbytes, nsendbytes):
+        def republish_set_goal(self, npkgs, ngetbytes, nsendbytes,
+            showspeed=False):
                 self.dl_mode = self.DL_MODE_REPUBLISH # pylint: disable=W0201
+                self.repub_show_speed = showspeed # pylint: disable=W0201
 
                 self.repub_pkgs.goalitems = npkgs
                 self.repub_send_bytes.goalitems = nsendbytes
@@ -1570,6 +1588,8 @@ class ProgressTracker(ProgressTrackerFrontend, ProgressTrackerBackend):
                 self.repub_pkgs.done()
                 self.repub_send_bytes.done()
                 self.dl_bytes.done()
+                if self.repub_pkgs.printed and not dryrun:
+                        self.dl_estimator.done()
 
                 if self.repub_pkgs.goalitems != 0:
                         outspec = OutSpec(last=True)
@@ -2129,6 +2149,15 @@ class CommandLineProgressTracker(ProgressTracker):
                     _("Completed {numactions:d} actions in {time:>.2f} "
                     "seconds.").format(
                     numactions=total_goal, time=total_time))
+                for actionid in sorted(self._actionitems):
+                        actionitem = self._actionitems[actionid]
+                        if actionitem.goalitems == 0:
+                                continue
+                        self._pe.cprint(self._phase_prefix() +
+                            _("  {name}: {numactions:d} in {time:>.2f} "
+                            "seconds").format(name=actionitem.name,
+                            numactions=actionitem.goalitems,
+                            time=actionitem.elapsed()))
 
         def _job_output(self, outspec, jobitem):
                 if outspec.first:
@@ -3061,25 +3090,51 @@ class FancyUNIXProgressTracker(ProgressTracker):
 
                 # The first time, emit header.
                 if outspec.first:
-                        self._pe.cprint("{0:40} {1:>12} {2:>11} {3:>11}".format(
-                            _("PROCESS"), _("ITEMS"), _("GET (MB)"),
-                            _("SEND (MB)")))
+                        if self.repub_show_speed:
+                                self._pe.cprint("{0:32} {1:>12} {2:>11} "
+                                    "{3:>11} {4:>7}".format(_("PROCESS"),
+                                    _("ITEMS"), _("GET (MB)"), _("SEND (MB)"),
+                                    _("SPEED")))
+                        else:
+                                self._pe.cprint("{0:40} {1:>12} {2:>11} "
+                                    "{3:>11}".format(_("PROCESS"), _("ITEMS"),
+                                    _("GET (MB)"), _("SEND (MB)")))
 
                 if outspec.last:
                         pkg_name = "Completed"
                 else:
                         pkg_name = self.repub_pkgs.curinfo.get_name()
-                if len(pkg_name) > 40:
-                        pkg_name = "..." + pkg_name[-37:]
-
-                s = "{0:<40.40} {1:>12} {2:>11} {3:>11}".format(
-                    pkg_name, self.repub_pkgs.pair(),
-                    format_pair("{0:.1f}", self.dl_bytes.items,
-                        self.dl_bytes.goalitems, scale=(1024 * 1024),
-                        targetwidth=5, format2="{0:d}"),
-                    format_pair("{0:.1f}", self.repub_send_bytes.items,
-                        self.repub_send_bytes.goalitems, scale=(1024 * 1024),
-                        targetwidth=5, format2="{0:d}"))
+
+                getstr = format_pair("{0:.1f}", self.dl_bytes.items,
+                    self.dl_bytes.goalitems, scale=(1024 * 1024),
+                    targetwidth=5, format2="{0:d}")
+                sendstr = format_pair("{0:.1f}", self.repub_send_bytes.items,
+                    self.repub_send_bytes.goalitems, scale=(1024 * 1024),
+                    targetwidth=5, format2="{0:d}")
+
+                if not self.repub_show_speed:
+                        if len(pkg_name) > 40:
+                                pkg_name = "..." + pkg_name[-37:]
+                        s = "{0:<40.40} {1:>12} {2:>11} {3:>11}".format(
+                            pkg_name, self.repub_pkgs.pair(), getstr, sendstr)
+                else:
+                        if len(pkg_name) > 32:
+                                pkg_name = "..." + pkg_name[-29:]
+
+                        if outspec.last:
+                                speedstr = self.dl_estimator.format_speed(
+                                    self.dl_estimator.get_final_speed())
+                        elif self.dl_caching > 10:
+                                speedstr = "cache"
+                        else:
+                                speedstr = self.dl_estimator.format_speed(
+                                    self.dl_estimator.get_speed_estimate())
+                        if speedstr is None:
+                                speedstr = "--"
+
+                        s = "{0:<32.32} {1:>12} {2:>11} {3:>11} {4:>7}".format(
+                            pkg_name, self.repub_pkgs.pair(), getstr, sendstr,
+                            speedstr)
                 self._pe.cprint(s, erase=True, end='')
 
                 if outspec.last:
@@ -3386,6 +3441,7 @@ def test_progress_tracker(t, gofast=False):
                 t.actions_set_goal(t.ACTION_INSTALL, nactions)
                 t.actions_set_goal(t.ACTION_UPDATE, nactions)
                 for act in [t.ACTION_REMOVE, t.ACTION_INSTALL, t.ACTION_UPDATE]:
+                        t.actions_start(act)
                         for x in range(0, nactions):
                                 t.actions_add_progress(act)
                                 time.sleep(0.0015 * fast)
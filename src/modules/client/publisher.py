@@ -21,7 +21,7 @@
 #
 
 #
-# Copyright (c) 2009, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2009, 2026, Oracle and/or its affiliates. All rights reserved.
 #
 
 #
@@ -1996,11 +1996,23 @@ pkg unset-publisher {0}
                 revalidate = not redownload and mismatched
 
                 v1_cat = pkg.catalog.Catalog(meta_root=croot)
+
+                # The catalog.attrs file kept with the catalog is a copy of
+                # the one last retrieved, so the repository can be asked to
+                # only send it if it has changed.
+                etag = None
+                if not redownload and not revalidate and v1_cat.exists:
+                        try:
+                                etag = misc.get_data_digest(os.path.join(croot,
+                                    "catalog.attrs"), hash_func=hashlib.sha1)[0]
+                        except EnvironmentError:
+                                pass
+
                 try:
                         self.transport.get_catalog1(self, ["catalog.attrs"],
                             path=tempdir, redownload=redownload,
                             revalidate=revalidate, alt_repo=repo,
-                            progtrack=progtrack)
+                            progtrack=progtrack, etag=etag)
                 except api_errors.UnsupportedRepositoryOperation:
                         # No v1 catalogs available.
                         if v1_cat.exists:
@@ -2017,6 +2029,11 @@ pkg unset-publisher {0}
                 if v0_cat.exists:
                         v0_cat.destroy(root=croot)
 
+                if etag and not os.path.exists(os.path.join(tempdir,
+                    "catalog.attrs")):
+                        # The repository's catalog hasn't changed.
+                        return False, True
+
                 # If above succeeded, we now have a catalog.attrs file.  Parse
                 # this to determine what other constituent parts need to be
                 # downloaded.
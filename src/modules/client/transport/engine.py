@@ -21,7 +21,7 @@
 #
 
 #
-# Copyright (c) 2009, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2009, 2026, Oracle and/or its affiliates. All rights reserved.
 #
 
 from __future__ import division
@@ -53,6 +53,13 @@ from pkg.client.debugvalues import DebugValues
 pipelined_protocols = ()
 response_protocols = ("ftp", "http", "https")
 
+# Requests using these protocols are multiplexed over a single HTTP/2
+# connection to each origin, if libcurl supports it.
+multiplexed_protocols = ()
+if hasattr(pycurl, "PIPE_MULTIPLEX") and \
+    pycurl.version_info()[4] & getattr(pycurl, "VERSION_HTTP2", 0):
+        multiplexed_protocols = ("https",)
+
 class TransportEngine(object):
         """This is an abstract class.  It shouldn't implement any
         of the methods that it contains.  Leave that to transport-specific
@@ -87,17 +94,40 @@ class CurlTransportEngine(TransportEngine):
                 self.__common_header = {}
                 self.__last_stall_check = 0
 
-                # Set options on multi-handle
-                self.__mhandle.setopt(pycurl.M_PIPELINING, 0)
+                # Set options on multi-handle.  Connections are kept in the
+                # multi-handle's connection cache, which is shared by all of
+                # the easy handles and isn't cleared by reset(), so later
+                # operations can reuse connections to the same origin and
+                # proxy until the engine is shut down.
+                if multiplexed_protocols:
+                        self.__mhandle.setopt(pycurl.M_PIPELINING,
+                            pycurl.PIPE_MULTIPLEX)
+                else:
+                        self.__mhandle.setopt(pycurl.M_PIPELINING, 0)
+                self.__mhandle.setopt(pycurl.M_MAXCONNECTS, self.__max_handles)
+
+                # DNS results and TLS sessions are shared by the easy handles
+                # so that new connections to an origin can skip the lookup and
+                # resume the TLS session instead of performing a full
+                # handshake.  Resetting a handle doesn't detach it from the
+                # share handle.
+                self.__shandle = pycurl.CurlShare()
+                self.__shandle.setopt(pycurl.SH_SHARE, pycurl.LOCK_DATA_DNS)
+                self.__shandle.setopt(pycurl.SH_SHARE,
+                    pycurl.LOCK_DATA_SSL_SESSION)
 
                 # initialize easy handles
                 for i in range(self.__max_handles):
                         eh = pycurl.Curl()
+                        eh.setopt(pycurl.SHARE, self.__shandle)
                         eh.url = None
                         eh.repourl = None
                         eh.fobj = None
                         eh.r_fobj = None
                         eh.filepath = None
+                        eh.resume = False
+                        eh.resume_offset = 0
+                        eh.keep_partial = False
                         eh.success = False
                         eh.fileprog = None
                         eh.filetime = -1
@@ -123,7 +153,7 @@ class CurlTransportEngine(TransportEngine):
         def add_url(self, url, filepath=None, writefunc=None, header=None,
             progclass=None, progtrack=None, sslcert=None, sslkey=None,
             repourl=None, compressible=False, failonerror=True, proxy=None,
-            runtime_proxy=None):
+            runtime_proxy=None, resume=False):
                 """Add a URL to the transport engine.  Caller must supply
                 either a filepath where the file should be downloaded,
                 or a callback to a function that will peform the write.
@@ -136,14 +166,18 @@ class CurlTransportEngine(TransportEngine):
                 stored as part of the transport stats accounting.
 
                 'runtime_proxy' is the actual proxy value that is used by pycurl
-                to retrieve this resource."""
+                to retrieve this resource.
+
+                'resume' indicates whether the transfer of a file partially
+                downloaded to filepath by an earlier request that failed
+                should be continued from where it stopped."""
 
                 t = TransportRequest(url, filepath=filepath,
                     writefunc=writefunc, header=header, progclass=progclass,
                     progtrack=progtrack, sslcert=sslcert, sslkey=sslkey,
                     repourl=repourl, compressible=compressible,
                     failonerror=failonerror, proxy=proxy,
-                    runtime_proxy=runtime_proxy)
+                    runtime_proxy=runtime_proxy, resume=resume)
 
                 self.__req_q.appendleft(t)
 
@@ -193,6 +227,9 @@ class CurlTransportEngine(TransportEngine):
                                 ex = tx.TransportStallError(url,
                                     repourl=urlstem, uuid=uuid)
 
+                                # Keep any partially downloaded file so the
+                                # retry can resume its transfer.
+                                h.keep_partial = True
                                 self.__mhandle.remove_handle(h)
                                 self.__teardown_handle(h)
                                 self.__freehandles.append(h)
@@ -269,6 +306,8 @@ class CurlTransportEngine(TransportEngine):
                                 repostats.record_connection(conn_time)
 
                         respcode = h.getinfo(pycurl.RESPONSE_CODE)
+                        if respcode and proto in ("http", "https"):
+                                self.__record_reuse(h, repostats)
 
                         # If we were cancelled, raise an API error.
                         # Otherwise fall through to transport's exception
@@ -303,6 +342,14 @@ class CurlTransportEngine(TransportEngine):
                                     uuid=uuid)
                                 repostats.record_error(decayable=ex.decayable)
                                 errors_seen += 1
+                                if respcode == \
+                                    httplib.REQUESTED_RANGE_NOT_SATISFIABLE \
+                                    and h.resume_offset:
+                                        # The partially downloaded file is
+                                        # no longer usable; it is discarded
+                                        # so the retry starts from the
+                                        # beginning.
+                                        ex.retryable = True
                         else:
                                 timeout = en == pycurl.E_OPERATION_TIMEOUTED
                                 ex = tx.TransportFrameworkError(en, url, em,
@@ -310,6 +357,18 @@ class CurlTransportEngine(TransportEngine):
                                 repostats.record_error(decayable=ex.decayable,
                                     timeout=timeout)
                                 errors_seen += 1
+                                if en == pycurl.E_RANGE_ERROR and \
+                                    h.resume_offset:
+                                        # The server doesn't support byte
+                                        # ranges; the partially downloaded
+                                        # file is discarded so the retry
+                                        # starts from the beginning.
+                                        ex.retryable = True
+                                elif ex.retryable:
+                                        # Keep the partially downloaded file
+                                        # so the retry can resume its
+                                        # transfer.
+                                        h.keep_partial = True
 
                         if ex and ex.retryable:
                                 failures.append(ex)
@@ -378,9 +437,12 @@ class CurlTransportEngine(TransportEngine):
                                 repostats.record_connection(conn_time)
 
                         respcode = h.getinfo(pycurl.RESPONSE_CODE)
+                        if respcode and proto in ("http", "https"):
+                                self.__record_reuse(h, repostats)
 
                         if proto not in response_protocols or \
-                            respcode == httplib.OK:
+                            respcode == httplib.OK or (h.resume_offset and
+                            respcode == httplib.PARTIAL_CONTENT):
                                 h.success = True
                                 repostats.clear_consecutive_errors()
                                 success.append(url)
@@ -457,6 +519,17 @@ class CurlTransportEngine(TransportEngine):
                                 raise tx.ExcessiveTransientFailure(rs.url,
                                     numce)
 
+        @staticmethod
+        def __record_reuse(hdl, repostats):
+                """Record whether the request performed using the handle
+                reused an existing connection, or performed a TLS handshake
+                to establish a new one, in the RepoStats object."""
+
+                if hdl.getinfo(pycurl.NUM_CONNECTS) == 0:
+                        repostats.record_reuse()
+                elif hdl.getinfo(pycurl.APPCONNECT_TIME) > 0:
+                        repostats.record_handshake()
+
         def check_status(self, urllist=None, good_reqs=False):
                 """Return information about retryable failures that occured
                 during the request.
@@ -520,6 +593,21 @@ class CurlTransportEngine(TransportEngine):
 
                 return rf, rs
 
+        def check_success(self, urlset):
+                """Return a list of the URLs in the set 'urlset' that have
+                been transferred successfully since this method or
+                check_status was last called for them.  The URLs returned
+                are forgotten, so callers may use this to process completed
+                requests while others are still in progress."""
+
+                rs = [ts for ts in self.__success if ts in urlset]
+                if rs:
+                        self.__success = [
+                            ts for ts in self.__success
+                            if ts not in urlset
+                        ]
+                return rs
+
         def get_url(self, url, header=None, sslcert=None, sslkey=None,
             repourl=None, compressible=False, ccancel=None,
             failonerror=True, proxy=None, runtime_proxy=None, system=False):
@@ -693,7 +781,8 @@ class CurlTransportEngine(TransportEngine):
 
         def reset(self):
                 """Reset the state of the transport engine.  Do this
-                before performing another type of request."""
+                before performing another type of request.  Established
+                connections are kept so that they can be reused."""
 
                 for c in self.__chandles:
                         if c not in self.__freehandles:
@@ -867,8 +956,25 @@ class CurlTransportEngine(TransportEngine):
                 # error output, and statistics reporting.
                 hdl.repourl = treq.repourl
                 if treq.filepath:
+                        mode = "wb+"
+                        hdl.resume = treq.resume
+                        hdl.resume_offset = 0
+                        if treq.resume:
+                                # Continue the transfer of a file that an
+                                # earlier request partially downloaded.
+                                try:
+                                        hdl.resume_offset = os.stat(
+                                            treq.filepath).st_size
+                                except EnvironmentError as e:
+                                        if e.errno != errno.ENOENT:
+                                                raise \
+                                                    tx.TransportOperationError(
+                                                    "Unable to stat file: "
+                                                    "{0}".format(e))
+                                if hdl.resume_offset:
+                                        mode = "ab+"
                         try:
-                                hdl.fobj = open(treq.filepath, "wb+",
+                                hdl.fobj = open(treq.filepath, mode,
                                     self.__file_bufsz)
                         except EnvironmentError as e:
                                 if e.errno == errno.EACCES:
@@ -883,6 +989,9 @@ class CurlTransportEngine(TransportEngine):
                                     "Unable to open file: {0}".format(e))
 
                         hdl.setopt(pycurl.WRITEDATA, hdl.fobj)
+                        if hdl.resume_offset:
+                                hdl.setopt(pycurl.RESUME_FROM_LARGE,
+                                    hdl.resume_offset)
                         # Request filetime, if endpoint knows it.
                         hdl.setopt(pycurl.OPT_FILETIME, True)
                         hdl.filepath = treq.filepath
@@ -989,6 +1098,15 @@ class CurlTransportEngine(TransportEngine):
                         else:
                                 hdl.unsetopt(pycurl.CAINFO)
 
+                if proto in multiplexed_protocols:
+                        # Negotiate HTTP/2, and wait for a connection to the
+                        # origin that's being established to find out whether
+                        # the request can be multiplexed over it instead of
+                        # opening another one.
+                        hdl.setopt(pycurl.HTTP_VERSION,
+                            pycurl.CURL_HTTP_VERSION_2TLS)
+                        hdl.setopt(pycurl.PIPEWAIT, 1)
+
         def shutdown(self):
                 """Shutdown the transport engine, perform cleanup."""
 
@@ -999,6 +1117,8 @@ class CurlTransportEngine(TransportEngine):
                 self.__freehandles = None
                 self.__mhandle.close()
                 self.__mhandle = None
+                self.__shandle.close()
+                self.__shandle = None
                 self.__req_q = None
                 self.__failures = None
                 self.__success = None
@@ -1020,7 +1140,12 @@ class CurlTransportEngine(TransportEngine):
                                 if hdl.fileprog:
                                         hdl.fileprog.abort()
                                 try:
-                                        os.remove(hdl.filepath)
+                                        # Keep a partially downloaded file if
+                                        # a retry of the request can resume
+                                        # its transfer.
+                                        if not (hdl.resume and
+                                            hdl.keep_partial):
+                                                os.remove(hdl.filepath)
                                 except EnvironmentError as e:
                                         if e.errno != errno.ENOENT:
                                                 raise \
@@ -1047,6 +1172,9 @@ class CurlTransportEngine(TransportEngine):
                 hdl.repourl = None
                 hdl.success = False
                 hdl.filepath = None
+                hdl.resume = False
+                hdl.resume_offset = 0
+                hdl.keep_partial = False
                 hdl.fileprog = None
                 hdl.uuid = None
                 hdl.filetime = -1
@@ -1063,7 +1191,7 @@ class TransportRequest(object):
             progclass=None, progtrack=None, sslcert=None, sslkey=None,
             repourl=None, compressible=False, progfunc=None, uuid=None,
             read_fobj=None, read_filepath=None, failonerror=False, proxy=None,
-            runtime_proxy=None, system=False):
+            runtime_proxy=None, system=False, resume=False):
                 """Create a TransportRequest with the following parameters:
 
                 url - The url that the transport engine should retrieve
@@ -1145,6 +1273,10 @@ class TransportRequest(object):
                 resources served by the system-repository, we use this to
                 prevent $http_proxy environment variables from being used.
 
+                resume - If the transfer of the file at filepath was left
+                incomplete by an earlier request that failed, continue it
+                from where it stopped instead of starting again.
+
                 A TransportRequest must contain enough information to uniquely
                 identify any pkg.client.publisher.TransportRepoURI - in
                 particular, it must contain all fields used by
@@ -1173,3 +1305,4 @@ class TransportRequest(object):
                 self.proxy = proxy
                 self.runtime_proxy = runtime_proxy
                 self.system = system
+                self.resume = resume
@@ -21,7 +21,7 @@
 #
 
 #
-# Copyright (c) 2009, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2009, 2026, Oracle and/or its affiliates. All rights reserved.
 #
 
 import cStringIO
@@ -31,10 +31,12 @@ import itertools
 import os
 import simplejson as json
 import sys
+import tarfile
 import urlparse
 import urllib
 
 import pkg
+import pkg.misc as misc
 import pkg.p5i as p5i
 import pkg.client.api_errors as apx
 import pkg.client.publisher as pub
@@ -45,6 +47,7 @@ import pkg.server.repository as svr_repo
 import pkg.server.query_parser as sqp
 
 from email.utils import formatdate
+from pkg.client import global_settings
 from pkg.misc import N_
 import tempfile
 import shutil
@@ -87,11 +90,26 @@ class TransportRepo(object):
 
                 raise NotImplementedError
 
-        def get_files(self, filelist, dest, progtrack, version, header=None, pub=None):
+        def get_deltas(self, deltalist, dest, header=None, pub=None):
+                """Get multiple gzip-compressed deltas (see pkg.delta) from
+                the repo at once.  The deltalist argument contains tuples
+                (old_hash, new_hash); each delta reconstructs the file named
+                by new_hash from the file named by old_hash and is stored in
+                the destination directory dest, named by new_hash."""
+
+                raise NotImplementedError
+
+        def get_files(self, filelist, dest, progtrack, version, header=None,
+            pub=None, done_cb=None):
                 """Get multiple files from the repo at once.
                 The files are named by hash and supplied in filelist.
                 If dest is specified, download to the destination
-                directory that is given. Progtrack is a ProgressTracker"""
+                directory that is given. Progtrack is a ProgressTracker.
+                If done_cb is specified, it is called with the name of each
+                file as soon as it has been retrieved successfully, while
+                other files may still be in transfer.  Files reported this
+                way are not included in the list of successful requests
+                attached to an ExcessiveTransientFailure."""
 
                 raise NotImplementedError
 
@@ -110,6 +128,17 @@ class TransportRepo(object):
 
                 raise NotImplementedError
 
+        def get_manifests_batch(self, mfstlist, dest, progtrack=None,
+            pub=None):
+                """Get manifests named in list using a single request.  The
+                mfstlist argument contains tuples (fmri, header) as for
+                get_manifests, but only the header of the first entry is
+                used.  The destination directory is specified in the dest
+                argument.  Returns a list of errors, each of which has a
+                'request' attribute naming the FMRI that failed."""
+
+                raise NotImplementedError
+
         def get_publisherinfo(self, header=None, ccancel=None):
                 """Get publisher configuration information from the
                 repository."""
@@ -304,6 +333,20 @@ class TransportRepo(object):
 
                 return reqlist
 
+        def _run_files(self, urlset, done_cb):
+                """Run the transport engine until all pending requests have
+                completed.  If 'done_cb' is not None, it is called with the
+                request for each URL in 'urlset' as soon as that URL has been
+                transferred successfully."""
+
+                while self._engine.pending:
+                        self._engine.run()
+                        if not done_cb:
+                                continue
+                        for req in self._url_to_request(
+                            self._engine.check_success(urlset)):
+                                done_cb(req)
+
         @staticmethod
         def _analyze_server_error(error_header):
                 """ Decode the X-Ipkg-Error header which is appended by the
@@ -379,12 +422,12 @@ class HTTPRepo(TransportRepo):
                     self._repouri)
 
         def _add_file_url(self, url, filepath=None, progclass=None,
-            progtrack=None, header=None, compress=False):
+            progtrack=None, header=None, compress=False, resume=False):
                 self._engine.add_url(url, filepath=filepath,
                     progclass=progclass, progtrack=progtrack, repourl=self._url,
                     header=header, compressible=compress,
                     runtime_proxy=self._repouri.runtime_proxy,
-                    proxy=self._repouri.proxy)
+                    proxy=self._repouri.proxy, resume=resume)
 
         def _fetch_url(self, url, header=None, compress=False, ccancel=None,
             failonerror=True, system=False):
@@ -591,6 +634,47 @@ class HTTPRepo(TransportRepo):
                 requesturl = urlparse.urljoin(baseurl, fhash)
                 return self._fetch_url(requesturl, header, ccancel=ccancel)
 
+        def get_deltas(self, deltalist, dest, header=None, pub=None):
+                """Get multiple gzip-compressed deltas (see pkg.delta) from
+                the repo at once.  The deltalist argument contains tuples
+                (old_hash, new_hash); each delta reconstructs the file named
+                by new_hash from the file named by old_hash and is stored in
+                the destination directory dest, named by new_hash."""
+
+                baseurl = self.__get_request_url("delta/0/", pub=pub)
+                urllist = []
+
+                for old_hash, new_hash in deltalist:
+                        url = urlparse.urljoin(baseurl, "{0}/{1}".format(
+                            old_hash, new_hash))
+                        urllist.append(url)
+                        fn = os.path.join(dest, new_hash)
+                        self._add_file_url(url, filepath=fn, header=header)
+
+                try:
+                        while self._engine.pending:
+                                self._engine.run()
+                except tx.ExcessiveTransientFailure as e:
+                        # Attach a list of failed and successful
+                        # requests to this exception.
+                        errors, success = self._engine.check_status(urllist,
+                            True)
+
+                        errors = self._annotate_exceptions(errors)
+                        success = self._url_to_request(success)
+                        e.failures = errors
+                        e.success = success
+
+                        # Reset the engine before propagating exception.
+                        self._engine.reset()
+                        raise
+
+                errors = self._engine.check_status(urllist)
+
+                # The request for each error is the new_hash of the delta,
+                # which is the basename of the request URL.
+                return self._annotate_exceptions(errors)
+
         def get_publisherinfo(self, header=None, ccancel=None):
                 """Get publisher information from the repository."""
 
@@ -683,13 +767,79 @@ class HTTPRepo(TransportRepo):
 
                 return self._annotate_exceptions(errors, urlmapping)
 
-        def get_files(self, filelist, dest, progtrack, version, header=None, pub=None):
+        def get_manifests_batch(self, mfstlist, dest, progtrack=None,
+            pub=None):
+                """Get manifests named in list using a single request.  The
+                mfstlist argument contains tuples (fmri, header) as for
+                get_manifests, but only the header of the first entry is
+                used.  The destination directory is specified in the dest
+                argument."""
+
+                if not mfstlist:
+                        return []
+
+                requesturl = self.__get_request_url("manifests/0/", pub=pub)
+                request_data = urllib.urlencode([
+                    (i, f.get_fmri(anarchy=True, include_scheme=False))
+                    for i, (f, h) in enumerate(mfstlist)
+                ])
+
+                # The manifests are returned as a compressed tar stream in
+                # which each manifest is named by the encoded FMRI of its
+                # package.
+                pending = dict(
+                    (f.get_url_path(), f)
+                    for f, h in mfstlist
+                )
+                try:
+                        resp = self._post_url(requesturl, request_data,
+                            mfstlist[0][1])
+                        tar_stream = tarfile.open(mode="r|gz", fileobj=resp)
+                        for info in tar_stream:
+                                if info.name not in pending or \
+                                    not info.isfile():
+                                        continue
+                                src = tar_stream.extractfile(info)
+                                fn = os.path.join(dest, info.name)
+                                try:
+                                        with open(fn, "wb") as dst:
+                                                shutil.copyfileobj(src, dst)
+                                except EnvironmentError as e:
+                                        raise apx._convert_error(e)
+                                del pending[info.name]
+                                if progtrack:
+                                        progtrack.manifest_fetch_progress(
+                                            completion=True)
+                        tar_stream.close()
+                        resp.close()
+                except (tx.TransportException, tarfile.TarError) as e:
+                        # The manifests that weren't received have failed;
+                        # the caller will retrieve them individually.
+                        return [
+                            tx.TransportProtoError("http",
+                                getattr(e, "code", None), url=requesturl,
+                                reason=str(e), repourl=self._url,
+                                request=fmri)
+                            for fmri in pending.itervalues()
+                        ]
+
+                # Manifests that aren't in the repository are omitted from
+                # the response.
+                return [
+                    tx.TransportProtoError("http", httplib.NOT_FOUND,
+                        url=requesturl, repourl=self._url, request=fmri)
+                    for fmri in pending.itervalues()
+                ]
+
+        def get_files(self, filelist, dest, progtrack, version, header=None,
+            pub=None, done_cb=None):
                 """Get multiple files from the repo at once.
                 The files are named by hash and supplied in filelist.
                 If dest is specified, download to the destination
                 directory that is given.  If progtrack is not None,
                 it contains a ProgressTracker object for the
-                downloads."""
+                downloads.  If done_cb is not None, it is called with
+                the name of each file as soon as it has been retrieved."""
 
                 baseurl = self.__get_request_url("file/{0}/".format(version),
                     pub=pub)
@@ -703,13 +853,14 @@ class HTTPRepo(TransportRepo):
                         url = urlparse.urljoin(baseurl, f)
                         urllist.append(url)
                         fn = os.path.join(dest, f)
+                        # Files never change once stored, so any transfer
+                        # left incomplete by an earlier attempt is resumed.
                         self._add_file_url(url, filepath=fn,
                             progclass=progclass, progtrack=progtrack,
-                            header=header)
+                            header=header, resume=True)
 
                 try:
-                        while self._engine.pending:
-                                self._engine.run()
+                        self._run_files(frozenset(urllist), done_cb)
                 except tx.ExcessiveTransientFailure as e:
                         # Attach a list of failed and successful
                         # requests to this exception.
@@ -1092,14 +1243,14 @@ class HTTPSRepo(HTTPRepo):
 
         # override the download functions to use ssl cert/key
         def _add_file_url(self, url, filepath=None, progclass=None,
-            progtrack=None, header=None, compress=False):
+            progtrack=None, header=None, compress=False, resume=False):
                 self._engine.add_url(url, filepath=filepath,
                     progclass=progclass, progtrack=progtrack,
                     sslcert=self._repouri.ssl_cert,
                     sslkey=self._repouri.ssl_key, repourl=self._url,
                     header=header, compressible=compress,
                     runtime_proxy=self._repouri.runtime_proxy,
-                    proxy=self._repouri.proxy)
+                    proxy=self._repouri.proxy, resume=resume)
 
         def _fetch_url(self, url, header=None, compress=False, ccancel=None,
             failonerror=True):
@@ -1488,13 +1639,52 @@ class _FilesystemRepo(TransportRepo):
 
                 return errors + pre_exec_errors
 
-        def get_files(self, filelist, dest, progtrack, version, header=None, pub=None):
+        def get_manifests_batch(self, mfstlist, dest, progtrack=None,
+            pub=None):
+                """Get manifests named in list.  The mfstlist argument contains
+                tuples (fmri, header) as for get_manifests.  The manifests are
+                copied directly from the repository to the destination
+                directory specified in the dest argument."""
+
+                errors = []
+                pub_prefix = getattr(pub, "prefix", None)
+                for fmri, h in mfstlist:
+                        try:
+                                mpath = self._frepo.manifest(fmri,
+                                    pub=pub_prefix)
+                        except svr_repo.RepositoryError as e:
+                                ex = tx.TransportProtoError("file",
+                                    errno.EPROTO, reason=str(e),
+                                    repourl=self._url, request=fmri)
+                                self.__record_proto_error(ex)
+                                errors.append(ex)
+                                continue
+                        if not os.path.isfile(mpath):
+                                ex = tx.TransportProtoError("file",
+                                    errno.ENOENT, reason=mpath,
+                                    repourl=self._url, request=fmri)
+                                self.__record_proto_error(ex)
+                                errors.append(ex)
+                                continue
+                        try:
+                                shutil.copyfile(mpath, os.path.join(dest,
+                                    fmri.get_url_path()))
+                        except EnvironmentError as e:
+                                raise apx._convert_error(e)
+                        if progtrack:
+                                progtrack.manifest_fetch_progress(
+                                    completion=True)
+                return errors
+
+        def get_files(self, filelist, dest, progtrack, version, header=None,
+            pub=None, done_cb=None):
                 """Get multiple files from the repo at once.
                 The files are named by hash and supplied in filelist.
                 If dest is specified, download to the destination
                 directory that is given.  If progtrack is not None,
                 it contains a ProgressTracker object for the
-                downloads."""
+                downloads.  If done_cb is not None, it is called with
+                the name of each file as soon as it has been retrieved."""
 
                 urllist = []
                 progclass = None
@@ -1533,8 +1723,7 @@ class _FilesystemRepo(TransportRepo):
                             header=header)
 
                 try:
-                        while self._engine.pending:
-                                self._engine.run()
+                        self._run_files(frozenset(urllist), done_cb)
                 except tx.ExcessiveTransientFailure as e:
                         # Attach a list of failed and successful
                         # requests to this exception.
@@ -1589,6 +1778,7 @@ class _FilesystemRepo(TransportRepo):
                     "close": ["0"],
                     "file": ["0", "1"],
                     "manifest": ["0"],
+                    "manifests": ["0"],
                     "open": ["0"],
                     "publisher": ["0", "1"],
                     "search": ["1"],
@@ -2044,38 +2234,75 @@ class _ArchiveRepo(TransportRepo):
                                 continue
                 return errors
 
-        def get_files(self, filelist, dest, progtrack, version, header=None, pub=None):
+        def get_manifests_batch(self, mfstlist, dest, progtrack=None,
+            pub=None):
+                """Get manifests named in list.  The mfstlist argument contains
+                tuples (fmri, header) as for get_manifests.  Manifests are
+                always extracted directly from the archive, so this is the
+                same as get_manifests."""
+
+                return self.get_manifests(mfstlist, dest, progtrack=progtrack,
+                    pub=pub)
+
+        def get_files(self, filelist, dest, progtrack, version, header=None,
+            pub=None, done_cb=None):
                 """Get multiple files from the repo at once.
                 The files are named by hash and supplied in filelist.
                 If dest is specified, download to the destination
                 directory that is given.  If progtrack is not None,
                 it contains a ProgressTracker object for the
-                downloads."""
+                downloads.  If done_cb is not None, it is called with
+                the name of each file as soon as it has been retrieved.
+                Files are extracted from the archive by several threads at
+                once."""
 
                 pub_prefix = getattr(pub, "prefix", None)
-                errors = []
-                for f in filelist:
+                failures = {}
+
+                def extract(f):
                         try:
                                 self._arc.extract_package_files([f], dest,
                                     pub=pub_prefix)
-                                if progtrack:
-                                        fs = os.stat(os.path.join(dest, f))
-                                        progtrack.download_add_progress(1,
-                                            fs.st_size)
-                        except pkg.p5p.UnknownArchiveFiles as e:
+                        except Exception as e:
+                                failures[f] = e
+
+                def gen_extracted():
+                        for f in filelist:
+                                extract(f)
+                                yield f
+
+                nworkers = min(len(filelist),
+                    global_settings.PKG_CLIENT_ARCHIVE_THREADS)
+                if nworkers > 1:
+                        extracted = misc.threaded_imap(extract, filelist,
+                            nworkers)
+                else:
+                        extracted = gen_extracted()
+
+                # Progress and errors are recorded by the calling thread.
+                errors = []
+                for f in extracted:
+                        e = failures.pop(f, None)
+                        if isinstance(e, pkg.p5p.UnknownArchiveFiles):
                                 ex = tx.TransportProtoError("file",
                                     errno.ENOENT, reason=str(e),
                                     repourl=self._url, request=f)
                                 self.__record_proto_error(ex)
                                 errors.append(ex)
                                 continue
-                        except Exception as e:
+                        elif e:
                                 ex = tx.TransportProtoError("file",
                                     errno.EPROTO, reason=str(e),
                                     repourl=self._url, request=f)
                                 self.__record_proto_error(ex)
                                 errors.append(ex)
                                 continue
+
+                        if progtrack:
+                                fs = os.stat(os.path.join(dest, f))
+                                progtrack.download_add_progress(1, fs.st_size)
+                        if done_cb:
+                                done_cb(f)
                 return errors
 
         def get_url(self):
@@ -2097,6 +2324,7 @@ class _ArchiveRepo(TransportRepo):
                     "catalog": ["1"],
                     "file": ["0"],
                     "manifest": ["0"],
+                    "manifests": ["0"],
                     "publisher": ["0", "1"],
                     "versions": ["0"],
                     "status": ["0"]
@@ -21,7 +21,7 @@
 #
 
 #
-# Copyright (c) 2009, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2009, 2026, Oracle and/or its affiliates. All rights reserved.
 #
 
 from __future__ import division
@@ -72,10 +72,10 @@ class RepoChooser(object):
         def dump(self):
                 """Write the repo statistics to stdout."""
 
-                hfmt = "{0:41.41} {1:30} {2:6} {3:4} {4:4} {5:8} {6:10} {7:5} {8:7} {9:4}"
-                dfmt = "{0:41.41} {1:30} {2:6} {3:4} {4:4} {5:8} {6:10} {7:5} {8:6f} {9:4}"
+                hfmt = "{0:41.41} {1:30} {2:6} {3:4} {4:4} {5:5} {6:4} {7:8} {8:10} {9:5} {10:7} {11:4}"
+                dfmt = "{0:41.41} {1:30} {2:6} {3:4} {4:4} {5:5} {6:4} {7:8} {8:10} {9:5} {10:6f} {11:4}"
                 misc.msg(hfmt.format("URL", "Proxy", "Good", "Err", "Conn",
-                    "Speed", "Size", "Used", "CSpeed", "Qual"))
+                    "Reuse", "TLS", "Speed", "Size", "Used", "CSpeed", "Qual"))
 
                 for ds in self.__rsobj.values():
 
@@ -85,8 +85,9 @@ class RepoChooser(object):
                         sizestr = misc.bytes_to_str(ds.bytes_xfr)
                         proxy = self.__get_proxy(ds)
                         misc.msg(dfmt.format(ds.url, proxy, ds.success,
-                            ds.failures, ds.num_connect, speedstr, sizestr,
-                            ds.used, ds.connect_time, ds.quality))
+                            ds.failures, ds.num_connect, ds.num_reuse,
+                            ds.num_handshake, speedstr, sizestr, ds.used,
+                            ds.connect_time, ds.quality))
 
         def get_num_visited(self, repouri_list):
                 """Walk a list of TransportRepoURIs and return the number
@@ -216,6 +217,8 @@ class RepoStats(object):
 
                 self.__connections = 0
                 self.__connect_time = 0.0
+                self.__reused = 0
+                self.__handshakes = 0
 
                 self.__used = False
 
@@ -240,6 +243,18 @@ class RepoStats(object):
                 self.__connections += 1
                 self.__connect_time += time
 
+        def record_handshake(self):
+                """Record that a TLS handshake was performed to establish a
+                connection."""
+
+                self.__handshakes += 1
+
+        def record_reuse(self):
+                """Record that an operation reused an existing connection
+                instead of establishing a new one."""
+
+                self.__reused += 1
+
         def record_error(self, decayable=False, content=False, timeout=False):
                 """Record that an operation to the TransportRepoURI represented
                 by this RepoStats object failed with an error.
@@ -355,6 +370,20 @@ class RepoStats(object):
 
                 return self.__connections
 
+        @property
+        def num_handshake(self):
+                """Return the number of TLS handshakes that were performed to
+                establish connections to the host."""
+
+                return self.__handshakes
+
+        @property
+        def num_reuse(self):
+                """Return the number of transactions that reused an existing
+                connection to the host."""
+
+                return self.__reused
+
         @property
         def priority(self):
                 """Return the priority of the URI, if one is assigned."""
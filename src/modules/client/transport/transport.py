@@ -21,20 +21,26 @@
 #
 
 #
-# Copyright (c) 2009, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2009, 2026, Oracle and/or its affiliates. All rights reserved.
 #
 
+import Queue
 import cStringIO
 import copy
 import errno
 import httplib
+import itertools
 import os
+import shutil
 import simplejson as json
 import statvfs
+import sys
 import tempfile
+import threading
 import zlib
 
 import pkg.catalog as catalog
+import pkg.delta
 import pkg.client.api_errors as apx
 import pkg.client.imageconfig as imageconfig
 import pkg.client.publisher as publisher
@@ -59,6 +65,7 @@ import pkg.updatelog as updatelog
 from pkg.actions import ActionError
 from pkg.client import global_settings
 from pkg.client.debugvalues import DebugValues
+from pkg.pkggzip import PkgGzipFile
 logger = global_settings.logger
 
 class TransportCfg(object):
@@ -822,7 +829,7 @@ class Transport(object):
         @LockedTransport()
         def get_catalog1(self, pub, flist, ts=None, path=None,
             progtrack=None, ccancel=None, revalidate=False, redownload=False,
-            alt_repo=None):
+            alt_repo=None, etag=None):
                 """Get the catalog1 files from publisher 'pub' that
                 are given as a list in 'flist'.  If the caller supplies
                 an optional timestamp argument, only get the files that
@@ -852,11 +859,22 @@ class Transport(object):
                 and needs a refresh it should set 'revalidate' to True.
                 If the caller knows that the upstream metadata is cached and
                 is corrupted, it should set 'redownload' to True.  Either
-                'revalidate' or 'redownload' may be used, but not both."""
+                'revalidate' or 'redownload' may be used, but not both.
+
+                If the caller already has a copy of the file, it may supply
+                the SHA-1 hash of its content in 'etag' so that the file is
+                only retrieved if it has changed.  Like 'ts', this may only
+                be used if the length of flist is 1.  If the repository
+                indicates that the file hasn't changed, nothing is placed in
+                the completed directory."""
 
                 retry_count = global_settings.PKG_CLIENT_MAX_TIMEOUT
                 failures = []
                 header = self.__build_header(uuid=self.__get_uuid(pub))
+                if etag:
+                        if not header:
+                                header = {}
+                        header["If-None-Match"] = "\"{0}\"".format(etag)
 
                 if progtrack and ccancel:
                         progtrack.check_cancelation = ccancel
@@ -866,6 +884,9 @@ class Transport(object):
                 if ts and len(flist) > 1:
                         raise ValueError("Ts may only be used with a single"
                             " item flist.")
+                if etag and len(flist) > 1:
+                        raise ValueError("Etag may only be used with a single"
+                            " item flist.")
 
                 if redownload and revalidate:
                         raise ValueError("Either revalidate or redownload"
@@ -935,6 +956,12 @@ class Transport(object):
                                 gave_up = True
                                 errlist = ex.failures
                                 success = ex.success
+                        except tx.TransportProtoError as e:
+                                if e.code == httplib.NOT_MODIFIED:
+                                        # The caller's copy of the file is
+                                        # current.
+                                        return
+                                raise
 
                         for e in errlist:
                                 # General case: Fish the request information
@@ -1553,12 +1580,19 @@ class Transport(object):
                                 mfstlist = [(fmri, d.build_refetch_header(h))
                                     for fmri, h in mfstlist]
 
+                        # Retrieve all of the manifests using a single
+                        # request if the repository supports it.
+                        if self.__supports_manifests_batch(d):
+                                get_manifests = d.get_manifests_batch
+                        else:
+                                get_manifests = d.get_manifests
+
                         # This returns a list of transient errors
                         # that occurred during the transport operation.
                         # An exception handler here isn't necessary
                         # unless we want to suppress a permanent failure.
                         try:
-                                errlist = d.get_manifests(mfstlist,
+                                errlist = get_manifests(mfstlist,
                                     download_dir, progtrack=progtrack, pub=pub)
                         except tx.ExcessiveTransientFailure as ex:
                                 # If an endpoint experienced so many failures
@@ -1653,6 +1687,20 @@ class Transport(object):
                         else:
                                 return
 
+        def __supports_manifests_batch(self, repo):
+                """Returns a boolean value indicating whether the given
+                transport repository object supports retrieving multiple
+                manifests in a single request."""
+
+                if not repo.has_version_data():
+                        try:
+                                self.__fill_repo_vers(repo)
+                        except tx.TransportException:
+                                # Prefetch is best-effort; fall back to
+                                # retrieving manifests individually.
+                                return False
+                return repo.supports_version("manifests", [0]) > -1
+
         def _verify_manifest(self, fmri, mfstpath=None, content=None, pub=None):
                 """Verify a manifest.  The caller must supply the FMRI
                 for the package in 'fmri', as well as the path to the
@@ -1779,7 +1827,11 @@ class Transport(object):
                 allows us to break up download operations into multiple
                 chunks.  Since we re-evaluate our host selection after
                 each chunk, this gives us a better way of reacting to
-                changing conditions in the network."""
+                changing conditions in the network.
+
+                Each file is handed to a pool of threads for verification as
+                soon as its transfer completes, so that content is verified
+                while the remaining files are still being transferred."""
 
                 retry_count = global_settings.PKG_CLIENT_MAX_TIMEOUT
                 failures = []
@@ -1802,80 +1854,28 @@ class Transport(object):
                 else:
                         cache = None
 
-                for d, retries, v in self.__gen_repo(pub, retry_count,
-                    operation="file", versions=[0, 1],
-                    alt_repo=mfile.get_alt_repo()):
-
-                        failedreqs = []
-                        repostats = self.stats[d.get_repouri_key()]
-                        if repostats.content_errors and retries > 1:
-                                header = d.build_refetch_header(header)
-
-                        gave_up = False
-
-                        # This returns a list of transient errors
-                        # that occurred during the transport operation.
-                        # An exception handler here isn't necessary
-                        # unless we want to supress a permanant failure.
-                        try:
-                                errlist = d.get_files(filelist, download_dir,
-                                    progtrack, v, header, pub=pub)
-                        except tx.ExcessiveTransientFailure as ex:
-                                # If an endpoint experienced so many failures
-                                # that we just gave up, record this for later
-                                # and try a different host.
-                                gave_up = True
-                                errlist = ex.failures
-                                success = ex.success
-
-                        for e in errlist:
-                                req = getattr(e, "request", None)
-                                if req:
-                                        failedreqs.append(req)
-                                        failures.append(e)
-                                else:
-                                        raise e
-
-                        if gave_up:
-                                # If the transport gave up due to excessive
-                                # consecutive errors, the caller is returned a
-                                # list of successful requests, and a list of
-                                # failures.  We need to consider the requests
-                                # that were not attempted because we gave up
-                                # early.  In this situation, they're failed
-                                # requests, even though no exception was
-                                # returned.  Filter the flist to remove the
-                                # successful requests.  Everything else failed.
-                                failedreqs = [
-                                    x for x in filelist
-                                    if x not in success
-                                ]
-                                filelist = failedreqs
-                        elif failedreqs:
-                                success = [
-                                    x for x in filelist
-                                    if x not in failedreqs
-                                ]
-                                filelist = failedreqs
-                        else:
-                                success = filelist
-                                filelist = None
-
-                        for s in success:
-
-                                dl_path = os.path.join(download_dir, s)
-
-                                try:
-                                        self._verify_content(mfile[s][0],
-                                            dl_path)
-                                except tx.InvalidContentException as e:
+                pipeline = _VerifyPipeline(self._verify_content,
+                    min(len(flist), misc.get_ncpus(),
+                    global_settings.PKG_CLIENT_VERIFY_THREADS))
+
+                def dispatch(s):
+                        pipeline.add(s, mfile[s][0],
+                            os.path.join(download_dir, s))
+                        dispatched.add(s)
+                        finish()
+
+                def finish(wait=False):
+                        # Complete the processing of the files that have been
+                        # verified.  This must be done in this thread, as
+                        # neither mfile nor the progress tracker are
+                        # thread-safe.
+                        for s, dl_path, e in pipeline.results(wait=wait):
+                                if e:
                                         mfile.subtract_progress(e.size)
-                                        e.request = s                                        
+                                        e.request = s
                                         repostats.record_error(content=True)
-                                        failedreqs.append(s)
+                                        badreqs.append(s)
                                         failures.append(e)
-                                        if not filelist:
-                                                filelist = failedreqs
                                         continue
 
                                 if cache:
@@ -1884,9 +1884,97 @@ class Transport(object):
                                 else:
                                         mfile.file_done(s, dl_path)
 
-                        # Return if everything was successful
-                        if not filelist and not errlist:
-                                return
+                try:
+                        for d, retries, v in self.__gen_repo(pub, retry_count,
+                            operation="file", versions=[0, 1],
+                            alt_repo=mfile.get_alt_repo()):
+
+                                failedreqs = []
+                                badreqs = []
+                                dispatched = set()
+                                repostats = self.stats[d.get_repouri_key()]
+                                if repostats.content_errors and retries > 1:
+                                        header = d.build_refetch_header(header)
+
+                                gave_up = False
+
+                                # This returns a list of transient errors
+                                # that occurred during the transport operation.
+                                # An exception handler here isn't necessary
+                                # unless we want to supress a permanant failure.
+                                # Files are passed to dispatch() as soon as
+                                # they have been transferred.
+                                try:
+                                        errlist = d.get_files(filelist,
+                                            download_dir, progtrack, v, header,
+                                            pub=pub, done_cb=dispatch)
+                                except tx.ExcessiveTransientFailure as ex:
+                                        # If an endpoint experienced so many
+                                        # failures that we just gave up, record
+                                        # this for later and try a different
+                                        # host.
+                                        gave_up = True
+                                        errlist = ex.failures
+                                        success = ex.success
+
+                                for e in errlist:
+                                        req = getattr(e, "request", None)
+                                        if req:
+                                                failedreqs.append(req)
+                                                failures.append(e)
+                                        else:
+                                                raise e
+
+                                if gave_up:
+                                        # If the transport gave up due to
+                                        # excessive consecutive errors, the
+                                        # caller is returned a list of
+                                        # successful requests, and a list of
+                                        # failures.  We need to consider the
+                                        # requests that were not attempted
+                                        # because we gave up early.  In this
+                                        # situation, they're failed requests,
+                                        # even though no exception was
+                                        # returned.  Filter the flist to remove
+                                        # the successful requests, including
+                                        # those already dispatched.
+                                        # Everything else failed.
+                                        failedreqs = [
+                                            x for x in filelist
+                                            if x not in success and
+                                            x not in dispatched
+                                        ]
+                                        filelist = failedreqs
+                                elif failedreqs:
+                                        success = [
+                                            x for x in filelist
+                                            if x not in failedreqs and
+                                            x not in dispatched
+                                        ]
+                                        filelist = failedreqs
+                                else:
+                                        success = [
+                                            x for x in filelist
+                                            if x not in dispatched
+                                        ]
+                                        filelist = None
+
+                                for s in success:
+                                        dispatch(s)
+                                finish(wait=True)
+
+                                if badreqs:
+                                        # Files with invalid content are
+                                        # retried along with any failed
+                                        # requests.
+                                        failedreqs.extend(badreqs)
+                                        filelist = failedreqs
+
+                                # Return if everything was successful
+                                if not filelist and not errlist:
+                                        return
+                finally:
+                        pipeline.close()
 
                 if failedreqs and failures:
                         failures = [
@@ -1937,11 +2025,16 @@ class Transport(object):
                         # os.statvfs is not available on Windows
                         pass
 
+                # Files for which an older version is installed may be
+                # retrieved as deltas against it.
+                self._get_deltas(mfile)
+
                 while mfile:
 
                         filelist = []
                         chunksz = self.__chunk_size(pub,
-                            alt_repo=mfile.get_alt_repo())
+                            alt_repo=mfile.get_alt_repo(),
+                            filesize=mfile.get_avg_size())
 
                         for i, v in enumerate(mfile):
                                 if i >= chunksz:
@@ -1950,6 +2043,163 @@ class Transport(object):
 
                         self._get_files_list(mfile, filelist)
 
+        def _get_deltas(self, mfile):
+                """Retrieve the files in 'mfile' for which an older version is
+                installed as deltas against that version, if the publisher's
+                repository supports it.  Files that can't be retrieved this
+                way are left in 'mfile' to be retrieved in full."""
+
+                origins = mfile.get_origins()
+                pub = mfile.get_publisher()
+                if not origins or not isinstance(pub, publisher.Publisher):
+                        return
+
+                # The reconstructed files are kept in the writable cache until
+                # they are installed, so there must be one.
+                cache = self.cfg.get_caches(pub, readonly=False)
+                if not cache:
+                        return
+                cache = cache[0]
+
+                # Small files are cheaper to retrieve in full along with the
+                # rest than to retrieve and apply a delta for.
+                minsize = global_settings.PKG_CLIENT_DELTA_MIN_SIZE
+                deltas = {}
+                for s, orig, opath in origins:
+                        action = mfile[s][0]
+                        if misc.get_pkg_otw_size(action) < minsize:
+                                continue
+                        ohash = digest.get_least_preferred_hash(orig)[1]
+                        deltas[s] = (ohash, action, opath)
+                if not deltas:
+                        return
+
+                try:
+                        d, retries, v = next(self.__gen_repo(pub, 1,
+                            operation="delta", versions=[0],
+                            alt_repo=mfile.get_alt_repo()))
+                except (StopIteration, apx.UnsupportedRepositoryOperation,
+                    apx.NoPublisherRepositories, tx.TransportException):
+                        return
+
+                header = self.__build_header(uuid=self.__get_uuid(pub))
+                download_dir = os.path.join(self.cfg.incoming_root, "delta")
+                delta_cache = self._delta_cache_dir(cache)
+                self._makedirs(download_dir)
+                self._makedirs(delta_cache)
+                progtrack = mfile.get_progtrack()
+
+                pending = set(deltas)
+                try:
+                        while pending:
+                                deltalist = [
+                                    (deltas[s][0], s)
+                                    for s in pending
+                                ]
+                                try:
+                                        errlist = d.get_deltas(deltalist,
+                                            download_dir, header, pub=pub)
+                                        failed = set(
+                                            getattr(e, "request", None)
+                                            for e in errlist
+                                        )
+                                        success = pending - failed
+                                        pending = set()
+                                except tx.ExcessiveTransientFailure as e:
+                                        # Deltas the repository hasn't
+                                        # generated yet are reported as errors
+                                        # too, so carry on with those that
+                                        # weren't attempted.
+                                        failed = set(
+                                            getattr(f, "request", None)
+                                            for f in e.failures
+                                        )
+                                        success = set(e.success)
+                                        if not (pending & (failed | success)):
+                                                break
+                                        pending -= failed | success
+                                except tx.TransportException:
+                                        # The files will be retrieved in full
+                                        # instead.
+                                        break
+
+                                for s in success:
+                                        ohash, action, opath = deltas[s]
+                                        cpath = os.path.join(delta_cache, s)
+                                        if not self.__apply_delta(action, opath,
+                                            os.path.join(download_dir, s),
+                                            cpath):
+                                                continue
+
+                                        # The transport engine didn't account
+                                        # for this file, so do so here.
+                                        if progtrack:
+                                                progtrack.download_add_progress(
+                                                    1, os.stat(cpath).st_size)
+                                        mfile.file_done(s, cpath)
+                finally:
+                        shutil.rmtree(download_dir, True)
+
+        @staticmethod
+        def _delta_cache_dir(cache):
+                """Return the directory of the writable cache 'cache' in which
+                files reconstructed from deltas are kept.  These are stored
+                apart from the retrieved files as they are compressed locally
+                and so don't match the compressed hash of their actions."""
+
+                return os.path.join(cache.root, "delta")
+
+        def __apply_delta(self, action, opath, dpath, cpath):
+                """Reconstruct the payload of 'action' from the installed file
+                'opath' using the gzip-compressed delta at 'dpath', and store it
+                compressed at 'cpath'.  The reconstructed content is verified
+                against the preferred hash of 'action'.  Returns a boolean
+                indicating whether this was successful."""
+
+                hash_attr, hash_val, hash_func = digest.get_preferred_hash(
+                    action, hash_type=digest.HASH)
+                ddir = os.path.dirname(dpath)
+
+                dtmp = ntmp = None
+                success = False
+                try:
+                        dfd, dtmp = tempfile.mkstemp(dir=ddir)
+                        with os.fdopen(dfd, "w+b") as df:
+                                with open(dpath, "rb") as fobj:
+                                        misc.gunzip_from_stream(fobj, df,
+                                            ignore_hash=True)
+                                df.seek(0)
+                                nfd, ntmp = tempfile.mkstemp(dir=ddir)
+                                with os.fdopen(nfd, "wb") as nf:
+                                        with open(opath, "rb") as of:
+                                                pkg.delta.apply_delta(df, of,
+                                                    nf)
+
+                        if misc.get_data_digest(ntmp,
+                            hash_func=hash_func)[0] != hash_val:
+                                return False
+
+                        with open(ntmp, "rb") as nf:
+                                with open(cpath, "wb") as out:
+                                        gz = PkgGzipFile(fileobj=out)
+                                        shutil.copyfileobj(nf, gz)
+                                        gz.close()
+                        success = True
+                except (pkg.delta.DeltaError, zlib.error, EnvironmentError):
+                        # The file will be retrieved in full instead.
+                        pass
+                finally:
+                        paths = [dtmp, ntmp]
+                        if not success:
+                                paths.append(cpath)
+                        for p in paths:
+                                try:
+                                        if p:
+                                                portable.remove(p)
+                                except EnvironmentError:
+                                        pass
+                return success
+
         def get_versions(self, pub, ccancel=None, alt_repo=None):
                 """Query the publisher's origin servers for versions
                 information.  Return a dictionary of "name":"versions" """
@@ -2231,15 +2481,26 @@ class Transport(object):
                                 raise apx.UnsupportedRepositoryOperation(pub,
                                     "{0}/{1:d}".format(operation, versions[-1]))
 
-        def __chunk_size(self, pub, alt_repo=None, origin_only=False):
+        def __chunk_size(self, pub, alt_repo=None, origin_only=False,
+            filesize=0):
                 """Determine the chunk size based upon how many of the known
                 mirrors have been visited.  If not all mirrors have been
                 visited, choose a small size so that if it ends up being
-                a poor choice, the client doesn't transfer too much data."""
+                a poor choice, the client doesn't transfer too much data.
+
+                Once they have all been visited, and the caller provides the
+                average size in bytes of the items to be transferred as
+                'filesize', the size is chosen so that a chunk takes about
+                CHUNK_SECONDS to transfer at the best speed observed, and
+                covers several times the bandwidth-delay product of that
+                repository so that the connections aren't left idle waiting
+                for the last requests of each chunk."""
 
                 CHUNK_SMALL = 10
                 CHUNK_LARGE = 100
                 CHUNK_HUGE = 1024
+                CHUNK_SECONDS = 10
+                CHUNK_MIN_BDP = 8
 
                 # Call setup if the transport isn't configured or was shutdown.
                 if not self.__engine:
@@ -2268,7 +2529,22 @@ class Transport(object):
                         return CHUNK_HUGE
                 if m < n:
                         return CHUNK_SMALL
-                return CHUNK_LARGE
+                if filesize <= 0:
+                        return CHUNK_LARGE
+
+                # The connection time is used as an estimate of the round
+                # trip time to the repository.
+                speed, rtt = max(
+                    (self.stats[r.key()].transfer_speed,
+                    self.stats[r.key()].connect_time)
+                    for r in repolist
+                )
+                if speed <= 0:
+                        return CHUNK_LARGE
+                nbytes = max(speed * CHUNK_SECONDS,
+                    speed * rtt * CHUNK_MIN_BDP)
+                return int(min(CHUNK_HUGE, max(CHUNK_SMALL,
+                    nbytes / filesize)))
 
         @LockedTransport()
         def valid_publisher_test(self, pub, ccancel=None):
@@ -2494,6 +2770,38 @@ class Transport(object):
                                 # hash of the action, verify will have already
                                 # purged the item from the cache.
                                 pass
+
+                if in_hash:
+                        return None
+
+                # Files reconstructed from deltas are only ever stored in
+                # writable caches, and have no compressed hash to verify; their
+                # uncompressed content is verified instead.
+                fname = hash_val
+                hash_attr, hash_val, hash_func = digest.get_preferred_hash(
+                    action, hash_type=digest.HASH)
+                for cache in self.cfg.get_caches(pub=pub, readonly=False):
+                        cache_path = os.path.join(self._delta_cache_dir(cache),
+                            fname)
+                        if not os.path.exists(cache_path):
+                                continue
+                        if verify is False:
+                                return cache_path
+
+                        try:
+                                with open(cache_path, "rb") as ifile:
+                                        with open(os.devnull, "wb") as ofile:
+                                                fhash = misc.gunzip_from_stream(
+                                                    ifile, ofile,
+                                                    hash_func=hash_func)
+                        except (zlib.error, EnvironmentError):
+                                fhash = None
+                        if fhash == hash_val:
+                                return cache_path
+                        try:
+                                portable.remove(cache_path)
+                        except EnvironmentError:
+                                pass
                 return None
 
         @staticmethod
@@ -3028,6 +3336,94 @@ class Transport(object):
                 return True
 
 
+class _VerifyPipeline(object):
+        """Verifies downloaded content using a pool of threads, so that the
+        decompression and hashing of files which have been transferred
+        overlaps with the transfer of others.  The results are collected by
+        the thread that added the files, which is the only one that may act
+        on them."""
+
+        def __init__(self, verify_func, nthreads):
+                """'verify_func' is called with an action and the path of its
+                downloaded payload, and raises InvalidContentException if the
+                content is not valid.  'nthreads' is the number of threads
+                to verify content with."""
+
+                self.__verify = verify_func
+                self.__tasks = Queue.Queue()
+                self.__results = Queue.Queue()
+                self.__pending = 0
+                self.__threads = []
+                for i in range(max(nthreads, 1)):
+                        t = threading.Thread(target=self.__worker)
+                        t.daemon = True
+                        t.start()
+                        self.__threads.append(t)
+
+        def __worker(self):
+                while True:
+                        item = self.__tasks.get()
+                        if item is None:
+                                return
+                        req, action, path = item
+                        try:
+                                self.__verify(action, path)
+                        except tx.InvalidContentException as e:
+                                self.__results.put((req, path, e, None))
+                        except:
+                                self.__results.put((req, path, None,
+                                    sys.exc_info()))
+                        else:
+                                self.__results.put((req, path, None, None))
+
+        def add(self, req, action, path):
+                """Queue the file for request 'req', downloaded to 'path', for
+                verification against 'action'."""
+
+                self.__pending += 1
+                self.__tasks.put((req, action, path))
+
+        def results(self, wait=False):
+                """Yield a tuple of (request, path, error) for each file which
+                has been verified, where 'error' is the InvalidContentException
+                raised for the file, or None.  If 'wait' is True, wait for all
+                queued files to be verified.  Any other exception raised while
+                verifying a file is re-raised here."""
+
+                while self.__pending:
+                        try:
+                                # A timeout is used so that the calling thread
+                                # can still be interrupted while waiting.
+                                if wait:
+                                        item = self.__results.get(True, 0.5)
+                                else:
+                                        item = self.__results.get_nowait()
+                        except Queue.Empty:
+                                if wait:
+                                        continue
+                                return
+
+                        self.__pending -= 1
+                        req, path, err, exc_info = item
+                        if exc_info:
+                                raise exc_info[0], exc_info[1], exc_info[2]
+                        yield req, path, err
+
+        def close(self):
+                """Discard any files not yet verified and stop the threads."""
+
+                while True:
+                        try:
+                                self.__tasks.get_nowait()
+                        except Queue.Empty:
+                                break
+                for t in self.__threads:
+                        self.__tasks.put(None)
+                for t in self.__threads:
+                        t.join()
+                self.__threads = []
+
+
 class MultiXfr(object):
         """A transport object for performing multiple simultaneous
         requests.  This object matches publisher to list of requests, and
@@ -3115,12 +3511,18 @@ class MultiFile(MultiXfr):
                     ccancel=ccancel, alt_repo=alt_repo)
 
                 self._transport = xport
+                self._origins = {}
 
-        def add_action(self, action):
+        def add_action(self, action, origin=None):
                 """The multiple file retrieval operation is asynchronous.
                 Add files to retrieve with this function.  The caller
                 should pass the action, which causes its file to
-                be added to an internal retrieval list."""
+                be added to an internal retrieval list.
+
+                'origin', if specified, is a tuple of the action that
+                delivered an older version of the file and the path at which
+                it is installed; the file may then be retrieved as a delta
+                against that version."""
 
                 cpath = self._transport._action_cached(action,
                     self.get_publisher())
@@ -3145,6 +3547,8 @@ class MultiFile(MultiXfr):
                 if action.name == "signature":
                         for c in action.get_chain_certs(least_preferred=True):
                                 self.add_hash(c, action)
+                elif origin:
+                        self._origins.setdefault(hash_val, origin)
 
         def add_hash(self, hashval, item):
                 """Add 'item' to list of values that exist for
@@ -3152,6 +3556,30 @@ class MultiFile(MultiXfr):
 
                 self._hash.setdefault(hashval, []).append(item)
 
+        def get_origins(self):
+                """Return a list of (hash value, original action, installed
+                path) tuples for the files yet to be retrieved that may be
+                retrieved as deltas."""
+
+                return [
+                    (h, orig, opath)
+                    for h, (orig, opath) in self._origins.iteritems()
+                    if h in self._hash
+                ]
+
+        def get_avg_size(self, sample=100):
+                """Return the average size in bytes of the files to be
+                transferred, based on at most 'sample' of them, or 0 if
+                there are none."""
+
+                sizes = [
+                    misc.get_pkg_otw_size(self._hash[h][0])
+                    for h in itertools.islice(self._hash, sample)
+                ]
+                if not sizes:
+                        return 0
+                return sum(sizes) / float(len(sizes))
+
         def file_done(self, hashval, current_path):
                 """Tell MFile that the transfer completed successfully."""
 
@@ -3245,8 +3673,11 @@ class MultiFileNI(MultiFile):
                 hash_attr, hash_val, hash_func = \
                     digest.get_least_preferred_hash(action)
 
-                if cpath and self._final_dir:
-                        self._final_copy(hash_val, cpath)
+                # Files which are already cached are never retrieved again,
+                # even if they are to be left in the cache.
+                if cpath:
+                        if self._final_dir:
+                                self._final_copy(hash_val, cpath)
                         if self._progtrack:
                                 filesz = int(misc.get_pkg_otw_size(action))
                                 self._progtrack.download_add_progress(1, filesz,
@@ -3257,8 +3688,9 @@ class MultiFileNI(MultiFile):
                         for c in action.get_chain_certs(least_preferred=True):
                                 cpath = self._transport._action_cached(action,
                                     self.get_publisher(), in_hash=c)
-                                if cpath and self._final_dir:
-                                        self._final_copy(c, cpath)
+                                if cpath:
+                                        if self._final_dir:
+                                                self._final_copy(c, cpath)
                                         if self._progtrack:
                                                 self._progtrack.download_add_progress(
                                                     1, int(
@@ -0,0 +1,265 @@
+#!/usr/bin/python2.7
+#
+# CDDL HEADER START
+#
+# The contents of this file are subject to the terms of the
+# Common Development and Distribution License (the "License").
+# You may not use this file except in compliance with the License.
+#
+# You can obtain a copy of the license at usr/src/OPENSOLARIS.LICENSE
+# or http://www.opensolaris.org/os/licensing.
+# See the License for the specific language governing permissions
+# and limitations under the License.
+#
+# When distributing Covered Code, include this CDDL HEADER in each
+# file and include the License file at usr/src/OPENSOLARIS.LICENSE.
+# If applicable, add the following below this CDDL HEADER, with the
+# fields enclosed by brackets "[]" replaced with your own identifying
+# information: Portions Copyright [yyyy] [name of copyright owner]
+#
+# CDDL HEADER END
+#
+
+#
+# Copyright (c) 2026, Oracle and/or its affiliates. All rights reserved.
+#
+
+"""Binary deltas between two versions of a file.
+
+A delta describes how to reconstruct a new version of a file from an old one.
+Both files are split into chunks whose boundaries are chosen based on their
+content, so that an insertion or deletion only affects the chunks around it.
+Chunks of the new file that also appear in the old file are copied from it,
+and the rest are included in the delta.
+
+A delta starts with DELTA_MAGIC, followed by a sequence of operations, each
+starting with a single byte:
+
+    "C" <offset> <length>
+        Copy 'length' bytes starting at 'offset' in the old file.
+
+    "D" <length> <data>
+        Write the 'length' bytes of 'data' that follow.
+
+    "E" <size>
+        End of the delta; the new file is 'size' bytes long.
+
+All numbers are unsigned 64-bit integers in network byte order.  Deltas are
+only generated by repositories, so the chunking parameters can change without
+affecting clients."""
+
+import hashlib
+import random
+import struct
+
+DELTA_MAGIC = "PKG5DLT1"
+
+# Minimum, maximum, and (approximately) average size of a chunk.
+_MIN_CHUNK = 2 * 1024
+_MAX_CHUNK = 64 * 1024
+# A chunk ends where the thirteen high bits of the rolling hash are zero,
+# giving an average chunk size of 8k beyond the minimum.
+_BOUNDARY_MASK = 0xfff80000
+
+# Random values used by the rolling hash for each byte value.  The seed is
+# fixed so that chunk boundaries are the same for every run.
+_rand = random.Random(0x706b6735)
+_GEAR = tuple(_rand.getrandbits(32) for i in range(256))
+del _rand
+
+_OP = struct.Struct("!c")
+_NUM = struct.Struct("!Q")
+_COPY = struct.Struct("!QQ")
+
+# Literal data is written in pieces no larger than this.
+_MAX_DATA = 1024 * 1024
+
+
+class DeltaError(Exception):
+        """Raised when a delta is malformed or doesn't apply to the file it
+        is applied to."""
+
+        def __init__(self, reason):
+                Exception.__init__(self, reason)
+                self.reason = reason
+
+        def __str__(self):
+                return _("Invalid delta: {0}").format(self.reason)
+
+
+class FileTooLargeError(Exception):
+        """Raised by make_delta() when a file is larger than the largest size
+        of the files it was asked to generate a delta for."""
+
+        def __init__(self, size):
+                Exception.__init__(self, size)
+                self.size = size
+
+        def __str__(self):
+                return _("File is larger than {0:d} bytes.").format(self.size)
+
+
+def _cut(buf, start, end):
+        """Return the length of the chunk starting at 'start' in 'buf', where
+        'end' is the offset at which the chunk must end if no boundary is
+        found before it."""
+
+        if end - start <= _MIN_CHUNK:
+                return end - start
+
+        gear = _GEAR
+        h = 0
+        first = start + _MIN_CHUNK
+        for i, b in enumerate(bytearray(buf[first:end])):
+                h = ((h << 1) + gear[b]) & 0xffffffff
+                if not h & _BOUNDARY_MASK:
+                        return _MIN_CHUNK + i + 1
+        return end - start
+
+
+def chunks(f, bufsz=1024 * 1024):
+        """Yield a tuple of (offset, data) for each content-defined chunk of
+        the file object 'f', read in 'bufsz' byte pieces."""
+
+        buf = ""
+        pos = 0
+        offset = 0
+        eof = False
+        while True:
+                if not eof and len(buf) - pos < _MAX_CHUNK:
+                        data = f.read(bufsz)
+                        if data:
+                                buf = buf[pos:] + data
+                                pos = 0
+                                continue
+                        eof = True
+
+                if pos >= len(buf):
+                        return
+
+                n = _cut(buf, pos, min(len(buf), pos + _MAX_CHUNK))
+                yield offset, buf[pos:pos + n]
+                offset += n
+                pos += n
+
+
+def make_delta(old, new, out, max_size=None):
+        """Write a delta that transforms the content of the file object 'old'
+        into the content of the file object 'new' to the file object 'out'.
+        Returns a tuple of the number of bytes of the new file that will be
+        copied from the old one and the number included in the delta.
+
+        Chunking a file is slow, so if 'max_size' is specified, generation
+        stops and FileTooLargeError is raised as soon as either file is found
+        to be larger than that many bytes."""
+
+        def limit(f):
+                for offset, data in chunks(f):
+                        if max_size is not None and \
+                            offset + len(data) > max_size:
+                                raise FileTooLargeError(max_size)
+                        yield offset, data
+
+        index = {}
+        for offset, data in limit(old):
+                index.setdefault(hashlib.sha1(data).digest(),
+                    (offset, len(data)))
+
+        out.write(DELTA_MAGIC)
+        copied = 0
+        literal = 0
+        size = 0
+        # Adjacent operations of the same kind are merged.
+        copy_off = copy_len = 0
+        pending = []
+        pending_len = 0
+
+        def flush_copy():
+                if copy_len:
+                        out.write("C")
+                        out.write(_COPY.pack(copy_off, copy_len))
+
+        def flush_data():
+                if pending_len:
+                        out.write("D")
+                        out.write(_NUM.pack(pending_len))
+                        out.write("".join(pending))
+
+        for offset, data in limit(new):
+                size += len(data)
+                entry = index.get(hashlib.sha1(data).digest())
+                if entry and entry[1] == len(data):
+                        flush_data()
+                        pending = []
+                        pending_len = 0
+                        copied += len(data)
+                        if copy_len and copy_off + copy_len == entry[0]:
+                                copy_len += len(data)
+                                continue
+                        flush_copy()
+                        copy_off, copy_len = entry
+                        continue
+
+                flush_copy()
+                copy_len = 0
+                literal += len(data)
+                if pending_len + len(data) > _MAX_DATA:
+                        flush_data()
+                        pending = []
+                        pending_len = 0
+                pending.append(data)
+                pending_len += len(data)
+
+        flush_copy()
+        flush_data()
+        out.write("E")
+        out.write(_NUM.pack(size))
+        return copied, literal
+
+
+def apply_delta(delta, old, out, bufsz=64 * 1024):
+        """Reconstruct the new version of a file by applying the delta read
+        from the file object 'delta' to the file object 'old', which must be
+        seekable, writing the result to the file object 'out'.  Returns the
+        size of the new file.  DeltaError is raised if the delta is malformed
+        or refers to data beyond the end of 'old'."""
+
+        def read(n):
+                data = delta.read(n)
+                if len(data) != n:
+                        raise DeltaError(_("unexpected end of data"))
+                return data
+
+        if read(len(DELTA_MAGIC)) != DELTA_MAGIC:
+                raise DeltaError(_("unknown format"))
+
+        size = 0
+        while True:
+                op = read(_OP.size)
+                if op == "C":
+                        offset, length = _COPY.unpack(read(_COPY.size))
+                        old.seek(offset)
+                        while length:
+                                data = old.read(min(length, bufsz))
+                                if not data:
+                                        raise DeltaError(_("copy beyond end "
+                                            "of original file"))
+                                out.write(data)
+                                length -= len(data)
+                                size += len(data)
+                elif op == "D":
+                        length = _NUM.unpack(read(_NUM.size))[0]
+                        while length:
+                                data = read(min(length, bufsz))
+                                out.write(data)
+                                length -= len(data)
+                                size += len(data)
+                elif op == "E":
+                        expected = _NUM.unpack(read(_NUM.size))[0]
+                        if expected != size:
+                                raise DeltaError(_("size mismatch: expected "
+                                    "{0:d}, got {1:d}").format(expected, size))
+                        return size
+                else:
+                        raise DeltaError(_("unknown operation {0!r}").format(
+                            op))
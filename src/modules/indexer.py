@@ -21,13 +21,16 @@
 #
 
 #
-# Copyright (c) 2007, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2007, 2026, Oracle and/or its affiliates. All rights reserved.
 #
 
 import errno
+import heapq
+import multiprocessing
 import os
 import platform
 import shutil
+import signal
 import urllib
 
 import pkg.fmri as fmri
@@ -55,6 +58,11 @@ SORT_FILE_PREFIX = "sort."
 
 SORT_FILE_MAX_SIZE = 128 * 1024 * 1024
 
+# When indexing with multiple processes, the packages are divided into this
+# many shards per process so that the work remains balanced when some
+# manifests take much longer to tokenize than others.
+SHARDS_PER_JOB = 4
+
 
 def makedirs(pathname):
         """Create a directory at the specified location if it does not
@@ -74,6 +82,82 @@ def makedirs(pathname):
                         raise
 
 
+def _gen_sort_lines(p_id, new_dict):
+        """Yields a tuple of the token and the temporary sort file line for
+        each entry of 'new_dict', the search dictionary of the manifest for
+        the package with id 'p_id'."""
+
+        for tok_tup in new_dict.keys():
+                tok, action_type, subtype, fv = tok_tup
+                lst = [(action_type, [(subtype, [(fv, [(p_id,
+                    list(new_dict[tok_tup]))])])])]
+                yield tok, ss.IndexStoreMainDict.transform_main_dict_line(tok,
+                    lst)
+
+
+def _write_sort_file(path, lines):
+        """Writes the list of (token, line) tuples 'lines' to 'path' in
+        token order."""
+
+        lines.sort()
+        with open(path, "wb", PKG_FILE_BUFSIZ) as fh:
+                fh.writelines(line for tok, line in lines)
+
+
+# The manifest excludes and log function used by a tokenizing process; these
+# are inherited from the parent when the process is created since they can't
+# be pickled.
+_shard_excludes = EmptyI
+_shard_log = None
+
+
+def _shard_init(excludes, log):
+        """Initialize a tokenizing process.  Interrupts are left to the parent
+        process, which terminates the workers."""
+
+        global _shard_excludes, _shard_log
+
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        _shard_excludes = excludes
+        _shard_log = log
+
+
+def _tokenize_shard(args):
+        """Tokenizes the manifests of a shard of the packages being indexed,
+        writing the results to sorted temporary sort files in the same form
+        as Indexer._add_terms does.
+
+        'args' is a tuple of the directory to write the sort files to, the
+        shard number, the maximum size of each sort file, and a list of
+        (package id, manifest path) tuples.
+
+        Returns a list of the pathnames of the sort files written."""
+
+        tmp_dir, shard, sort_file_max_size, pkgs = args
+        paths = []
+        lines = []
+        nbytes = 0
+        for p_id, mpath in pkgs:
+                new_dict = manifest.Manifest.search_dict(mpath,
+                    _shard_excludes, log=_shard_log)
+                for tok, s in _gen_sort_lines(p_id, new_dict):
+                        if lines and len(s) + nbytes >= sort_file_max_size:
+                                paths.append(os.path.join(tmp_dir,
+                                    "{0}s{1:d}.{2:d}".format(SORT_FILE_PREFIX,
+                                    shard, len(paths))))
+                                _write_sort_file(paths[-1], lines)
+                                lines = []
+                                nbytes = 0
+                        lines.append((ss.IndexStoreMainDict.
+                            parse_main_dict_line_for_token(s), s))
+                        nbytes += len(s)
+        if lines:
+                paths.append(os.path.join(tmp_dir, "{0}s{1:d}.{2:d}".format(
+                    SORT_FILE_PREFIX, shard, len(paths))))
+                _write_sort_file(paths[-1], lines)
+        return paths
+
+
 class Indexer(object):
         """Indexer is a class designed to index a set of manifests or pkg plans
         and provide a compact representation on disk, which is quickly
@@ -83,7 +167,7 @@ class Indexer(object):
 
         def __init__(self, index_dir, get_manifest_func, get_manifest_path_func,
             progtrack=None, excludes=EmptyI, log=None,
-            sort_file_max_size=SORT_FILE_MAX_SIZE):
+            sort_file_max_size=SORT_FILE_MAX_SIZE, jobs=1):
                 self._num_keys = 0
                 self._num_manifests = 0
                 self._num_entries = 0
@@ -95,6 +179,12 @@ class Indexer(object):
                 if self.sort_file_max_size <= 0:
                         raise search_errors.IndexingException(
                             _("sort_file_max_size must be greater than 0"))
+                # The number of processes used to tokenize manifests when
+                # indexing packages by fmri.
+                self.jobs = jobs
+                if self.jobs <= 0:
+                        raise search_errors.IndexingException(
+                            _("jobs must be greater than 0"))
 
                 # This structure was used to gather all index files into one
                 # location. If a new index structure is needed, the files can
@@ -130,6 +220,11 @@ class Indexer(object):
                     ss.InvertedDict(ss.FMRI_OFFSETS_FILE, self._data_manf)
                 self._data_fmri_offsets = self._data_dict["fmri_offsets"]
 
+                # The trigram index is optional, so it isn't opened along with
+                # the other index files.  It's rebuilt whenever the main
+                # dictionary is.
+                self._data_trigrams = ss.IndexStoreTrigrams(ss.TRIGRAM_FILE)
+
                 self._index_dir = index_dir
                 self._tmp_dir = os.path.join(self._index_dir, "TMP")
 
@@ -169,12 +264,18 @@ class Indexer(object):
                 """Turn fmris into strings correctly while writing out
                 the fmri offsets file."""
 
+                if not pfmri:
+                        # An unused id.
+                        return ""
                 return pfmri.get_fmri(anarchy=True, include_scheme=False)
 
         @staticmethod
         def __build_fmri(s):
                 """Build fmris while reading the fmri offset information."""
 
+                if not s:
+                        # An unused id.
+                        return ""
                 return fmri.PkgFmri(s)
 
         @staticmethod
@@ -223,6 +324,7 @@ class Indexer(object):
                 files used to produce a sorted main_dict file."""
 
                 self._sort_fh.close()
+                self._sort_fh = None
                 self._sort_file_bytes = 0
                 tmp_file_name = os.path.join(self._tmp_dir,
                     SORT_FILE_PREFIX + str(self._sort_file_num - 1))
@@ -233,10 +335,16 @@ class Indexer(object):
                     for line in tmp_fh
                 ]
                 tmp_fh.close()
-                l.sort()
-                tmp_fh = file(tmp_file_name, "wb", buffering=PKG_FILE_BUFSIZ)
-                tmp_fh.writelines((line for tok, line in l))
-                tmp_fh.close()
+                _write_sort_file(tmp_file_name, l)
+
+        def __open_sort_fh(self):
+                """Opens the next temporary sort file for writing."""
+
+                assert not self._sort_fh
+                self._sort_fh = open(os.path.join(self._tmp_dir,
+                    SORT_FILE_PREFIX + str(self._sort_file_num)), "wb",
+                    buffering=PKG_FILE_BUFSIZ)
+                self._sort_file_num += 1
 
         def _add_terms(self, pfmri, new_dict):
                 """Adds tokens, and the actions generating them, to the current
@@ -249,22 +357,12 @@ class Indexer(object):
                 the action."""
 
                 p_id = self._data_manf.get_id_and_add(pfmri)
-                pfmri = p_id
-
-                for tok_tup in new_dict.keys():
-                        tok, action_type, subtype, fv = tok_tup
-                        lst = [(action_type, [(subtype, [(fv, [(pfmri,
-                            list(new_dict[tok_tup]))])])])]
-                        s = ss.IndexStoreMainDict.transform_main_dict_line(tok,
-                            lst)
+
+                for tok, s in _gen_sort_lines(p_id, new_dict):
                         if len(s) + self._sort_file_bytes >= \
                             self.sort_file_max_size:
                                 self.__close_sort_fh()
-                                self._sort_fh = open(os.path.join(self._tmp_dir,
-                                    SORT_FILE_PREFIX +
-                                    str(self._sort_file_num)), "wb",
-                                    buffering=PKG_FILE_BUFSIZ)
-                                self._sort_file_num += 1
+                                self.__open_sort_fh()
                         self._sort_fh.write(s)
                         self._sort_file_bytes += len(s)
                 return
@@ -325,13 +423,18 @@ class Indexer(object):
                                 else:
                                         nfast_remove += 1
 
-                if nfast_add > MAX_FAST_INDEXED_PKGS:
+                if nfast_add > MAX_FAST_INDEXED_PKGS or \
+                    nfast_remove > MAX_FAST_INDEXED_PKGS:
                         return False
 
-                #
-                # Second pass actually updates the fast_add and fast_remove
-                # sets and updates progress.
-                #
+                self.__update_fast_logs(pkgplan_list)
+                return True
+
+        def __update_fast_logs(self, pkgplan_list):
+                """Updates the fast_add and fast_remove sets to reflect the
+                changes in the list of pkgplans 'pkgplan_list' and updates
+                progress."""
+
                 self._progtrack.job_start(self._progtrack.JOB_UPDATE_SEARCH,
                     goal=len(pkgplan_list))
                 for p in pkgplan_list:
@@ -361,13 +464,69 @@ class Indexer(object):
 
                 self._progtrack.job_done(self._progtrack.JOB_UPDATE_SEARCH)
 
+        def _merge_update(self, filters_pkgplan_list, out_dir):
+                """Updates the index for a change in the image which is too
+                large to record in the fast update logs.  Instead of
+                rebuilding the index, the packages in the logs, updated to
+                reflect the changes in 'filters_pkgplan_list', are merged into
+                the main dictionary in a single pass over it, and the logs are
+                emptied.
+
+                The "filters_pkgplan_list" parameter is as described for
+                _fast_update.
+
+                The "out_dir" parameter is the temporary directory in which to
+                build the indexes.
+
+                Returns False if the index can't be updated this way, in which
+                case it must be rebuilt."""
+
+                if self.empty_index:
+                        return False
+
+                filters, pkgplan_list = filters_pkgplan_list
+                self.__update_fast_logs(pkgplan_list)
+
+                # Every package being removed must have entries in the main
+                # dictionary; if one doesn't, the index isn't consistent with
+                # the image.
+                removed = set(
+                    fmri.PkgFmri(s) for s in self._data_fast_remove._set
+                )
+                for pfmri in removed:
+                        if not self._data_manf.has_entity(pfmri):
+                                return False
+                added = [
+                    fmri.PkgFmri(s)
+                    for s in sorted(self._data_fast_add._set)
+                ]
+                self._data_fast_add.clear()
+                self._data_fast_remove.clear()
+
+                self._progtrack.job_start(self._progtrack.JOB_REBUILD_SEARCH,
+                    goal=len(added))
+                self.__open_sort_fh()
+                self._process_fmris(added)
+                self.__close_sort_fh()
+                self._update_index(removed, out_dir)
+
+                # The ids of the removed packages are left empty in the
+                # manifest list so that they can be reused by packages added
+                # later.
+                for pfmri in removed:
+                        self._data_manf.remove_entity(pfmri)
+                self._progtrack.job_done(self._progtrack.JOB_REBUILD_SEARCH)
                 return True
 
         def _process_fmris(self, fmris):
                 """Takes a list of fmris and updates the internal storage to
                 reflect the new packages."""
 
-                removed_paths = []
+                removed_paths = set()
+
+                if self.jobs > 1 and len(fmris) > 1:
+                        self.__process_fmris_parallel(fmris)
+                        return removed_paths
 
                 for added_fmri in fmris:
                         self._data_full_fmri.add_entity(
@@ -381,6 +540,66 @@ class Indexer(object):
                             self._progtrack.JOB_REBUILD_SEARCH)
                 return removed_paths
 
+        def __process_fmris_parallel(self, fmris):
+                """Tokenizes the manifests of the list of fmris 'fmris' using a
+                pool of processes.  The packages are divided into contiguous
+                shards, each of which is tokenized into its own sorted
+                temporary sort files; these are merged along with any others
+                by _gen_new_toks_from_files."""
+
+                # Package ids are assigned here, in the order of 'fmris', so
+                # that they're the same as for a serial index build.
+                pkgs = []
+                for added_fmri in fmris:
+                        self._data_full_fmri.add_entity(
+                            added_fmri.get_fmri(anarchy=True))
+                        pkgs.append((self._data_manf.get_id_and_add(added_fmri),
+                            self.get_manifest_path_func(added_fmri)))
+
+                nshards = min(len(pkgs), self.jobs * SHARDS_PER_JOB)
+                size = (len(pkgs) + nshards - 1) // nshards
+                shards = [
+                    (self._tmp_dir, i, self.sort_file_max_size,
+                    pkgs[i * size:(i + 1) * size])
+                    for i in range((len(pkgs) + size - 1) // size)
+                ]
+
+                shard_paths = []
+                pool = multiprocessing.Pool(self.jobs, _shard_init,
+                    (self.excludes, self.__log))
+                try:
+                        # Results are returned in shard order so that the
+                        # merge, and so the index, is the same for every run.
+                        results = pool.imap(_tokenize_shard, shards)
+                        for shard in shards:
+                                # A timeout is used so that the wait can be
+                                # interrupted.
+                                while True:
+                                        try:
+                                                paths = results.next(1)
+                                                break
+                                        except multiprocessing.TimeoutError:
+                                                pass
+                                shard_paths.extend(paths)
+                                self._progtrack.job_add_progress(
+                                    self._progtrack.JOB_REBUILD_SEARCH,
+                                    nitems=len(shard[3]))
+                        pool.close()
+                except:
+                        pool.terminate()
+                        raise
+                finally:
+                        pool.join()
+
+                # Give the shards' sort files the names expected by the merge,
+                # keeping the sort file currently open last.
+                self.__close_sort_fh()
+                for path in shard_paths:
+                        portable.rename(path, os.path.join(self._tmp_dir,
+                            SORT_FILE_PREFIX + str(self._sort_file_num)))
+                        self._sort_file_num += 1
+                self.__open_sort_fh()
+
         def _write_main_dict_line(self, file_handle, token,
             fv_fmri_pos_list_list, out_dir):
                 """Writes out the new main dictionary file and also adds the
@@ -408,6 +627,7 @@ class Indexer(object):
                 cur_location_int = file_handle.tell()
                 cur_location = str(cur_location_int)
                 self._data_token_offset.write_entity(token, cur_location)
+                self._data_trigrams.add_token(token, cur_location_int)
 
                 for at, st_list in fv_fmri_pos_list_list:
                         self._progtrack.job_add_progress(
@@ -480,64 +700,35 @@ class Indexer(object):
                     for i in range(self._sort_file_num)
                 ])
 
-                cur_toks = {}
-                # Seed cur_toks with the first token from each temporary file.
-                # The line may not exist since, for a empty repo, an empty file
-                # is created.
-                for i in fh_dict.keys():
+                # The heap holds the next token from each temporary file,
+                # along with the file's number, which orders the files
+                # providing the same token, and the token's information.
+                # The line may not exist since, for a empty repo, an empty
+                # file is created.
+                heap = []
+                def push_next(i):
                         line = get_line(fh_dict[i])
                         if line is None:
+                                fh_dict[i].close()
                                 del fh_dict[i]
                         else:
-                                cur_toks[i] = line
+                                heapq.heappush(heap, (line[0], i, line[1]))
+
+                for i in fh_dict.keys():
+                        push_next(i)
 
                 old_min_token = None
-                # cur_toks will have items deleted from it as files no longer
-                # have tokens to provide. When no files have tokens, the merge
-                # is done.
-                while cur_toks:
-                        min_token = None
-                        matches = []
-                        # Find smallest available token and the temporary files
-                        # which contain that token.
-                        for i in fh_dict.keys():
-                                cur_tok, info = cur_toks[i]
-                                if cur_tok is None:
-                                        continue
-                                if min_token is None or cur_tok < min_token:
-                                        min_token = cur_tok
-                                        matches = [i]
-                                elif cur_tok == min_token:
-                                        matches.append(i)
-                        assert min_token is not None
-                        assert len(matches) > 0
-                        res = None
-                        for i in matches:
-                                new_tok, new_info = cur_toks[i]
-                                assert new_tok == min_token
-                                try:
-                                        # Continue pulling the next tokens from
-                                        # and adding them to the result list as
-                                        # long as the token matches min_token.
-                                        while new_tok == min_token:
-                                                if res is None:
-                                                        res = new_info
-                                                else:
-                                                        self.__splice(res,
-                                                            new_info)
-                                                new_tok, new_info = \
-                                                    ss.IndexStoreMainDict.parse_main_dict_line(fh_dict[i].next())
-                                        cur_toks[i] = new_tok, new_info
-                                except StopIteration:
-                                        # When a StopIteration happens, the
-                                        # last line in the file has been read
-                                        # and processed. Delete all the
-                                        # information associated with that file
-                                        # so that we no longer check that file.
-                                        fh_dict[i].close()
-                                        del fh_dict[i]
-                                        del cur_toks[i]
-                        assert res is not None
+                # When no files have tokens, the merge is done.
+                while heap:
+                        # Take the smallest available token and splice
+                        # together the information from every line, in every
+                        # temporary file, for that token.
+                        min_token, i, res = heapq.heappop(heap)
+                        push_next(i)
+                        while heap and heap[0][0] == min_token:
+                                new_tok, i, new_info = heapq.heappop(heap)
+                                self.__splice(res, new_info)
+                                push_next(i)
                         if old_min_token is not None and \
                             old_min_token >= min_token:
                                 raise RuntimeError("Got min token:{0} greater "
@@ -552,7 +743,7 @@ class Indexer(object):
                 """Processes the main dictionary file and writes out a new
                 main dictionary file reflecting the changes in the packages.
 
-                The "dicts" parameter is the list of fmris which have been
+                The "dicts" parameter is the set of fmris which have been
                 removed during update.
 
                 The "out_dir" parameter is the temporary directory in which to
@@ -582,6 +773,7 @@ class Indexer(object):
 
                 self._data_token_offset.open_out_file(out_dir,
                     self.file_version_number)
+                self._data_trigrams.clear()
 
                 new_toks_available = True
                 new_toks_it = self._gen_new_toks_from_files()
@@ -683,6 +875,9 @@ class Indexer(object):
 
                         removed_paths = []
 
+                self._data_trigrams.write_dict_file(out_dir,
+                    self.file_version_number)
+
         def _write_assistant_dicts(self, out_dir):
                 """Write out the companion dictionaries needed for
                 translating the internal representation of the main
@@ -752,7 +947,9 @@ class Indexer(object):
                                 #
                                 fast_update = self._fast_update(inputs)
 
-                                if not fast_update:
+                                if not fast_update and \
+                                    not self._merge_update(inputs,
+                                    tmp_index_dir):
                                         self._data_main_dict.close_file_handle()
                                         self._data_fast_add.clear()
                                         self._data_fast_remove.clear()
@@ -766,11 +963,7 @@ class Indexer(object):
                                             tmp_index_dir)
 
                         elif input_type == IDX_INPUT_TYPE_FMRI:
-                                assert not self._sort_fh
-                                self._sort_fh = file(os.path.join(self._tmp_dir,
-                                    SORT_FILE_PREFIX +
-                                    str(self._sort_file_num)), "wb")
-                                self._sort_file_num += 1
+                                self.__open_sort_fh()
 
                                 self._progtrack.job_start(
                                     self._progtrack.JOB_REBUILD_SEARCH,
@@ -968,6 +1161,11 @@ class Indexer(object):
                                     d.get_file_name()),
                                     os.path.join(dest_dir, d.get_file_name()))
                 if not fast_update:
+                        shutil.move(os.path.join(source_dir,
+                            self._data_trigrams.get_file_name()),
+                            os.path.join(dest_dir,
+                            self._data_trigrams.get_file_name()))
+
                         # Remove legacy index/pkg/ directory which is obsoleted
                         # by the fmri_offsets.v1 file.
                         try:
@@ -21,7 +21,7 @@
 #
 
 #
-# Copyright (c) 2007, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2007, 2026, Oracle and/or its affiliates. All rights reserved.
 #
 
 from collections import namedtuple, defaultdict
@@ -1485,10 +1485,21 @@ null = Manifest()
 class FactoredManifest(Manifest):
         """This class serves as a wrapper for the Manifest class for callers
         that need efficient access to package data on a per-action type basis.
-        It achieves this by partitioning the manifest into multiple files (one
-        per action type) and then storing an on-disk cache of the directories
-        explictly and implicitly referenced by the manifest each tagged with
-        the appropriate variants/facets."""
+        It achieves this by partitioning the manifest into multiple sections
+        (one per action type) and then storing an on-disk cache of the
+        directories explictly and implicitly referenced by the manifest each
+        tagged with the appropriate variants/facets.
+
+        The sections are stored in a single packed cache file which starts
+        with a header line containing CACHE_MAGIC, followed by a line of the
+        form '<name> <offset> <length>' for each section, and an empty line.
+        Offsets are relative to the end of the header.  Older versions stored
+        each section in a separate manifest.<name> file; these are still read
+        if no packed cache file exists."""
+
+        # The name of the packed cache file.
+        CACHE_NAME = "manifest.cache"
+        CACHE_MAGIC = "pkg5-manifest-cache 1"
 
         def __init__(self, fmri, cache_root, contents=None, excludes=EmptyI,
             pathname=None):
@@ -1519,6 +1530,8 @@ class FactoredManifest(Manifest):
 
                 Manifest.__init__(self, fmri)
                 self.__cache_root = cache_root
+                self.__cache_index = None
+                self.__cache_index_loaded = False
                 self.__pathname = pathname
                 # Make sure that either no excludes were provided or 2+ excludes
                 # were.
@@ -1541,10 +1554,9 @@ class FactoredManifest(Manifest):
                         return
 
                 # we have a cached copy of the manifest
-                mdpath = self.__cache_path("manifest.dircache")
 
                 # have we computed the dircache?
-                if not os.path.exists(mdpath): # we're adding cache
+                if not self.__has_cache(): # we're adding cache
                         self.excludes = EmptyI # to existing manifest
                         self.__load()
                         if self.__storeback():
@@ -1590,7 +1602,7 @@ class FactoredManifest(Manifest):
                         return False
 
         def __storebytype(self):
-                """ create manifest.<typename> files to accelerate partial
+                """ create the packed manifest cache file to accelerate partial
                 parsing of manifests.  Separate from __storeback code to
                 allow upgrade to reuse existing on disk manifests"""
 
@@ -1601,57 +1613,48 @@ class FactoredManifest(Manifest):
                 # Ensure target cache directory and intermediates exist.
                 misc.makedirs(t_dir)
 
-                # create per-action type cache; use rename to avoid corrupt
-                # files if ^C'd in the middle.  All action types are considered
-                # so that empty cache files are created if no action of that
-                # type exists for the package (avoids full manifest loads
-                # later).
+                # Create a section for each action type in the manifest; any
+                # type without a section is known to be absent from the
+                # package (avoids full manifest loads later).
+                sections = []
                 for n, acts in self.actions_bytype.iteritems():
-                        t_prefix = "manifest.{0}.".format(n)
-
-                        try:
-                                fd, fn = tempfile.mkstemp(dir=t_dir,
-                                    prefix=t_prefix)
-                        except EnvironmentError as e:
-                                raise apx._convert_error(e)
-
-                        f = os.fdopen(fd, "wb")
-                        try:
-                                for a in acts:
-                                        f.write("{0}\n".format(a))
-                                if n == "set":
-                                        # Add supplemental action data; yes this
-                                        # does mean the cache is not the same as
-                                        # retrieved manifest, but that's ok.
-                                        # Signature verification is done using
-                                        # the raw manifest.
-                                        f.writelines(self._gen_attrs_to_str())
-                        except EnvironmentError as e:
-                                raise apx._convert_error(e)
-                        finally:
-                                f.close()
-
-                        try:
-                                os.chmod(fn, PKG_FILE_MODE)
-                                portable.rename(fn,
-                                    self.__cache_path("manifest.{0}".format(n)))
-                        except EnvironmentError as e:
-                                raise apx._convert_error(e)
-
-                def create_cache(name, refs):
-                        try:
-                                fd, fn = tempfile.mkstemp(dir=t_dir,
-                                    prefix=name + ".")
-                                with os.fdopen(fd, "wb") as f:
-                                        f.writelines(refs())
-                                os.chmod(fn, PKG_FILE_MODE)
-                                portable.rename(fn, self.__cache_path(name))
-                        except EnvironmentError as e:
-                                raise apx._convert_error(e)
+                        data = "".join("{0}\n".format(a) for a in acts)
+                        if n == "set":
+                                # Add supplemental action data; yes this
+                                # does mean the cache is not the same as
+                                # retrieved manifest, but that's ok.
+                                # Signature verification is done using
+                                # the raw manifest.
+                                data += "".join(self._gen_attrs_to_str())
+                        sections.append((n, data))
+                sections.append(("dircache",
+                    "".join(self._gen_dirs_to_str())))
+                sections.append(("mediatorcache",
+                    "".join(self._gen_mediators_to_str())))
+
+                header = [self.CACHE_MAGIC + "\n"]
+                offset = 0
+                for n, data in sections:
+                        header.append("{0} {1:d} {2:d}\n".format(n, offset,
+                            len(data)))
+                        offset += len(data)
+                header.append("\n")
+
+                # Use rename to avoid a corrupt file if ^C'd in the middle.
+                try:
+                        fd, fn = tempfile.mkstemp(dir=t_dir,
+                            prefix=self.CACHE_NAME + ".")
+                        with os.fdopen(fd, "wb") as f:
+                                f.writelines(header)
+                                for n, data in sections:
+                                        f.write(data)
+                        os.chmod(fn, PKG_FILE_MODE)
+                        portable.rename(fn, self.__cache_path(self.CACHE_NAME))
+                except EnvironmentError as e:
+                        raise apx._convert_error(e)
 
-                create_cache("manifest.dircache", self._gen_dirs_to_str)
-                create_cache("manifest.mediatorcache",
-                    self._gen_mediators_to_str)
+                # Ensure the new cache file is used.
+                self.__cache_index_loaded = False
 
         @staticmethod
         def clear_cache(cache_root):
@@ -1683,40 +1686,141 @@ class FactoredManifest(Manifest):
                                 # cache directory not existing.
                                 raise apx._convert_error(e)
 
+        def __discard_cache(self):
+                """Private helper function for removing a malformed cache."""
+
+                # Cache file is malformed; hopefully due to bugs that have
+                # been resolved (as opposed to actual corruption).  Assume we
+                # should just ignore the cache and load action data.
+                try:
+                        self.clear_cache(self.__cache_root)
+                except Exception as e:
+                        # Ignore errors encountered during cache dump for
+                        # this specific case.
+                        pass
+                self.__cache_index = None
+                self.__cache_index_loaded = True
+
+        def __get_cache_index(self):
+                """Private helper function that returns a dictionary of the
+                sections of the packed cache file, indexed by name, with values
+                of the form (offset, length); or None if there's no packed
+                cache file."""
+
+                if self.__cache_index_loaded:
+                        return self.__cache_index
+
+                self.__cache_index = None
+                self.__cache_index_loaded = True
+                try:
+                        f = open(self.__cache_path(self.CACHE_NAME), "rb")
+                except EnvironmentError as e:
+                        if e.errno == errno.ENOENT:
+                                return None
+                        raise apx._convert_error(e)
+
+                index = {}
+                try:
+                        with f:
+                                if f.readline() != self.CACHE_MAGIC + "\n":
+                                        raise ValueError(self.CACHE_NAME)
+                                while True:
+                                        l = f.readline()
+                                        if l == "\n":
+                                                break
+                                        name, offset, length = l.split()
+                                        index[name] = (int(offset),
+                                            int(length))
+                                start = f.tell()
+                                size = os.fstat(f.fileno()).st_size
+                except EnvironmentError as e:
+                        raise apx._convert_error(e)
+                except ValueError:
+                        # The header is malformed or truncated.
+                        self.__discard_cache()
+                        return None
+
+                for name, (offset, length) in index.iteritems():
+                        if start + offset + length > size:
+                                # The file is truncated.
+                                self.__discard_cache()
+                                return None
+                        index[name] = (start + offset, length)
+
+                self.__cache_index = index
+                return index
+
+        def __has_cache(self):
+                """Private helper function that returns a boolean indicating
+                whether the cache of manifest data exists."""
+
+                return self.__get_cache_index() is not None or \
+                    os.path.exists(self.__cache_path("manifest.dircache"))
+
+        def __read_cache_section(self, name):
+                """Private helper function that returns a list of the lines of
+                the named section of the cache ('dircache', 'mediatorcache',
+                or the name of an action type), or None if there's no such
+                section.  The section is read from the packed cache file if
+                it exists, and from the manifest.<name> file otherwise."""
+
+                index = self.__get_cache_index()
+                if index is not None:
+                        try:
+                                offset, length = index[name]
+                        except KeyError:
+                                return None
+                        try:
+                                with open(self.__cache_path(self.CACHE_NAME),
+                                    "rb") as f:
+                                        f.seek(offset)
+                                        data = f.read(length)
+                                # Only split on newlines; splitlines() would
+                                # also split values containing other line
+                                # break characters such as "\r".
+                                lines = data.split("\n")
+                                if not lines[-1]:
+                                        lines.pop()
+                                return lines
+                        except EnvironmentError as e:
+                                if e.errno != errno.ENOENT:
+                                        raise apx._convert_error(e)
+                                # The cache was removed since the index was
+                                # read.
+                                self.__cache_index = None
+
+                try:
+                        with open(self.__cache_path("manifest." + name),
+                            "rb") as f:
+                                return f.readlines()
+                except EnvironmentError as e:
+                        if e.errno == errno.ENOENT:
+                                return None
+                        raise apx._convert_error(e)
+
         def __load_cached_data(self, name):
                 """Private helper function for loading arbitrary cached manifest
                 data.
                 """
 
-                mpath = self.__cache_path(name)
-                if os.path.exists(mpath):
+                # Cached data is named 'manifest.<section name>'.
+                lines = self.__read_cache_section(name.split(".", 1)[1])
+                if lines is not None:
                         # we have cached copy on disk; use it
                         try:
-                                with open(mpath, "rb") as f:
-                                        self._cache[name] = [
-                                            a for a in
-                                            (
-                                                actions.fromstr(s.rstrip())
-                                                for s in f
-                                            )
-                                            if not self.excludes or
-                                                a.include_this(self.excludes,
-                                                    publisher=self.publisher)
-                                        ]
+                                self._cache[name] = [
+                                    a for a in
+                                    (
+                                        actions.fromstr(s.rstrip())
+                                        for s in lines
+                                    )
+                                    if not self.excludes or
+                                        a.include_this(self.excludes,
+                                            publisher=self.publisher)
+                                ]
                                 return
-                        except EnvironmentError as e:
-                                raise apx._convert_error(e)
                         except actions.ActionError as e:
-                                # Cache file is malformed; hopefully due to bugs
-                                # that have been resolved (as opposed to actual
-                                # corruption).  Assume we should just ignore the
-                                # cache and load action data.
-                                try:
-                                        self.clear_cache(self.__cache_root)
-                                except Exception as e:
-                                        # Ignore errors encountered during cache
-                                        # dump for this specific case.
-                                        pass
+                                self.__discard_cache()
 
                 # no cached copy
                 if not self.loaded:
@@ -1744,11 +1848,9 @@ class FactoredManifest(Manifest):
                         return
 
                 # This checks if we've already written out the factored
-                # manifest files.  If so, we'll use it, and if not, then
+                # manifest cache.  If so, we'll use it, and if not, then
                 # we'll load the full manifest.
-                mpath = self.__cache_path("manifest.dircache")
-
-                if not os.path.exists(mpath):
+                if not self.__has_cache():
                         # no cached copy :-(
                         if not self.loaded:
                                 # get manifest from disk
@@ -1771,31 +1873,24 @@ class FactoredManifest(Manifest):
 
                 # Assume a cached copy exists; if not, tag the action type to
                 # avoid pointless I/O later.
-                mpath = self.__cache_path("manifest.{0}".format(atype))
+                lines = self.__read_cache_section(atype)
+                if lines is None:
+                        self._absent_cache.append(atype)
+                        return # no such action in this manifest
 
                 if attr_match:
                         attr_match = _compile_fnpats(attr_match)
 
-                try:
-                        with open(mpath, "rb") as f:
-                                for l in f:
-                                        a = actions.fromstr(l.rstrip())
-                                        if (excludes and
-                                            not a.include_this(excludes,
-                                                publisher=self.publisher)):
-                                                continue
-                                        # These conditions are split by
-                                        # performance.
-                                        if not attr_match:
-                                                yield a
-                                        elif _attr_matches(a, attr_match):
-                                                yield a
-
-                except EnvironmentError as e:
-                        if e.errno == errno.ENOENT:
-                                self._absent_cache.append(atype)
-                                return # no such action in this manifest
-                        raise apx._convert_error(e)
+                for l in lines:
+                        a = actions.fromstr(l.rstrip())
+                        if (excludes and not a.include_this(excludes,
+                            publisher=self.publisher)):
+                                continue
+                        # These conditions are split by performance.
+                        if not attr_match:
+                                yield a
+                        elif _attr_matches(a, attr_match):
+                                yield a
 
         def gen_facets(self, excludes=EmptyI, patterns=EmptyI):
                 """A generator function that returns the supported facet
@@ -1833,16 +1928,15 @@ class FactoredManifest(Manifest):
                 """Load attributes dictionary from cached set actions;
                 this speeds up pkg info a lot"""
 
-                mpath = self.__cache_path("manifest.set")
-                if not os.path.exists(mpath):
+                lines = self.__read_cache_section("set")
+                if lines is None:
                         return False
-                with open(mpath, "rb") as f:
-                        for l in f:
-                                a = actions.fromstr(l.rstrip())
-                                if not self.excludes or \
-                                    a.include_this(self.excludes,
-                                        publisher=self.publisher):
-                                        self.fill_attributes(a)
+                for l in lines:
+                        a = actions.fromstr(l.rstrip())
+                        if not self.excludes or \
+                            a.include_this(self.excludes,
+                                publisher=self.publisher):
+                                self.fill_attributes(a)
 
                 return True
 
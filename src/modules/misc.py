@@ -30,6 +30,7 @@ from __future__ import division
 from __future__ import print_function
 
 import OpenSSL.crypto as osc
+import Queue
 import cStringIO
 import calendar
 import collections
@@ -2590,6 +2591,111 @@ class AsyncCall(object):
                 return self.rv
 
 
+def get_ncpus():
+        """Return the number of online processors, or 1 if that cannot be
+        determined."""
+
+        try:
+                return max(1, os.sysconf("SC_NPROCESSORS_ONLN"))
+        except (AttributeError, ValueError, OSError):
+                return 1
+
+
+def threaded_imap(func, iterable, nworkers, window=None):
+        """Call 'func' on each item of 'iterable' using a pool of 'nworkers'
+        threads and yield each item once the call for it has completed.
+        Items are yielded in completion order, not in the order they were
+        provided.
+
+        'window' is the maximum number of items dispatched to the pool but
+        not yet yielded; it bounds how far ahead of the caller the pool may
+        run.  If not provided, four times 'nworkers' is used.
+
+        Items are only dispatched as the caller consumes results, so the
+        caller may safely do per-item bookkeeping (such as progress tracking)
+        in its own thread.  If any call raises an exception, no further items
+        are dispatched, calls already in progress are allowed to finish, and
+        the first exception is re-raised in the calling thread along with its
+        original traceback."""
+
+        assert nworkers > 0
+        if window is None:
+                window = nworkers * 4
+
+        tasks = Queue.Queue()
+        results = Queue.Queue()
+        done = object()
+
+        def worker():
+                while True:
+                        item = tasks.get()
+                        if item is done:
+                                return
+                        try:
+                                func(item)
+                        except:
+                                results.put((item, sys.exc_info()))
+                        else:
+                                results.put((item, None))
+
+        threads = []
+        for i in range(nworkers):
+                t = threading.Thread(target=worker)
+                t.daemon = True
+                t.start()
+                threads.append(t)
+
+        def get_result():
+                # A timeout is used so that the calling thread can still be
+                # interrupted (e.g. by SIGINT) while waiting.
+                while True:
+                        try:
+                                return results.get(True, 0.5)
+                        except Queue.Empty:
+                                continue
+
+        failure = None
+        pending = 0
+        try:
+                for item in iterable:
+                        tasks.put(item)
+                        pending += 1
+                        while pending >= window:
+                                item, exc_info = get_result()
+                                pending -= 1
+                                if exc_info:
+                                        failure = exc_info
+                                        break
+                                yield item
+                        if failure:
+                                break
+
+                while pending:
+                        item, exc_info = get_result()
+                        pending -= 1
+                        if failure:
+                                continue
+                        if exc_info:
+                                failure = exc_info
+                                continue
+                        yield item
+        finally:
+                # Discard anything not yet started if the caller stopped
+                # consuming results early.
+                while True:
+                        try:
+                                tasks.get_nowait()
+                        except Queue.Empty:
+                                break
+                for t in threads:
+                        tasks.put(done)
+                for t in threads:
+                        t.join()
+
+        if failure:
+                raise failure[0], failure[1], failure[2]
+
+
 def get_runtime_proxy(proxy, uri):
         """Given a proxy string and a URI we want to access using it, determine
         whether any OS environment variables should override that value.
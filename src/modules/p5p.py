@@ -21,12 +21,15 @@
 #
 
 #
-# Copyright (c) 2011, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2011, 2026, Oracle and/or its affiliates. All rights reserved.
 #
 
+import array
 import atexit
+import bisect
 import collections
 import errno
+import operator
 import tarfile as tf
 import pkg.pkggzip
 import pkg.pkgtarfile as ptf
@@ -41,8 +44,10 @@ import pkg.misc
 import pkg.portable
 import pkg.p5i
 import shutil
+import stat
 import sys
 import tempfile
+import threading
 import urllib
 
 if sys.version > '3':
@@ -205,6 +210,178 @@ class ArchiveIndex(object):
                 self.__closed = True
 
 
+class _ArchiveNames(object):
+        """A sorted sequence of names stored in a single string, with their
+        positions in an array."""
+
+        def __init__(self, names, typecode):
+                self.__starts = array.array(typecode, [0])
+                for name in names:
+                        self.__starts.append(self.__starts[-1] + len(name))
+                self.__names = "".join(names)
+
+        def __len__(self):
+                return len(self.__starts) - 1
+
+        def __getitem__(self, i):
+                if i < 0 or i >= len(self):
+                        raise IndexError(i)
+                return self.__names[int(self.__starts[i]):
+                    int(self.__starts[i + 1])]
+
+        def index(self, name):
+                """Returns the position of 'name' in the sequence, or -1 if
+                it isn't present."""
+
+                i = bisect.bisect_left(self, name)
+                if i < len(self) and self[i] == name:
+                        return i
+                return -1
+
+
+class _ArchiveOffsets(collections.Mapping):
+        """A read-only mapping of the names of archive members to the offsets
+        of their headers in the archive.  The names are kept in sorted order
+        in a single string and the offsets in an array, which uses a fraction
+        of the memory of a dictionary for archives with many members."""
+
+        # Offsets beyond 4GB can't be stored in an array of unsigned longs on
+        # 32-bit systems, but can be stored exactly as doubles.
+        __typecode = "L" if array.array("L").itemsize >= 8 else "d"
+
+        def __init__(self, entries):
+                """'entries' is an iterable of tuples of the form (name,
+                offset); if a name occurs more than once, its last offset is
+                used."""
+
+                names = []
+                self.__offsets = array.array(self.__typecode)
+                for name, offset in sorted(entries,
+                    key=operator.itemgetter(0)):
+                        if names and names[-1] == name:
+                                self.__offsets[-1] = offset
+                                continue
+                        names.append(name)
+                        self.__offsets.append(offset)
+                self.__names = _ArchiveNames(names, self.__typecode)
+
+        def __len__(self):
+                return len(self.__offsets)
+
+        def __getitem__(self, name):
+                i = self.__names.index(name)
+                if i < 0:
+                        raise KeyError(name)
+                return long(self.__offsets[i])
+
+        def __iter__(self):
+                return iter(self.__names)
+
+
+class _ArchiveReader(object):
+        """Provides positional reads of an archive file that may be used by
+        several threads at once."""
+
+        def __init__(self, pathname):
+                self.__pathname = pathname
+                self.__fd = None
+                # Descriptors not currently in use by any thread; only needed
+                # if os.pread() isn't available.  A descriptor is only opened
+                # when none are idle, so there are never more of them than
+                # the largest number of reads that were made at once.
+                self.__idle_fds = []
+                self.__lock = threading.Lock()
+
+                if hasattr(os, "pread"):
+                        self.__fd = os.open(pathname, os.O_RDONLY)
+
+        def __acquire_fd(self):
+                """Returns a descriptor for the calling thread's exclusive use
+                until it is passed to __release_fd()."""
+
+                with self.__lock:
+                        if self.__idle_fds:
+                                return self.__idle_fds.pop()
+                return os.open(self.__pathname, os.O_RDONLY)
+
+        def __release_fd(self, fd):
+                """Makes a descriptor returned by __acquire_fd() available to
+                other threads."""
+
+                with self.__lock:
+                        self.__idle_fds.append(fd)
+
+        def pread(self, size, offset):
+                """Returns up to 'size' bytes of the archive starting at
+                'offset'; fewer bytes are only returned at the end of the
+                archive."""
+
+                pooled = self.__fd is None
+                if pooled:
+                        # A descriptor is only used by one thread at a time,
+                        # so its file offset is not shared.
+                        fd = self.__acquire_fd()
+                else:
+                        fd = self.__fd
+
+                data = []
+                try:
+                        while size > 0:
+                                if pooled:
+                                        os.lseek(fd, offset, os.SEEK_SET)
+                                        buf = os.read(fd, size)
+                                else:
+                                        buf = os.pread(fd, size, offset)
+                                if not buf:
+                                        break
+                                data.append(buf)
+                                size -= len(buf)
+                                offset += len(buf)
+                finally:
+                        if pooled:
+                                self.__release_fd(fd)
+                return "".join(data)
+
+        def close(self):
+                with self.__lock:
+                        fds = self.__idle_fds
+                        self.__idle_fds = []
+                if self.__fd is not None:
+                        fds.append(self.__fd)
+                        self.__fd = None
+                for fd in fds:
+                        os.close(fd)
+
+
+class _ArchiveMember(object):
+        """A stand-in for the TarFile object that the tarfile module uses to
+        read the headers and data of an archive member.  Each member has a
+        position of its own in the archive, so that several members can be
+        read at once."""
+
+        def __init__(self, reader, offset, tfile):
+                # The tarfile module reads from 'fileobj' and records the
+                # offset of the next member in 'offset'.
+                self.fileobj = self
+                self.offset = offset
+                self.encoding = tfile.encoding
+                self.errors = tfile.errors
+                self.pax_headers = tfile.pax_headers.copy()
+                self.__reader = reader
+                self.__pos = offset
+
+        def read(self, size):
+                data = self.__reader.pread(size, self.__pos)
+                self.__pos += len(data)
+                return data
+
+        def seek(self, pos):
+                self.__pos = pos
+
+        def tell(self):
+                return self.__pos
+
+
 class InvalidArchive(ArchiveErrors):
         """Used to indicate that the specified archive is in a format not
         supported or recognized by this version of the pkg(5) Archive class.
@@ -289,6 +466,7 @@ class Archive(object):
         __index = None
         __arc_tfile = None
         __arc_file = None
+        __reader = None
         version = None
 
         # If the repository format changes, then the version of the package
@@ -307,10 +485,13 @@ class Archive(object):
                 respectively.  An archive opened for writing may not be used for
                 any extraction operations, and must not already exist.
 
-                'archive_index', if supplied is the dictionary returned by
+                'archive_index', if supplied is the mapping returned by
                 self.get_index(), allowing multiple Archive objects to be open,
                 sharing the same index object, for efficient use of memory.
                 Using an existing archive_index requires mode='r'.
+
+                An archive opened for reading may be used to extract or
+                retrieve members from several threads at once.
                 """
 
                 assert os.path.isabs(pathname)
@@ -347,6 +528,11 @@ class Archive(object):
                 self.__queue_offset = 0
                 self.__queue = collections.deque()
 
+                # Serializes use of the archive's tarfile object, which is
+                # only needed when members can't be read using positional
+                # reads.
+                self.__lock = threading.Lock()
+
                 # Ensure cleanup is performed on exit if the archive is not
                 # explicitly closed.
                 def arc_cleanup():
@@ -368,6 +554,11 @@ class Archive(object):
 
                 self.__extract_offsets = {}
                 if "r" in mode:
+                        try:
+                                self.__reader = _ArchiveReader(self.__arc_name)
+                        except EnvironmentError as e:
+                                raise apx._convert_error(e)
+
                         # Opening the tarfile loaded the first member, which
                         # should be the archive index file.
                         member = self.__arc_tfile.firstmember
@@ -424,10 +615,10 @@ class Archive(object):
                         try:
                                 self.__index = ArchiveIndex(idxfn,
                                     mode="r", version=self.__idx_ver)
-                                for name, offset in \
-                                    self.__index.offsets():
-                                        self.__extract_offsets[name] = \
-                                            index_offset + offset
+                                self.__extract_offsets = _ArchiveOffsets(
+                                    (name, index_offset + offset)
+                                    for name, offset in self.__index.offsets()
+                                )
                         except InvalidArchiveIndex:
                                 # Index is corrupt; rather than driving on
                                 # and failing later, bail now.
@@ -507,16 +698,99 @@ class Archive(object):
 
                 # This causes the entire archive to be read, but is the only way
                 # to find the offsets to extract everything.
+                with self.__lock:
+                        if self.__extract_offsets:
+                                return
+                        try:
+                                self.__extract_offsets = _ArchiveOffsets(
+                                    (member.name, member.offset)
+                                    for member in
+                                    self.__arc_tfile.getmembers()
+                                )
+                        except tf.TarError:
+                                # Read error encountered.
+                                raise InvalidArchive(self.__arc_name)
+                        except EnvironmentError as e:
+                                raise apx._convert_error(e)
+
+        def __read_member(self, src, offset):
+                """Private helper method that reads the headers of the archive
+                member 'src' starting at 'offset' without using the archive's
+                tarfile object.  Returns a tuple of the member's TarInfo object
+                and the _ArchiveMember object to use to read its data."""
+
+                ctx = _ArchiveMember(self.__reader, offset, self.__arc_tfile)
                 try:
-                        for member in self.__arc_tfile.getmembers():
-                                self.__extract_offsets[member.name] = \
-                                    member.offset
+                        member = tf.TarInfo.fromtarfile(ctx)
                 except tf.TarError:
                         # Read error encountered.
                         raise InvalidArchive(self.__arc_name)
                 except EnvironmentError as e:
                         raise apx._convert_error(e)
 
+                if member.name != src:
+                        # Index must be invalid or tarfile has gone off the
+                        # rails trying to read the archive.
+                        raise InvalidArchive(self.__arc_name)
+                return member, ctx
+
+        def __extract_file(self, member, ctx, dest):
+                """Private helper method that extracts the regular file
+                described by the TarInfo object 'member' to the absolute path
+                'dest' using positional reads."""
+
+                ddir = os.path.dirname(dest)
+                if not os.path.exists(ddir):
+                        # As for PkgTarFile.extract_to(), parent directories
+                        # are created with restrictive permissions.
+                        try:
+                                os.makedirs(ddir, stat.S_IRWXU)
+                        except EnvironmentError:
+                                pass
+
+                # The file is extracted to a temporary name and then renamed so
+                # that an existing read-only file is replaced, and a file being
+                # extracted by another thread at the same time is never seen
+                # partially written.
+                try:
+                        fd, tmp = tempfile.mkstemp(dir=ddir,
+                            prefix=".{0}.".format(os.path.basename(dest)))
+                except EnvironmentError as e:
+                        raise apx._convert_error(e)
+                try:
+                        with os.fdopen(fd, "wb") as dfile:
+                                shutil.copyfileobj(tf.ExFileObject(ctx,
+                                    member), dfile, 128 * 1024)
+                        # Ownership is set as for members extracted by the
+                        # tarfile object; see pkg.pkgtarfile for why owners
+                        # aren't looked up by name.  This doesn't modify the
+                        # tarfile object, so no lock is needed.
+                        self.__arc_tfile.chown(member, tmp)
+                        os.chmod(tmp, member.mode)
+                        os.utime(tmp, (member.mtime, member.mtime))
+                        pkg.portable.rename(tmp, dest)
+                except:
+                        try:
+                                os.unlink(tmp)
+                        except EnvironmentError:
+                                pass
+                        raise
+
+        def __extract_members(self, members, path, nworkers):
+                """Private helper method that extracts each archive member
+                listed in 'members', a list of tuples of the form (src,
+                filename), to 'path' using up to 'nworkers' threads."""
+
+                if nworkers > 1 and len(members) > 1:
+                        for m in pkg.misc.threaded_imap(
+                            lambda m: self.extract_to(m[0], path,
+                            filename=m[1]), members, nworkers):
+                                pass
+                        return
+
+                for src, filename in members:
+                        self.extract_to(src, path, filename=filename)
+
         def __mkdtemp(self):
                 """Creates a temporary directory for use during archive
                 operations, and return its absolute path.  The temporary
@@ -858,7 +1132,7 @@ class Archive(object):
                 except EnvironmentError as e:
                         raise apx._convert_error(e)
 
-        def extract_package_files(self, hashes, path, pub=None):
+        def extract_package_files(self, hashes, path, pub=None, nworkers=1):
                 """Extract one or more package files from the archive.
 
                 'hashes' is a list of the files to extract named by their hash.
@@ -872,6 +1146,8 @@ class Archive(object):
                 named after the given hash found in the archive will be used.
                 (This will be noticeably slower depending on the size of the
                 archive.)
+
+                'nworkers' is the maximum number of files to extract at once.
                 """
 
                 assert not self.__closed and "r" in self.__mode
@@ -883,22 +1159,22 @@ class Archive(object):
 
                 if not pub:
                         # Scan extract offsets index for the first instance of
-                        # any package file seen for each hash and extract the
-                        # file as each is found.
+                        # any package file seen for each hash.
                         hashes = set(hashes)
+                        members = []
 
                         for name in self.__extract_offsets:
                                 for fhash in hashes:
                                         hash_fname = os.path.join("file",
                                             fhash[:2], fhash)
                                         if name.endswith(hash_fname):
-                                                self.extract_to(name, path,
-                                                    filename=fhash)
+                                                members.append((name, fhash))
                                                 hashes.discard(fhash)
                                                 break
                                 if not hashes:
                                         break
 
+                        self.__extract_members(members, path, nworkers)
                         if hashes:
                                 # Any remaining hashes are for package files
                                 # that couldn't be found.
@@ -906,10 +1182,11 @@ class Archive(object):
                                     hashes)
                         return
 
-                for fhash in hashes:
-                        arcname = os.path.join("publisher", pub, "file",
-                            fhash[:2], fhash)
-                        self.extract_to(arcname, path, filename=fhash)
+                self.__extract_members([
+                    (os.path.join("publisher", pub, "file", fhash[:2], fhash),
+                    fhash)
+                    for fhash in hashes
+                ], path, nworkers)
 
         def extract_package_manifest(self, pfmri, path, filename=""):
                 """Extract a package manifest from the archive.
@@ -960,29 +1237,15 @@ class Archive(object):
                 assert not self.__closed and "r" in self.__mode
 
                 # Get the offset in the archive for the given file, and then
-                # seek to it.
+                # read its headers from there.
                 offset = self.__extract_offsets.get(src, None)
-                tfile = self.__arc_tfile
+                ctx = None
                 if offset is not None:
-                        # Prepare the tarfile object for extraction by telling
-                        # it where to look for the file.
-                        self.__arc_file.seek(offset)
-                        tfile.offset = offset
-
-                        # Get the tarinfo object needed to extract the file.
-                        try:
-                                member = tf.TarInfo.fromtarfile(tfile)
-                        except tf.TarError:
-                                # Read error encountered.
-                                raise InvalidArchive(self.__arc_name)
-                        except EnvironmentError as e:
-                                raise apx._convert_error(e)
-
-                        if member.name != src:
-                                # Index must be invalid or tarfile has gone off
-                                # the rails trying to read the archive.
-                                raise InvalidArchive(self.__arc_name)
-
+                        member, ctx = self.__read_member(src, offset)
+                        if not member.isreg():
+                                # Links and other types of members are left to
+                                # the tarfile object.
+                                ctx = None
                 elif self.__extract_offsets:
                         # Assume there is no such archive member if extract
                         # offsets are known, but the item can't be found.
@@ -993,8 +1256,14 @@ class Archive(object):
 
                 # Extract the file to the specified location.
                 try:
-                        self.__arc_tfile.extract_to(member, path=path,
-                            filename=filename)
+                        if ctx:
+                                self.__extract_file(member, ctx,
+                                    os.path.join(path,
+                                    filename or member.name))
+                        else:
+                                with self.__lock:
+                                        self.__arc_tfile.extract_to(member,
+                                            path=path, filename=filename)
                 except KeyError:
                         raise UnknownArchiveFiles(self.__arc_name, [src])
                 except tf.TarError:
@@ -1034,22 +1303,14 @@ class Archive(object):
                 assert not self.__closed and "r" in self.__mode
 
                 # Get the offset in the archive for the given file, and then
-                # seek to it.
+                # read its headers from there.
                 offset = self.__extract_offsets.get(src, None)
-                tfile = self.__arc_tfile
                 if offset is not None:
-                        # Prepare the tarfile object for extraction by telling
-                        # it where to look for the file.
-                        self.__arc_file.seek(offset)
-                        tfile.offset = offset
-
-                        try:
-                                # Get the tarinfo object needed to extract the
-                                # file.
-                                member = tf.TarInfo.fromtarfile(tfile)
-                        except tf.TarError:
-                                # Read error encountered.
-                                raise InvalidArchive(self.__arc_name)
+                        member, ctx = self.__read_member(src, offset)
+                        if member.isreg():
+                                # The returned object has a position of its
+                                # own in the archive.
+                                return tf.ExFileObject(ctx, member)
                 elif self.__extract_offsets:
                         # Assume there is no such archive member if extract
                         # offsets are known, but the item can't be found.
@@ -1060,7 +1321,8 @@ class Archive(object):
 
                 # Finally, return the object for the matching archive member.
                 try:
-                        return tfile.extractfile(member)
+                        with self.__lock:
+                                return self.__arc_tfile.extractfile(member)
                 except KeyError:
                         raise UnknownArchiveFiles(self.__arc_name, [src])
 
@@ -1208,6 +1470,10 @@ class Archive(object):
                 if self.__arc_file:
                         self.__arc_file.close()
                         self.__arc_file = None
+
+                if self.__reader:
+                        self.__reader.close()
+                        self.__reader = None
                 self.__closed = True
 
         def close(self, progtrack=None):
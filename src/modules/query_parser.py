@@ -21,7 +21,7 @@
 #
 
 #
-# Copyright (c) 2009, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2009, 2026, Oracle and/or its affiliates. All rights reserved.
 #
 
 from __future__ import print_function
@@ -1030,6 +1030,11 @@ class TermQuery(object):
 
         __dict_locks = {}
 
+        # The trigram index for each index path, along with the version of
+        # the index it was opened for.  The trigram index is optional, so it
+        # isn't kept with the rest of the index data.
+        __trigram_dict = {}
+
         has_non_wildcard_character = re.compile('.*[^\*\?].*')
 
         fmris = None
@@ -1065,6 +1070,7 @@ class TermQuery(object):
                 self._data_manf = None
                 self._data_token_offset = None
                 self._data_main_dict = None
+                self._data_trigrams = None
 
         def __init_gdd(self, path):
                 gdd = self._global_data_dict
@@ -1074,7 +1080,7 @@ class TermQuery(object):
                 # Setup default global dictionary for this index path.
                 gdd[path] = {
                     "manf": ss.IndexStoreDict(ss.MANIFEST_LIST),
-                    "token_byte_offset": ss.IndexStoreDictMutable(
+                    "token_byte_offset": ss.IndexStoreDictMapped(
                         ss.BYTE_OFFSET_FILE),
                     "fmri_offsets": ss.InvertedDict(ss.FMRI_OFFSETS_FILE, None)
                 }
@@ -1132,6 +1138,7 @@ class TermQuery(object):
                 gdd = cls._global_data_dict
                 cls.__lock_gdd(index_dir)
                 try:
+                        cls.__trigram_dict.pop(index_dir, None)
                         del gdd[index_dir]
                 except KeyError:
                         pass
@@ -1279,6 +1286,21 @@ class TermQuery(object):
                         self._data_token_offset = tq_gdd["token_byte_offset"]
                         self._data_fmri_offsets = tq_gdd.get("fmri_offsets",
                             None)
+
+                        # The trigram index is only used if it was written
+                        # along with the version of the index which was just
+                        # opened.  Like the other shared data, it is replaced
+                        # rather than modified so that searches in other
+                        # threads can continue to use the old one.
+                        ver, tri = self.__trigram_dict.get(self._dir_path,
+                            (None, None))
+                        if ver != ret or tri is None or tri.should_reread():
+                                tri = ss.IndexStoreTrigrams(ss.TRIGRAM_FILE)
+                                if not tri.open_version(self._dir_path, ret):
+                                        tri = None
+                                self.__trigram_dict[self._dir_path] = (ret,
+                                    tri)
+                        self._data_trigrams = tri
                 finally:
                         self.__unlock_gdd(self._dir_path)
 
@@ -1292,6 +1314,7 @@ class TermQuery(object):
                 entirely into memory in one shot."""
 
                 self._data_main_dict.close_file_handle()
+                self._data_trigrams = None
 
         @staticmethod
         def flatten(lst):
@@ -1402,17 +1425,35 @@ class TermQuery(object):
                 # If offsets is equal to None, match all possible results.  A
                 # match with no results is represented by an empty set.
                 offsets = None
+                # If token_match is set, the tokens found at the offsets may
+                # not match the term and must be checked.
+                token_match = None
 
                 if glob:
                         # If the term has at least one non-wildcard character
-                        # in it, do the glob search.
+                        # in it, do the glob search.  The trigram index is
+                        # used to find the tokens which could match if
+                        # possible since examining every token is slow.
                         if TermQuery.has_non_wildcard_character.match(term):
-                                keys = self._data_token_offset.get_keys()
-                                matches = choose(keys, term, case_sensitive)
-                                offsets = set([
-                                    self._data_token_offset.get_id(match)
-                                    for match in matches
-                                ])
+                                if self._data_trigrams is not None:
+                                        offsets = \
+                                            self._data_trigrams.get_offsets(
+                                            term)
+                                if offsets is not None:
+                                        token_match = re.compile(
+                                            fnmatch.translate(term),
+                                            0 if case_sensitive else
+                                            re.I).match
+                                else:
+                                        keys = \
+                                            self._data_token_offset.get_keys()
+                                        matches = choose(keys, term,
+                                            case_sensitive)
+                                        offsets = set([
+                                            self._data_token_offset.get_id(
+                                            match)
+                                            for match in matches
+                                        ])
                 elif self._data_token_offset.has_entity(term):
                         offsets = set([
                             self._data_token_offset.get_id(term)])
@@ -1485,6 +1526,8 @@ class TermQuery(object):
                         assert not line == '\n'
                         tok, at_lst = \
                             self._data_main_dict.parse_main_dict_line(line)
+                        if token_match and not token_match(tok):
+                                continue
                         # Check that the token was what was expected.
                         assert ((term == tok) or 
                             (not case_sensitive and
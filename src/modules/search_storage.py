@@ -21,11 +21,15 @@
 #
 
 #
-# Copyright (c) 2010, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2010, 2026, Oracle and/or its affiliates. All rights reserved.
 #
 
+import array
 import os
 import errno
+import mmap
+import struct
+import sys
 import time
 import hashlib
 import urllib
@@ -43,6 +47,16 @@ MAIN_FILE = 'main_dict.ascii.v2'
 BYTE_OFFSET_FILE = 'token_byte_offset.v1'
 FULL_FMRI_HASH_FILE = 'full_fmri_list.hash'
 FMRI_OFFSETS_FILE = 'fmri_offsets.v1'
+TRIGRAM_FILE = 'token_trigrams.v1'
+
+# Header of the trigram index: number of tokens, number of trigrams, and the
+# total number of entries in the posting lists.
+_TRI_HEADER = struct.Struct("!III")
+# Each trigram record: the trigram, and the position and length of its posting
+# list.
+_TRI_RECORD = struct.Struct("!3sII")
+# Each token record: the byte offset of the token in the main dictionary.
+_TRI_OFFSET = struct.Struct("!Q")
 
 def consistent_open(data_list, directory, timeout = 1):
         """Opens all data holders in data_list and ensures that the
@@ -610,6 +624,98 @@ class IndexStoreDictMutable(IndexStoreBase):
                 """
                 return 0
 
+class IndexStoreDictMapped(IndexStoreBase):
+        """Read-only view of a dictionary written by IndexStoreDictMutable.
+
+        Instead of reading the file into a dictionary, the file is memory
+        mapped and lookups are performed with a binary search of its lines,
+        which are sorted by entity because the indexer writes them in the
+        order of the main dictionary.  Objects of this class can be shared by
+        any number of threads, and the mapping is released once the last
+        reference to the object is dropped."""
+
+        def __init__(self, file_name):
+                IndexStoreBase.__init__(self, file_name)
+                self._map = None
+                self._start = 0
+
+        @staticmethod
+        def __parse(line):
+                """Returns the (entity, id) tuple for a line of the file."""
+
+                token, offset = line.rsplit(" ", 1)
+                if token[0] == "1":
+                        token = urllib.unquote(token[1:])
+                else:
+                        token = token[1:]
+                return token, int(offset)
+
+        def read_dict_file(self):
+                """Maps the file whose handle has been set; the version line
+                must already have been read."""
+
+                self._start = self._file_handle.tell()
+                self._map = None
+                if os.fstat(self._file_handle.fileno()).st_size > self._start:
+                        self._map = mmap.mmap(self._file_handle.fileno(), 0,
+                            access=mmap.ACCESS_READ)
+                IndexStoreBase.read_dict_file(self)
+
+        def __find(self, entity):
+                """Returns the id for 'entity' or None if it isn't present."""
+
+                if self._map is None:
+                        return None
+                if isinstance(entity, unicode):
+                        entity = entity.encode("utf-8")
+                m = self._map
+                lo = self._start
+                hi = len(m)
+                while lo < hi:
+                        mid = (lo + hi) // 2
+                        start = max(m.rfind("\n", lo, mid) + 1, lo)
+                        end = m.find("\n", start)
+                        if end < 0:
+                                end = len(m)
+                        token, offset = self.__parse(m[start:end])
+                        if token < entity:
+                                lo = end + 1
+                        elif token > entity:
+                                hi = start
+                        else:
+                                return offset
+                return None
+
+        def has_entity(self, entity):
+                return self.__find(entity) is not None
+
+        def get_id(self, entity):
+                offset = self.__find(entity)
+                if offset is None:
+                        raise KeyError(entity)
+                return offset
+
+        def get_keys(self):
+                """Yields each entity in the file."""
+
+                m = self._map
+                if m is None:
+                        return
+                pos = self._start
+                size = len(m)
+                while pos < size:
+                        end = m.find("\n", pos)
+                        if end < 0:
+                                end = size
+                        if end > pos:
+                                yield self.__parse(m[pos:end])[0]
+                        pos = end + 1
+
+        def count_entries_removed_during_partial_indexing(self):
+                """Returns the number of entries removed during a second phase
+                of indexing."""
+                return 0
+
 class IndexStoreSetHash(IndexStoreBase):
         def __init__(self, file_name):
                 IndexStoreBase.__init__(self, file_name)
@@ -838,3 +944,231 @@ class InvertedDict(IndexStoreBase):
                                             self._dict[fmris].split()))
                                         break
                 return set(offs)
+
+
+def pattern_trigrams(pat):
+        """Returns the set of lower case trigrams which any token matching the
+        fnmatch(3C) style pattern 'pat' must contain.  The set is empty if the
+        pattern doesn't contain three consecutive literal characters."""
+
+        tris = set()
+        runs = []
+        run = []
+        i = 0
+        n = len(pat)
+        while i < n:
+                c = pat[i]
+                i += 1
+                if c not in "*?[":
+                        run.append(c)
+                        continue
+                runs.append("".join(run))
+                run = []
+                if c == "[":
+                        # Skip the bracket expression, using the same rules
+                        # as fnmatch.translate() to find its end.  If it
+                        # isn't terminated, the rest of the pattern is
+                        # ignored.
+                        j = i
+                        if j < n and pat[j] == "!":
+                                j += 1
+                        if j < n and pat[j] == "]":
+                                j += 1
+                        j = pat.find("]", j)
+                        if j < 0:
+                                break
+                        i = j + 1
+        else:
+                runs.append("".join(run))
+
+        for r in runs:
+                r = r.lower()
+                for i in range(len(r) - 2):
+                        tris.add(r[i:i + 3])
+        return tris
+
+
+class IndexStoreTrigrams(IndexStoreBase):
+        """Index of the trigrams contained in the tokens of the main
+        dictionary, used to find the tokens which may match a wildcard
+        pattern without examining every token.
+
+        The file starts with a version line like the other index files,
+        followed by a binary header, a table containing the byte offset in
+        the main dictionary of each token in token order, a table of trigram
+        records sorted by trigram, and the posting lists of the token numbers
+        containing each trigram.  Trigrams are computed from the lower case
+        form of each token, so the index may be used for case sensitive and
+        case insensitive searches.
+
+        The index isn't required to be present; searches fall back to
+        examining every token if it is missing or doesn't match the version of
+        the other index files."""
+
+        def __init__(self, file_name):
+                IndexStoreBase.__init__(self, file_name)
+                self.__offsets = []
+                self.__postings = {}
+                self.__map = None
+
+        def add_token(self, token, offset):
+                """Adds 'token', found at 'offset' in the main dictionary, to
+                the index.  Tokens must be added in the order they appear in
+                the main dictionary."""
+
+                tid = len(self.__offsets)
+                self.__offsets.append(offset)
+                tok = token.lower()
+                for t in set(tok[i:i + 3] for i in range(len(tok) - 2)):
+                        try:
+                                self.__postings[t].append(tid)
+                        except KeyError:
+                                self.__postings[t] = array.array("I", [tid])
+
+        def clear(self):
+                """Discards the tokens added to the index."""
+
+                self.__offsets = []
+                self.__postings = {}
+
+        def write_dict_file(self, path, version_num):
+                """Writes the tokens added to the index to a file in 'path'
+                for the index version 'version_num'."""
+
+                tris = sorted(self.__postings)
+                with open(os.path.join(path, self._name), "wb",
+                    PKG_FILE_BUFSIZ) as fh:
+                        fh.write("VERSION: {0}\n".format(version_num))
+                        fh.write(_TRI_HEADER.pack(len(self.__offsets),
+                            len(tris), sum(
+                                len(self.__postings[t]) for t in tris)))
+                        for o in self.__offsets:
+                                fh.write(_TRI_OFFSET.pack(o))
+                        start = 0
+                        for t in tris:
+                                cnt = len(self.__postings[t])
+                                fh.write(_TRI_RECORD.pack(t, start, cnt))
+                                start += cnt
+                        for t in tris:
+                                p = self.__postings[t]
+                                if sys.byteorder != "big":
+                                        p.byteswap()
+                                fh.write(p.tostring())
+                self.clear()
+
+        def open_version(self, directory, version_num):
+                """Maps the index file in 'directory' for reading.  Returns
+                False if the file is missing, is incomplete, or isn't for the
+                index version 'version_num'."""
+
+                self.close_file_handle()
+                try:
+                        fh = open(os.path.join(directory, self._name), "rb")
+                except EnvironmentError as e:
+                        if e.errno == errno.ENOENT:
+                                return False
+                        raise
+                with fh:
+                        try:
+                                ver = int(fh.readline().split(" ")[1])
+                        except (IndexError, ValueError):
+                                return False
+                        if ver != version_num:
+                                return False
+                        base = fh.tell()
+                        st = os.fstat(fh.fileno())
+                        if st.st_size < base + _TRI_HEADER.size:
+                                return False
+                        self.__map = mmap.mmap(fh.fileno(), 0,
+                            access=mmap.ACCESS_READ)
+                        self._file_path = fh.name
+                        self._mtime = st.st_mtime
+                        self._size = st.st_size
+                        self._inode = st.st_ino
+                        self._have_read = True
+
+                ntoks, ntris, npost = _TRI_HEADER.unpack_from(self.__map, base)
+                self.__offbase = base + _TRI_HEADER.size
+                self.__tribase = self.__offbase + ntoks * _TRI_OFFSET.size
+                self.__postbase = self.__tribase + ntris * _TRI_RECORD.size
+                self.__ntris = ntris
+                if len(self.__map) != self.__postbase + npost * 4:
+                        self.close_file_handle()
+                        return False
+                return True
+
+        def should_reread(self):
+                """Returns whether the index file has been replaced since it
+                was opened."""
+
+                try:
+                        return IndexStoreBase.should_reread(self)
+                except EnvironmentError as e:
+                        if e.errno == errno.ENOENT:
+                                return True
+                        raise
+
+        def __find(self, tri):
+                """Returns the (start, count) tuple for the posting list of
+                'tri', or None if no token contains it."""
+
+                lo = 0
+                hi = self.__ntris
+                while lo < hi:
+                        mid = (lo + hi) // 2
+                        rec = _TRI_RECORD.unpack_from(self.__map,
+                            self.__tribase + mid * _TRI_RECORD.size)
+                        if rec[0] < tri:
+                                lo = mid + 1
+                        elif rec[0] > tri:
+                                hi = mid
+                        else:
+                                return rec[1], rec[2]
+                return None
+
+        def __read_postings(self, start, cnt):
+                pos = self.__postbase + start * 4
+                p = array.array("I")
+                p.fromstring(self.__map[pos:pos + cnt * 4])
+                if sys.byteorder != "big":
+                        p.byteswap()
+                return p
+
+        def get_offsets(self, pat):
+                """Returns the set of main dictionary offsets of the tokens
+                which may match the fnmatch(3C) style pattern 'pat', or None
+                if the index can't narrow down the tokens for the pattern.
+                Callers must still check each token against the pattern."""
+
+                assert self.__map is not None
+                if isinstance(pat, unicode):
+                        pat = pat.encode("utf-8")
+                tris = pattern_trigrams(pat)
+                if not tris:
+                        return None
+
+                recs = []
+                for t in tris:
+                        rec = self.__find(t)
+                        if rec is None:
+                                return set()
+                        recs.append(rec)
+                recs.sort(key=lambda r: r[1])
+
+                tids = set(self.__read_postings(*recs[0]))
+                for rec in recs[1:]:
+                        if not tids:
+                                break
+                        tids.intersection_update(self.__read_postings(*rec))
+                return set(
+                    _TRI_OFFSET.unpack_from(self.__map,
+                        self.__offbase + tid * _TRI_OFFSET.size)[0]
+                    for tid in tids
+                )
+
+        def close_file_handle(self):
+                """Releases the mapping of the index file."""
+
+                if self.__map is not None:
+                        self.__map.close()
+                        self.__map = None
@@ -21,13 +21,15 @@
 #
 
 #
-# Copyright (c) 2008, 2016, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2008, 2026, Oracle and/or its affiliates. All rights reserved.
 #
 
 from __future__ import division
 
 import cherrypy
 from cherrypy._cptools import HandlerTool
+from cherrypy.lib.cptools import validate_etags, validate_since
+from cherrypy.lib.httputil import get_ranges
 from cherrypy.lib.static import serve_file
 from email.utils import formatdate
 from cherrypy.process.plugins import SimplePlugin
@@ -42,12 +44,15 @@ else:
 
 import atexit
 import ast
+import collections
 import cStringIO
 import errno
+import hashlib
 import httplib
 import inspect
 import itertools
 import math
+import mmap
 import os
 import random
 import re
@@ -87,6 +92,202 @@ import pkg.version
 from pkg.server.query_parser import Query, ParseError, BooleanQueryException
 
 
+# The size of the regions of stored files that are mapped into memory at a
+# time when sending them to clients; must be a multiple of the allocation
+# granularity.
+_MAP_WINDOW = 8 * 1024 * 1024
+
+# The size of the pieces of a mapped region passed to the HTTP server.
+_SEND_CHUNK = 1024 * 1024
+
+# The default maximum size, in bytes, of the content of responses cached in
+# memory by the depot.
+RESPONSE_CACHE_SIZE = 64 * 1024 * 1024
+
+
+def _mapped_file_generator(fobj, start, end):
+        """A generator function that produces the bytes from offset 'start'
+        up to offset 'end' of the file object 'fobj' as views of read-only
+        memory mappings of it, so that the HTTP server can pass them to the
+        socket without the data being read into or copied by the interpreter.
+        The file object is closed when done."""
+
+        try:
+                fd = fobj.fileno()
+                offset = start
+                while offset < end:
+                        # Mappings must start at a multiple of the allocation
+                        # granularity.
+                        base = offset - offset % mmap.ALLOCATIONGRANULARITY
+                        length = min(base + _MAP_WINDOW, end) - base
+                        region = mmap.mmap(fd, length, access=mmap.ACCESS_READ,
+                            offset=base)
+                        pos = offset - base
+                        while pos < length:
+                                n = min(_SEND_CHUNK, length - pos)
+                                # Each view holds a reference to the region,
+                                # so it stays mapped for as long as the
+                                # server is using the view.
+                                yield memoryview(buffer(region, pos, n))
+                                pos += n
+                        offset = base + length
+        finally:
+                fobj.close()
+
+
+def _read_file_generator(fobj, start, end):
+        """A generator function that produces the bytes from offset 'start'
+        up to offset 'end' of the file object 'fobj' as strings, for HTTP
+        servers that don't accept anything else.  The file object is closed
+        when done."""
+
+        try:
+                fobj.seek(start)
+                remaining = end - start
+                while remaining > 0:
+                        data = fobj.read(min(_SEND_CHUNK, remaining))
+                        if not data:
+                                break
+                        remaining -= len(data)
+                        yield data
+        finally:
+                fobj.close()
+
+
+class _FileInfoCache(object):
+        """A bounded, thread-safe cache of the response headers for files
+        stored in the repository (such as file content, deltas, manifests,
+        and catalog parts), indexed by pathname.  Entries are checked against
+        the status of the file being sent, so a file that has been replaced
+        is never sent with stale headers."""
+
+        def __init__(self, size=8192):
+                self.__entries = collections.OrderedDict()
+                self.__lock = threading.Lock()
+                self.__size = size
+
+        def get(self, path, st, content_type, fobj=None):
+                """Returns a dict of the response headers for the file at
+                'path', where 'st' is the result of os.fstat() for it.
+
+                'content_type' is the value of the Content-Type header.
+
+                'fobj' is an optional file object open for reading the file.
+                If provided, the entity tag is the SHA-1 hash of the file's
+                content; otherwise, the file's name is assumed to be derived
+                from its content (as it is for file content and deltas), and
+                the entity tag is formed from its name and size."""
+
+                key = (st.st_size, st.st_mtime)
+                with self.__lock:
+                        entry = self.__entries.pop(path, None)
+                        if entry is not None and entry[0] == key:
+                                # Most recently used entries are last.
+                                self.__entries[path] = entry
+                                return entry[1]
+
+                if fobj is not None:
+                        etag = misc.get_data_digest(fobj, length=st.st_size,
+                            hash_func=hashlib.sha1)[0]
+                        fobj.seek(0)
+                else:
+                        etag = "{0}-{1:x}".format(os.path.basename(path),
+                            st.st_size)
+
+                headers = {
+                    "Accept-Ranges": "bytes",
+                    "Content-Length": str(st.st_size),
+                    "Content-Type": content_type,
+                    "ETag": "\"{0}\"".format(etag),
+                    "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+                }
+                with self.__lock:
+                        self.__entries[path] = (key, headers)
+                        while len(self.__entries) > self.__size:
+                                self.__entries.popitem(last=False)
+                return headers
+
+
+class _ResponseCache(object):
+        """A thread-safe, least-recently-used cache of the content of
+        frequently requested responses (such as manifests, catalog parts, and
+        p5i data), indexed by an operation-specific key.  The total size of
+        the cached content is limited to 'size' bytes.
+
+        Each entry is stored with a validator (such as the last modification
+        time of the catalog of the publisher it belongs to); an entry is
+        discarded if it's retrieved with a different validator."""
+
+        def __init__(self, size):
+                self.__entries = collections.OrderedDict()
+                self.__lock = threading.Lock()
+                self.__size = size
+                self.__used = 0
+                self.__hits = 0
+                self.__misses = 0
+                self.__evictions = 0
+
+                # Responses larger than this aren't cached so that a few
+                # large catalog parts can't displace everything else.
+                self.max_entry_size = size // 8
+
+        def get(self, key, validator):
+                """Returns the cached value for 'key' if it was stored with
+                the given 'validator', or None."""
+
+                with self.__lock:
+                        entry = self.__entries.pop(key, None)
+                        if entry is not None:
+                                if entry[0] == validator:
+                                        # Most recently used entries are last.
+                                        self.__entries[key] = entry
+                                        self.__hits += 1
+                                        return entry[1]
+                                self.__used -= entry[2]
+                        self.__misses += 1
+                return None
+
+        def put(self, key, validator, value, size):
+                """Stores 'value', which is 'size' bytes in length, for 'key'
+                with the given 'validator', evicting the least recently used
+                entries as needed."""
+
+                if validator is None or not self.__size or \
+                    size > self.max_entry_size:
+                        return
+
+                with self.__lock:
+                        entry = self.__entries.pop(key, None)
+                        if entry is not None:
+                                self.__used -= entry[2]
+                        self.__entries[key] = (validator, value, size)
+                        self.__used += size
+                        while self.__used > self.__size:
+                                key, entry = self.__entries.popitem(last=False)
+                                self.__used -= entry[2]
+                                self.__evictions += 1
+
+        def clear(self):
+                """Discards all cached entries."""
+
+                with self.__lock:
+                        self.__entries.clear()
+                        self.__used = 0
+
+        def get_status(self):
+                """Returns a dictionary of statistics about the cache."""
+
+                with self.__lock:
+                        return {
+                            "entries": len(self.__entries),
+                            "evictions": self.__evictions,
+                            "hits": self.__hits,
+                            "misses": self.__misses,
+                            "size": self.__size,
+                            "used": self.__used,
+                        }
+
+
 class Dummy(object):
         """Dummy object used for dispatch method mapping."""
         pass
@@ -108,8 +309,10 @@ class DepotHTTP(_Depot):
             "catalog",
             "info",
             "manifest",
+            "manifests",
             "filelist",
             "file",
+            "delta",
             "open",
             "append",
             "close",
@@ -128,8 +331,10 @@ class DepotHTTP(_Depot):
             "catalog",
             "info",
             "manifest",
+            "manifests",
             "filelist",
             "file",
+            "delta",
             "p5i",
             "publisher",
             "status",
@@ -165,6 +370,9 @@ class DepotHTTP(_Depot):
                 self.flist_requests = 0
                 self.flist_file_requests = 0
                 self.request_pub_func = request_pub_func
+                self.__file_info = _FileInfoCache()
+                self.__response_cache = _ResponseCache(
+                    dconf.get_property("pkg", "response_cache_size"))
 
                 content_root = dconf.get_property("pkg", "content_root")
                 pkg_root = dconf.get_property("pkg", "pkg_root")
@@ -275,6 +483,11 @@ class DepotHTTP(_Depot):
                 self.__bgtask = BackgroundTaskPlugin(cherrypy.engine)
                 self.__bgtask.subscribe()
 
+                # Deltas are generated by their own handler so that a burst
+                # of delta requests can't keep indexing from being queued.
+                self.__delta_bgtask = BackgroundTaskPlugin(cherrypy.engine)
+                self.__delta_bgtask.subscribe()
+
         def _queue_refresh_index(self):
                 """Queues a background task to update search indexes.  This
                 method is a protected helper function for depot consumers."""
@@ -287,6 +500,18 @@ class DepotHTTP(_Depot):
                         cherrypy.log("Skipping indexing; another operation is "
                             "already in progress.", "INDEX")
 
+        def __make_delta(self, old_hash, new_hash, pub):
+                """Background task that generates the delta between the
+                specified files for later delta_0 requests."""
+
+                try:
+                        self.repo.make_delta(old_hash, new_hash, pub=pub)
+                except (srepo.RepositoryError, EnvironmentError) as e:
+                        # The client has already been told to retrieve the
+                        # file instead, so just log the failure.
+                        cherrypy.log("Delta generation failed: {0}".format(
+                            str(e)), "DELTA")
+
         @staticmethod
         def default_error_page(**kwargs):
                 """This function is registered as the default error page
@@ -385,6 +610,9 @@ class DepotHTTP(_Depot):
                 """Catch SIGUSR1 and reload the depot information."""
                 old_pubs = self.repo.publishers
                 self.repo.reload()
+                # Cached responses may no longer match the repository's
+                # content or configuration.
+                self.__response_cache.clear()
                 if type(self.cfg) == cfg.SMFConfig:
                         # For all other cases, reloading depot configuration
                         # isn't desirable (because of command-line overrides).
@@ -688,7 +916,22 @@ class DepotHTTP(_Depot):
                         raise cherrypy.HTTPError(httplib.NOT_FOUND, str(e))
 
                 self.__set_response_expires("catalog", 86400, 86400)
-                return serve_file(fpath, "text/plain; charset=utf-8")
+
+                # Catalog parts are replaced whenever packages are added or
+                # removed, so cached content is validated against the status
+                # of the file.
+                cache_key = ("catalog", fpath)
+                try:
+                        st = os.stat(fpath)
+                        validator = (st.st_size, st.st_mtime)
+                except EnvironmentError:
+                        validator = None
+                entry = self.__response_cache.get(cache_key, validator)
+                if entry is not None:
+                        return self.__serve_cached_file(*entry)
+                return self.__serve_stored_file(fpath,
+                    "text/plain; charset=utf-8", hashed=True,
+                    cache_key=cache_key, validator=validator)
 
         catalog_1._cp_config = { "response.stream": True }
 
@@ -715,16 +958,24 @@ class DepotHTTP(_Depot):
                         # Only one slash here as another will be added below.
                         comps[0] += "/"
 
+                # If more than one token (request path component) was
+                # specified, assume that the extra components are part of the
+                # fmri and have been split out because of bad proxy behaviour.
+                pfmri = "/".join(comps)
+                pub = self._get_req_pub()
+                cache_key = ("manifest", pub, pfmri)
+                validator = self.__get_cache_validator(pub)
+                entry = self.__response_cache.get(cache_key, validator)
+                if entry is not None:
+                        self.repo.inc_manifest()
+                        self.__set_response_expires("manifest", 86400*365,
+                            86400*365)
+                        return self.__serve_cached_file(*entry)
+
                 # Parse request into FMRI component and decode.
                 try:
-                        # If more than one token (request path component) was
-                        # specified, assume that the extra components are part
-                        # of the fmri and have been split out because of bad
-                        # proxy behaviour.
-                        pfmri = "/".join(comps)
                         pfmri = fmri.PkgFmri(pfmri, None)
-                        fpath = self.repo.manifest(pfmri,
-                            pub=self._get_req_pub())
+                        fpath = self.repo.manifest(pfmri, pub=pub)
                 except (IndexError, fmri.FmriError) as e:
                         raise cherrypy.HTTPError(httplib.BAD_REQUEST, str(e))
                 except srepo.RepositoryError as e:
@@ -736,10 +987,76 @@ class DepotHTTP(_Depot):
 
                 # Send manifest
                 self.__set_response_expires("manifest", 86400*365, 86400*365)
-                return serve_file(fpath, "text/plain; charset=utf-8")
+                return self.__serve_stored_file(fpath,
+                    "text/plain; charset=utf-8", hashed=True,
+                    cache_key=cache_key, validator=validator)
 
         manifest_0._cp_config = { "response.stream": True }
 
+        def manifests_0(self, *tokens, **params):
+                """Request data contains application/x-www-form-urlencoded
+                entries with the FMRIs of the packages whose manifests are
+                requested.  The manifests are output directly to the client as
+                a gzip-compressed tar stream in which each manifest is named by
+                the encoded FMRI of its package (as used by manifest/0).
+                Manifests that aren't in the repository are omitted."""
+
+                if tokens or not params:
+                        raise cherrypy.HTTPError(httplib.BAD_REQUEST)
+
+                try:
+                        pfmris = [
+                            fmri.PkgFmri(v, None)
+                            for v in params.values()
+                        ]
+                except fmri.FmriError as e:
+                        raise cherrypy.HTTPError(httplib.BAD_REQUEST, str(e))
+
+                pub = self._get_req_pub()
+
+                # The tar stream is written to a list of pieces, which are
+                # sent to the client as each manifest is added to it.
+                pieces = []
+                out = Dummy()
+                out.write = pieces.append
+
+                def output():
+                        tar_stream = tarfile.open(mode="w|gz", fileobj=out)
+                        try:
+                                for pfmri in pfmris:
+                                        try:
+                                                mpath = self.repo.manifest(
+                                                    pfmri, pub=pub)
+                                        except srepo.RepositoryError:
+                                                # If the manifest isn't here,
+                                                # skip it.
+                                                continue
+                                        if not os.path.exists(mpath):
+                                                continue
+                                        tar_stream.add(mpath,
+                                            pfmri.get_url_path(), False)
+                                        if pieces:
+                                                data = "".join(pieces)
+                                                del pieces[:]
+                                                yield data
+                        finally:
+                                # Flush the remaining bytes to the client.
+                                tar_stream.close()
+                        yield "".join(pieces)
+
+                return output()
+
+        manifests_0._cp_config = {
+            "response.stream": True,
+            "tools.response_headers.on": True,
+            "tools.response_headers.headers": [
+                ("Content-Type", "application/data"),
+                ("Pragma", "no-cache"),
+                ("Cache-Control", "no-cache, no-transform, must-revalidate"),
+                ("Expires", 0)
+            ]
+        }
+
         @staticmethod
         def _tar_stream_close(**kwargs):
                 """This is a special function to finish a tar_stream-based
@@ -838,6 +1155,142 @@ class DepotHTTP(_Depot):
             ]
         }
 
+        @staticmethod
+        def __get_range(size):
+                """Returns a tuple of the offsets of the start and end of the
+                part of a file of 'size' bytes to send in response to the
+                current request.  If only part of the file is to be sent, the
+                response status and headers are set accordingly.  Requests for
+                multiple ranges, or with an If-Range condition that doesn't
+                match the current response headers, are answered with the
+                whole file."""
+
+                request = cherrypy.request
+                response = cherrypy.response
+
+                rheader = request.headers.get("Range")
+                if not rheader:
+                        return 0, size
+
+                if_range = request.headers.get("If-Range")
+                if if_range and if_range not in (response.headers["ETag"],
+                    response.headers["Last-Modified"]):
+                        return 0, size
+
+                try:
+                        ranges = get_ranges(rheader, size)
+                except ValueError:
+                        # Malformed Range headers are ignored.
+                        ranges = None
+
+                if ranges == []:
+                        response.headers["Content-Range"] = \
+                            "bytes */{0:d}".format(size)
+                        raise cherrypy.HTTPError(
+                            httplib.REQUESTED_RANGE_NOT_SATISFIABLE)
+                if not ranges or len(ranges) > 1:
+                        return 0, size
+
+                start, end = ranges[0]
+                response.status = httplib.PARTIAL_CONTENT
+                response.headers["Content-Range"] = \
+                    "bytes {0:d}-{1:d}/{2:d}".format(start, end - 1, size)
+                response.headers["Content-Length"] = str(end - start)
+                return start, end
+
+        def __get_cache_validator(self, pub):
+                """Returns the validator for cached responses containing data
+                for the publisher 'pub' (or for any publisher, if None): the
+                last modification time of the publisher's catalog, which
+                changes whenever packages are added or removed.  None is
+                returned if responses can't be cached."""
+
+                try:
+                        if pub:
+                                return self.repo.get_catalog(
+                                    pub=pub).last_modified
+                        return tuple(
+                            rstore.catalog.last_modified
+                            for rstore in self.repo.rstores
+                            if rstore.publisher
+                        )
+                except srepo.RepositoryError:
+                        return None
+
+        def __serve_cached_file(self, headers, data):
+                """Sends the content of a stored file cached in memory as
+                'data' using the response headers 'headers', which were
+                cached along with it, honoring conditional and range requests
+                as __serve_stored_file does."""
+
+                cherrypy.response.headers.update(headers)
+                validate_etags()
+                validate_since()
+                start, end = self.__get_range(len(data))
+                if start == 0 and end == len(data):
+                        return data
+                return data[start:end]
+
+        def __serve_stored_file(self, fpath, content_type="application/data",
+            hashed=False, cache_key=None, validator=None):
+                """Sends the file at 'fpath', which is stored in the repository
+                in the form it is sent (such as gzip-compressed file content),
+                to the client using the given 'content_type'.
+
+                If 'hashed' is True, the file's entity tag is the SHA-1 hash of
+                its content, which is computed when the file is first sent;
+                otherwise, the file's name must be derived from its content.
+
+                Conditional requests (If-Match, If-None-Match, and
+                If-Modified-Since) and requests for a single range of bytes
+                (optionally qualified by If-Range) are honored.
+
+                When running in CherryPy's own HTTP server, the file is sent
+                from memory mappings of it using response headers cached for
+                the file, so the file isn't read by the interpreter at all.
+                Other HTTP servers (such as mod_wsgi, which only accepts
+                strings) are sent the file's content as it is read.
+
+                If 'cache_key' is provided, the file's content and response
+                headers are also stored in the response cache using that key
+                and 'validator', if the file is small enough to be cached."""
+
+                try:
+                        fobj = open(fpath, "rb")
+                        st = os.fstat(fobj.fileno())
+                except EnvironmentError as e:
+                        if e.errno == errno.ENOENT:
+                                raise cherrypy.NotFound()
+                        raise
+
+                data = None
+                try:
+                        headers = self.__file_info.get(fpath, st,
+                            content_type, fobj=hashed and fobj or None)
+                        cherrypy.response.headers.update(headers)
+                        # Respond to conditional requests; these raise an
+                        # exception if the file shouldn't be sent.
+                        validate_etags()
+                        validate_since()
+                        start, end = self.__get_range(st.st_size)
+                        if cache_key is not None and st.st_size <= \
+                            self.__response_cache.max_entry_size:
+                                data = fobj.read()
+                except:
+                        fobj.close()
+                        raise
+
+                if data is not None:
+                        fobj.close()
+                        self.__response_cache.put(cache_key, validator,
+                            (headers, data), len(data))
+                        return data[start:end]
+
+                if cherrypy.request.wsgi_environ.get("SERVER_SOFTWARE",
+                    "").startswith("CherryPy"):
+                        return _mapped_file_generator(fobj, start, end)
+                return _read_file_generator(fobj, start, end)
+
         def file_0(self, *tokens):
                 """Outputs the contents of the file, named by the SHA-1 hash
                 name in the request path, directly to the client."""
@@ -859,10 +1312,52 @@ class DepotHTTP(_Depot):
                         raise cherrypy.HTTPError(httplib.NOT_FOUND, str(e))
 
                 self.__set_response_expires("file", 86400*365, 86400*365)
-                return serve_file(fpath, "application/data")
+                return self.__serve_stored_file(fpath)
 
         file_0._cp_config = { "response.stream": True }
 
+        def delta_0(self, *tokens):
+                """Outputs a gzip-compressed delta that reconstructs the file
+                named by the second SHA hash name in the request path from the
+                file named by the first, directly to the client.  Deltas are
+                generated in the background the first time they are requested;
+                until then, or if a delta would not be significantly smaller
+                than the new file, a 404 is returned and the client should
+                retrieve the file instead."""
+
+                try:
+                        old_hash, new_hash = tokens[:2]
+                except ValueError:
+                        raise cherrypy.HTTPError(httplib.BAD_REQUEST,
+                            "A delta request must specify two hashes.")
+
+                pub = self._get_req_pub()
+                try:
+                        dpath = self.repo.delta(old_hash, new_hash, pub=pub)
+                except srepo.RepositoryDeltaNotCachedError as e:
+                        try:
+                                self.__delta_bgtask.put(self.__make_delta,
+                                    old_hash, new_hash, pub)
+                        except Queue.Full:
+                                # Enough deltas are already being generated;
+                                # a later request will queue this one.
+                                pass
+                        raise cherrypy.HTTPError(httplib.NOT_FOUND, str(e))
+                except (srepo.RepositoryFileNotFoundError,
+                    srepo.RepositoryNoDeltaError) as e:
+                        raise cherrypy.HTTPError(httplib.NOT_FOUND, str(e))
+                except srepo.RepositoryError as e:
+                        # Treat any remaining repository error as a 404, but
+                        # log the error and include the real failure
+                        # information.
+                        cherrypy.log("Request failed: {0}".format(str(e)))
+                        raise cherrypy.HTTPError(httplib.NOT_FOUND, str(e))
+
+                self.__set_response_expires("file", 86400*365, 86400*365)
+                return self.__serve_stored_file(dpath)
+
+        delta_0._cp_config = { "response.stream": True }
+
         def file_1(self, *tokens):
                 """Outputs the contents of the file, named by the SHA hash
                 name in the request path, directly to the client."""
@@ -1509,8 +2004,16 @@ License:
                         end = len(pfmri) - len(".p5i")
                         pfmri = pfmri[:end]
 
-                output = ""
                 prefix = self._get_req_pub()
+                cache_key = ("p5i", prefix, pfmri)
+                validator = self.__get_cache_validator(prefix)
+                output = self.__response_cache.get(cache_key, validator)
+                if output is not None:
+                        self.__set_response_expires("p5i", 86400*365,
+                            86400*365)
+                        return output
+
+                output = ""
                 for rstore in self.repo.rstores:
                         if not rstore.publisher:
                                 continue
@@ -1522,8 +2025,11 @@ License:
                         raise cherrypy.HTTPError(httplib.NOT_FOUND, _("No "
                             "matching package found in repository."))
 
+                output = misc.force_bytes(output)
+                self.__response_cache.put(cache_key, validator, output,
+                    len(output))
                 self.__set_response_expires("p5i", 86400*365, 86400*365)
-                return misc.force_bytes(output)
+                return output
 
         @cherrypy.tools.response_headers(headers=\
             [("Content-Type", "application/json; charset=utf-8")])
@@ -1534,6 +2040,9 @@ License:
                 self.__set_response_expires("versions", 5*60, 5*60)
 
                 dump_struct = self.repo.get_status()
+                dump_struct["depot"] = {
+                    "response-cache": self.__response_cache.get_status(),
+                }
 
                 try:
                         out = json.dumps(dump_struct, ensure_ascii=False,
@@ -2409,6 +2918,9 @@ class DepotConfig(object):
                     cfg.PropInt("port"),
                     cfg.PropPubURI("proxy_base"),
                     cfg.PropBool("readonly"),
+                    cfg.PropInt("response_cache_size",
+                        default=RESPONSE_CACHE_SIZE,
+                        value_map={ "": RESPONSE_CACHE_SIZE }),
                     cfg.PropInt("socket_timeout"),
                     cfg.PropInt("sort_file_max_size",
                         default=indexer.SORT_FILE_MAX_SIZE,
@@ -19,20 +19,25 @@
 #
 # CDDL HEADER END
 #
-# Copyright (c) 2008, 2016, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2008, 2026, Oracle and/or its affiliates. All rights reserved.
 
 import cStringIO
 import codecs
+import collections
 import datetime
 import errno
 import hashlib
 import logging
+import multiprocessing
 import os
 import os.path
 import shutil
+import signal
 import stat
 import sys
 import tempfile
+import threading
+import time
 import urllib
 import zlib
 
@@ -45,6 +50,7 @@ import pkg.client.api_errors as apx
 import pkg.client.progress as progress
 import pkg.client.publisher as publisher
 import pkg.config as cfg
+import pkg.delta
 import pkg.digest as digest
 import pkg.file_layout.file_manager as file_manager
 import pkg.file_layout.layout as layout
@@ -87,6 +93,24 @@ verify_default_checks = frozenset([
       VERIFY_DEPENDENCY,
 ])
 
+# The name of the file in each repository store that records the files found
+# to be valid by verify, and the maximum age in seconds of an entry in it before
+# the file it describes is verified again.
+REPO_VERIFY_LEDGER = "verify.ledger"
+REPO_VERIFY_LEDGER_MAX_AGE = 30 * 24 * 60 * 60
+
+# The name of the directory in each repository store's writable root used to
+# cache deltas between files, and the largest size of a delta as a fraction of
+# the size of the file it reconstructs for it to be worth sending.
+REPO_DELTA_DIR = "delta"
+REPO_DELTA_MAX_RATIO = 0.9
+# The largest size of the files to generate deltas for; larger files take too
+# long to generate deltas for and are always sent in full.
+REPO_DELTA_MAX_FILE_SIZE = 32 * 1024 * 1024
+# The largest total size of the deltas cached in each repository store; the
+# least recently used deltas are removed to stay below it.
+REPO_DELTA_CACHE_SIZE = 1024 * 1024 * 1024
+
 from pkg.pkggzip import PkgGzipFile
 
 class RepositoryError(Exception):
@@ -259,6 +283,25 @@ class RepositoryNoPublisherError(RepositoryError):
                     "default publisher has not been configured.")
 
 
+class RepositoryNoDeltaError(RepositoryError):
+        """Used to indicate that a delta between the two specified files is
+        not available because it would not be significantly smaller than the
+        new file."""
+
+        def __str__(self):
+                return _("No delta is available from '{0}' to '{1}'.").format(
+                    *self.data)
+
+
+class RepositoryDeltaNotCachedError(RepositoryError):
+        """Used to indicate that a delta between the two specified files has
+        not been generated yet."""
+
+        def __str__(self):
+                return _("The delta from '{0}' to '{1}' is not available "
+                    "yet.").format(*self.data)
+
+
 class RepositoryNoSuchFileError(RepositoryError):
         """Used to indicate that the file provided does not exist."""
 
@@ -377,6 +420,130 @@ class RepositorySigNoTrustAnchorDirError(RepositoryError):
                 return _("Unable to find trust anchor directory {0}").format(
                     self.data)
 
+def _verify_hash(path, pfmri, h, alg=digest.DEFAULT_HASH_FUNC):
+        """Perform hash verification on the given gzip file.
+        'path' is the full path to the file in the repository. 'pfmri'
+        is the package that we're verifying. 'h' is the expected hash
+        of the path. 'alg' is the hash function used to compute the
+        hash."""
+
+        gzf = None
+        try:
+                gzf = PkgGzipFile(fileobj=open(path, "rb"))
+                fhash = alg()
+                fhash.update(gzf.read())
+                actual = fhash.hexdigest()
+                if actual != h:
+                        return (REPO_VERIFY_BADHASH, path,
+                            {"actual": actual, "hash": h,
+                            "pkg": pfmri})
+        except (ValueError, zlib.error) as e:
+                return (REPO_VERIFY_BADGZIP, path,
+                    {"hash": h, "pkg": pfmri})
+        except IOError as e:
+                if e.errno in [errno.EACCES, errno.EPERM]:
+                        return (REPO_VERIFY_PERM, path,
+                            {"err": str(e), "hash": h,
+                            "pkg": pfmri})
+                else:
+                        return (REPO_VERIFY_BADGZIP, path,
+                            {"hash": h, "pkg": pfmri})
+        finally:
+                if gzf:
+                        gzf.close()
+
+
+def _verify_perm(path, pfmri, h):
+        """Check that we don't get any permissions errors when
+        trying to stat the given path."""
+        try:
+                st = os.stat(path)
+                # if it's a directory, we'll try to list it
+                if stat.S_ISDIR(st.st_mode):
+                        os.listdir(path)
+        except OSError as e:
+                if e.errno in [errno.EPERM, errno.EACCES]:
+                        if not pfmri:
+                                return (REPO_VERIFY_MFPERM, path,
+                                    {"err": str(e)})
+                        return (REPO_VERIFY_PERM, path,
+                            {"hash": h, "err": str(e), "pkg": pfmri})
+                else:
+                        return (REPO_VERIFY_NOFILE, path,
+                            {"hash": h, "err": str(e), "pkg": pfmri})
+
+
+# Maps each hash function used to verify payloads to its name in
+# digest.HASH_ALGS, so that it can be passed to _verify_payload.
+_hash_alg_names = dict(
+    (func, name) for name, func in digest.HASH_ALGS.iteritems()
+)
+
+
+def _verify_payload(task):
+        """Verify the payload files delivered by a package.  This is used
+        directly by serial verification and runs in a worker process for
+        parallel verification, so its argument and return values must be
+        picklable.
+
+        'task' is a tuple of (pfmri, files, max_age) where 'files' is a list
+        of tuples of the form (path, hash, hash_name, entry), 'hash_name'
+        being the key of the hash function to use in digest.HASH_ALGS and
+        'entry' the verify ledger entry for the file or None.  The hash of a
+        file isn't checked if its ledger entry matches the file and is no
+        older than 'max_age' seconds.
+
+        Returns a tuple of (errors, nfiles, nbytes, nskipped, clean), where
+        'errors' is a list of the (error, path, reason) tuples found, 'nfiles'
+        is the number of files hashed, 'nbytes' is their total size in the
+        repository, 'nskipped' is the number of files not hashed because of
+        their ledger entry, and 'clean' is a list of (path, entry) tuples for
+        the files found to be valid."""
+
+        pfmri, files, max_age = task
+        errors = []
+        clean = []
+        nbytes = 0
+        nskipped = 0
+        now = int(time.time())
+        for path, h, hname, entry in files:
+                err = _verify_perm(path, pfmri, h)
+                if err:
+                        errors.append(err)
+                        continue
+                try:
+                        st = os.stat(path)
+                except OSError:
+                        # _verify_hash will report the problem.
+                        st = None
+                else:
+                        # The mode and owner are included so that a file
+                        # which has become unreadable is checked again.
+                        fstat = (h, st.st_size, int(st.st_mtime * 1000000),
+                            st.st_ino, st.st_mode, st.st_uid)
+                        if entry and entry[:6] == fstat and \
+                            now - entry[6] < max_age:
+                                nskipped += 1
+                                clean.append((path, entry))
+                                continue
+                        nbytes += st.st_size
+
+                err = _verify_hash(path, pfmri, h,
+                    alg=digest.HASH_ALGS[hname])
+                if err:
+                        errors.append(err)
+                elif st:
+                        clean.append((path, fstat + (now,)))
+        return errors, len(files) - nskipped, nbytes, nskipped, clean
+
+
+def _verify_worker_init():
+        """Initialize a verification worker process.  Interrupts are left to
+        the parent process, which terminates the workers."""
+
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
 class _RepoStore(object):
         """The _RepoStore object provides an interface for performing operations
         on a set of package data contained within a repository.  This class is
@@ -384,8 +551,8 @@ class _RepoStore(object):
         """
 
         def __init__(self, allow_invalid=False, file_layout=None,
-            file_root=None, log_obj=None, mirror=False, pub=None,
-            read_only=False, root=None,
+            file_root=None, index_jobs=1, log_obj=None, mirror=False,
+            pub=None, read_only=False, root=None,
             sort_file_max_size=indexer.SORT_FILE_MAX_SIZE, writable_root=None):
                 """Prepare the repository for use."""
 
@@ -397,6 +564,7 @@ class _RepoStore(object):
                 self.__file_layout = file_layout
                 self.__file_root = None
                 self.__in_flight_trans = {}
+                self.__index_jobs = index_jobs
                 self.__read_only = read_only
                 self.__root = None
                 self.__sort_file_max_size = sort_file_max_size
@@ -428,6 +596,9 @@ class _RepoStore(object):
 
                 self.__search_available = False
                 self.__refresh_again = False
+                # Query parsers are expensive to build, so each thread keeps
+                # one for reuse by later searches.
+                self.__query_parsers = threading.local()
 
                 self.__lock = pkg.nrlock.NRLock()
                 if self.__tmp_root:
@@ -512,7 +683,8 @@ class _RepoStore(object):
                 ind = indexer.Indexer(self.index_root,
                     self._get_manifest, self.manifest,
                     log=self.__index_log,
-                    sort_file_max_size=self.__sort_file_max_size)
+                    sort_file_max_size=self.__sort_file_max_size,
+                    jobs=self.__index_jobs)
                 cie = False
                 try:
                         cie = ind.check_index_existence()
@@ -618,7 +790,8 @@ class _RepoStore(object):
                                 ind = indexer.Indexer(self.index_root,
                                     self._get_manifest, self.manifest,
                                     log=self.__index_log,
-                                    sort_file_max_size=self.__sort_file_max_size)
+                                    sort_file_max_size=self.__sort_file_max_size,
+                                    jobs=self.__index_jobs)
                                 ind.lock(blocking=False)
                         except se.IndexLockedException:
                                 index_locked = True
@@ -720,7 +893,8 @@ class _RepoStore(object):
                     self._get_manifest,
                     self.manifest,
                     log=self.__index_log,
-                    sort_file_max_size=self.__sort_file_max_size)
+                    sort_file_max_size=self.__sort_file_max_size,
+                    jobs=self.__index_jobs)
 
                 # To prevent issues with NFS consumers, attempt to lock the
                 # index first, but don't hold the lock as holding a lock while
@@ -856,7 +1030,8 @@ class _RepoStore(object):
                     self._get_manifest,
                     self.manifest,
                     log=self.__index_log,
-                    sort_file_max_size=self.__sort_file_max_size)
+                    sort_file_max_size=self.__sort_file_max_size,
+                    jobs=self.__index_jobs)
                 ind.setup()
                 if not self.__search_available:
                         self.__index_log("Search Available")
@@ -1182,7 +1357,8 @@ class _RepoStore(object):
                         index_inst = indexer.Indexer(self.index_root,
                             self._get_manifest, self.manifest,
                             log=self.__index_log,
-                            sort_file_max_size=self.__sort_file_max_size)
+                            sort_file_max_size=self.__sort_file_max_size,
+                            jobs=self.__index_jobs)
                         index_inst.server_update_index(fmris)
                         if not self.__search_available:
                                 self.__index_log("Search Available")
@@ -1430,6 +1606,173 @@ class _RepoStore(object):
                         return fp
                 raise RepositoryFileNotFoundError(fhash)
 
+        def __delta_path(self, old_hash, new_hash):
+                """Returns a tuple of the absolute pathnames of the files named
+                by 'old_hash' and 'new_hash' and of the cached delta between
+                them."""
+
+                if not self.file_root:
+                        raise RepositoryUnsupportedOperationError()
+
+                droot = self.writable_root or self.root
+                if not droot or (self.read_only and not self.writable_root):
+                        raise RepositoryUnsupportedOperationError()
+
+                for h in (old_hash, new_hash):
+                        # The hashes are used to name the cached delta.
+                        if not h or not h.isalnum():
+                                raise RepositoryFileNotFoundError(h)
+                old_path = self.file(old_hash)
+                new_path = self.file(new_hash)
+
+                return old_path, new_path, os.path.join(droot, REPO_DELTA_DIR,
+                    old_hash[:2], "{0}-{1}".format(old_hash, new_hash))
+
+        def delta(self, old_hash, new_hash):
+                """Returns the absolute pathname of a gzip-compressed delta
+                (see pkg.delta) that reconstructs the file specified by the
+                SHA-n hash name 'new_hash' from the file specified by
+                'old_hash'.
+
+                Generating a delta is expensive, so deltas are only returned
+                once they have been generated and cached by make_delta().
+                RepositoryDeltaNotCachedError is raised if that hasn't been
+                done yet, and RepositoryNoDeltaError if the delta would not be
+                significantly smaller than the new file."""
+
+                old_path, new_path, dpath = self.__delta_path(old_hash,
+                    new_hash)
+                try:
+                        size = os.stat(dpath).st_size
+                except EnvironmentError as e:
+                        if e.errno == errno.ENOENT:
+                                raise RepositoryDeltaNotCachedError(
+                                    (old_hash, new_hash))
+                        raise
+                if size == 0:
+                        # The delta was found to be too large when it was
+                        # generated.
+                        raise RepositoryNoDeltaError((old_hash, new_hash))
+
+                # Mark the delta as recently used so that it is kept when the
+                # cache is pruned.
+                try:
+                        os.utime(dpath, None)
+                except EnvironmentError:
+                        pass
+                return dpath
+
+        def make_delta(self, old_hash, new_hash):
+                """Generates and caches, in the repository store's writable
+                root, the delta returned by delta() for the specified files if
+                it hasn't been already.  If either file is larger than
+                REPO_DELTA_MAX_FILE_SIZE, or the delta would not be
+                significantly smaller than the new file, an empty file is
+                cached in its place so that it isn't generated again.  The
+                least recently used deltas are then removed if the cache has
+                grown larger than REPO_DELTA_CACHE_SIZE."""
+
+                old_path, new_path, dpath = self.__delta_path(old_hash,
+                    new_hash)
+                if os.path.exists(dpath):
+                        return
+
+                ddir = os.path.dirname(dpath)
+                try:
+                        if not os.path.exists(ddir):
+                                os.makedirs(ddir, misc.PKG_DIR_MODE)
+                        fd, tmp = tempfile.mkstemp(dir=ddir)
+                except EnvironmentError as e:
+                        if e.errno in (errno.EACCES, errno.EPERM,
+                            errno.EROFS):
+                                # Deltas can't be cached, so aren't offered.
+                                raise RepositoryUnsupportedOperationError()
+                        raise
+
+                try:
+                        with os.fdopen(fd, "wb") as fh:
+                                # Stored files are compressed, so a file
+                                # whose stored size is too large is certainly
+                                # too large uncompressed.
+                                useful = max(os.stat(old_path).st_size,
+                                    os.stat(new_path).st_size) <= \
+                                    REPO_DELTA_MAX_FILE_SIZE
+                                if useful:
+                                        useful = self.__write_delta(old_path,
+                                            new_path, fh)
+                        os.chmod(tmp, misc.PKG_FILE_MODE)
+                        if not useful or os.stat(tmp).st_size >= \
+                            os.stat(new_path).st_size * REPO_DELTA_MAX_RATIO:
+                                # Leave an empty file behind so that the
+                                # delta isn't generated again.
+                                open(tmp, "wb").close()
+                        portable.rename(tmp, dpath)
+                except:
+                        portable.remove(tmp)
+                        raise
+
+                self.__prune_deltas(os.path.dirname(ddir))
+
+        @staticmethod
+        def __write_delta(old_path, new_path, fh):
+                """Writes the compressed delta between the stored files
+                'old_path' and 'new_path' to the file object 'fh'.  Returns
+                False if either file is larger than REPO_DELTA_MAX_FILE_SIZE
+                once uncompressed, in which case what was written must be
+                discarded."""
+
+                gz = PkgGzipFile(fileobj=fh)
+                try:
+                        with PkgGzipFile(old_path, "rb") as old, \
+                            PkgGzipFile(new_path, "rb") as new:
+                                pkg.delta.make_delta(old, new, gz,
+                                    max_size=REPO_DELTA_MAX_FILE_SIZE)
+                except pkg.delta.FileTooLargeError:
+                        return False
+                finally:
+                        gz.close()
+                return True
+
+        @staticmethod
+        def __prune_deltas(droot):
+                """Removes the least recently used of the deltas cached in
+                'droot' until their total size is no larger than
+                REPO_DELTA_CACHE_SIZE."""
+
+                deltas = []
+                total = 0
+                for dirpath, dirnames, filenames in os.walk(droot):
+                        for fn in filenames:
+                                if "-" not in fn:
+                                        # A delta still being generated.
+                                        continue
+                                path = os.path.join(dirpath, fn)
+                                try:
+                                        st = os.stat(path)
+                                except EnvironmentError as e:
+                                        if e.errno == errno.ENOENT:
+                                                continue
+                                        raise
+                                # The empty files left for deltas that aren't
+                                # worth sending still take up space.
+                                size = max(st.st_size, 512)
+                                deltas.append((st.st_mtime, size, path))
+                                total += size
+
+                if total <= REPO_DELTA_CACHE_SIZE:
+                        return
+
+                deltas.sort()
+                for mtime, size, path in deltas:
+                        try:
+                                portable.remove(path)
+                        except EnvironmentError as e:
+                                if e.errno != errno.ENOENT:
+                                        raise
+                        total -= size
+                        if total <= REPO_DELTA_CACHE_SIZE:
+                                break
+
         def get_publisher(self):
                 """Return the Publisher object for this storage object or None
                 if not available.
@@ -1850,7 +2193,8 @@ class _RepoStore(object):
                         ind = indexer.Indexer(self.index_root,
                             self._get_manifest, self.manifest,
                             log=self.__index_log,
-                            sort_file_max_size=self.__sort_file_max_size)
+                            sort_file_max_size=self.__sort_file_max_size,
+                            jobs=self.__index_jobs)
                         ind.setup()
                         if not self.__search_available:
                                 self.__index_log("Search Available")
@@ -1872,9 +2216,12 @@ class _RepoStore(object):
 
                 def _search(q):
                         assert self.index_root
-                        l = sqp.QueryLexer()
-                        l.build()
-                        qqp = sqp.QueryParser(l)
+                        qqp = getattr(self.__query_parsers, "parser", None)
+                        if qqp is None:
+                                l = sqp.QueryLexer()
+                                l.build()
+                                qqp = sqp.QueryParser(l)
+                                self.__query_parsers.parser = qqp
                         query = qqp.parse(q.text)
                         query.set_info(num_to_return=q.num_to_return,
                             start_point=q.start_point,
@@ -2090,57 +2437,6 @@ class _RepoStore(object):
                         return (REPO_VERIFY_PERM, path, {"err": str(e),
                             "pkg": pfmri})
 
-        def __verify_hash(self, path, pfmri, h, alg=digest.DEFAULT_HASH_FUNC):
-                """Perform hash verification on the given gzip file.
-                'path' is the full path to the file in the repository. 'pfmri'
-                is the package that we're verifying. 'h' is the expected hash
-                of the path. 'alg' is the hash function used to compute the
-                hash."""
-
-                gzf = None
-                try:
-                        gzf = PkgGzipFile(fileobj=open(path, "rb"))
-                        fhash = alg()
-                        fhash.update(gzf.read())
-                        actual = fhash.hexdigest()
-                        if actual != h:
-                                return (REPO_VERIFY_BADHASH, path,
-                                    {"actual": actual, "hash": h,
-                                    "pkg": pfmri})
-                except (ValueError, zlib.error) as e:
-                        return (REPO_VERIFY_BADGZIP, path,
-                            {"hash": h, "pkg": pfmri})
-                except IOError as e:
-                        if e.errno in [errno.EACCES, errno.EPERM]:
-                                return (REPO_VERIFY_PERM, path,
-                                    {"err": str(e), "hash": h,
-                                    "pkg": pfmri})
-                        else:
-                                return (REPO_VERIFY_BADGZIP, path,
-                                    {"hash": h, "pkg": pfmri})
-                finally:
-                        if gzf:
-                                gzf.close()
-
-        def __verify_perm(self, path, pfmri, h):
-                """Check that we don't get any permissions errors when
-                trying to stat the given path."""
-                try:
-                        st = os.stat(path)
-                        # if it's a directory, we'll try to list it
-                        if stat.S_ISDIR(st.st_mode):
-                                os.listdir(path)
-                except OSError as e:
-                        if e.errno in [errno.EPERM, errno.EACCES]:
-                                if not pfmri:
-                                        return (REPO_VERIFY_MFPERM, path,
-                                            {"err": str(e)})
-                                return (REPO_VERIFY_PERM, path,
-                                    {"hash": h, "err": str(e), "pkg": pfmri})
-                        else:
-                                return (REPO_VERIFY_NOFILE, path,
-                                    {"hash": h, "err": str(e), "pkg": pfmri})
-
         def __verify_signature(self, path, pfmri, pub, trust_anchors,
             sig_required_names, use_crls):
                 """Verify signatures on a given FMRI."""
@@ -2248,16 +2544,161 @@ class _RepoStore(object):
                                         return False, pth
                 return True, None
 
+        @staticmethod
+        def __get_result(item):
+                """Wait for the result of the _verify_payload call for the
+                pending package 'item' of __gen_verify and return the item
+                with the result in place of the AsyncResult object."""
+
+                pfmri, errors, result = item
+                while result:
+                        # A timeout is used so that the wait can be
+                        # interrupted.
+                        try:
+                                return pfmri, errors, result.get(1)
+                        except multiprocessing.TimeoutError:
+                                pass
+                return item
+
+        def __gen_verify_pkg(self, pdir, pname, ver, pub, trust_anchors,
+            sig_required_names, use_crls, ledger, max_age):
+                """Check the manifest for version 'ver' of the package named
+                'pname', whose manifests are found in 'pdir', yielding tuples
+                as described in __gen_verify.  'ledger' and 'max_age' are
+                used to build the argument for _verify_payload."""
+
+                path = os.path.join(pdir, ver)
+                # Version must be decoded before use.
+                pver = urllib.unquote(ver)
+                try:
+                        pfmri = fmri.PkgFmri("@".join((pname, pver)),
+                            publisher=self.publisher)
+                        if not os.path.isfile(path):
+                                raise Exception("{0} is not a file".format(
+                                    path))
+                except Exception as e:
+                        # Assume the error is result of an unexpected file in
+                        # the directory. We don't know the FMRI here, so use
+                        # None.
+                        yield None, [(REPO_VERIFY_UNKNOWN, path,
+                            {"err": str(e)})], None
+                        return
+
+                err = self.__verify_manifest(path, pfmri)
+                if err:
+                        # with a bad manifest, we can go no further
+                        yield pfmri, [err], None
+                        return
+
+                hashes, errors = self.__get_hashes(path, pfmri)
+
+                # verify manifest signatures
+                errors.extend(self.__verify_signature(path, pfmri, pub,
+                    trust_anchors, sig_required_names, use_crls))
+
+                # find the payload delivered by this pkg
+                files = []
+                for fname, h, alg in hashes:
+                        try:
+                                path = self.cache_store.lookup(fname,
+                                     check_existence=False)
+                        except apx.PermissionsException as e:
+                                # if we can't even get the path within the
+                                # repository, then we'll do the best we can
+                                # to report the problem.
+                                errors.append((REPO_VERIFY_PERM, pfmri,
+                                    {"hash": fname, "err": _("Permission "
+                                    "denied.", "path", h)}))
+                                continue
+                        files.append((path, h, _hash_alg_names[alg],
+                            ledger.get(path)))
+
+                yield pfmri, errors, files and (pfmri, files, max_age) or None
+
+        def __load_verify_ledger(self):
+                """Return a dictionary mapping the path of each file recorded
+                in the verify ledger to a tuple of the form (hash, size,
+                mtime, inode, mode, uid, verified), where 'mtime' is in
+                microseconds and 'verified' is the time in seconds the file
+                was last verified."""
+
+                ledger = {}
+                try:
+                        with open(os.path.join(self.index_root,
+                            REPO_VERIFY_LEDGER), "rb") as f:
+                                if f.readline().rstrip() != "VERSION 1":
+                                        return ledger
+                                for l in f:
+                                        fields = l.rstrip("\n").split(" ", 7)
+                                        path = fields.pop()
+                                        ledger[path] = (fields[0],) + tuple(
+                                            int(v) for v in fields[1:])
+                                        if len(ledger[path]) != 7:
+                                                raise ValueError(l)
+                except EnvironmentError as e:
+                        if e.errno != errno.ENOENT:
+                                raise apx._convert_error(e)
+                except ValueError:
+                        # A corrupt ledger is discarded; everything will be
+                        # verified.
+                        return {}
+                return ledger
+
+        def __save_verify_ledger(self, ledger):
+                """Replace the verify ledger with the entries in the
+                dictionary 'ledger', as returned by __load_verify_ledger.
+                The ledger is kept with the search index, since, like the
+                index, it is local state that isn't part of the repository's
+                content and isn't copied with it."""
+
+                lpath = os.path.join(self.index_root, REPO_VERIFY_LEDGER)
+                try:
+                        if not os.path.isdir(self.index_root):
+                                os.makedirs(self.index_root, misc.PKG_DIR_MODE)
+                        fd, tmp = tempfile.mkstemp(prefix=REPO_VERIFY_LEDGER,
+                            dir=self.index_root)
+                        with os.fdopen(fd, "wb") as f:
+                                f.write("VERSION 1\n")
+                                for path, entry in sorted(ledger.iteritems()):
+                                        f.write("{0} {1:d} {2:d} {3:d} {4:d} "
+                                            "{5:d} {6:d} {7}\n".format(
+                                            *(entry + (path,))))
+                        os.chmod(tmp, misc.PKG_FILE_MODE)
+                        portable.rename(tmp, lpath)
+                except EnvironmentError as e:
+                        if e.errno in (errno.EACCES, errno.EPERM, errno.EROFS):
+                                # The ledger is only an optimization, so
+                                # verify must still work for repositories
+                                # that can't be written to.
+                                return
+                        raise apx._convert_error(e)
+
         def __gen_verify(self, progtrack, pub, trust_anchors,
-            sig_required_names, use_crls):
+            sig_required_names, use_crls, jobs=1, stats=None, full=False,
+            max_age=REPO_VERIFY_LEDGER_MAX_AGE):
                 """A generator that produces verify errors, each a tuple
-                of the form (error_code, path, message, details)"""
+                of the form (error_code, path, message, details)
+
+                'jobs' is the number of processes used to verify package
+                payloads; if greater than one, payloads are verified by a
+                pool of worker processes.
+
+                'stats' is an optional dictionary to which the number of
+                payload files verified ("files"), their total size in bytes
+                ("bytes"), and the number of files skipped because they are
+                unchanged since they were last verified ("skipped") are added.
+
+                'full' is a boolean indicating whether every file should be
+                verified, ignoring the verify ledger.
+
+                'max_age' is the number of seconds after which a file
+                recorded in the verify ledger must be verified again."""
                 # We may not have a manifest_root directory if no
                 # packages have ever been published for this publisher.
                 if not os.path.exists(self.manifest_root):
                         return
 
-                err = self.__verify_perm(self.manifest_root, None, None)
+                err = _verify_perm(self.manifest_root, None, None)
                 if err:
                         yield self.__build_verify_error(*err)
                         return
@@ -2298,111 +2739,144 @@ class _RepoStore(object):
                             {"permissionspath": path, "pub": pub.prefix})
                 progtrack.repo_verify_end_pkg(None)
 
-                for name in mflist:
-                        pdir = os.path.join(self.manifest_root, name)
-                        err = self.__verify_perm(pdir, None, None)
-                        if err:
-                                yield self.__build_verify_error(*err)
-                                continue
-
-                        # Stem must be decoded before use.
-                        try:
-                                pname = urllib.unquote(name)
-                        except Exception:
-                                # Assume error is result of an
-                                # unexpected file in the directory. We
-                                # don't know the FMRI here, so use None.
-                                progtrack.repo_verify_start_pkg(None)
-                                progtrack.repo_verify_add_progress(None)
-                                yield self.__build_verify_error(
-                                    REPO_VERIFY_UNKNOWN, pdir, {"err": str(e)})
-                                progtrack.repo_verify_end_pkg(None)
-                                continue
+                def gen_pkgs():
+                        """Walk the manifests, yielding a tuple of (pfmri,
+                        errors, payload) for each, where 'errors' are the
+                        errors found by checking the manifest itself and
+                        'payload' is the argument for _verify_payload or
+                        None if there's no payload to verify.  'pfmri' is
+                        False for errors that aren't associated with a
+                        package."""
+
+                        for name in mflist:
+                                pdir = os.path.join(self.manifest_root, name)
+                                err = _verify_perm(pdir, None, None)
+                                if err:
+                                        yield False, [err], None
+                                        continue
 
-                        for ver in os.listdir(pdir):
-                                path = os.path.join(pdir, ver)
-                                # Version must be decoded before
-                                # use.
-                                pver = urllib.unquote(ver)
+                                # Stem must be decoded before use.
                                 try:
-                                        pfmri = fmri.PkgFmri("@".join((pname,
-                                            pver)),
-                                            publisher=self.publisher)
-                                        if not os.path.isfile(path):
-                                                raise Exception(
-                                                    "{0} is not a file".format(
-                                                    path))
+                                        pname = urllib.unquote(name)
                                 except Exception as e:
-                                        # Assume the error is result of an
+                                        # Assume error is result of an
                                         # unexpected file in the directory. We
                                         # don't know the FMRI here, so use None.
-                                        progtrack.repo_verify_start_pkg(None)
-                                        progtrack.repo_verify_add_progress(None)
-                                        yield self.__build_verify_error(
-                                            REPO_VERIFY_UNKNOWN, path,
-                                            {"err": str(e)})
-                                        progtrack.repo_verify_end_pkg(None)
+                                        yield None, [(REPO_VERIFY_UNKNOWN,
+                                            pdir, {"err": str(e)})], None
                                         continue
 
-                                progtrack.repo_verify_start_pkg(pfmri)
-                                err = self.__verify_manifest(path, pfmri)
-                                if err:
-                                        # with a bad manifest, we can go no
-                                        # further
-                                        yield self.__build_verify_error(*err)
-                                        progtrack.repo_verify_end_pkg(None)
-                                        continue
+                                for ver in os.listdir(pdir):
+                                        for item in self.__gen_verify_pkg(pdir,
+                                            pname, ver, pub, trust_anchors,
+                                            sig_required_names, use_crls,
+                                            ledger, max_age):
+                                                yield item
 
-                                hashes, errors = self.__get_hashes(path, pfmri)
-                                for err in errors:
-                                        yield self.__build_verify_error(*err)
-
-                                # verify manifest signatures
-                                errs = self.__verify_signature(path, pfmri, pub,
-                                    trust_anchors, sig_required_names, use_crls)
-                                for err in errs:
-                                        yield self.__build_verify_error(*err)
+                def report(pfmri, errors, result):
+                        """Yield the verify errors for a package in the
+                        order they would be found by a serial verify."""
 
-                                # verify payload delivered by this pkg
-                                errors = []
-                                for fname, h, alg in hashes:
-                                        try:
-                                                path = self.cache_store.lookup(
-                                                     fname,
-                                                     check_existence=False)
-                                        except apx.PermissionsException as e:
-                                                # if we can't even get the path
-                                                # within the repository, then
-                                                # we'll do the best we can to
-                                                # report the problem.
-                                                errors.append((REPO_VERIFY_PERM,
-                                                    pfmri, {"hash": fname,
-                                                    "err": _("Permission "
-                                                    "denied.", "path", h)}))
-                                                continue
-
-                                        err = self.__verify_perm(path, pfmri, h)
-                                        if err:
-                                                errors.append(err)
-                                                continue
-                                        err = self.__verify_hash(path, pfmri, h,
-                                            alg=alg)
-                                        if err:
-                                                errors.append(err)
-                                for err in errors:
+                        if pfmri is not False:
+                                progtrack.repo_verify_start_pkg(pfmri)
+                                if pfmri is None:
+                                        progtrack.repo_verify_add_progress(
+                                            None)
+                        for err in errors:
+                                yield self.__build_verify_error(*err)
+                        if result:
+                                perrors, nfiles, nbytes, nskipped, clean = \
+                                    result
+                                stats["files"] += nfiles
+                                stats["bytes"] += nbytes
+                                stats["skipped"] += nskipped
+                                new_ledger.update(clean)
+                                for err in perrors:
                                         yield self.__build_verify_error(*err)
+                        if pfmri is not False:
+                                progtrack.repo_verify_end_pkg(pfmri)
+
+                if stats is None:
+                        stats = {}
+                stats.setdefault("files", 0)
+                stats.setdefault("bytes", 0)
+                stats.setdefault("skipped", 0)
+
+                # Files in the repository are named by their hash and never
+                # modified, so one found to be valid by a previous verify
+                # needn't be hashed again unless its stat information has
+                # changed.  Only files found to be valid by this verify are
+                # recorded in the new ledger.
+                ledger = {}
+                if not full:
+                        ledger = self.__load_verify_ledger()
+                new_ledger = {}
+
+                if jobs <= 1:
+                        for pfmri, errors, payload in gen_pkgs():
+                                result = None
+                                if payload:
+                                        result = _verify_payload(payload)
+                                for err in report(pfmri, errors, result):
+                                        yield err
+                        self.__save_verify_ledger(new_ledger)
+                        progtrack.job_done(progtrack.JOB_REPO_VERIFY_REPO)
+                        return
 
-                                progtrack.repo_verify_end_pkg(fmri)
+                # The payload of each package is verified by a pool of worker
+                # processes while the manifests of the packages that follow
+                # are checked; results are reported in manifest order so
+                # that output is the same as for a serial verify.  The number
+                # of packages in flight is bounded to limit memory use.
+                pool = multiprocessing.Pool(jobs, _verify_worker_init)
+                pending = collections.deque()
+                try:
+                        for pfmri, errors, payload in gen_pkgs():
+                                result = None
+                                if payload:
+                                        result = pool.apply_async(
+                                            _verify_payload, (payload,))
+                                pending.append((pfmri, errors, result))
+                                while len(pending) > jobs * 4:
+                                        for err in report(*self.__get_result(
+                                            pending.popleft())):
+                                                yield err
+                        while pending:
+                                for err in report(*self.__get_result(
+                                    pending.popleft())):
+                                        yield err
+                        pool.close()
+                except:
+                        pool.terminate()
+                        raise
+                finally:
+                        pool.join()
+                self.__save_verify_ledger(new_ledger)
                 progtrack.job_done(progtrack.JOB_REPO_VERIFY_REPO)
 
         def verify(self, pub=None, progtrack=None,
-            trust_anchor_dir=None, sig_required_names=None, use_crls=False):
+            trust_anchor_dir=None, sig_required_names=None, use_crls=False,
+            jobs=1, stats=None, full=False,
+            max_age=REPO_VERIFY_LEDGER_MAX_AGE):
                 """A generator which verifies the contents of the repository
                 store, checking for several different types of errors.
                 No modifying operations may be performed until complete.
 
                 'progtrack' is an optional ProgressTracker object.
 
+                'jobs' is the number of processes to use to verify the files
+                in the repository.
+
+                'stats' is an optional dictionary which is updated with the
+                number of files ("files") and bytes ("bytes") verified, and
+                the number of files skipped ("skipped").
+
+                'full' is an optional boolean indicating that all files should
+                be verified.  Otherwise, files recorded as valid in the
+                repository store's verify ledger are only verified if they
+                have changed or were last verified more than 'max_age'
+                seconds ago.
+
                 'trust_anchor_dir' is set in the repository configuration and
                 corresponds to the image property of the same name.
 
@@ -2461,7 +2935,9 @@ class _RepoStore(object):
                 self.__lock_rstore()
                 try:
                         for err in self.__gen_verify(progtrack, pub,
-                            trust_anchors, sig_required_names, use_crls):
+                            trust_anchors, sig_required_names, use_crls,
+                            jobs=jobs, stats=stats, full=full,
+                            max_age=max_age):
                                 yield err
                 except (Exception, EnvironmentError) as e:
                         import traceback
@@ -2472,10 +2948,15 @@ class _RepoStore(object):
                         shutil.rmtree(tmp_metaroot)
 
         def fix(self,  pub=None, progtrack=None, verify_callback=None,
-            trust_anchor_dir=None, sig_required_names=None, use_crls=False):
+            trust_anchor_dir=None, sig_required_names=None, use_crls=False,
+            jobs=1, stats=None, full=False,
+            max_age=REPO_VERIFY_LEDGER_MAX_AGE):
                 """Verify, then quarantine any packages in the repository that
                 were found to be faulty, according to self.verify(..).
 
+                'jobs', 'stats', 'full', and 'max_age' are passed to
+                self.verify(..).
+
                 This method yields tuples of the form:
 
                 (status_code, fmri, message, reason) where
@@ -2504,7 +2985,8 @@ class _RepoStore(object):
                 broken_items = set()
                 for error, path, message, reason in self.verify(pub=pub,
                     progtrack=progtrack, trust_anchor_dir=trust_anchor_dir,
-                    sig_required_names=sig_required_names, use_crls=use_crls):
+                    sig_required_names=sig_required_names, use_crls=use_crls,
+                    jobs=jobs, stats=stats, full=full, max_age=max_age):
                         if verify_callback:
                                 verify_callback(progtrack, (error, path,
                                     message, reason))
@@ -2644,7 +3126,7 @@ class Repository(object):
         pkg(5) repository and an interface to manipulate it."""
 
         def __init__(self, allow_invalid=False, cfgpathname=None, create=False,
-            file_root=None, log_obj=None, mirror=False,
+            file_root=None, index_jobs=1, log_obj=None, mirror=False,
             properties=misc.EmptyDict, read_only=False, root=None,
             sort_file_max_size=indexer.SORT_FILE_MAX_SIZE, writable_root=None):
                 """Prepare the repository for use."""
@@ -2657,6 +3139,7 @@ class Repository(object):
 
                 # Setup any root overrides or root defaults first.
                 self.__file_root = file_root
+                self.__index_jobs = index_jobs
                 self.__pub_root = None
                 self.__root = None
                 self.__tmp_root = None
@@ -3007,9 +3490,9 @@ class Repository(object):
 
                 rstore = _RepoStore(allow_invalid=allow_invalid,
                     file_layout=file_layout, file_root=froot,
-                    log_obj=self.log_obj, mirror=self.mirror, pub=pub,
-                    read_only=self.read_only, root=root,
-                    sort_file_max_size=self.__sort_file_max_size,
+                    index_jobs=self.__index_jobs, log_obj=self.log_obj,
+                    mirror=self.mirror, pub=pub, read_only=self.read_only,
+                    root=root, sort_file_max_size=self.__sort_file_max_size,
                     writable_root=writ_root)
                 self.__rstores[pub] = rstore
                 return rstore
@@ -3241,6 +3724,52 @@ class Repository(object):
                 # Not found in any repository store.
                 raise RepositoryFileNotFoundError(fhash)
 
+        def delta(self, old_hash, new_hash, pub=None):
+                """Returns the absolute pathname of a gzip-compressed delta
+                that reconstructs the file specified by the SHA-n hash name
+                'new_hash' from the file specified by 'old_hash'.
+
+                'pub' is the prefix of the publisher the files belong to.  If
+                not specified, every repository store will be tried.
+
+                RepositoryDeltaNotCachedError is raised if the delta has not
+                been generated by make_delta() yet."""
+
+                self.inc_file()
+                if pub:
+                        rstore = self.get_pub_rstore(pub)
+                        return rstore.delta(old_hash, new_hash)
+
+                for rstore in self.rstores:
+                        try:
+                                return rstore.delta(old_hash, new_hash)
+                        except RepositoryFileNotFoundError:
+                                # Ignore and try next repository store.
+                                pass
+
+                raise RepositoryFileNotFoundError(new_hash)
+
+        def make_delta(self, old_hash, new_hash, pub=None):
+                """Generates and caches the delta returned by delta() for the
+                specified files if it hasn't been already.  Generating a delta
+                is expensive, so this should be done in the background.
+
+                'pub' is the prefix of the publisher the files belong to.  If
+                not specified, every repository store will be tried."""
+
+                if pub:
+                        rstore = self.get_pub_rstore(pub)
+                        return rstore.make_delta(old_hash, new_hash)
+
+                for rstore in self.rstores:
+                        try:
+                                return rstore.make_delta(old_hash, new_hash)
+                        except RepositoryFileNotFoundError:
+                                # Ignore and try next repository store.
+                                pass
+
+                raise RepositoryFileNotFoundError(new_hash)
+
         def get_catalog(self, pub=None):
                 """Return the catalog object for the given publisher.
 
@@ -3733,12 +4262,27 @@ class Repository(object):
                 rstore.update_publisher(pub)
 
         def verify(self, pubs=[], allowed_checks=[],
-            force_dep_check=False, ignored_dep_files=[], progtrack=None):
+            force_dep_check=False, ignored_dep_files=[], progtrack=None,
+            jobs=1, stats=None, full=False,
+            max_age=REPO_VERIFY_LEDGER_MAX_AGE):
                 """A generator that verifies that repository content matches
                 expected state for all or specified publishers.
 
                 'progtrack' is an optional ProgressTracker object.
 
+                'jobs' is the number of processes to use to verify the files
+                in the repository.
+
+                'stats' is an optional dictionary which is updated with the
+                number of files ("files") and bytes ("bytes") verified, and
+                the number of files skipped ("skipped").
+
+                'full' is an optional boolean indicating that all files should
+                be verified.  Otherwise, files recorded as valid in each
+                repository store's verify ledger are only verified if they
+                have changed or were last verified more than 'max_age'
+                seconds ago.
+
                 'pubs' is an optional publisher list to limit the
                 operation to.
 
@@ -3778,7 +4322,8 @@ class Repository(object):
                         for verify_tuple in rstore.verify(progtrack=progtrack,
                             pub=pub, trust_anchor_dir=trust_anchor_dir,
                             sig_required_names=sig_required_names,
-                            use_crls=use_crls):
+                            use_crls=use_crls, jobs=jobs, stats=stats,
+                            full=full, max_age=max_age):
                                 yield verify_tuple
 
                 if VERIFY_DEPENDENCY in allowed_checks:
@@ -4139,11 +4684,16 @@ class Repository(object):
                 tracker.job_done(tracker.JOB_REPO_VERIFY_REPO)
 
         def fix(self, pubs=[], force_dep_check=False,
-            ignored_dep_files=[], progtrack=None, verify_callback=None):
+            ignored_dep_files=[], progtrack=None, verify_callback=None,
+            jobs=1, stats=None, full=False,
+            max_age=REPO_VERIFY_LEDGER_MAX_AGE):
                 """A generator that corrects any problems in the repository.
 
                 'progtrack' is an optional ProgressTracker object.
 
+                'jobs', 'stats', 'full', and 'max_age' are as described for
+                verify(..).
+
                 'pubs' is an optional publisher list to limit the
                 operation to.
 
@@ -4189,7 +4739,8 @@ class Repository(object):
                             verify_callback=verify_callback,
                             trust_anchor_dir=trust_anchor_dir,
                             sig_required_names=sig_required_names,
-                            use_crls=use_crls):
+                            use_crls=use_crls, jobs=jobs, stats=stats,
+                            full=full, max_age=max_age):
                                 yield verify_tuple
 
                 for verify_tuple in self.__verify_depend(
@@ -376,6 +376,21 @@ msat_get_added_clauses(msat_solver *self, PyObject *args)
 	return (Py_BuildValue("i", solver_nclauses(self->msat_instance)));
 }
 
+/*ARGSUSED*/
+static PyObject *
+msat_get_stats(msat_solver *self, PyObject *args)
+{
+	stats *st = &self->msat_instance->stats;
+
+	return (Py_BuildValue("{s:K,s:K,s:K,s:K,s:K,s:K}",
+	    "starts", (unsigned PY_LONG_LONG)st->starts,
+	    "decisions", (unsigned PY_LONG_LONG)st->decisions,
+	    "propagations", (unsigned PY_LONG_LONG)st->propagations,
+	    "inspects", (unsigned PY_LONG_LONG)st->inspects,
+	    "conflicts", (unsigned PY_LONG_LONG)st->conflicts,
+	    "learnts", (unsigned PY_LONG_LONG)st->learnts));
+}
+
 static int *
 msat_unpack_integers(PyObject *list, int *nout)
 {
@@ -527,6 +542,9 @@ PyMethodDef msat_methods[] = {
 		METH_VARARGS, NULL},
 	{ "get_added_clauses", (PyCFunction) msat_get_added_clauses,
 		METH_VARARGS, NULL},
+	{ "get_stats", (PyCFunction) msat_get_stats,
+		METH_VARARGS,
+		"Return a dictionary of cumulative search statistics"},
 	{ "add_clause", (PyCFunction) msat_add_clause,
 		METH_VARARGS,
 		"Add another clause (as list of integers) to solution space"},
@@ -21,7 +21,7 @@
 #
 
 #
-# Copyright (c) 2010, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2010, 2026, Oracle and/or its affiliates. All rights reserved.
 #
 
 PKG_CLIENT_NAME = "pkgrepo"
@@ -52,6 +52,7 @@ import shutil
 import sys
 import tempfile
 import textwrap
+import time
 import traceback
 import warnings
 import itertools
@@ -154,9 +155,11 @@ Subcommands:
 
      pkgrepo rebuild [-p publisher ...] -s repo_uri_or_path [--key ssl_key ...
          --cert ssl_cert ...] [--no-catalog] [--no-index]
+         [--jobs n]
 
      pkgrepo refresh [-p publisher ...] -s repo_uri_or_path [--key ssl_key ...
          --cert ssl_cert ...] [--no-catalog] [--no-index]
+         [--jobs n]
 
      pkgrepo remove [-n] [-p publisher ...] -s repo_uri_or_path
          pkg_fmri_pattern ...
@@ -166,9 +169,11 @@ Subcommands:
          section/property[+|-]=([value]) ...
 
      pkgrepo verify [-d] [-p publisher ...] [-i ignored_dep_file ...]
-         [--disable verification ...] -s repo_uri_or_path
+         [--disable verification ...] [--jobs n] [--full]
+         [--max-age days] -s repo_uri_or_path
 
-     pkgrepo fix [-v] [-p publisher ...] -s repo_uri_or_path
+     pkgrepo fix [-v] [-p publisher ...] [--jobs n] [--full]
+         [--max-age days] -s repo_uri_or_path
 
      pkgrepo help
      pkgrepo version
@@ -260,11 +265,15 @@ def subcmd_remove(conf, args):
         return EXIT_OK
 
 
-def get_repo(conf, allow_invalid=False, read_only=True, subcommand=None):
+def get_repo(conf, allow_invalid=False, read_only=True, subcommand=None,
+    index_jobs=1):
         """Return the repository object for current program configuration.
 
         'allow_invalid' specifies whether potentially corrupt repositories are
-        allowed; should only be True if performing a rebuild operation."""
+        allowed; should only be True if performing a rebuild operation.
+
+        'index_jobs' is the number of processes to use when building search
+        indexes."""
 
         repo_uri = conf["repo_uri"]
         if repo_uri.scheme != "file":
@@ -275,8 +284,8 @@ def get_repo(conf, allow_invalid=False, read_only=True, subcommand=None):
         if not path:
                 # Bad URI?
                 raise sr.RepositoryInvalidError(str(repo_uri))
-        return sr.Repository(allow_invalid=allow_invalid, read_only=read_only,
-            root=path)
+        return sr.Repository(allow_invalid=allow_invalid,
+            index_jobs=index_jobs, read_only=read_only, root=path)
 
 
 def setup_transport(conf, subcommand=None, prefix=None, verbose=False,
@@ -1162,13 +1171,14 @@ were found in the repository."""))
         return rval
 
 
-def __rebuild_local(subcommand, conf, pubs, build_catalog, build_index):
+def __rebuild_local(subcommand, conf, pubs, build_catalog, build_index,
+    jobs):
         """In an attempt to allow operations on potentially corrupt
         repositories, 'local' repositories (filesystem-basd ones) are handled
         separately."""
 
         repo = get_repo(conf, allow_invalid=build_catalog, read_only=False,
-            subcommand=subcommand)
+            subcommand=subcommand, index_jobs=jobs)
 
         rpubs = set(repo.publishers)
         if not pubs:
@@ -1225,9 +1235,10 @@ def subcmd_rebuild(conf, args):
         build_index = True
         key = None
         cert = None
+        jobs = 1
 
         opts, pargs = getopt.getopt(args, "p:s:", ["no-catalog", "no-index",
-            "key=", "cert="])
+            "key=", "cert=", "jobs="])
         pubs = set()
         for opt, arg in opts:
                 if opt == "-p":
@@ -1237,6 +1248,8 @@ def subcmd_rebuild(conf, args):
                         pubs.add(arg)
                 elif opt == "-s":
                         conf["repo_uri"] = parse_uri(arg)
+                elif opt == "--jobs":
+                        jobs = __parse_jobs(arg, subcommand)
                 elif opt == "--no-catalog":
                         build_catalog = False
                 elif opt == "--no-index":
@@ -1260,12 +1273,46 @@ def subcmd_rebuild(conf, args):
 
         if conf["repo_uri"].scheme == "file":
                 return __rebuild_local(subcommand, conf, pubs, build_catalog,
-                    build_index)
+                    build_index, jobs)
 
         return __rebuild_remote(subcommand, conf, pubs, key, cert,
             build_catalog, build_index)
 
 
+def __refresh_local(subcommand, conf, pubs, add_content, refresh_index,
+    jobs):
+        """Refresh the catalog and index data of a filesystem-based
+        repository directly so that the number of processes used to index
+        the repository can be specified."""
+
+        repo = get_repo(conf, read_only=False, subcommand=subcommand,
+            index_jobs=jobs)
+
+        rpubs = set(repo.publishers)
+        if not pubs:
+                found = rpubs
+        else:
+                found = rpubs & pubs
+        notfound = pubs - found
+
+        rval = EXIT_OK
+        if found and notfound:
+                rval = EXIT_PARTIAL
+        elif pubs and not found:
+                error(_("no matching publishers found"), cmd=subcommand)
+                return EXIT_OOPS
+
+        logger.info("Initiating repository refresh.")
+        for pfx in found:
+                if add_content:
+                        repo.add_content(pub=pfx,
+                            refresh_index=refresh_index)
+                else:
+                        repo.refresh_index(pub=pfx)
+
+        return rval
+
+
 def subcmd_refresh(conf, args):
         """Refresh the repository's catalog and index data (as permitted)."""
 
@@ -1274,9 +1321,10 @@ def subcmd_refresh(conf, args):
         refresh_index = True
         key = None
         cert = None
+        jobs = 1
 
         opts, pargs = getopt.getopt(args, "p:s:", ["no-catalog", "no-index",
-            "key=", "cert="])
+            "key=", "cert=", "jobs="])
         pubs = set()
         for opt, arg in opts:
                 if opt == "-p":
@@ -1286,6 +1334,8 @@ def subcmd_refresh(conf, args):
                         pubs.add(arg)
                 elif opt == "-s":
                         conf["repo_uri"] = parse_uri(arg)
+                elif opt == "--jobs":
+                        jobs = __parse_jobs(arg, subcommand)
                 elif opt == "--no-catalog":
                         add_content = False
                 elif opt == "--no-index":
@@ -1307,6 +1357,10 @@ def subcmd_refresh(conf, args):
                 usage(_("A package repository location must be provided "
                     "using -s."), cmd=subcommand)
 
+        if conf["repo_uri"].scheme == "file":
+                return __refresh_local(subcommand, conf, pubs, add_content,
+                    refresh_index, jobs)
+
         def do_refresh(xport, xpub):
                 if add_content and refresh_index:
                         xport.publish_refresh(xpub)
@@ -1609,6 +1663,57 @@ def __fmt_verify(verify_tuple):
         return formatted_message, reason["path"]
 
 
+def __parse_jobs(arg, subcommand):
+        """Parse the value of the --jobs option of 'subcommand', returning
+        the number of processes the subcommand should use."""
+
+        try:
+                jobs = int(arg)
+                if jobs < 0:
+                        raise ValueError(arg)
+        except ValueError:
+                usage(_("--jobs expects a non-negative integer value; "
+                    "got '{0}'").format(arg), cmd=subcommand)
+        if jobs == 0:
+                # Use one process per CPU.
+                jobs = misc.get_ncpus()
+        return jobs
+
+
+def __parse_max_age(arg, subcommand):
+        """Parse the value of the --max-age option, returning the number of
+        seconds after which previously verified files are verified again."""
+
+        try:
+                days = float(arg)
+                if days < 0:
+                        raise ValueError(arg)
+        except ValueError:
+                usage(_("--max-age expects a non-negative number of days; "
+                    "got '{0}'").format(arg), cmd=subcommand)
+        return int(days * 24 * 60 * 60)
+
+
+def __fmt_verify_stats(stats, elapsed):
+        """Return a summary of the amount of content verified in 'elapsed'
+        seconds as recorded in the 'stats' dictionary updated by
+        sr.Repository.verify(..)."""
+
+        mbytes = stats.get("bytes", 0) / 1024.0 / 1024.0
+        files = stats.get("files", 0)
+        elapsed = max(elapsed, 0.001)
+        msg = _("Verified {files:d} files ({mbytes:.1f} MB) in "
+            "{elapsed:.1f} seconds: {fps:.1f} files/s, {mbps:.1f} MB/s").format(
+            files=files, mbytes=mbytes, elapsed=elapsed,
+            fps=files / elapsed, mbps=mbytes / elapsed)
+        skipped = stats.get("skipped", 0)
+        if skipped:
+                msg += "\n" + _("Skipped {skipped:d} unchanged files verified "
+                    "previously; use --full to verify them.").format(
+                    skipped=skipped)
+        return msg
+
+
 def __collect_default_ignore_dep_files(ignored_dep_files):
         """Helpler function to collect default ignored-dependency files."""
 
@@ -1630,13 +1735,23 @@ def subcmd_verify(conf, args):
         subcommand = "verify"
         __load_verify_msgs()
 
-        opts, pargs = getopt.getopt(args, "dp:s:i:", ["disable="])
+        opts, pargs = getopt.getopt(args, "dp:s:i:", ["disable=", "jobs=",
+            "full", "max-age="])
         allowed_checks = set(sr.verify_default_checks)
         force_dep_check = False
         ignored_dep_files = []
+        jobs = 1
+        full = False
+        max_age = sr.REPO_VERIFY_LEDGER_MAX_AGE
         pubs = set()
         for opt, arg in opts:
-                if opt == "-s":
+                if opt == "--jobs":
+                        jobs = __parse_jobs(arg, subcommand)
+                elif opt == "--full":
+                        full = True
+                elif opt == "--max-age":
+                        max_age = __parse_max_age(arg, subcommand)
+                elif opt == "-s":
                         conf["repo_uri"] = parse_uri(arg)
                 elif opt == "-p":
                         if not misc.valid_pub_prefix(arg):
@@ -1704,11 +1819,17 @@ def subcmd_verify(conf, args):
                 xpub.transport = xport
                 found_pubs.append(xpub)
 
+        stats = {}
+        start = time.time()
         for verify_tuple in repo.verify(pubs=found_pubs,
             allowed_checks=allowed_checks, force_dep_check=force_dep_check,
-            ignored_dep_files=ignored_dep_files, progtrack=progtrack):
+            ignored_dep_files=ignored_dep_files, progtrack=progtrack,
+            jobs=jobs, stats=stats, full=full, max_age=max_age):
                 report_error(verify_tuple)
 
+        progtrack.flush()
+        logger.info(__fmt_verify_stats(stats, time.time() - start))
+
         if bad_fmris:
                 return EXIT_OOPS
         return EXIT_OK
@@ -1727,9 +1848,19 @@ def subcmd_fix(conf, args):
         force_dep_check = False
         ignored_dep_files = []
 
-        opts, pargs = getopt.getopt(args, "vp:s:")
+        opts, pargs = getopt.getopt(args, "vp:s:", ["jobs=", "full",
+            "max-age="])
+        jobs = 1
+        full = False
+        max_age = sr.REPO_VERIFY_LEDGER_MAX_AGE
         pubs = set()
         for opt, arg in opts:
+                if opt == "--jobs":
+                        jobs = __parse_jobs(arg, subcommand)
+                if opt == "--full":
+                        full = True
+                if opt == "--max-age":
+                        max_age = __parse_max_age(arg, subcommand)
                 if opt == "-s":
                         conf["repo_uri"] = parse_uri(arg)
                 if opt == "-v":
@@ -1784,11 +1915,14 @@ def subcmd_fix(conf, args):
                 xpub.transport = xport
                 found_pubs.append(xpub)
 
+        stats = {}
+        start = time.time()
         for status_code, path, message, reason in \
             repo.fix(pubs=found_pubs, force_dep_check=force_dep_check,
                 ignored_dep_files=ignored_dep_files,
                 progtrack=progtrack,
-                verify_callback=verify_cb):
+                verify_callback=verify_cb, jobs=jobs, stats=stats, full=full,
+                max_age=max_age):
                 if status_code == sr.REPO_FIX_ITEM:
                         # When we can't get the FMRI, eg. in the case
                         # of a corrupt manifest, use the path instead.
@@ -1806,6 +1940,8 @@ def subcmd_fix(conf, args):
 
         progtrack.flush()
         logger.info("")
+        if verbose:
+                logger.info(__fmt_verify_stats(stats, time.time() - start))
 
         if broken_fmris:
                 logger.info(_("Use pkgsend(1) or pkgrecv(1) to republish the\n"
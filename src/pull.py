@@ -21,10 +21,11 @@
 #
 
 #
-# Copyright (c) 2008, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2008, 2026, Oracle and/or its affiliates. All rights reserved.
 #
 
 import calendar
+import collections
 import errno
 import getopt
 import gettext
@@ -33,6 +34,7 @@ import os
 import shutil
 import sys
 import tempfile
+import threading
 import traceback
 import urllib
 import warnings
@@ -48,6 +50,7 @@ import pkg.client.transport.transport as transport
 import pkg.misc as misc
 import pkg.p5p
 import pkg.pkgsubprocess as subprocess
+import pkg.portable as portable
 import pkg.publish.transaction as trans
 import pkg.server.repository as sr
 import pkg.version as version
@@ -68,6 +71,8 @@ xport_cfg = None
 dest_xport = None
 targ_pub = None
 target = None
+fetch_jobs = 1
+publish_jobs = 1
 
 def error(text):
         """Emit an error message prefixed by the command name """
@@ -97,10 +102,11 @@ Usage:
         pkgrecv [-aknrv] [-s src_uri] [-d (path|dest_uri)] [-c cache_dir]
             [-m match] [--raw] [--key src_key --cert src_cert]
             [--dkey dest_key --dcert dest_cert]
+            [--fetch-jobs n] [--publish-jobs n]
             (fmri|pattern) ...
         pkgrecv [-s src_repo_uri] --newest
         pkgrecv [-nv] [-s src_repo_uri] [-d path] [-p publisher ...]
-            [--key src_key --cert src_cert] --clone
+            [--key src_key --cert src_cert] [--fetch-jobs n] --clone
 
 Options:
         -a              Store the retrieved package data in a pkg(5) archive
@@ -180,6 +186,16 @@ Options:
         --dcert dest_cert Specify a client SSL certificate file to use for pkg
                           publication.
 
+        --fetch-jobs n  The number of packages whose content is retrieved
+                        at the same time.  Content shared by any of the
+                        packages is only retrieved once.  The default is 1.
+
+        --publish-jobs n
+                        The number of packages republished at the same time.
+                        Packages are republished as soon as their content
+                        has been retrieved.  Ignored when not republishing.
+                        The default is 1.
+
 Environment:
         PKG_DEST        Destination directory or URI
         PKG_SRC         Source URI or path"""))
@@ -321,6 +337,314 @@ def add_hashes_to_multi(mfst, multi):
                 if a.has_payload:
                         multi.add_action(a)
 
+def get_hashes(mfst):
+        """Returns the set of names under which the payloads of the manifest
+        'mfst' are stored in the cache."""
+
+        hashes = set()
+        for a in mfst.gen_actions():
+                if not a.has_payload:
+                        continue
+                # Content is always cached by the least-preferred hash.
+                hashes.add(a.hash)
+                if a.name == "signature":
+                        hashes.update(a.get_chain_certs(least_preferred=True))
+        return hashes
+
+def gen_batches(items, size):
+        """Yield lists of up to 'size' consecutive elements of the list
+        'items'."""
+
+        for i in range(0, len(items), size):
+                yield items[i:i + size]
+
+def prefetch_content(src_pub, fmri_list, tracker):
+        """Retrieve the content of all of the packages in 'fmri_list' to the
+        cache using a single multi-file request, so that the files of
+        different packages are transferred in parallel and content shared by
+        the packages is only transferred once."""
+
+        mfile = xport.multi_file_ni(src_pub, None, progtrack=tracker)
+        for f in fmri_list:
+                add_hashes_to_multi(get_manifest(f, xport_cfg), mfile)
+        if mfile:
+                mfile.wait_files()
+
+def fetch_pkgs(src_pub, fmri_list, keep_compressed, republish, tracker):
+        """Retrieve the content of each package in 'fmri_list', 'fetch_jobs'
+        packages at a time.  If 'republish' is True, yield a tuple of (fmri,
+        manifest, package name, package directory) for each package as soon
+        as its content has been retrieved, so that it can be republished
+        while the content of the packages that follow it is retrieved."""
+
+        global download_start
+
+        # Content is retrieved to the cache once for the whole run and copied
+        # from there for each package that needs it.  If cache_dir is listed
+        # in tmpdirs, then it's safe to dump cache contents; to conserve
+        # space, each file is dumped once the content of the last package
+        # needing it has been retrieved.  Otherwise, it's a user cache
+        # directory and shouldn't be dumped.
+        refs = None
+        if republish and cache_dir in tmpdirs:
+                cache = xport_cfg.get_caches(readonly=False)[0]
+                refs = collections.Counter()
+                for f in fmri_list:
+                        refs.update(get_hashes(get_manifest(f, xport_cfg)))
+
+        for batch in gen_batches(fmri_list, fetch_jobs):
+                fetch_tracker = tracker
+                if len(batch) > 1:
+                        # Retrieve the content of the whole batch to the cache
+                        # first; it is then copied from there for each
+                        # package.  The tracker must be started before any
+                        # progress is reported.
+                        tracker.republish_start_pkg(batch[0])
+                        download_start = True
+                        prefetch_content(src_pub, batch, tracker)
+                        fetch_tracker = None
+
+                for f in batch:
+                        tracker.republish_start_pkg(f)
+                        pkgdir = xport_cfg.get_pkg_dir(f)
+                        mfile = xport.multi_file_ni(src_pub, pkgdir,
+                            not keep_compressed, fetch_tracker)
+                        m = get_manifest(f, xport_cfg)
+                        add_hashes_to_multi(m, mfile)
+
+                        if mfile:
+                                download_start = True
+                                mfile.wait_files()
+
+                        if refs is not None:
+                                for h in get_hashes(m):
+                                        refs[h] -= 1
+                                        if refs[h]:
+                                                continue
+                                        cpath = cache.lookup(h)
+                                        if not cpath:
+                                                continue
+                                        try:
+                                                portable.remove(cpath)
+                                        except EnvironmentError as e:
+                                                raise apx._convert_error(e)
+
+                        if not republish:
+                                # Nothing more to do for this package.
+                                tracker.republish_end_pkg(f)
+                                continue
+
+                        yield f, m, get_republish_name(f), pkgdir
+
+def get_republish_name(pfmri):
+        """Returns the name of the package 'pfmri' to use for republication,
+        which only includes the scheme if the original manifest did."""
+
+        # Get first line of original manifest so that inclusion of the scheme
+        # can be determined.
+        use_scheme = True
+        contents = get_manifest(pfmri, xport_cfg, contents=True)
+        if contents.splitlines()[0].find("pkg:/") == -1:
+                use_scheme = False
+        return pfmri.get_fmri(include_scheme=use_scheme)
+
+def republish_pkg(pfmri, m, pkg_name, pkgdir, target, pxport, tpub, tracker):
+        """Republish the package 'pfmri' with manifest 'm' as 'pkg_name' to
+        'target' using the transport 'pxport' and the target publisher 'tpub'.
+        The content of the package must already have been retrieved to
+        'pkgdir'."""
+
+        # This is needed so any previous failures for a package can be
+        # aborted.
+        open_time = pfmri.get_timestamp()
+        trans_id = "{0:d}_{1}".format(
+            calendar.timegm(open_time.utctimetuple()),
+            urllib.quote(str(pfmri), ""))
+
+        t = trans.Transaction(target, pkg_name=pkg_name, trans_id=trans_id,
+            xport=pxport, pub=tpub, progtrack=tracker)
+
+        # Remove any previous failed attempt to republish this package.
+        try:
+                t.close(abandon=True)
+        except:
+                # It might not exist already.
+                pass
+
+        t.open()
+        for a in m.gen_actions():
+                if a.name == "set" and \
+                    a.attrs.get("name", "") in ("fmri", "pkg.fmri"):
+                        # To be consistent with the server, the fmri can't be
+                        # added to the manifest.
+                        continue
+
+                if hasattr(a, "hash"):
+                        fname = os.path.join(pkgdir, a.hash)
+                        a.data = lambda: open(fname, "rb")
+                t.add(a)
+                if a.name == "signature":
+                        # We always store content in the repository by the
+                        # least-preferred hash.
+                        for fp in a.get_chain_certs(least_preferred=True):
+                                fname = os.path.join(pkgdir, fp)
+                                t.add_file(fname)
+        # Always defer catalog update.
+        t.close(add_to_catalog=False)
+
+class PublishPool(object):
+        """Republishes packages using a pool of threads.  Each thread uses a
+        transport of its own, since transports may only be used by one thread
+        at a time."""
+
+        def __init__(self, target, prefix, dkey, dcert):
+                self.__target = target
+                self.__prefix = prefix
+                self.__dkey = dkey
+                self.__dcert = dcert
+                self.__lock = threading.Lock()
+                self.__idle = []
+
+        def __get_transport(self):
+                """Return a tuple of (transport, target publisher, incoming
+                directory) not in use by any other thread."""
+
+                with self.__lock:
+                        if self.__idle:
+                                return self.__idle.pop()
+
+                incoming_dir = tempfile.mkdtemp(dir=temp_root,
+                    prefix=global_settings.client_name + "-")
+                tmpdirs.append(incoming_dir)
+
+                pxport, pxport_cfg = transport.setup_transport()
+                pxport_cfg.add_cache(cache_dir, readonly=False)
+                pxport_cfg.incoming_root = incoming_dir
+                pxport_cfg.pkg_root = xport_cfg.pkg_root
+                tpub = transport.setup_publisher(self.__target, self.__prefix,
+                    pxport, pxport_cfg, remote_prefix=True,
+                    ssl_key=self.__dkey, ssl_cert=self.__dcert)
+                return pxport, tpub, incoming_dir
+
+        def __publish(self, item):
+                pfmri, m, pkg_name, pkgdir = item
+                ctx = self.__get_transport()
+                try:
+                        pxport, tpub, incoming_dir = ctx
+                        republish_pkg(pfmri, m, pkg_name, pkgdir,
+                            self.__target, pxport, tpub, None)
+
+                        # Dump data retrieved so far after each successful
+                        # republish to conserve space.
+                        try:
+                                shutil.rmtree(incoming_dir)
+                                shutil.rmtree(pkgdir)
+                        except EnvironmentError as e:
+                                raise apx._convert_error(e)
+                        misc.makedirs(incoming_dir)
+                finally:
+                        with self.__lock:
+                                self.__idle.append(ctx)
+
+        def publish(self, items):
+                """Republish each of the packages described by 'items', an
+                iterable of (fmri, manifest, package name, package directory)
+                tuples, and yield each such tuple once the package has been
+                republished, in order of completion.  Items are taken from
+                'items' while earlier packages are being republished."""
+
+                return misc.threaded_imap(self.__publish, items,
+                    publish_jobs)
+
+class CloneJournal(object):
+        """A log of the packages for which a clone operation has completed
+        each step, kept beside the publisher's packages in the target
+        repository so that an interrupted clone can resume where it stopped.
+
+        Each line of the journal records one completed step:
+
+            manifest <fmri>     the package's manifest has been stored in
+                                the target repository
+
+            files <fmri>        all of the package's files have been stored
+                                in the target repository
+
+        A partially written last line is ignored."""
+
+        NAME = "clone.journal"
+
+        def __init__(self, root):
+                self.path = os.path.join(root, self.NAME)
+                self.manifests = set()
+                self.files = set()
+                self.__fh = None
+                # The length of the complete lines in the journal.
+                self.__end = 0
+                self.__torn = False
+
+                try:
+                        with open(self.path, "rb") as fh:
+                                for line in fh:
+                                        if not line.endswith("\n"):
+                                                self.__torn = True
+                                                break
+                                        self.__end += len(line)
+                                        step, pfmri = line.rstrip(
+                                            "\n").partition(" ")[::2]
+                                        if step == "manifest":
+                                                self.manifests.add(pfmri)
+                                        elif step == "files":
+                                                self.files.add(pfmri)
+                except EnvironmentError as e:
+                        if e.errno != errno.ENOENT:
+                                raise apx._convert_error(e)
+
+        def record(self, step, pfmri):
+                """Record that 'step' has been completed for 'pfmri'.  The
+                record survives the process being interrupted, but is only
+                durable across a system failure once sync() is called."""
+
+                try:
+                        if not self.__fh:
+                                if self.__torn:
+                                        with open(self.path, "r+b") as fh:
+                                                fh.truncate(self.__end)
+                                        self.__torn = False
+                                self.__fh = open(self.path, "ab")
+                        self.__fh.write("{0} {1}\n".format(step, pfmri))
+                        self.__fh.flush()
+                except EnvironmentError as e:
+                        raise apx._convert_error(e)
+
+                if step == "manifest":
+                        self.manifests.add(str(pfmri))
+                elif step == "files":
+                        self.files.add(str(pfmri))
+
+        def sync(self):
+                """Write everything recorded so far to stable storage."""
+
+                if self.__fh:
+                        try:
+                                os.fsync(self.__fh.fileno())
+                        except EnvironmentError as e:
+                                raise apx._convert_error(e)
+
+        def close(self):
+                if self.__fh:
+                        self.__fh.close()
+                        self.__fh = None
+
+        def remove(self):
+                """Discard the journal once the clone has completed."""
+
+                self.close()
+                try:
+                        os.unlink(self.path)
+                except EnvironmentError as e:
+                        if e.errno != errno.ENOENT:
+                                raise apx._convert_error(e)
+
 def prune(fmri_list, all_versions, all_timestamps):
         """Returns a filtered version of fmri_list based on the provided
         parameters."""
@@ -376,7 +700,7 @@ def fetch_catalog(src_pub, tracker, txport, target_catalog,
 
 def main_func():
         global archive, cache_dir, download_start, xport, xport_cfg, \
-            dest_xport, temp_root, targ_pub, target
+            dest_xport, temp_root, targ_pub, target, fetch_jobs, publish_jobs
 
         all_timestamps = True
         all_versions = False
@@ -408,7 +732,7 @@ def main_func():
         try:
                 opts, pargs = getopt.getopt(sys.argv[1:], "ac:D:d:hkm:np:rs:v",
                     ["cert=", "key=", "dcert=", "dkey=", "newest", "raw",
-                    "debug=", "clone"])
+                    "debug=", "clone", "fetch-jobs=", "publish-jobs="])
         except getopt.GetoptError as e:
                 usage(_("Illegal option -- {0}").format(e.opt))
 
@@ -472,6 +796,19 @@ def main_func():
                         dkey = arg
                 elif opt == "--dcert":
                         dcert = arg
+                elif opt in ("--fetch-jobs", "--publish-jobs"):
+                        try:
+                                jobs = int(arg)
+                                if jobs < 1:
+                                        raise ValueError(arg)
+                        except ValueError:
+                                usage(_("{opt} takes a positive integer "
+                                    "argument, not {arg}").format(opt=opt,
+                                    arg=arg))
+                        if opt == "--fetch-jobs":
+                                fetch_jobs = jobs
+                        else:
+                                publish_jobs = jobs
 
         if not list_newest and not target:
                 usage(_("a destination must be provided"))
@@ -785,6 +1122,7 @@ def clone_repo(pargs, target, list_newest, all_versions, all_timestamps,
         deleted_pkgs = False
         old_c_root = {}
         del_search_index = set()
+        journals = {}
 
         # Turn target into a valid URI.
         target = publisher.RepositoryURI(misc.parse_uri(target))
@@ -820,6 +1158,18 @@ def clone_repo(pargs, target, list_newest, all_versions, all_timestamps,
                             e))
                 return old_c_root
 
+        def get_target_manifest(pfmri):
+                """Returns the manifest for 'pfmri' stored in the target
+                repository, or None if it isn't there or isn't valid."""
+
+                try:
+                        m = manifest.Manifest(pfmri)
+                        m.set_content(pathname=repo.get_pub_rstore(
+                            pfmri.publisher).manifest(pfmri))
+                except (EnvironmentError, apx.InvalidPackageErrors):
+                        return None
+                return m
+
         # Check if all publishers in src are also in target. If not, add
         # depending on what publishers were specified by user.
         pubs_to_sync = []
@@ -928,6 +1278,18 @@ def clone_repo(pargs, target, list_newest, all_versions, all_timestamps,
                 del targ_fmris
                 del to_add_set
 
+                # Packages whose manifests and files were stored by a previous,
+                # interrupted clone operation are listed in the journal.
+                try:
+                        journal = CloneJournal(repo.get_pub_rstore(
+                            src_pub.prefix).root)
+                except sr.RepositoryUnknownPublisher:
+                        # The publisher is only added to the target by a
+                        # real clone, so there is nothing to resume.
+                        journal = CloneJournal(src_basedir)
+                if not dry_run:
+                        journals[src_pub.prefix] = journal
+
                 # We have to do package removal first because after the sync we
                 # don't have the old catalog anymore and if we delete packages
                 # after the sync based on the current catalog we might delete
@@ -958,15 +1320,25 @@ def clone_repo(pargs, target, list_newest, all_versions, all_timestamps,
 
                 get_bytes = 0
                 get_files = 0
+                to_fetch = []
 
                 msg(_("Retrieving and evaluating {0:d} package(s)...").format(
                     len(to_add)))
+                resumed = sum(1 for f, i in to_add
+                    if str(f) in journal.manifests)
+                if resumed:
+                        msg(_("Resuming an interrupted clone; {0:d} "
+                            "package(s) were already retrieved.").format(
+                            resumed))
 
                 # Retrieve manifests.
                 # Try prefetching manifests in bulk first for faster, parallel
                 # transport. Retryable errors during prefetch are ignored and
                 # manifests are retrieved again during the "Reading" phase.
-                src_pub.transport.prefetch_manifests(to_add, progtrack=tracker)
+                src_pub.transport.prefetch_manifests([
+                    (f, i) for f, i in to_add
+                    if str(f) not in journal.manifests
+                ], progtrack=tracker)
 
                 # Need to change the output of mfst_fetch since otherwise we
                 # would see "Download Manifests x/y" twice, once from the
@@ -976,16 +1348,28 @@ def clone_repo(pargs, target, list_newest, all_versions, all_timestamps,
                     _("Reading Manifests"))
                 tracker.manifest_fetch_start(len(to_add))
                 for f, i in to_add:
-                        try:
-                                m = get_manifest(f, xport_cfg)
-                        except apx.InvalidPackageErrors as e:
-                                invalid_manifests.extend(e.errors)
+                        m = None
+                        if str(f) in journal.manifests:
+                                m = get_target_manifest(f)
+                        stored = m is not None
+                        if stored and str(f) in journal.files:
+                                # Nothing left to retrieve.
+                                total_processed += 1
+                                tracker.manifest_fetch_progress(completion=True)
                                 continue
+
+                        if not stored:
+                                try:
+                                        m = get_manifest(f, xport_cfg)
+                                except apx.InvalidPackageErrors as e:
+                                        invalid_manifests.extend(e.errors)
+                                        continue
                         getb, getf, sendb, sendcb = get_sizes(m)
                         get_bytes += getb
                         get_files += getf
+                        to_fetch.append(f)
 
-                        if dry_run:
+                        if dry_run or stored:
                                 tracker.manifest_fetch_progress(completion=True)
                                 continue
 
@@ -1003,8 +1387,10 @@ def clone_repo(pargs, target, list_newest, all_versions, all_timestamps,
                                 txt = _("Unable to copy manifest: {0}").format(e)
                                 abort(err=txt)
 
+                        journal.record("manifest", f)
                         tracker.manifest_fetch_progress(completion=True)
 
+                journal.sync()
                 tracker.manifest_fetch_done()
                 # Restore old GoalTrackerItem for manifest download.
                 tracker.mfst_fetch = old_gti
@@ -1037,21 +1423,28 @@ def clone_repo(pargs, target, list_newest, all_versions, all_timestamps,
                 if dry_run:
                         continue
 
-                tracker.download_set_goal(len(to_add), get_files, get_bytes)
+                tracker.download_set_goal(len(to_fetch), get_files, get_bytes)
 
-                # Retrieve package files.
-                for f, i in to_add:
-                        tracker.download_start_pkg(f)
+                # Retrieve package files; the files of each batch of packages
+                # are retrieved together.  Files already in the target
+                # repository are found in the cache and not retrieved again.
+                for batch in gen_batches(to_fetch, fetch_jobs):
                         mfile = xport.multi_file_ni(src_pub, None,
                             progtrack=tracker)
-                        m = get_manifest(f, xport_cfg)
-                        add_hashes_to_multi(m, mfile)
+                        for f in batch:
+                                tracker.download_start_pkg(f)
+                                m = get_target_manifest(f) or \
+                                    get_manifest(f, xport_cfg)
+                                add_hashes_to_multi(m, mfile)
 
                         if mfile:
                                 mfile.wait_files()
 
-                        tracker.download_end_pkg(f)
-                        total_processed += 1
+                        for f in batch:
+                                journal.record("files", f)
+                                tracker.download_end_pkg(f)
+                                total_processed += 1
+                        journal.sync()
 
                 tracker.download_done
                 tracker.reset()
@@ -1095,6 +1488,14 @@ def clone_repo(pargs, target, list_newest, all_versions, all_timestamps,
                         # restore/delete as much as we can.
                         continue
 
+        # The journals are no longer needed once the clone has completed;
+        # otherwise, they allow it to be resumed.
+        for journal in journals.values():
+                if ret:
+                        journal.close()
+                else:
+                        journal.remove()
+
         if ret:
                 txt = _("Pkgrepo verify found errors in the updated repository."
                     "\nThe original package catalog has been restored.\n")
@@ -1222,12 +1623,6 @@ def transfer_pkgs(pargs, target, list_newest, all_versions, all_timestamps,
                         # No matches at all; nothing to do for this publisher.
                         continue
 
-                def get_basename(pfmri):
-                        open_time = pfmri.get_timestamp()
-                        return "{0:d}_{1}".format(
-                            calendar.timegm(open_time.utctimetuple()),
-                            urllib.quote(str(pfmri), ""))
-
                 # First, retrieve the manifests and calculate package transfer
                 # sizes.
                 npkgs = len(matches)
@@ -1267,8 +1662,11 @@ def transfer_pkgs(pargs, target, list_newest, all_versions, all_timestamps,
                 tracker.manifest_fetch_done()
 
                 # Next, retrieve and store the content for each package.
+                # The transfer rate is only shown for parallel transfers so
+                # that the output of the default, serial, case is unchanged.
                 tracker.republish_set_goal(len(pkgs_to_get), get_bytes,
-                    send_bytes)
+                    send_bytes, showspeed=(fetch_jobs > 1 or
+                    publish_jobs > 1))
 
                 if verbose:
                         if not dry_run:
@@ -1303,104 +1701,49 @@ def transfer_pkgs(pargs, target, list_newest, all_versions, all_timestamps,
 
                 processed = 0
                 pkgs_to_get = sorted(pkgs_to_get)
-                for f in pkgs_to_get:
-                        tracker.republish_start_pkg(f)
-                        pkgdir = xport_cfg.get_pkg_dir(f)
-                        mfile = xport.multi_file_ni(src_pub, pkgdir,
-                            not keep_compressed, tracker)
-                        m = get_manifest(f, xport_cfg)
-                        add_hashes_to_multi(m, mfile)
-
-                        if mfile:
-                                download_start = True
-                                mfile.wait_files()
-
-                        if not republish:
-                                # Nothing more to do for this package.
-                                tracker.republish_end_pkg(f)
-                                continue
-
-                        # Get first line of original manifest so that inclusion
-                        # of the scheme can be determined.
-                        use_scheme = True
-                        contents = get_manifest(f, xport_cfg, contents=True)
-                        if contents.splitlines()[0].find("pkg:/") == -1:
-                                use_scheme = False
-
-                        pkg_name = f.get_fmri(include_scheme=use_scheme)
-                        pkgdir = xport_cfg.get_pkg_dir(f)
-
-                        # This is needed so any previous failures for a package
-                        # can be aborted.
-                        trans_id = get_basename(f)
-
-                        if not targ_pub:
-                                targ_pub = transport.setup_publisher(target,
-                                    src_pub.prefix, dest_xport, dest_xport_cfg,
-                                    remote_prefix=True, ssl_key=dkey,
-                                    ssl_cert=dcert)
-
+                if republish and not targ_pub:
+                        targ_pub = transport.setup_publisher(target,
+                            src_pub.prefix, dest_xport, dest_xport_cfg,
+                            remote_prefix=True, ssl_key=dkey, ssl_cert=dcert)
+
+                # Nothing is yielded if the packages aren't being republished.
+                fetched = fetch_pkgs(src_pub, pkgs_to_get, keep_compressed,
+                    republish, tracker)
+                if republish and publish_jobs > 1:
+                        # Packages are republished by the pool as soon as
+                        # their content has been retrieved, while the content
+                        # of the packages that follow is retrieved.
+                        pool = PublishPool(target, src_pub.prefix, dkey, dcert)
                         try:
-                                t = trans.Transaction(target, pkg_name=pkg_name,
-                                    trans_id=trans_id, xport=dest_xport,
-                                    pub=targ_pub, progtrack=tracker)
-
-                                # Remove any previous failed attempt to
-                                # to republish this package.
-                                try:
-                                        t.close(abandon=True)
-                                except:
-                                        # It might not exist already.
-                                        pass
-
-                                t.open()
-                                for a in m.gen_actions():
-                                        if a.name == "set" and \
-                                            a.attrs.get("name", "") in ("fmri",
-                                            "pkg.fmri"):
-                                                # To be consistent with the
-                                                # server, the fmri can't be
-                                                # added to the manifest.
-                                                continue
-
-                                        if hasattr(a, "hash"):
-                                                fname = os.path.join(pkgdir,
-                                                    a.hash)
-                                                a.data = lambda: open(fname,
-                                                    "rb")
-                                        t.add(a)
-                                        if a.name == "signature":
-                                                # We always store content in the
-                                                # repository by the least-
-                                                # preferred hash.
-                                                for fp in a.get_chain_certs(
-                                                    least_preferred=True):
-                                                        fname = os.path.join(
-                                                            pkgdir, fp)
-                                                        t.add_file(fname)
-                                # Always defer catalog update.
-                                t.close(add_to_catalog=False)
+                                for f, m, pkg_name, pkgdir in \
+                                    pool.publish(fetched):
+                                        tracker.upload_add_progress(
+                                            get_sizes(m)[2])
+                                        processed += 1
+                                        tracker.republish_end_pkg(f)
                         except trans.TransactionError as e:
                                 abort(err=e)
+                else:
+                        for f, m, pkg_name, pkgdir in fetched:
+                                try:
+                                        republish_pkg(f, m, pkg_name, pkgdir,
+                                            target, dest_xport, targ_pub,
+                                            tracker)
+                                except trans.TransactionError as e:
+                                        abort(err=e)
 
-                        # Dump data retrieved so far after each successful
-                        # republish to conserve space.
-                        try:
-                                shutil.rmtree(dest_xport_cfg.incoming_root)
-                                shutil.rmtree(pkgdir)
-                                if cache_dir in tmpdirs:
-                                        # If cache_dir is listed in tmpdirs,
-                                        # then it's safe to dump cache contents.
-                                        # Otherwise, it's a user cache directory
-                                        # and shouldn't be dumped.
-                                        shutil.rmtree(cache_dir)
-                                        misc.makedirs(cache_dir)
-                        except EnvironmentError as e:
-                                raise apx._convert_error(e)
-                        misc.makedirs(dest_xport_cfg.incoming_root)
-
-                        processed += 1
-                        tracker.republish_end_pkg(f)
+                                # Dump data retrieved so far after each
+                                # successful republish to conserve space.
+                                try:
+                                        shutil.rmtree(
+                                            dest_xport_cfg.incoming_root)
+                                        shutil.rmtree(pkgdir)
+                                except EnvironmentError as e:
+                                        raise apx._convert_error(e)
+                                misc.makedirs(dest_xport_cfg.incoming_root)
+
+                                processed += 1
+                                tracker.republish_end_pkg(f)
 
                 tracker.republish_done()
                 tracker.reset()
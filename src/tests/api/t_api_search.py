@@ -20,7 +20,7 @@
 # CDDL HEADER END
 #
 
-# Copyright (c) 2009, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2009, 2026, Oracle and/or its affiliates. All rights reserved.
 
 import testutils
 if __name__ == "__main__":
@@ -484,17 +484,17 @@ close
         ])
 
         fast_add_after_install = set([
-            "VERSION: 2\n",
+            "VERSION: 3\n",
             "pkg22@1.0,5.11",
             "pkg21@1.0,5.11"
         ])
 
         fast_remove_after_install = set([
-            "VERSION: 2\n",
+            "VERSION: 3\n",
         ])
 
         fast_add_after_first_update = set([
-            "VERSION: 2\n",
+            "VERSION: 3\n",
             "pkg0@2.0,5.11",
             "pkg22@1.0,5.11",
             "pkg21@1.0,5.11",
@@ -502,7 +502,7 @@ close
         ])
 
         fast_remove_after_first_update = set([
-            "VERSION: 2\n",
+            "VERSION: 3\n",
             "pkg0@1.0,5.11",
             "pkg1@1.0,5.11"
         ])
@@ -517,9 +517,9 @@ close
             ('pkg:/example_pkg@1.0-0', 'path',
             'dir group=bin mode=0755 owner=root path=bin/example_dir')])
 
-        fast_add_after_second_update = set(["VERSION: 2\n"])
+        fast_add_after_second_update = set(["VERSION: 4\n"])
 
-        fast_remove_after_second_update = set(["VERSION: 2\n"])
+        fast_remove_after_second_update = set(["VERSION: 4\n"])
 
         debug_features = []
 
@@ -2536,6 +2536,62 @@ class TestApiSearchBasics_nonP(TestApiSearchBasics):
                         self._search_op(api_obj, remote=False,
                             token="pkg{0}".format(n), test_value=tv)
 
+        def test_incremental_merge(self):
+                """Test that changes to more than
+                indexer.MAX_FAST_INDEXED_PKGS packages are merged into the
+                existing index instead of causing it to be rebuilt, and that
+                the ids of removed packages are reused."""
+
+                durl = self.dc.get_depot_url()
+                count = indexer.MAX_FAST_INDEXED_PKGS + 5
+                pkg_list = []
+                for i in range(0, count):
+                        self.pkgsend_bulk(durl,
+                            "open pkg{0}@1.0,5.11-0\nclose\n".format(i))
+                        pkg_list.append("pkg{0}".format(i))
+                api_obj = self.image_create(durl)
+                api_obj.rebuild_search_index()
+
+                index_dir = self._get_index_dirs()[0]
+                main_loc = os.path.join(index_dir, "main_dict.ascii.v2")
+                manf_loc = os.path.join(index_dir, "manf_list.v1")
+                fast_add_loc = os.path.join(index_dir, "fast_add.v1")
+                fast_remove_loc = os.path.join(index_dir, "fast_remove.v1")
+                test_value = 'pkg:/pkg{0}@1.0-0', 'test/pkg{0}', \
+                    'set name=pkg.fmri value=pkg://test/pkg{0}@1.0,5.11-0:'
+
+                def check(version, installed):
+                        self.assertEqual(self._get_lines(main_loc)[0],
+                            "VERSION: {0:d}\n".format(version))
+                        self.assertEqual(self._get_lines(fast_add_loc),
+                            ["VERSION: {0:d}\n".format(version)])
+                        self.assertEqual(self._get_lines(fast_remove_loc),
+                            ["VERSION: {0:d}\n".format(version)])
+                        for n in range(0, count):
+                                tv = set()
+                                if n in installed:
+                                        tv.add(tuple(v.format(n)
+                                            for v in test_value))
+                                self._search_op(api_obj, remote=False,
+                                    token="pkg{0}".format(n), test_value=tv)
+
+                # Each change is merged into the index built by the rebuild,
+                # so the index version increases by one for each.
+                self._api_install(api_obj, pkg_list)
+                check(3, range(0, count))
+
+                removed = pkg_list[:indexer.MAX_FAST_INDEXED_PKGS + 2]
+                self._api_uninstall(api_obj, removed)
+                check(4, range(len(removed), count))
+                self.assertEqual(len([
+                    l for l in self._get_lines(manf_loc) if l == "\n"
+                ]), len(removed))
+
+                self._api_install(api_obj, removed)
+                check(5, range(0, count))
+                self.assertEqual(len(self._get_lines(manf_loc)), count + 1)
+                self.assert_("\n" not in self._get_lines(manf_loc))
+
         def test_bug_13485(self):
                 """Test that indexer.Indexer's check_for_updates function works
                 as excepted. This needs to be a separate test because other
@@ -21,7 +21,7 @@
 # CDDL HEADER END
 #
 
-# Copyright (c) 2008, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2008, 2026, Oracle and/or its affiliates. All rights reserved.
 
 from __future__ import print_function
 import testutils
@@ -1115,6 +1115,153 @@ class TestCatalog(pkg5unittest.Pkg5TestCase):
                         self.assertFalse(fname.startswith("catalog.") or \
                             fname.startswith("update."))
 
+        def test_11_compact(self):
+                """Verify that catalogs with compact indices return the same
+                data as those without, and that stale indices are ignored."""
+
+                def get_data(cat):
+                        part = cat.get_part("catalog.base.C", must_exist=True)
+                        return (
+                            list(cat.fmris(ordered=True)),
+                            list(cat.tuple_entries()),
+                            cat.names(),
+                            [
+                                (f, part.get_entry(f))
+                                for f in cat.fmris()
+                            ],
+                            [
+                                (v, list(entries))
+                                for name in sorted(cat.names())
+                                for v, entries in cat.entries_by_version(name)
+                            ],
+                        )
+
+                cpath = self.create_test_dir("test-11")
+                nc = catalog.Catalog(meta_root=cpath, compact=True)
+                nc.append(self.c)
+                nc.finalize()
+                nc.save()
+
+                idx = os.path.join(cpath, "catalog.base.C.idx")
+                self.assertTrue(os.path.exists(idx))
+
+                expected = get_data(catalog.Catalog(meta_root=cpath))
+                self.assertEqual(get_data(catalog.Catalog(meta_root=cpath,
+                    compact=True)), expected)
+
+                # Verify that a compact catalog can be modified and that the
+                # index is updated when it's saved.
+                nc = catalog.Catalog(meta_root=cpath, compact=True)
+                f = fmri.PkgFmri("pkg://opensolaris.org/"
+                    "test@1.0,5.11-1:20000101T120000Z")
+                nc.remove_package(f)
+                nc.save()
+                expected = get_data(catalog.Catalog(meta_root=cpath))
+                self.assertTrue(f not in expected[0])
+                self.assertEqual(get_data(catalog.Catalog(meta_root=cpath,
+                    compact=True)), expected)
+
+                # Verify that an index that's out of date with respect to the
+                # JSON data is ignored.
+                nc = catalog.Catalog(meta_root=cpath)
+                nc.add_package(f)
+                nc.save()
+                expected = get_data(catalog.Catalog(meta_root=cpath))
+                self.assertTrue(f in expected[0])
+                self.assertEqual(get_data(catalog.Catalog(meta_root=cpath,
+                    compact=True)), expected)
+
+                # Verify that destroy removes the indices.
+                nc = catalog.Catalog(meta_root=cpath, compact=True)
+                nc.destroy()
+                self.assertFalse(os.path.exists(idx))
+
+        def test_12_stream(self):
+                """Verify that catalog parts and update logs that are read
+                incrementally produce the same results as those that are
+                loaded, and that their signatures are validated the same
+                way."""
+
+                cpath = self.create_test_dir("test-12")
+                nc = catalog.Catalog(meta_root=cpath, log_updates=True)
+                for f in self.c.fmris():
+                        nc.add_package(f, manifest=self.__gen_manifest(f))
+                nc.save()
+
+                def get_entries(entries):
+                        return sorted(entries, key=lambda e: str(e[0]))
+
+                # Verify that streamed entries match the loaded ones.
+                for name in ("catalog.base.C", "catalog.dependency.C",
+                    "catalog.summary.C"):
+                        part = catalog.CatalogPart(name, meta_root=cpath)
+                        streamed = get_entries(part.stream_entries())
+                        self.assertFalse(part.loaded)
+                        self.assertEqual(streamed,
+                            get_entries(part.entries()))
+                        self.assertEqual(
+                            get_entries(part.stream_entries(pubs=["extra"])),
+                            get_entries(part.entries(pubs=["extra"])))
+
+                # Verify that an appended catalog matches its source.
+                ac = catalog.Catalog()
+                ac.append(catalog.Catalog(meta_root=cpath))
+                ac.finalize()
+                self.assertEqual(list(ac.entries(info_needed=[ac.DEPENDENCY,
+                    ac.SUMMARY])), list(nc.entries(info_needed=[nc.DEPENDENCY,
+                    nc.SUMMARY])))
+
+                # Verify that a streamed update log matches the loaded one.
+                uname = [
+                    name for name in os.listdir(cpath)
+                    if name.startswith("update.")
+                ][0]
+                ulog = catalog.CatalogUpdate(uname, meta_root=cpath)
+                streamed = get_entries(ulog.updates())
+                self.assertFalse(ulog.loaded)
+                self.assertTrue(len(streamed) > 0)
+                ulog.load()
+                self.assertEqual(streamed, get_entries(ulog.updates()))
+
+                # Verify that signatures are validated without loading parts.
+                nc = catalog.Catalog(meta_root=cpath)
+                nc.validate(require_signatures=True)
+                part = nc.get_part("catalog.base.C", must_exist=True)
+                self.assertFalse(part.loaded)
+
+                # Verify that a modified part fails validation.
+                bpath = os.path.join(cpath, "catalog.base.C")
+                with open(bpath, "rb") as f:
+                        data = f.read()
+                with open(bpath, "wb") as f:
+                        f.write(data.replace("5.11-1", "5.11-2", 1))
+                nc = catalog.Catalog(meta_root=cpath)
+                self.assertRaises(api_errors.BadCatalogSignatures,
+                    nc.validate)
+
+                # Verify that a part that isn't stored in sorted order is
+                # still validated correctly.
+                struct = simplejson.loads(data)
+                sigs = struct.pop("_SIGNATURE")
+                with open(bpath, "wb") as f:
+                        f.write("{")
+                        f.write(",".join(
+                            "{0}:{1}".format(simplejson.dumps(k),
+                                simplejson.dumps(struct[k]))
+                            for k in sorted(struct, reverse=True)
+                        ))
+                        f.write(",\"_SIGNATURE\":{0}}}\n".format(
+                            simplejson.dumps(sigs)))
+                nc = catalog.Catalog(meta_root=cpath)
+                nc.validate(require_signatures=True)
+
+                # Verify that a corrupt part is rejected when streamed.
+                with open(bpath, "wb") as f:
+                        f.write(data[:len(data) // 2])
+                part = catalog.CatalogPart("catalog.base.C", meta_root=cpath)
+                self.assertRaises(api_errors.InvalidCatalogFile, list,
+                    part.stream_entries())
+
 
 class TestEmptyCatalog(pkg5unittest.Pkg5TestCase):
         """Basic functionality tests for empty catalogs."""
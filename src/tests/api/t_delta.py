@@ -0,0 +1,139 @@
+#!/usr/bin/python2.7
+#
+# CDDL HEADER START
+#
+# The contents of this file are subject to the terms of the
+# Common Development and Distribution License (the "License").
+# You may not use this file except in compliance with the License.
+#
+# You can obtain a copy of the license at usr/src/OPENSOLARIS.LICENSE
+# or http://www.opensolaris.org/os/licensing.
+# See the License for the specific language governing permissions
+# and limitations under the License.
+#
+# When distributing Covered Code, include this CDDL HEADER in each
+# file and include the License file at usr/src/OPENSOLARIS.LICENSE.
+# If applicable, add the following below this CDDL HEADER, with the
+# fields enclosed by brackets "[]" replaced with your own identifying
+# information: Portions Copyright [yyyy] [name of copyright owner]
+#
+# CDDL HEADER END
+#
+
+
+#
+# Copyright (c) 2026, Oracle and/or its affiliates. All rights reserved.
+#
+
+import testutils
+if __name__ == "__main__":
+        testutils.setup_environment("../../../proto")
+import pkg5unittest
+
+import cStringIO
+import random
+import unittest
+
+import pkg.delta as delta
+
+
+class TestDelta(pkg5unittest.Pkg5TestCase):
+
+        def __data(self, size, seed):
+                rand = random.Random(seed)
+                return "".join(chr(rand.getrandbits(8)) for i in xrange(size))
+
+        def __roundtrip(self, old, new):
+                out = cStringIO.StringIO()
+                copied, literal = delta.make_delta(cStringIO.StringIO(old),
+                    cStringIO.StringIO(new), out)
+                self.assertEqual(copied + literal, len(new))
+
+                result = cStringIO.StringIO()
+                size = delta.apply_delta(cStringIO.StringIO(out.getvalue()),
+                    cStringIO.StringIO(old), result)
+                self.assertEqual(size, len(new))
+                self.assertEqual(result.getvalue(), new)
+                return out.getvalue(), copied, literal
+
+        def test_chunks(self):
+                """Verify that chunking covers the whole file, and that chunk
+                boundaries depend only on content."""
+
+                data = self.__data(300 * 1024, 1)
+                chunks = list(delta.chunks(cStringIO.StringIO(data),
+                    bufsz=4096))
+                self.assertEqual("".join(c for o, c in chunks), data)
+                self.assert_(len(chunks) > 1)
+                for (o1, c1), (o2, c2) in zip(chunks, chunks[1:]):
+                        self.assertEqual(o1 + len(c1), o2)
+
+                # Prepending data shouldn't change the boundaries of the
+                # chunks that follow the first few.
+                shifted = list(delta.chunks(cStringIO.StringIO(
+                    "prefix" + data)))
+                self.assert_(set(c for o, c in chunks[2:]) <=
+                    set(c for o, c in shifted))
+
+        def test_delta(self):
+                """Verify that deltas reproduce the new file and only include
+                the data that changed."""
+
+                old = self.__data(512 * 1024, 2)
+
+                # Identical files.
+                d, copied, literal = self.__roundtrip(old, old)
+                self.assertEqual(literal, 0)
+                self.assert_(len(d) < 1024)
+
+                # A small insertion and removal.
+                new = old[:1000] + "inserted" + old[1000:200000] + \
+                    old[210000:]
+                d, copied, literal = self.__roundtrip(old, new)
+                self.assert_(literal < len(new) / 4)
+                self.assert_(len(d) < len(new) / 4)
+
+                # Unrelated and empty files.
+                self.__roundtrip(old, self.__data(100 * 1024, 3))
+                self.__roundtrip("", old)
+                self.__roundtrip(old, "")
+
+        def test_max_size(self):
+                """Verify that generation stops for files larger than the
+                maximum size."""
+
+                old = self.__data(64 * 1024, 5)
+                for o, n in ((old, old[:1024]), (old[:1024], old)):
+                        self.assertRaises(delta.FileTooLargeError,
+                            delta.make_delta, cStringIO.StringIO(o),
+                            cStringIO.StringIO(n), cStringIO.StringIO(),
+                            max_size=32 * 1024)
+
+                # Files at the limit are accepted.
+                out = cStringIO.StringIO()
+                delta.make_delta(cStringIO.StringIO(old),
+                    cStringIO.StringIO(old), out, max_size=len(old))
+
+        def test_bad_delta(self):
+                """Verify that malformed deltas are rejected."""
+
+                old = self.__data(64 * 1024, 4)
+                new = old + "appended"
+                out = cStringIO.StringIO()
+                delta.make_delta(cStringIO.StringIO(old),
+                    cStringIO.StringIO(new), out)
+                d = out.getvalue()
+
+                for bad in ("", "NOTADELTA", d[:-1], d[:8] + "X" + d[9:]):
+                        self.assertRaises(delta.DeltaError, delta.apply_delta,
+                            cStringIO.StringIO(bad), cStringIO.StringIO(old),
+                            cStringIO.StringIO())
+
+                # Copying beyond the end of the original file.
+                self.assertRaises(delta.DeltaError, delta.apply_delta,
+                    cStringIO.StringIO(d), cStringIO.StringIO(old[:1024]),
+                    cStringIO.StringIO())
+
+
+if __name__ == "__main__":
+        unittest.main()
@@ -0,0 +1,173 @@
+#!/usr/bin/python2.7
+#
+# CDDL HEADER START
+#
+# The contents of this file are subject to the terms of the
+# Common Development and Distribution License (the "License").
+# You may not use this file except in compliance with the License.
+#
+# You can obtain a copy of the license at usr/src/OPENSOLARIS.LICENSE
+# or http://www.opensolaris.org/os/licensing.
+# See the License for the specific language governing permissions
+# and limitations under the License.
+#
+# When distributing Covered Code, include this CDDL HEADER in each
+# file and include the License file at usr/src/OPENSOLARIS.LICENSE.
+# If applicable, add the following below this CDDL HEADER, with the
+# fields enclosed by brackets "[]" replaced with your own identifying
+# information: Portions Copyright [yyyy] [name of copyright owner]
+#
+# CDDL HEADER END
+#
+
+
+#
+# Copyright (c) 2026, Oracle and/or its affiliates. All rights reserved.
+#
+
+import testutils
+if __name__ == "__main__":
+        testutils.setup_environment("../../../proto")
+import pkg5unittest
+
+import cStringIO
+import os
+import unittest
+
+import pkg.client.fastlookup as fastlookup
+
+
+class TestFastLookup(pkg5unittest.Pkg5TestCase):
+
+        added = [
+            ("file", "usr/bin/ls", "pkg://test/ls@1.0", "file path=usr/bin/ls"),
+            ("dir", "usr", "pkg://test/ls@1.0", "dir path=usr"),
+            ("dir", "usr", "pkg://test/cat@1.0", "dir path=usr"),
+            ("link", "usr/bin/dir", "pkg://test/cat@1.0",
+                "link path=usr/bin/dir"),
+        ]
+
+        def __write(self, entries, timestamp):
+                path = os.path.join(self.test_root, "actions.offsets")
+                fh = open(path, "wb")
+                fastlookup.write_offsets(fh, timestamp, "state", entries)
+                fh.close()
+                return fastlookup.ActionOffsets(path)
+
+        def __lines(self, stripped, offsets, key):
+                offset, cnt = offsets[key]
+                return stripped[offset:].splitlines()[:cnt]
+
+        def test_offsets(self):
+                """Verify that offsets written by write_offsets can be looked
+                up and iterated."""
+
+                out = cStringIO.StringIO()
+                entries, changed = fastlookup.merge_stripped("", {}, out, 1234,
+                    set(), self.added)
+                stripped = out.getvalue()
+                self.assert_(stripped.startswith("{0}\n1234\n".format(
+                    fastlookup.STRIPPED_VERSION)))
+
+                offsets = self.__write(entries, 1234)
+                self.assertEqual(offsets.timestamp, "1234")
+                self.assertEqual(offsets.state, "state")
+                self.assertEqual(changed, set([("dir", "usr"),
+                    ("file", "usr/bin/ls"), ("link", "usr/bin/dir")]))
+                self.assertEqual(len(offsets), 3)
+                self.assertEqual([k for k, v in offsets.iteritems()],
+                    [("dir", "usr"), ("file", "usr/bin/ls"),
+                    ("link", "usr/bin/dir")])
+                self.assertEqual(offsets.get(("dir", "var")), None)
+                self.assertRaises(KeyError, offsets.__getitem__,
+                    ("file", "usr"))
+                self.assert_(("link", "usr/bin/dir") in offsets)
+                self.assertEqual(self.__lines(stripped, offsets,
+                    ("dir", "usr")), ["pkg://test/ls@1.0 dir path=usr",
+                    "pkg://test/cat@1.0 dir path=usr"])
+                offsets.close()
+
+        def test_merge(self):
+                """Verify that merge_stripped drops the actions of removed
+                packages and adds new ones."""
+
+                out = cStringIO.StringIO()
+                entries, changed = fastlookup.merge_stripped("", {}, out, 1,
+                    set(), self.added)
+                stripped = out.getvalue()
+                offsets = self.__write(entries, 1)
+
+                out = cStringIO.StringIO()
+                entries, changed = fastlookup.merge_stripped(stripped,
+                    offsets, out, 2, set(["pkg://test/ls@1.0"]), [
+                    ("file", "usr/bin/ls", "pkg://test/ls@2.0",
+                        "file path=usr/bin/ls"),
+                    ("dir", "var", "pkg://test/ls@2.0", "dir path=var")])
+                offsets.close()
+                stripped = out.getvalue()
+                offsets = self.__write(entries, 2)
+
+                self.assertEqual(len(offsets), 4)
+                self.assertEqual(changed, set([("dir", "usr"),
+                    ("file", "usr/bin/ls"), ("dir", "var")]))
+                self.assertEqual(self.__lines(stripped, offsets,
+                    ("dir", "usr")), ["pkg://test/cat@1.0 dir path=usr"])
+                self.assertEqual(self.__lines(stripped, offsets,
+                    ("file", "usr/bin/ls")),
+                    ["pkg://test/ls@2.0 file path=usr/bin/ls"])
+                self.assertEqual(self.__lines(stripped, offsets,
+                    ("dir", "var")), ["pkg://test/ls@2.0 dir path=var"])
+                offsets.close()
+
+        def test_bad_version(self):
+                """Verify that a text offsets file from an older client is
+                rejected."""
+
+                path = os.path.join(self.test_root, "actions.offsets")
+                with open(path, "wb") as fh:
+                        fh.write("VERSION 2\n1\ndir 22 1 usr\n")
+                self.assertRaises(ValueError, fastlookup.ActionOffsets, path)
+
+        def test_bytype(self):
+                """Verify that the sections written by write_bytype can be
+                read back, and that a truncated file is rejected."""
+
+                path = os.path.join(self.test_root, "actions.bytype")
+                with open(path, "wb") as fh:
+                        fastlookup.write_bytype(fh, "state", {
+                            "dir": [("pkg://test/ls@1.0,5.11", "dir path=usr"),
+                                ("pkg://test/cat@1.0,5.11", "dir path=usr")],
+                            "link": [("pkg://test/cat@1.0,5.11",
+                                "link path=usr/bin/dir target=ls")],
+                            fastlookup.IMPLICIT_DIRS: [
+                                ("pkg://test/ls@1.0,5.11",
+                                "dir implicit=true path=\"usr/a b\"")],
+                        })
+
+                bytype = fastlookup.ActionsByType(path)
+                self.assertEqual(bytype.state, "state")
+                self.assertEqual(list(bytype.gen_lines("file")), [])
+                self.assertEqual(list(bytype.gen_lines("link")),
+                    [("pkg://test/cat@1.0,5.11",
+                    "link path=usr/bin/dir target=ls")])
+                self.assertEqual(
+                    [(a.attrs["path"], str(f)) for a, f in
+                        bytype.gen_actions("dir", implicit_dirs=True)],
+                    [("usr", "pkg://test/ls@1.0,5.11"),
+                    ("usr", "pkg://test/cat@1.0,5.11"),
+                    ("usr/a b", "pkg://test/ls@1.0,5.11")])
+                self.assertEqual(
+                    [str(f) for a, f in bytype.gen_actions("dir",
+                        pkgs=set(["pkg://test/cat@1.0,5.11"]))],
+                    ["pkg://test/cat@1.0,5.11"])
+                bytype.close()
+
+                with open(path, "rb") as fh:
+                        data = fh.read()
+                with open(path, "wb") as fh:
+                        fh.write(data[:-10])
+                self.assertRaises(ValueError, fastlookup.ActionsByType, path)
+
+
+if __name__ == "__main__":
+        unittest.main()
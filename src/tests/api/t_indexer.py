@@ -30,6 +30,9 @@ import pkg5unittest
 import unittest
 import pkg.indexer as indexer
 import pkg.search_errors as se
+import pkg.search_storage as ss
+
+from pkg.choose import choose
 
 import os
 import sys
@@ -108,5 +111,68 @@ class TestIndexer(pkg5unittest.Pkg5TestCase):
                         self.assert_(len(open(os.path.join(ind._tmp_dir,
                             file)).readlines()) <= 1)
 
+        def test_trigram_index(self):
+                """Verify that the trigram index finds every token which
+                matches a wildcard pattern."""
+
+                toks = sorted(["libssl.so.1.0.0", "libSSL", "openssl",
+                    "ssl", "usr/lib/libcrypto.so", "crypto", "LIBSSL.so",
+                    "sslx", "ab"])
+                tri = ss.IndexStoreTrigrams(ss.TRIGRAM_FILE)
+                offsets = {}
+                for i, t in enumerate(toks):
+                        offsets[i * 100] = t
+                        tri.add_token(t, i * 100)
+                tri.write_dict_file(self.test_root, 3)
+
+                # The index isn't used for other versions of the index.
+                tri = ss.IndexStoreTrigrams(ss.TRIGRAM_FILE)
+                self.assertFalse(tri.open_version(self.test_root, 4))
+                self.assertTrue(tri.open_version(self.test_root, 3))
+
+                for pat in ("*libssl*", "*ssl", "libssl*", "*ssl*", "*SSL*",
+                    "lib?sl*", "*crypto*", "*[cC]rypto*", "ssl", "*zzz*"):
+                        for cs in (True, False):
+                                found = tri.get_offsets(pat)
+                                self.assertTrue(found is not None)
+                                found = [offsets[o] for o in found]
+                                self.assertEqual(
+                                    sorted(choose(toks, pat, cs)),
+                                    sorted(choose(found, pat, cs)))
+
+                # Patterns without three literal characters in a row can't
+                # be narrowed down using the index.
+                for pat in ("a*", "*ab*", "a?b*", "[ab]*"):
+                        self.assertEqual(tri.get_offsets(pat), None)
+                tri.close_file_handle()
+
+                self.assertEqual(ss.pattern_trigrams("*ab[cd]efg?hij*"),
+                    set(["efg", "hij"]))
+
+        def test_mapped_dict(self):
+                """Verify that a memory mapped token dictionary finds the same
+                entries as the dictionary which wrote it."""
+
+                toks = sorted(["a", "a b", "a%20b", "ab", "b", "bin",
+                    "lib/libc.so.1", "z z"])
+                out = ss.IndexStoreDictMutable(ss.BYTE_OFFSET_FILE)
+                out.open_out_file(self.test_root, 2)
+                for i, t in enumerate(toks):
+                        out.write_entity(t, i * 10)
+                out.close_file_handle()
+
+                d = ss.IndexStoreDictMapped(ss.BYTE_OFFSET_FILE)
+                self.assertEqual(d.open(self.test_root), 2)
+                d.read_dict_file()
+                d.close_file_handle()
+
+                self.assertEqual(list(d.get_keys()), toks)
+                for i, t in enumerate(toks):
+                        self.assertTrue(d.has_entity(t))
+                        self.assertEqual(d.get_id(t), i * 10)
+                for t in ("", "a c", "c", "zz"):
+                        self.assertFalse(d.has_entity(t))
+                        self.assertRaises(KeyError, d.get_id, t)
+
 if __name__ == "__main__":
         unittest.main()
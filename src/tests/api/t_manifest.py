@@ -21,7 +21,7 @@
 # CDDL HEADER END
 #
 
-# Copyright (c) 2008, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2008, 2026, Oracle and/or its affiliates. All rights reserved.
 
 import unittest
 import tempfile
@@ -414,6 +414,68 @@ dir owner=root path="opt/dir with whitespaces	in value" group=bin mode=0755 vari
                 m1.exclude_content([v.allow_action, lambda x, publisher: True])
                 self.assertEqual(len(list(m1.gen_actions_by_type("dir"))), 1)
 
+        def test_cache_line_breaks(self):
+                """Verify that action values containing a carriage return
+                don't cause the packed cache to be discarded."""
+
+                # Pass the manifest as a list of actions since a string would
+                # be split on the carriage return.
+                contents = [actions.fromstr(s) for s in (
+                    "set name=pkg.fmri value=pkg:/bar@1",
+                    "set name=pkg.description value=\"one\rtwo\"",
+                    "dir path=one group=sys owner=root")]
+                m1 = manifest.FactoredManifest("bar@1", self.cache_dir,
+                    contents=contents)
+                cfile_path = os.path.join(self.cache_dir, "manifest.cache")
+                self.assert_(os.path.isfile(cfile_path))
+                expected = sorted(str(a) for a in m1.gen_actions_by_type("set"))
+
+                # Load the actions from the cache and verify it was kept.
+                m1 = manifest.FactoredManifest("bar@1", self.cache_dir)
+                self.assertEqualDiff(expected,
+                    sorted(str(a) for a in m1.gen_actions_by_type("set")))
+                self.assert_(not m1.loaded)
+                self.assert_(os.path.isfile(cfile_path))
+
+        def test_cache_malformed_header(self):
+                """Verify that a packed cache with a malformed or truncated
+                header or section is discarded and regenerated."""
+
+                m1 = manifest.FactoredManifest("foo-content@1.0",
+                    self.cache_dir, pathname=self.foo_content_p5m)
+                cfile_path = os.path.join(self.cache_dir, "manifest.cache")
+                self.assert_(os.path.isfile(cfile_path))
+                expected = sorted(str(a) for a in m1.gen_actions_by_type("dir"))
+                with open(cfile_path, "rb") as f:
+                        cache = f.read()
+                header = cache[:cache.index("\n\n") + 2]
+                magic, index = header.split("\n", 1)
+
+                for bad in (
+                    # Wrong magic.
+                    "pkg5-manifest-cache 0\n" + cache[len(magic) + 1:],
+                    # Empty file.
+                    "",
+                    # Header truncated before the blank line.
+                    header[:header.index("\n", len(header) // 2) + 1],
+                    # Header truncated in the middle of an index line.
+                    header[:-8],
+                    # Malformed index line.
+                    magic + "\n" + index.replace(" ", "", 1) +
+                    cache[len(header):],
+                    # Section data truncated.
+                    cache[:len(header) + 1]):
+                        with open(cfile_path, "wb") as f:
+                                f.write(bad)
+                        m1 = manifest.FactoredManifest("foo-content@1.0",
+                            self.cache_dir, pathname=self.foo_content_p5m)
+                        # Verify the cache was regenerated.
+                        with open(cfile_path, "rb") as f:
+                                self.assertEqualDiff(cache, f.read())
+                        self.assertEqualDiff(expected,
+                            sorted(str(a) for a in
+                            m1.gen_actions_by_type("dir")))
+
         def test_store_to_disk(self):
                 """Verfies that a FactoredManifest gets force-loaded before it
                 gets stored to disk."""
@@ -462,22 +524,26 @@ dir owner=root path="opt/dir with whitespaces	in value" group=bin mode=0755 vari
                 do_get_dirs()
 
                 # Now repeat experiment using "cached" FactoredManifest.
-                cfile_path = os.path.join(self.cache_dir, "manifest.dircache")
+                cfile_path = os.path.join(self.cache_dir, "manifest.cache")
                 self.assert_(os.path.isfile(cfile_path))
                 m1 = manifest.FactoredManifest("foo-content@1.0", self.cache_dir,
                     pathname=self.foo_content_p5m)
 
                 do_get_dirs()
 
-                # Now rewrite the dircache so that it contains actions with
-                # paths that are not properly quoted to simulate older, broken
-                # behaviour and verify that the cache will be removed and that
-                # get_directories() still works as expected.
+                # Now replace the cache with an old-style dircache that
+                # contains actions with paths that are not properly quoted to
+                # simulate older, broken behaviour and verify that the cache
+                # will be removed and that get_directories() still works as
+                # expected.
                 m1 = manifest.FactoredManifest("foo-content@1.0", self.cache_dir,
                     pathname=self.foo_content_p5m)
+                dacts = list(m1.gen_actions_by_type("dir"))
+                portable.remove(cfile_path)
 
-                with open(cfile_path, "wb") as f:
-                        for a in m1.gen_actions_by_type("dir"):
+                dfile_path = os.path.join(self.cache_dir, "manifest.dircache")
+                with open(dfile_path, "wb") as f:
+                        for a in dacts:
                                 f.write(
                                     "dir path={0} {1}\n".format(a.attrs["path"],
                                         " ".join(
@@ -488,10 +554,13 @@ dir owner=root path="opt/dir with whitespaces	in value" group=bin mode=0755 vari
                                 ))
 
                 # Repeat tests again.
+                m1 = manifest.FactoredManifest("foo-content@1.0", self.cache_dir,
+                    pathname=self.foo_content_p5m)
                 do_get_dirs()
 
                 # Verify cache file was removed (presumably because we
                 # detected it was malformed).
+                self.assert_(not os.path.exists(dfile_path))
                 self.assert_(not os.path.exists(cfile_path))
 
                 # Repeat tests again, verifying cache file is recreated.
@@ -510,7 +579,7 @@ dir owner=root path="opt/dir with whitespaces	in value" group=bin mode=0755 vari
                     pathname=self.foo_content_p5m)
 
                 # Verify cache was created.
-                cfile_path = os.path.join(cache_dir, "manifest.dircache")
+                cfile_path = os.path.join(cache_dir, "manifest.cache")
                 self.assert_(os.path.isfile(cfile_path))
 
                 # Create random file in cache_dir.
@@ -197,5 +197,25 @@ except MemoryError:
                 self.assertTrue(res > mem_cap - mem_tol,
                     "process mem consumption too low")
 
+        def test_threaded_imap(self):
+                """Verify that misc.threaded_imap calls the function for every
+                item and propagates the first failure to the caller."""
+
+                seen = []
+                items = range(100)
+                done = list(misc.threaded_imap(seen.append, items, 4,
+                    window=7))
+                self.assertEqualDiff(sorted(done), items)
+                self.assertEqualDiff(sorted(seen), items)
+
+                def fail(item):
+                        if item == 10:
+                                raise ValueError(item)
+
+                def consume():
+                        for i in misc.threaded_imap(fail, items, 4):
+                                pass
+                self.assertRaises(ValueError, consume)
+
 if __name__ == "__main__":
         unittest.main()
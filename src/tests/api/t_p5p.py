@@ -21,7 +21,7 @@
 #
 
 #
-# Copyright (c) 2011, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2011, 2026, Oracle and/or its affiliates. All rights reserved.
 #
 
 import testutils
@@ -45,6 +45,7 @@ import shutil
 import sys
 import tarfile as tf
 import tempfile
+import threading
 
 
 class TestP5P(pkg5unittest.SingleDepotTestCase):
@@ -1014,5 +1015,110 @@ class TestP5P(pkg5unittest.SingleDepotTestCase):
                 arc.close()
                 os.unlink(arc_path)
 
+        def test_07_parallel_extract(self):
+                """Verify that package files can be extracted and retrieved
+                from an archive by several threads at once."""
+
+                repo = self.get_repo(self.dc.get_repodir())
+                arc_path = os.path.join(self.test_root, "parallel.p5p")
+                arc = pkg.p5p.Archive(arc_path, mode="w")
+                arc.add_repo_package(self.foo, repo)
+                arc.add_repo_package(self.signed, repo)
+                arc.add_repo_package(self.quux, repo)
+                arc.close()
+
+                hashes = set()
+                for rstore in repo.rstores:
+                        if rstore.publisher != "test":
+                                continue
+                        for dirpath, dirnames, filenames in os.walk(
+                            rstore.file_root):
+                                hashes.update(filenames)
+                self.assertTrue(len(hashes) > 1)
+
+                def verify(ext_dir):
+                        self.assertEqualDiff(sorted(hashes),
+                            sorted(os.listdir(ext_dir)))
+                        for h in hashes:
+                                fpath = os.path.join(ext_dir, h)
+                                self.assertEqual(os.path.getsize(fpath),
+                                    os.path.getsize(repo.file(h, pub="test")))
+
+                arc = pkg.p5p.Archive(arc_path, mode="r")
+                ext_dir = os.path.join(self.test_root, "parallel")
+                arc.extract_package_files(hashes, ext_dir, pub="test",
+                    nworkers=4)
+                verify(ext_dir)
+
+                # Existing read-only files are replaced.
+                for h in hashes:
+                        os.chmod(os.path.join(ext_dir, h),
+                            pkg.misc.PKG_RO_FILE_MODE)
+                arc.extract_package_files(hashes, ext_dir, nworkers=4)
+                verify(ext_dir)
+
+                self.assertRaisesStringify(pkg.p5p.UnknownArchiveFiles,
+                    arc.extract_package_files, list(hashes) + ["a"], ext_dir,
+                    pub="test", nworkers=4)
+
+                # Descriptors used to read the archive are reused by later
+                # extractions instead of accumulating.
+                if os.path.isdir("/proc/self/fd"):
+                        nfds = len(os.listdir("/proc/self/fd"))
+                        for i in range(5):
+                                arc.extract_package_files(hashes, ext_dir,
+                                    nworkers=4)
+                        self.assertTrue(
+                            len(os.listdir("/proc/self/fd")) <= nfds + 4)
+
+                # Read all of the files at once, each from several threads.
+                contents = {}
+                failures = []
+                def read(h):
+                        try:
+                                fobj = arc.get_package_file(h, pub="test")
+                                data = []
+                                while True:
+                                        buf = fobj.read(1024)
+                                        if not buf:
+                                                break
+                                        data.append(buf)
+                                fobj.close()
+                                contents.setdefault(h, set()).add(
+                                    "".join(data))
+                        except Exception as e:
+                                failures.append(e)
+
+                threads = [
+                    threading.Thread(target=read, args=(h,))
+                    for h in hashes
+                    for i in range(3)
+                ]
+                for t in threads:
+                        t.start()
+                for t in threads:
+                        t.join()
+                self.assertEqual(failures, [])
+                for h in hashes:
+                        with open(os.path.join(ext_dir, h), "rb") as f:
+                                self.assertEqual(contents[h],
+                                    set([f.read()]))
+
+                # The index can be shared with another archive object.
+                idx = arc.get_index()
+                for h in hashes:
+                        self.assertTrue(os.path.join("publisher", "test",
+                            "file", h[:2], h) in idx)
+                self.assertTrue("no/such/file" not in idx)
+                arc.close()
+
+                shutil.rmtree(ext_dir)
+                arc = pkg.p5p.Archive(arc_path, mode="r", archive_index=idx)
+                arc.extract_package_files(hashes, ext_dir, pub="test",
+                    nworkers=4)
+                verify(ext_dir)
+                arc.close()
+
+
 if __name__ == "__main__":
         unittest.main()
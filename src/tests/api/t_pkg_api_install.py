@@ -21,7 +21,7 @@
 #
 
 #
-# Copyright (c) 2008, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2008, 2026, Oracle and/or its affiliates. All rights reserved.
 #
 
 import testutils
@@ -1090,7 +1090,7 @@ class TestPkgApiInstall(pkg5unittest.SingleDepotTestCase):
 
                 # Verify that manifest cache file exists after install.
                 mcdir = self.get_img_manifest_cache_dir(pfmri)
-                mcpath = os.path.join(mcdir, "manifest.set")
+                mcpath = os.path.join(mcdir, "manifest.cache")
                 assert os.path.exists(mcpath)
 
                 # Verify that manifest cache file and directories do not exist
@@ -1132,7 +1132,7 @@ class TestPkgApiInstall(pkg5unittest.SingleDepotTestCase):
                 mpath = self.get_img_manifest_path(pfmri)
                 mdir = os.path.dirname(mpath)
                 mcdir = self.get_img_manifest_cache_dir(pfmri)
-                mcpath = os.path.join(mcdir, "manifest.set")
+                mcpath = os.path.join(mcdir, "manifest.cache")
 
                 # Install foo again, then remove manifest cache files and then
                 # verify uninstall doesn't fail.
@@ -28,6 +28,7 @@ if __name__ == "__main__":
         testutils.setup_environment("../../../proto")
 
 import pkg5unittest
+import pkg.client.pkg_solver as pkg_solver
 import pkg.solver as solver
 import os
 import sys
@@ -40,6 +41,37 @@ class TestSolver(pkg5unittest.Pkg5TestCase):
         def test_solution(self):
                 cnf_test(working_test_case.splitlines())
 
+        def test_solver_cache(self):
+                """Verify that the solver cache persists results for the same
+                key only."""
+
+                path = os.path.join(self.test_root, "cache", "solver.cache")
+                sc = pkg_solver.SolverCache(path, "key1")
+                self.assertEqual(sc.get_match("pkg:/foo@1.0 0", 3), None)
+                sc.set_match("pkg:/foo@1.0 0", 3, 0, 1)
+                sc.set_match("pkg:/bar@1.0 0", 2, None, None)
+                sc.save()
+
+                sc = pkg_solver.SolverCache(path, "key1")
+                self.assertEqual(sc.get_match("pkg:/foo@1.0 0", 3), (0, 1))
+                self.assertEqual(sc.get_match("pkg:/bar@1.0 0", 2),
+                    (None, None))
+                # The number of candidates must match.
+                self.assertEqual(sc.get_match("pkg:/foo@1.0 0", 4), None)
+
+                sc = pkg_solver.SolverCache(path, "key2")
+                self.assertEqual(sc.get_match("pkg:/foo@1.0 0", 3), None)
+
+                # A corrupt cache is ignored and replaced.
+                with open(path, "wb") as f:
+                        f.write("{garbage")
+                sc = pkg_solver.SolverCache(path, "key1")
+                self.assertEqual(sc.get_match("pkg:/foo@1.0 0", 3), None)
+                sc.set_match("pkg:/foo@1.0 0", 3, 1, 2)
+                sc.save()
+                sc = pkg_solver.SolverCache(path, "key1")
+                self.assertEqual(sc.get_match("pkg:/foo@1.0 0", 3), (1, 2))
+
 def cnf_test(lines):
         s = solver.msat_solver()
         
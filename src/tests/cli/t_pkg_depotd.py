@@ -21,7 +21,7 @@
 #
 
 #
-# Copyright (c) 2008, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2008, 2026, Oracle and/or its affiliates. All rights reserved.
 #
 
 import testutils
@@ -29,10 +29,14 @@ if __name__ == "__main__":
         testutils.setup_environment("../../../proto")
 import pkg5unittest
 
+import cStringIO
 import datetime
+import gzip
+import hashlib
 import httplib
 import os
 import shutil
+import simplejson as json
 import tempfile
 import time
 import unittest
@@ -41,6 +45,7 @@ import urllib2
 import urlparse
 
 import pkg.client.publisher as publisher
+import pkg.delta as delta
 import pkg.depotcontroller as dc
 import pkg.fmri as fmri
 import pkg.manifest as man
@@ -49,6 +54,7 @@ import pkg.server.repository as sr
 import pkg.p5i as p5i
 import re
 import subprocess
+import tarfile
 
 class TestPkgDepot(pkg5unittest.SingleDepotTestCase):
         # Only start/stop the depot once (instead of for every test)
@@ -243,6 +249,290 @@ class TestPkgDepot(pkg5unittest.SingleDepotTestCase):
                     urllib.quote(plist[0])))
                 urllib2.urlopen(repourl)
 
+        def __fetch_delta(self, durl):
+                """Request the delta at 'durl' until the depot has generated
+                it in the background, and return its content."""
+
+                for i in range(60):
+                        try:
+                                return urllib2.urlopen(durl).read()
+                        except urllib2.HTTPError as e:
+                                self.assertEqual(e.code, httplib.NOT_FOUND)
+                        time.sleep(1)
+                raise RuntimeError("Delta {0} was never generated".format(
+                    durl))
+
+        def test_delta(self):
+                """Verify that the depot provides deltas between files that
+                are similar, and refuses to for those that aren't."""
+
+                old = "".join("line {0:d}\n".format(i) for i in xrange(50000))
+                new = old[:1000] + "changed" + old[1000:]
+                self.make_misc_files({
+                    "tmp/delta.old": old,
+                    "tmp/delta.new": new,
+                    "tmp/delta.other": "unrelated",
+                })
+                depot_url = self.dc.get_depot_url()
+                self.pkgsend_bulk(depot_url, """
+                    open delta@1.0,5.11-0
+                    add file tmp/delta.old mode=0444 owner=root group=bin path=/etc/delta.old
+                    add file tmp/delta.new mode=0444 owner=root group=bin path=/etc/delta.new
+                    add file tmp/delta.other mode=0444 owner=root group=bin path=/etc/delta.other
+                    close """)
+
+                ohash, nhash, xhash = [
+                    hashlib.sha1(c).hexdigest()
+                    for c in (old, new, "unrelated")
+                ]
+
+                # Deltas aren't generated while the client waits; the first
+                # request only queues generation of the delta.  Deltas are
+                # generated in order, so the one that isn't worthwhile has
+                # been attempted by the time the other is available.
+                for h in (xhash, nhash):
+                        durl = urlparse.urljoin(depot_url,
+                            "delta/0/{0}/{1}".format(ohash, h))
+                        try:
+                                urllib2.urlopen(durl)
+                        except urllib2.HTTPError as e:
+                                self.assertEqual(e.code, httplib.NOT_FOUND)
+                        else:
+                                raise RuntimeError("Expected failure for "
+                                    "{0}".format(durl))
+
+                # Retrieve the delta twice once it has been generated, so
+                # that the cached copy is used the second time.
+                for i in range(2):
+                        data = self.__fetch_delta(durl)
+                        self.assert_(len(data) < len(new) / 10)
+                        out = cStringIO.StringIO()
+                        delta.apply_delta(gzip.GzipFile(
+                            fileobj=cStringIO.StringIO(data)),
+                            cStringIO.StringIO(old), out)
+                        self.assertEqual(out.getvalue(), new)
+
+                # A delta that isn't smaller than the file, a missing file,
+                # and a malformed request.
+                for req in ("{0}/{1}".format(ohash, xhash),
+                    "{0}/{1}".format(ohash, "0" * 40),
+                    "{0}/..%2F{1}".format(ohash, nhash)):
+                        durl = urlparse.urljoin(depot_url,
+                            "delta/0/{0}".format(req))
+                        try:
+                                urllib2.urlopen(durl)
+                        except urllib2.HTTPError as e:
+                                self.assertEqual(e.code, httplib.NOT_FOUND)
+                        else:
+                                raise RuntimeError("Expected failure for "
+                                    "{0}".format(req))
+
+                durl = urlparse.urljoin(depot_url, "delta/0/{0}".format(ohash))
+                try:
+                        urllib2.urlopen(durl)
+                except urllib2.HTTPError as e:
+                        self.assertEqual(e.code, httplib.BAD_REQUEST)
+                else:
+                        raise RuntimeError("Expected failure for {0}".format(
+                            durl))
+
+        def test_file(self):
+                """Verify that the depot sends stored files intact, with the
+                expected headers, and that it responds to conditional and
+                range requests for them."""
+
+                content = "".join("line {0:d}\n".format(i)
+                    for i in xrange(200000))
+                self.make_misc_files({ "tmp/large": content })
+                depot_url = self.dc.get_depot_url()
+                self.pkgsend_bulk(depot_url, """
+                    open large@1.0,5.11-0
+                    add file tmp/large mode=0444 owner=root group=bin path=/etc/large
+                    close """)
+
+                furl = urlparse.urljoin(depot_url, "file/0/{0}".format(
+                    hashlib.sha1(content).hexdigest()))
+
+                # Retrieve the file twice, so that the cached response
+                # headers are used the second time.
+                for i in range(2):
+                        f = urllib2.urlopen(furl)
+                        data = f.read()
+                        hdrs = f.info()
+                        self.assertEqual(int(hdrs["content-length"]),
+                            len(data))
+                        self.assertEqual(hdrs["content-type"],
+                            "application/data")
+                        self.assertTrue(hdrs.get("etag"))
+                        self.assertEqual(gzip.GzipFile(
+                            fileobj=cStringIO.StringIO(data)).read(), content)
+
+                # Conditional requests for an unchanged file.
+                req = urllib2.Request(furl, headers={
+                    "If-Modified-Since": hdrs["last-modified"] })
+                try:
+                        urllib2.urlopen(req)
+                except urllib2.HTTPError as e:
+                        self.assertEqual(e.code, httplib.NOT_MODIFIED)
+                else:
+                        raise RuntimeError("Expected 304 for {0}".format(furl))
+
+                req = urllib2.Request(furl, headers={ "Range": "bytes=10-19" })
+                f = urllib2.urlopen(req)
+                self.assertEqual(f.getcode(), httplib.PARTIAL_CONTENT)
+                self.assertEqual(f.read(), data[10:20])
+
+        def test_conditional(self):
+                """Verify that the depot uses the SHA-1 hash of manifests and
+                catalog files as their entity tags and honors conditional and
+                range requests for them."""
+
+                depot_url = self.dc.get_depot_url()
+                plist = self.pkgsend_bulk(depot_url, self.info20)
+                pfmri = fmri.PkgFmri(plist[0])
+
+                def expect_error(req, code):
+                        try:
+                                urllib2.urlopen(req)
+                        except urllib2.HTTPError as e:
+                                self.assertEqual(e.code, code)
+                                return e
+                        raise RuntimeError("Expected {0:d} for {1}".format(
+                            code, req.get_full_url()))
+
+                for path in ("manifest/0/{0}".format(pfmri.get_url_path()),
+                    "catalog/1/catalog.attrs"):
+                        url = urlparse.urljoin(depot_url, path)
+                        f = urllib2.urlopen(url)
+                        data = f.read()
+                        etag = f.info()["etag"]
+                        self.assertEqual(etag, "\"{0}\"".format(
+                            hashlib.sha1(data).hexdigest()))
+                        self.assertEqual(f.info()["accept-ranges"], "bytes")
+
+                        # Conditional requests.
+                        expect_error(urllib2.Request(url,
+                            headers={ "If-None-Match": etag }),
+                            httplib.NOT_MODIFIED)
+                        f = urllib2.urlopen(urllib2.Request(url,
+                            headers={ "If-None-Match": "\"0\"" }))
+                        self.assertEqual(f.read(), data)
+                        expect_error(urllib2.Request(url,
+                            headers={ "If-Match": "\"0\"" }),
+                            httplib.PRECONDITION_FAILED)
+
+                        # Range requests.
+                        f = urllib2.urlopen(urllib2.Request(url,
+                            headers={ "Range": "bytes=5-14" }))
+                        self.assertEqual(f.getcode(), httplib.PARTIAL_CONTENT)
+                        self.assertEqual(f.info()["content-range"],
+                            "bytes 5-14/{0:d}".format(len(data)))
+                        self.assertEqual(f.read(), data[5:15])
+
+                        f = urllib2.urlopen(urllib2.Request(url,
+                            headers={ "Range": "bytes=5-", "If-Range": etag }))
+                        self.assertEqual(f.getcode(), httplib.PARTIAL_CONTENT)
+                        self.assertEqual(f.read(), data[5:])
+
+                        # A range request for a changed file returns all of
+                        # the new file.
+                        f = urllib2.urlopen(urllib2.Request(url, headers={
+                            "Range": "bytes=5-", "If-Range": "\"0\"" }))
+                        self.assertEqual(f.getcode(), httplib.OK)
+                        self.assertEqual(f.read(), data)
+
+                        e = expect_error(urllib2.Request(url,
+                            headers={ "Range": "bytes={0:d}-".format(
+                            len(data)) }),
+                            httplib.REQUESTED_RANGE_NOT_SATISFIABLE)
+                        self.assertEqual(e.info()["content-range"],
+                            "bytes */{0:d}".format(len(data)))
+
+        def test_response_cache(self):
+                """Verify that the depot caches manifest and catalog responses,
+                that cached catalog responses are replaced when packages are
+                published, and that cache statistics are reported by
+                status/0."""
+
+                depot_url = self.dc.get_depot_url()
+                plist = self.pkgsend_bulk(depot_url, self.foo10)
+                pfmri = fmri.PkgFmri(plist[0])
+
+                def get_cache_status():
+                        status = json.loads(urllib2.urlopen(urlparse.urljoin(
+                            depot_url, "status/0/")).read())
+                        return status["depot"]["response-cache"]
+
+                murl = urlparse.urljoin(depot_url,
+                    "manifest/0/{0}".format(pfmri.get_url_path()))
+                curl = urlparse.urljoin(depot_url, "catalog/1/catalog.attrs")
+
+                mdata = urllib2.urlopen(murl).read()
+                cdata = urllib2.urlopen(curl).read()
+                before = get_cache_status()
+                self.assertEqual(urllib2.urlopen(murl).read(), mdata)
+                self.assertEqual(urllib2.urlopen(curl).read(), cdata)
+                after = get_cache_status()
+                self.assertEqual(after["hits"] - before["hits"], 2)
+                self.assertEqual(after["misses"], before["misses"])
+                self.assertTrue(after["used"] >= len(mdata) + len(cdata))
+
+                # Publishing a package replaces the cached catalog data.
+                self.pkgsend_bulk(depot_url, self.info10)
+                ndata = urllib2.urlopen(curl).read()
+                self.assertNotEqual(ndata, cdata)
+                cpath = os.path.join(self.dc.get_repodir(), "publisher",
+                    "test", "catalog", "catalog.attrs")
+                self.assertEqual(ndata, file(cpath).read())
+                self.assertEqual(urllib2.urlopen(murl).read(), mdata)
+
+        def test_manifests(self):
+                """Verify that the depot returns multiple manifests in a
+                single response to manifests/0 requests."""
+
+                depot_url = self.dc.get_depot_url()
+                plist = self.pkgsend_bulk(depot_url, (self.foo10,
+                    self.info20))
+                pfmris = [fmri.PkgFmri(p) for p in plist]
+
+                vers = urllib2.urlopen(urlparse.urljoin(depot_url,
+                    "versions/0/")).read()
+                self.assertTrue("manifests 0" in vers.splitlines())
+
+                # Manifests that aren't in the repository are omitted from
+                # the response.
+                missing = fmri.PkgFmri("pkg://test/missing@1.0")
+                req = urllib.urlencode([
+                    (i, f.get_fmri(anarchy=True, include_scheme=False))
+                    for i, f in enumerate(pfmris + [missing])
+                ])
+                f = urllib2.urlopen(urlparse.urljoin(depot_url,
+                    "manifests/0/"), req)
+                tar_stream = tarfile.open(mode="r|gz",
+                    fileobj=cStringIO.StringIO(f.read()))
+                received = {}
+                for info in tar_stream:
+                        received[info.name] = \
+                            tar_stream.extractfile(info).read()
+                tar_stream.close()
+
+                self.assertEqual(sorted(received),
+                    sorted(p.get_url_path() for p in pfmris))
+                for p in pfmris:
+                        mdata = urllib2.urlopen(urlparse.urljoin(depot_url,
+                            "manifest/0/{0}".format(p.get_url_path()))).read()
+                        self.assertEqual(received[p.get_url_path()], mdata)
+
+                # An invalid FMRI fails the request.
+                try:
+                        urllib2.urlopen(urlparse.urljoin(depot_url,
+                            "manifests/0/"), urllib.urlencode({ 0: "@@" }))
+                except urllib2.HTTPError as e:
+                        self.assertEqual(e.code, httplib.BAD_REQUEST)
+                else:
+                        raise RuntimeError("Expected failure for invalid "
+                            "FMRI")
+
         def test_info(self):
                 """Testing information showed in /info/0."""
 
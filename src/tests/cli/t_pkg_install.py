@@ -22,7 +22,7 @@
 #
 
 #
-# Copyright (c) 2008, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2008, 2026, Oracle and/or its affiliates. All rights reserved.
 #
 
 import testutils
@@ -31,10 +31,12 @@ if __name__ == "__main__":
 import pkg5unittest
 
 import errno
+import hashlib
 import os
 import platform
 import re
 import shutil
+import simplejson as json
 import socket
 import subprocess
 import stat
@@ -45,6 +47,7 @@ import unittest
 import urllib2
 
 import pkg.actions
+import pkg.client.fastlookup as fastlookup
 import pkg.digest as digest
 import pkg.fmri as fmri
 import pkg.manifest as manifest
@@ -659,6 +662,80 @@ class TestPkgInstallBasics(pkg5unittest.SingleDepotTestCase):
                 self.pkg("list bar@1.0")
                 self.pkg("list foo@1.2")
 
+        def test_basics_10_concurrency(self):
+                """Verify that actions are executed correctly when the client
+                is allowed to execute them concurrently."""
+
+                pfiles10 = """
+                    open pfiles@1.0,5.11-0
+                    add dir mode=0755 owner=root group=bin path=/pfiles"""
+                pfiles11 = """
+                    open pfiles@1.1,5.11-0
+                    add dir mode=0755 owner=root group=bin path=/pfiles"""
+                for i in range(20):
+                        pfiles10 += """
+                    add file tmp/cat mode=0555 owner=root group=bin path=/pfiles/cat{0:d}
+                    add hardlink path=/pfiles/hcat{0:d} target=cat{0:d}
+                    add link path=/pfiles/lcat{0:d} target=cat{0:d}""".format(i)
+                        pfiles11 += """
+                    add file tmp/baz mode=0444 owner=root group=bin path=/pfiles/cat{0:d}
+                    add hardlink path=/pfiles/hcat{0:d} target=cat{0:d}
+                    add link path=/pfiles/lcat{0:d} target=hcat{0:d}""".format(i)
+                pfiles10 += "\nclose"
+                pfiles11 += "\nclose"
+
+                self.pkgsend_bulk(self.rurl, (pfiles10, pfiles11))
+                self.image_create(self.rurl)
+
+                env = {"PKG_CONCURRENCY": "4"}
+                self.pkg("install pfiles@1.0", env_arg=env)
+                self.pkg("verify")
+                self.pkg("update pfiles@1.1", env_arg=env)
+                self.pkg("verify")
+                self.file_contains("pfiles/lcat3", "tmp/baz")
+                self.pkg("uninstall pfiles", env_arg=env)
+                self.pkg("verify")
+                self.assertFalse(os.path.exists(os.path.join(self.img_path(),
+                    "pfiles")))
+
+        def test_solver_stats(self):
+                """Verify that --solver-stats writes a report of the work done
+                by the solver when planning succeeds."""
+
+                self.pkgsend_bulk(self.rurl, (self.foo10, self.foo11))
+                self.image_create(self.rurl)
+                spath = os.path.join(self.test_root, "solver-stats.json")
+
+                self.pkg("install -n --solver-stats={0} foo@1.0".format(spath))
+                with open(spath) as f:
+                        stats = json.load(f)
+                self.assertEqual(stats["state"], "Succeeded")
+                self.assertTrue(stats["variables"] > 0)
+                self.assertTrue(stats["clauses"] > 0)
+                self.assertTrue(stats["literals"] >= stats["clauses"])
+                self.assertTrue(stats["iterations"] > 0)
+                self.assertTrue(stats["phases"])
+                for phase in stats["phases"]:
+                        self.assertTrue(phase["name"])
+                        self.assertTrue(phase["seconds"] >= 0)
+                for k in ("conflicts", "decisions", "propagations",
+                    "peak_rss"):
+                        self.assertTrue(stats[k] >= 0)
+
+                self.pkg("install foo@1.0")
+                os.unlink(spath)
+                self.pkg("update --solver-stats={0}".format(spath))
+                with open(spath) as f:
+                        stats = json.load(f)
+                self.assertEqual(stats["state"], "Succeeded")
+                self.pkg("list foo@1.1")
+
+                # No report is written if planning fails.
+                os.unlink(spath)
+                self.pkg("install --solver-stats={0} nosuchpkg".format(spath),
+                    exit=1)
+                self.assertFalse(os.path.exists(spath))
+
         def test_freeze_exact_install(self):
                 """Verify frozen packages can be relaxed with exact_install.
                 Which means we can ignore the frozen list with exact_install.
@@ -1088,6 +1165,40 @@ class TestPkgInstallBasics(pkg5unittest.SingleDepotTestCase):
                 shutil.rmtree(self.img_path())
                 self.set_img_path(old_img_path)
 
+        def test_download_verify_threads(self):
+                """Verify that downloaded content is installed correctly
+                regardless of the number of threads used to verify it, and
+                that invalid content is still rejected."""
+
+                self.pkgsend_bulk(self.rurl, (self.foo11, self.bar10))
+                for threads in ("1", "2", "8"):
+                        env = {"PKG_CLIENT_VERIFY_THREADS": threads}
+                        self.image_create(self.rurl)
+                        self.pkg("install bar", env_arg=env)
+                        self.pkg("verify")
+                        self.pkg("uninstall '*'")
+
+                # Corrupt the content of one of the files in the repository;
+                # the others should still be verified and the install must
+                # fail.
+                with open(os.path.join(self.test_root, "tmp/cat"), "rb") as f:
+                        fhash = hashlib.sha1(f.read()).hexdigest()
+                fpath = os.path.join(self.dc.get_repodir(), "publisher",
+                    "test", "file", fhash[:2], fhash)
+                with open(fpath, "rb") as f:
+                        saved = f.read()
+                try:
+                        with open(fpath, "wb") as f:
+                                f.write("noodles\n")
+                        self.image_create(self.rurl)
+                        self.pkg("install bar", env_arg={
+                            "PKG_CLIENT_MAX_TIMEOUT": "1"}, exit=1)
+                        self.pkg("list bar", exit=1)
+                finally:
+                        # The depot is shared by the tests in this class.
+                        with open(fpath, "wb") as f:
+                                f.write(saved)
+
 
 class TestPkgInstallApache(pkg5unittest.ApacheDepotTestCase):
 
@@ -1465,6 +1576,103 @@ class TestPkgInstallRepoPerTest(pkg5unittest.SingleDepotTestCase):
                     self.img_path(), "bin", "cat")))
 
 
+class TestPkgInstallDelta(pkg5unittest.SingleDepotTestCase):
+        """Test that updated files are retrieved as deltas against the
+        installed version when the depot provides them."""
+
+        delta10 = """
+            open delta@1.0,5.11-0
+            add file tmp/delta.old mode=0444 owner=root group=bin path=etc/delta
+            close """
+
+        delta11 = """
+            open delta@1.1,5.11-0
+            add file tmp/delta.new mode=0444 owner=root group=bin path=etc/delta
+            close """
+
+        def setUp(self):
+                # Deltas are only provided by depot servers.
+                pkg5unittest.SingleDepotTestCase.setUp(self, start_depot=True)
+
+                # Random content doesn't compress, so the file is well over
+                # the minimum size of files retrieved as deltas.
+                self.old = os.urandom(512 * 1024)
+                self.new = self.old[:1000] + "changed" + self.old[1000:]
+                self.make_misc_files({
+                    "tmp/delta.old": self.old,
+                    "tmp/delta.new": self.new,
+                })
+
+        def __get_requests(self, offset):
+                """Return the GET request lines in the depot's access log
+                from 'offset' onwards."""
+
+                with open(self.dc.get_logpath(), "rb") as f:
+                        f.seek(offset)
+                        return [l for l in f if '"GET ' in l]
+
+        def test_update_delta(self):
+                """Verify that pkg update retrieves an updated file as a delta
+                once the depot has generated it, and installs the file
+                reconstructed from it intact."""
+
+                durl = self.dc.get_depot_url()
+                self.pkgsend_bulk(durl, self.delta10)
+                self.image_create(durl)
+                self.pkg("install delta")
+                self.pkgsend_bulk(durl, self.delta11)
+
+                ohash, nhash = [
+                    hashlib.sha1(c).hexdigest()
+                    for c in (self.old, self.new)
+                ]
+
+                # The depot generates deltas in the background once they have
+                # been requested; wait until this one is available.
+                dreq = "delta/0/{0}/{1}".format(ohash, nhash)
+                for i in range(60):
+                        try:
+                                urllib2.urlopen("{0}/{1}".format(durl, dreq))
+                                break
+                        except urllib2.HTTPError as e:
+                                self.assertEqual(e.code, 404)
+                        time.sleep(1)
+                else:
+                        raise RuntimeError("Delta {0} was never "
+                            "generated".format(dreq))
+
+                offset = os.stat(self.dc.get_logpath()).st_size
+                self.pkg("update")
+                self.pkg("verify")
+                with open(os.path.join(self.get_img_path(), "etc", "delta"),
+                    "rb") as f:
+                        self.assertEqual(f.read(), self.new)
+
+                # The new file must only have been retrieved as a delta.
+                reqs = self.__get_requests(offset)
+                self.assert_([
+                    l for l in reqs
+                    if '{0} HTTP/1.1" 200 '.format(dreq) in l
+                ], "\n".join(reqs))
+                self.assert_(not [
+                    l for l in reqs
+                    if "/file/" in l and nhash in l
+                ], "\n".join(reqs))
+
+                # Small files are retrieved in full.
+                self.pkg("update delta@1.0")
+                offset = os.stat(self.dc.get_logpath()).st_size
+                self.pkg("update", env_arg={
+                    "PKG_CLIENT_DELTA_MIN_SIZE": str(2 * len(self.new))})
+                reqs = self.__get_requests(offset)
+                self.assert_(not [l for l in reqs if "/delta/" in l],
+                    "\n".join(reqs))
+                self.assert_([
+                    l for l in reqs
+                    if "/file/" in l and nhash in l
+                ], "\n".join(reqs))
+
+
 class TestPkgActuators(pkg5unittest.SingleDepotTestCase):
         """Test package actuators"""
         persistent_setup = True
@@ -9508,6 +9716,47 @@ adm
                 self.pkg("uninstall pkg2", exit=1)
                 self.pkg("verify pkg2")
 
+        def test_incremental_fast_lookups(self):
+                """Test that the fast lookups database updated incrementally
+                by install and uninstall operations matches one built from
+                scratch."""
+
+                self.image_create(self.rurl)
+                cache_dir = os.path.join(self.img_path(), "var", "pkg",
+                    "cache")
+
+                def read_db():
+                        with open(os.path.join(cache_dir,
+                            "actions.stripped"), "rb") as fh:
+                                # Skip the version and timestamp.
+                                stripped = sorted(fh.readlines()[2:])
+                        with open(os.path.join(cache_dir,
+                            "keys.conflicting"), "rb") as fh:
+                                bad_keys = fh.read()
+                        bytype = fastlookup.ActionsByType(os.path.join(
+                            cache_dir, "actions.bytype"))
+                        sections = dict(
+                            (name, sorted(bytype.gen_lines(name)))
+                            for name in fastlookup.BYTYPE_SECTIONS
+                        )
+                        bytype.close()
+                        return stripped, bad_keys, sections
+
+                self.pkg("install dupfilesp1 dupotherfilesp1")
+                self.pkg("-D broken-conflicting-action-handling=1 install "
+                    "dupfilesp2@0")
+                self.pkg("install implicitdirs2")
+                self.pkg("uninstall dupotherfilesp1")
+                incremental = read_db()
+
+                for fname in ("actions.stripped", "actions.offsets",
+                    "keys.conflicting", "actions.bytype"):
+                        os.unlink(os.path.join(cache_dir, fname))
+                # Planning an operation recreates the database.
+                self.pkg("install -n dupotherfilesp1")
+                self.assertEqual(incremental, read_db())
+                self.assert_(incremental[2][fastlookup.IMPLICIT_DIRS])
+
         def test_overlay_files_install(self):
                 """Test the behaviour of pkg(1) when actions for editable files
                 overlay other actions."""
@@ -20,7 +20,7 @@
 # CDDL HEADER END
 #
 
-# Copyright (c) 2008, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2008, 2026, Oracle and/or its affiliates. All rights reserved.
 
 import testutils
 if __name__ == "__main__":
@@ -28,6 +28,7 @@ if __name__ == "__main__":
 import pkg5unittest
 
 import hashlib
+import httplib
 import os
 import re
 import shutil
@@ -84,11 +85,12 @@ class TestPkgRefreshMulti(pkg5unittest.ManyDepotTestCase):
                 """Reduce runs of spaces down to a single space."""
                 return re.sub(" +", " ", string)
 
-        def get_op_entries(self, dc, op, op_ver, method="GET"):
+        def get_op_entries(self, dc, op, op_ver, method="GET", status=None):
                 """Scan logpath for a specific depotcontroller looking for
                 access log entries for an operation.  Returns a list of request
                 URIs for each log entry found for the operation in chronological
-                order."""
+                order.  If 'status' is provided, only entries for responses with
+                that status code are returned."""
 
                 # 127.0.0.1 - - [15/Oct/2009:00:15:38]
                 # "GET [/<pub>]/catalog/1/catalog.base.C HTTP/1.1" 200 189 ""
@@ -115,8 +117,8 @@ class TestPkgRefreshMulti(pkg5unittest.ManyDepotTestCase):
                         if not m:
                                 continue
 
-                        host, user, req_time, req, status, clen, ref, agent = \
-                            m.groups()
+                        host, user, req_time, req, rstatus, clen, ref, \
+                            agent = m.groups()
 
                         req_method, uri, protocol = req.split(" ")
                         if req_method != method:
@@ -131,6 +133,9 @@ class TestPkgRefreshMulti(pkg5unittest.ManyDepotTestCase):
 
                         if req_parts[1] != op_ver:
                                 continue
+
+                        if status is not None and int(rstatus) != status:
+                                continue
                         entries.append(uri)
                 logfile.close()
                 self.debug("Found {0} for {1} /{2}/{3}/".format(entries, method, op,
@@ -415,6 +420,12 @@ class TestPkgRefreshMulti(pkg5unittest.ManyDepotTestCase):
                 returned = self.get_op_entries(dc, "catalog", "1")
                 self.assertEqual(returned, expected)
 
+                # The client's copy of the catalog attrs file is current, so
+                # the depot should not have sent it again.
+                returned = self.get_op_entries(dc, "catalog", "1",
+                    status=httplib.NOT_MODIFIED)
+                self.assertEqual(returned, ["/catalog/1/catalog.attrs"])
+
                 # Next, verify that a "full" refresh after incrementals works
                 # as expected.
                 self.pkg("refresh --full test1")
@@ -21,7 +21,7 @@
 #
 
 #
-# Copyright (c) 2008, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2008, 2026, Oracle and/or its affiliates. All rights reserved.
 #
 
 from __future__ import print_function
@@ -990,6 +990,8 @@ adm:NP:6445::::::
                 self.pkg("search -l /bin", exit=1)
                 # Test rebuilding the index with a missing manifest.
                 self.pkg("rebuild-index")
+                self.pkg("rebuild-index --jobs 2")
+                self.pkg("rebuild-index --jobs -1", exit=2)
 
         def test_15807844(self):
                 """ Check that pkg search for temporary sources is successful
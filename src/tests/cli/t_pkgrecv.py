@@ -21,7 +21,7 @@
 #
 
 #
-# Copyright (c) 2008, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2008, 2026, Oracle and/or its affiliates. All rights reserved.
 #
 
 import testutils
@@ -39,6 +39,7 @@ import pkg.misc as misc
 import pkg.p5p as p5p
 import pkg.portable as portable
 import pkg.server.repository as repo
+import re
 import shutil
 import subprocess
 import tempfile
@@ -1027,6 +1028,92 @@ Estimated transfer size: 528.00 B
                 self.pkgrecv(self.dpath1, "-d {0} -v \*".format(self.tempdir))
                 self.assert_("dry-run" not in self.output)
 
+        def test_14_parallel(self):
+                """Verify that retrieving and republishing packages in
+                parallel gives the same result as doing so serially."""
+
+                # Invalid job counts should be rejected.
+                for opt in ("--fetch-jobs", "--publish-jobs"):
+                        for val in ("0", "-1", "foo"):
+                                self.pkgrecv(self.durl1, "{0} {1} -d {2} "
+                                    "'*'".format(opt, val, self.dpath2),
+                                    exit=2)
+
+                # Cloning in parallel should produce an exact copy.
+                self.pkgrecv(self.durl1, "--fetch-jobs 3 --clone -d "
+                    "{0}".format(self.dpath2))
+                ret = subprocess.call(["/usr/bin/gdiff", "-Naur", "-x",
+                    "index", "-x", "trans", self.dpath1, self.dpath2])
+                self.assertTrue(ret==0)
+
+                self.pkgrepo("-s {0} list -H".format(self.dpath1))
+                expected = self.output
+
+                # Packages should be republished in parallel whether or not
+                # their content is also retrieved in parallel.
+                for i, opts in enumerate(("--fetch-jobs 3 --publish-jobs 2",
+                    "--publish-jobs 2")):
+                        rpath = os.path.join(self.test_root,
+                            "parallel{0:d}".format(i))
+                        self.create_repo(rpath, properties={ "publisher": {
+                            "prefix": "test1" } })
+                        self.pkgrecv(self.durl1, "{0} -d {1} '*'".format(opts,
+                            rpath))
+                        self.pkgrepo("-s {0} list -H".format(rpath))
+                        self.assertEqualDiff(expected, self.output)
+
+                        # Verify that the republished content is intact.
+                        self.pkgrepo("-s {0} verify".format(rpath))
+
+                # Content shared by packages should only be retrieved once
+                # for the whole run, even when packages are retrieved one at
+                # a time.
+                rpath = os.path.join(self.test_root, "serial")
+                self.create_repo(rpath, properties={ "publisher": {
+                    "prefix": "test1" } })
+                logpath = self.dcs[1].get_logpath()
+                offset = os.stat(logpath).st_size
+                self.pkgrecv(self.durl1, "-d {0} '*'".format(rpath))
+                with open(logpath, "rb") as f:
+                        f.seek(offset)
+                        hashes = re.findall(r'"GET \S*/file/\d+/(\w+) ',
+                            f.read())
+                self.assert_(hashes)
+                self.assertEqual(len(hashes), len(set(hashes)))
+                self.pkgrepo("-s {0} list -H".format(rpath))
+                self.assertEqualDiff(expected, self.output)
+
+        def test_15_clone_resume(self):
+                """Verify that an interrupted clone is resumed using its
+                journal and that the journal is removed once the clone has
+                completed."""
+
+                self.pkgrecv(self.durl1, "--clone -d {0}".format(self.dpath2))
+                jpath = os.path.join(self.dpath2, "publisher", "test1",
+                    "clone.journal")
+                self.assertTrue(not os.path.exists(jpath))
+
+                # Simulate a clone interrupted after all of the packages were
+                # retrieved but before the catalog was replaced; the last
+                # line of the journal was only partially written.
+                c_root = os.path.join(self.dpath2, "publisher", "test1",
+                    "catalog")
+                shutil.rmtree(c_root)
+                os.mkdir(c_root)
+                with open(jpath, "wb") as f:
+                        for s in self.published:
+                                f.write("manifest {0}\n".format(s))
+                                f.write("files {0}\n".format(s))
+                        f.write("manif")
+
+                self.pkgrecv(self.durl1, "--clone -d {0}".format(self.dpath2))
+                self.assertTrue("Resuming an interrupted clone; {0:d} "
+                    "package(s)".format(len(self.published)) in self.output)
+                self.assertTrue(not os.path.exists(jpath))
+                ret = subprocess.call(["/usr/bin/gdiff", "-Naur", "-x",
+                    "index", "-x", "trans", self.dpath1, self.dpath2])
+                self.assertTrue(ret==0)
+
 
 class TestPkgrecvHTTPS(pkg5unittest.HTTPSTestClass):
 
@@ -21,7 +21,7 @@
 #
 
 #
-# Copyright (c) 2010, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2010, 2026, Oracle and/or its affiliates. All rights reserved.
 #
 
 import testutils
@@ -3538,6 +3538,152 @@ publisher\tprefix\t""
                 # publisher will not result in partial failure.
                 self.pkgrepo("contents -s {0} zoo".format(repo_path))
 
+        def test_41_verify_jobs(self):
+                """Test that verify and fix produce the same results when
+                using multiple processes, and report throughput."""
+
+                repo_path = self.dc.get_repodir()
+                fmris = self.pkgsend_bulk(repo_path, (self.tree10,
+                    self.amber10, self.truck10, self.truck20))
+
+                self.pkgrepo("-s {0} verify --jobs 4".format(repo_path))
+                self.assert_("Verified " in self.output)
+                self.assert_("MB/s" in self.output)
+
+                bad_hash_path = self.__inject_badhash("tmp/truck1")
+                bad_gzip_path = self.__inject_badhash("tmp/truck2",
+                    valid_gzip=False)
+
+                def errors():
+                        # Strip the throughput summary, which varies.
+                        return [
+                            l for l in self.output.splitlines()
+                            if not l.startswith("Verified ") and
+                            not l.startswith("Skipped ")
+                        ]
+
+                self.pkgrepo("-s {0} verify".format(repo_path), exit=1)
+                expected = errors()
+                for jobs in (0, 2, 4):
+                        self.pkgrepo("-s {0} verify --jobs {1:d}".format(
+                            repo_path, jobs), exit=1)
+                        self.assertEqualDiff(expected, errors())
+                self.assert_(bad_hash_path in self.output)
+                self.assert_(bad_gzip_path in self.output)
+
+                self.pkgrepo("-s {0} verify --jobs -1".format(repo_path),
+                    exit=2)
+                self.pkgrepo("-s {0} verify --jobs many".format(repo_path),
+                    exit=2)
+
+                # Fix should quarantine the same content as a serial run.
+                self.pkgrepo("-s {0} fix -v --jobs 4".format(repo_path))
+                self.assert_("Verified " in self.output)
+                self.assert_(bad_hash_path in self.output)
+                self.assert_(bad_gzip_path in self.output)
+                self.pkgrepo("-s {0} verify --jobs 4".format(repo_path))
+
+        def test_42_verify_ledger(self):
+                """Test that verify only checks the hashes of files that have
+                changed since they were last verified, unless --full is used
+                or the files were last verified too long ago."""
+
+                repo_path = self.dc.get_repodir()
+                self.pkgsend_bulk(repo_path, (self.tree10, self.amber10,
+                    self.truck10, self.truck20))
+                ledger = os.path.join(repo_path, "publisher", "test",
+                    "index", "verify.ledger")
+
+                self.pkgrepo("-s {0} verify".format(repo_path))
+                self.assert_("Skipped " not in self.output)
+                self.assert_(os.path.exists(ledger))
+
+                # Unchanged files shouldn't be hashed again.
+                self.pkgrepo("-s {0} verify".format(repo_path))
+                self.assert_("Verified 0 files" in self.output)
+                self.assert_("Skipped " in self.output)
+                self.pkgrepo("-s {0} verify --jobs 2".format(repo_path))
+                self.assert_("Verified 0 files" in self.output)
+
+                # ...unless asked to, or they were verified too long ago.
+                self.pkgrepo("-s {0} verify --full".format(repo_path))
+                self.assert_("Verified 0 files" not in self.output)
+                self.assert_("Skipped " not in self.output)
+                self.pkgrepo("-s {0} verify --max-age 0".format(repo_path))
+                self.assert_("Skipped " not in self.output)
+                self.pkgrepo("-s {0} verify --max-age soon".format(repo_path),
+                    exit=2)
+
+                # A corrupted file must be found even if it has the same size
+                # and inode as before.
+                bad_path = self.__get_file_path("tmp/truck1")
+                st = os.stat(bad_path)
+                with open(bad_path, "r+b") as f:
+                        f.write("\0" * min(st.st_size, 16))
+                os.utime(bad_path, (st.st_atime, st.st_mtime + 10))
+                self.pkgrepo("-s {0} verify".format(repo_path), exit=1)
+                self.assert_("Verified 1 files" in self.output)
+                self.assert_(bad_path in self.output)
+
+                # Invalid files are never recorded in the ledger.
+                os.utime(bad_path, (st.st_atime, st.st_mtime + 10))
+                self.pkgrepo("-s {0} verify".format(repo_path), exit=1)
+                self.assert_(bad_path in self.output)
+
+                # Once repaired, the file is recorded again.
+                self.__repair_badhash("tmp/truck1")
+                self.pkgrepo("-s {0} verify".format(repo_path))
+                self.assert_("Verified 1 files" in self.output)
+                self.pkgrepo("-s {0} verify".format(repo_path))
+                self.assert_("Verified 0 files" in self.output)
+
+                # A corrupt ledger is ignored.
+                with open(ledger, "wb") as f:
+                        f.write("VERSION 1\nbogus\n")
+                self.pkgrepo("-s {0} verify".format(repo_path))
+                self.assert_("Skipped " not in self.output)
+
+        def test_43_index_jobs(self):
+                """Verify that rebuild and refresh produce the same search
+                results when using multiple processes to index packages."""
+
+                repo_path = self.dc.get_repodir()
+                self.pkgsend_bulk(repo_path, (self.tree10, self.amber10,
+                    self.amber20, self.truck10, self.truck20))
+
+                def search(text):
+                        repo = self.get_repo(repo_path)
+                        query = Query(text, False, Query.RETURN_ACTIONS,
+                            None, None)
+                        return sorted(
+                            e for e in [r for r in repo.search([query])][0]
+                        )
+
+                queries = ("tree", "amber", "truck", "bin", "*ree")
+                self.pkgrepo("rebuild -s {0} --no-catalog".format(repo_path))
+                expected = [search(q) for q in queries]
+                self.assert_(all(expected))
+
+                for jobs in (0, 2, 4):
+                        self.pkgrepo("rebuild -s {0} --no-catalog "
+                            "--jobs {1:d}".format(repo_path, jobs))
+                        self.assertEqualDiff(expected,
+                            [search(q) for q in queries])
+
+                # Packages published without updating the index are indexed
+                # by refresh.
+                self.pkgsend_bulk(repo_path, self.zoo10)
+                self.assertEqual([], search("zoo"))
+                self.pkgrepo("refresh -s {0} --no-catalog --jobs 2".format(
+                    repo_path))
+                self.assert_(search("zoo"))
+                self.assertEqualDiff(expected, [search(q) for q in queries])
+
+                self.pkgrepo("rebuild -s {0} --jobs -1".format(repo_path),
+                    exit=2)
+                self.pkgrepo("refresh -s {0} --jobs many".format(repo_path),
+                    exit=2)
+
 
 class TestPkgrepoHTTPS(pkg5unittest.HTTPSTestClass):
 
@@ -0,0 +1,129 @@
+#!/usr/bin/python2.7
+#
+# CDDL HEADER START
+#
+# The contents of this file are subject to the terms of the
+# Common Development and Distribution License (the "License").
+# You may not use this file except in compliance with the License.
+#
+# You can obtain a copy of the license at usr/src/OPENSOLARIS.LICENSE
+# or http://www.opensolaris.org/os/licensing.
+# See the License for the specific language governing permissions
+# and limitations under the License.
+#
+# When distributing Covered Code, include this CDDL HEADER in each
+# file and include the License file at usr/src/OPENSOLARIS.LICENSE.
+# If applicable, add the following below this CDDL HEADER, with the
+# fields enclosed by brackets "[]" replaced with your own identifying
+# information: Portions Copyright [yyyy] [name of copyright owner]
+#
+# CDDL HEADER END
+#
+
+#
+# Copyright (c) 2026, Oracle and/or its affiliates. All rights reserved.
+#
+
+#
+# catalogbench - benchmark time and peak memory usage of loading catalog
+# parts and update logs compared to reading them incrementally
+#
+# usage: catalogbench.py [npkgs]
+#
+
+from __future__ import print_function
+
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import pkg.catalog as catalog
+import pkg.fmri as fmri
+
+npkgs = 100000
+if len(sys.argv) > 1:
+        npkgs = int(sys.argv[1])
+
+def gen_catalog(path):
+        c = catalog.Catalog(meta_root=path, log_updates=True)
+        c.batch_mode = True
+        for i in xrange(npkgs):
+                f = fmri.PkgFmri("pkg://bench.org/bench/pkg{0:d}@"
+                    "0.5.11,5.11-0.{1:d}:20260101T000000Z".format(i % 5000,
+                    i // 5000))
+                c.add_package(f, metadata={
+                    "signature-sha-1": "{0:040x}".format(i),
+                    "metadata": { "sources": ["http://bench.org/"] },
+                })
+        c.finalize()
+        c.save()
+
+def base_load(path):
+        part = catalog.CatalogPart("catalog.base.C", meta_root=path)
+        return sum(1 for t in part.entries())
+
+def base_stream(path):
+        part = catalog.CatalogPart("catalog.base.C", meta_root=path)
+        return sum(1 for t in part.stream_entries())
+
+def base_validate_load(path):
+        part = catalog.CatalogPart("catalog.base.C", meta_root=path)
+        part.load()
+        part.validate()
+
+def base_validate_stream(path):
+        part = catalog.CatalogPart("catalog.base.C", meta_root=path)
+        part.validate(require_signatures=True)
+
+def update_name(path):
+        return [
+            name for name in os.listdir(path)
+            if name.startswith("update.")
+        ][0]
+
+def updates_load(path):
+        ulog = catalog.CatalogUpdate(update_name(path), meta_root=path)
+        ulog.load()
+        return sum(1 for t in ulog.updates())
+
+def updates_stream(path):
+        ulog = catalog.CatalogUpdate(update_name(path), meta_root=path)
+        return sum(1 for t in ulog.updates())
+
+def append(path):
+        c = catalog.Catalog()
+        c.append(catalog.Catalog(meta_root=path))
+
+funcs = [base_load, base_stream, base_validate_load, base_validate_stream,
+    updates_load, updates_stream, append]
+
+path = tempfile.mkdtemp()
+try:
+        print("# generating catalog with {0:d} packages".format(npkgs))
+        gen_catalog(path)
+        print("# catalog.base.C: {0:d} bytes".format(
+            os.stat(os.path.join(path, "catalog.base.C")).st_size))
+
+        for func in funcs:
+                # Run each function in a new process so that the peak memory
+                # usage reported is that of the function alone.
+                pid = os.fork()
+                if pid == 0:
+                        startrss = resource.getrusage(
+                            resource.RUSAGE_SELF).ru_maxrss
+                        start = time.time()
+                        func(path)
+                        elapsed = time.time() - start
+                        endrss = resource.getrusage(
+                            resource.RUSAGE_SELF).ru_maxrss
+                        print("{0:24} {1:8.3f} s, peak rss growth: {2:d} KB"
+                            .format(func.__name__, elapsed, endrss - startrss))
+                        sys.stdout.flush()
+                        os._exit(0)
+                else:
+                        os.wait()
+finally:
+        shutil.rmtree(path)
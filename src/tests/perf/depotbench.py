@@ -0,0 +1,139 @@
+#!/usr/bin/python2.7
+#
+# CDDL HEADER START
+#
+# The contents of this file are subject to the terms of the
+# Common Development and Distribution License (the "License").
+# You may not use this file except in compliance with the License.
+#
+# You can obtain a copy of the license at usr/src/OPENSOLARIS.LICENSE
+# or http://www.opensolaris.org/os/licensing.
+# See the License for the specific language governing permissions
+# and limitations under the License.
+#
+# When distributing Covered Code, include this CDDL HEADER in each
+# file and include the License file at usr/src/OPENSOLARIS.LICENSE.
+# If applicable, add the following below this CDDL HEADER, with the
+# fields enclosed by brackets "[]" replaced with your own identifying
+# information: Portions Copyright [yyyy] [name of copyright owner]
+#
+# CDDL HEADER END
+#
+
+#
+# Copyright (c) 2026, Oracle and/or its affiliates. All rights reserved.
+#
+
+#
+# depotbench - benchmark the file retrieval throughput of the depot server
+# for a range of thread pool sizes
+#
+# usage: depotbench.py [-c clients] [-d depotd] [-p port] [-r rounds]
+#            repo_dir [threads ...]
+#
+
+from __future__ import print_function
+
+import getopt
+import httplib
+import os
+import sys
+import threading
+import time
+
+import pkg.depotcontroller as dc
+
+def find_files(repo_dir):
+        """Returns a list of the hashes of the files stored in the
+        repository."""
+
+        hashes = []
+        for dirpath, dirnames, filenames in os.walk(repo_dir):
+                if os.path.basename(os.path.dirname(dirpath)) != "file":
+                        continue
+                hashes.extend(filenames)
+        return hashes
+
+def fetch(port, hashes, totals):
+        """Retrieves each file named in 'hashes' using a persistent
+        connection and adds the number of bytes received to 'totals'."""
+
+        conn = httplib.HTTPConnection("localhost", port)
+        nbytes = 0
+        for h in hashes:
+                conn.request("GET", "/file/0/{0}".format(h))
+                resp = conn.getresponse()
+                while True:
+                        data = resp.read(1024 * 1024)
+                        if not data:
+                                break
+                        nbytes += len(data)
+                if resp.status != httplib.OK:
+                        print("{0}: {1:d}".format(h, resp.status),
+                            file=sys.stderr)
+        conn.close()
+        totals.append(nbytes)
+
+def bench(depotd, repo_dir, port, threads, clients, rounds, hashes):
+        ctl = dc.DepotController()
+        ctl.set_depotd_path(depotd)
+        ctl.set_repodir(repo_dir)
+        ctl.set_readonly()
+        ctl.set_port(port)
+        ctl.set_property("pkg", "threads", threads)
+        ctl.set_logpath("/dev/null")
+        ctl.start()
+        try:
+                work = hashes * rounds
+                totals = []
+                workers = [
+                    threading.Thread(target=fetch,
+                        args=(port, work[i::clients], totals))
+                    for i in range(clients)
+                ]
+                start = time.time()
+                for t in workers:
+                        t.start()
+                for t in workers:
+                        t.join()
+                elapsed = time.time() - start
+        finally:
+                ctl.stop()
+
+        nbytes = sum(totals)
+        print("{0:4d} threads {1:4d} clients {2:10.1f} MB/s {3:8.1f} "
+            "files/s".format(threads, clients, nbytes / elapsed / 1048576,
+            len(work) / elapsed))
+
+clients = 16
+depotd = "/usr/lib/pkg.depotd"
+port = 12001
+rounds = 3
+
+opts, pargs = getopt.getopt(sys.argv[1:], "c:d:p:r:")
+for opt, arg in opts:
+        if opt == "-c":
+                clients = int(arg)
+        elif opt == "-d":
+                depotd = arg
+        elif opt == "-p":
+                port = int(arg)
+        elif opt == "-r":
+                rounds = int(arg)
+
+if not pargs:
+        print("usage: depotbench.py [-c clients] [-d depotd] [-p port] "
+            "[-r rounds] repo_dir [threads ...]", file=sys.stderr)
+        sys.exit(2)
+
+repo_dir = os.path.abspath(pargs[0])
+thread_counts = [int(t) for t in pargs[1:]] or [10, 20, 50, 100]
+
+hashes = find_files(repo_dir)
+if not hashes:
+        print("no files found in {0}".format(repo_dir), file=sys.stderr)
+        sys.exit(1)
+print("# {0:d} files, {1:d} rounds".format(len(hashes), rounds))
+
+for threads in thread_counts:
+        bench(depotd, repo_dir, port, threads, clients, rounds, hashes)
@@ -19,7 +19,7 @@
 #
 # CDDL HEADER END
 #
-# Copyright (c) 2013, 2015, Oracle and/or its affiliates. All rights reserved.
+# Copyright (c) 2013, 2026, Oracle and/or its affiliates. All rights reserved.
 #
 
 #
@@ -94,6 +94,10 @@ LoadModule wsgi_module libexec/mod_wsgi-2.7.so
 
 # Turn on deflate for file types that support it
 AddOutputFilterByType DEFLATE text/html application/javascript text/css text/plain
+
+# Package content is stored gzip-compressed and served as-is from the
+# repository, so let the kernel copy it to the network directly.
+EnableSendfile on
 # We only alias a specific script, not all files in ${template_dir}
 WSGIScriptAlias ${sroot}/depot ${template_dir}/depot_index.py
 